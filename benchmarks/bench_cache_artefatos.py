@@ -0,0 +1,98 @@
+"""
+Benchmark do cache de XMLs assinados (cache_artefatos) no pipeline em memória (pipeline).
+
+Roda executar_pipeline duas vezes sobre os mesmos registros sintéticos: a primeira com o
+cache vazio (gera, valida e assina tudo) e a segunda sem nenhuma alteração (tudo vem do
+cache). Usa um certificado descartável e, sem --xsd, um XSD que aceita qualquer conteúdo.
+
+Uso (a partir da raiz do projeto):
+    python benchmarks/bench_cache_artefatos.py --quantidade 2000
+"""
+import argparse
+import datetime
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from cryptography import x509  # noqa: E402
+from cryptography.hazmat.primitives import hashes, serialization  # noqa: E402
+from cryptography.hazmat.primitives.asymmetric import rsa  # noqa: E402
+from cryptography.hazmat.primitives.serialization import pkcs12  # noqa: E402
+from cryptography.x509.oid import NameOID  # noqa: E402
+
+import certifica_xml  # noqa: E402
+import pipeline  # noqa: E402
+from bench_geracao_xml import gerar_registros_sinteticos  # noqa: E402
+from cache_artefatos import criar_cache_artefatos  # noqa: E402
+
+XSD_PERMISSIVO = """<xs:schema xmlns:xs="http://www.w3.org/2001/XMLSchema">
+ <xs:element name="ArrayOfTcCompNfse"><xs:complexType><xs:sequence>
+  <xs:any processContents="skip" maxOccurs="unbounded"/>
+ </xs:sequence><xs:anyAttribute processContents="skip"/></xs:complexType></xs:element>
+</xs:schema>
+"""
+SENHA_PFX_DESCARTAVEL = b"benchmark"
+
+
+def gerar_pfx_descartavel(caminho, senha=SENHA_PFX_DESCARTAVEL):
+    """Certificado autoassinado (RSA 2048) só para medir a assinatura."""
+    chave = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    nome = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "benchmark integracao_rps_nfse")])
+    agora = datetime.datetime.now(datetime.timezone.utc)
+    certificado = (
+        x509.CertificateBuilder()
+        .subject_name(nome)
+        .issuer_name(nome)
+        .public_key(chave.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(agora)
+        .not_valid_after(agora + datetime.timedelta(days=1))
+        .sign(chave, hashes.SHA256())
+    )
+    with open(caminho, "wb") as f:
+        f.write(pkcs12.serialize_key_and_certificates(
+            b"benchmark", chave, certificado, None, serialization.BestAvailableEncryption(senha)
+        ))
+    return caminho
+
+
+def medir(nome, registros, sessao, caminho_xsd, cache):
+    inicio = time.perf_counter()
+    etapas = {}
+    for resultado in pipeline.executar_pipeline(registros, caminho_xsd=caminho_xsd, sessao=sessao, cache=cache):
+        etapas[resultado.etapa] = etapas.get(resultado.etapa, 0) + 1
+    duracao = time.perf_counter() - inicio
+    print(f"{nome:>18} | {len(registros):>7} | {duracao:8.2f}s | {len(registros) / duracao:9.0f} XMLs/s | {etapas}")
+    return duracao
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--quantidade", type=int, default=2000)
+    parser.add_argument("--xsd", default=None, help="XSD real (padrão: um XSD permissivo).")
+    argumentos = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as pasta:
+        caminho_xsd = argumentos.xsd
+        if caminho_xsd is None:
+            caminho_xsd = os.path.join(pasta, "permissivo.xsd")
+            with open(caminho_xsd, "w", encoding="utf-8") as f:
+                f.write(XSD_PERMISSIVO)
+
+        caminho_pfx = gerar_pfx_descartavel(os.path.join(pasta, "descartavel.pfx"))
+        sessao = certifica_xml.SessaoAssinatura(caminho_pfx, SENHA_PFX_DESCARTAVEL, os.path.join(pasta, "assinados"))
+        os.makedirs(sessao.pasta_saida)
+        cache = criar_cache_artefatos(sessao.certificado, caminho_xsd, os.path.join(pasta, "cache"))
+        registros = list(gerar_registros_sinteticos(argumentos.quantidade))
+
+        print(f"{'execução':>18} | {'XMLs':>7} | {'tempo':>9} | {'vazão':>15} | etapas")
+        frio = medir("cache vazio", registros, sessao, caminho_xsd, cache)
+        quente = medir("sem alterações", registros, sessao, caminho_xsd, cache)
+        print(f"Aceleração da reexecução sem alterações: {frio / quente:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
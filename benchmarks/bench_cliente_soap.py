@@ -0,0 +1,86 @@
+"""
+Benchmark do cliente SOAP (cliente_soap) contra o servidor local (servidor_soap_local).
+
+Reenvia os envelopes de exemplo de manual_exemplo_sistema_prefeitura/BlueprintPHP/XML/ e
+compara uma conexão nova por requisição (como o Blueprint.php faz com cURL) com o pool de
+conexões persistentes do ClienteSoapNfse, com e sem requisições simultâneas.
+O --atraso simula a latência do webservice.
+
+Uso (a partir da raiz do projeto):
+    python benchmarks/bench_cliente_soap.py --requisicoes 500 --conexoes 1 4 8 --atraso 0.02
+"""
+import argparse
+import itertools
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import cliente_soap  # noqa: E402
+import servidor_soap_local  # noqa: E402
+
+
+def carregar_exemplos(pasta=servidor_soap_local.PASTA_EXEMPLOS_XML):
+    exemplos = []
+    for metodo, nome_arquivo in servidor_soap_local.EXEMPLOS_POR_METODO.items():
+        with open(os.path.join(pasta, nome_arquivo), "rb") as f:
+            exemplos.append((metodo, f.read()))
+    return exemplos
+
+
+def requisicoes_repetidas(exemplos, quantidade):
+    return itertools.islice(itertools.cycle(exemplos), quantidade)
+
+
+def relatar(nome, duracao, duracoes, falhas):
+    duracoes = sorted(duracoes)
+    p50 = statistics.median(duracoes) * 1000
+    p99 = duracoes[min(len(duracoes) - 1, int(len(duracoes) * 0.99))] * 1000
+    print(f"{nome:>26} | {len(duracoes):>6} | {duracao:7.2f}s | {len(duracoes) / duracao:8.0f} req/s | "
+          f"p50 {p50:7.2f}ms | p99 {p99:7.2f}ms | falhas {falhas}")
+
+
+def medir_sem_pool(url, exemplos, quantidade):
+    """Uma conexão nova a cada requisição, em sequência."""
+    duracoes, falhas = [], 0
+    inicio = time.perf_counter()
+    for metodo, xml in requisicoes_repetidas(exemplos, quantidade):
+        with cliente_soap.ClienteSoapNfse(url, conexoes=1) as cliente:
+            resposta = cliente.enviar(metodo, xml)
+        duracoes.append(resposta.duracao)
+        falhas += resposta.status != 200
+    relatar("conexão por requisição", time.perf_counter() - inicio, duracoes, falhas)
+
+
+def medir_com_pool(url, exemplos, quantidade, conexoes):
+    duracoes, falhas = [], 0
+    inicio = time.perf_counter()
+    with cliente_soap.ClienteSoapNfse(url, conexoes=conexoes) as cliente:
+        for resultado in cliente.enviar_em_lote(requisicoes_repetidas(exemplos, quantidade)):
+            duracoes.append(resultado.duracao)
+            falhas += not resultado.sucesso
+    relatar(f"pool, {conexoes} conexão(ões)", time.perf_counter() - inicio, duracoes, falhas)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requisicoes", type=int, default=500)
+    parser.add_argument("--conexoes", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--atraso", type=float, default=0.0, help="Atraso do servidor por requisição (s).")
+    argumentos = parser.parse_args()
+
+    exemplos = carregar_exemplos()
+    servidor, url = servidor_soap_local.iniciar_servidor(atraso=argumentos.atraso)
+    try:
+        print(f"{'cliente':>26} | {'req':>6} | {'tempo':>8} | {'vazão':>14} | {'latência':^32}")
+        medir_sem_pool(url, exemplos, argumentos.requisicoes)
+        for conexoes in argumentos.conexoes:
+            medir_com_pool(url, exemplos, argumentos.requisicoes, conexoes)
+    finally:
+        servidor.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Benchmark da geração dos DANFSE (geracao_danfse) a partir de XMLs sintéticos.
+
+Grava XMLs com o mesmo gerador do criacao_rps (parte deles com discriminação longa, que
+ocupa mais de uma página) e mede a renderização em um processo e no pool, em páginas por
+segundo, e a reexecução sem alterações (só confere o manifesto).
+
+Uso (a partir da raiz do projeto):
+    python benchmarks/bench_danfse.py --quantidade 2000 --processos 4
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import geracao_danfse  # noqa: E402
+import instrumentacao  # noqa: E402
+from bench_geracao_xml import gerar_registros_sinteticos  # noqa: E402
+from criacao_rps import renderizar_xml_nfse  # noqa: E402
+
+# Uma nota a cada DISCRIMINACAO_LONGA_A_CADA tem discriminação de várias páginas
+DISCRIMINACAO_LONGA_A_CADA = 20
+LINHAS_DISCRIMINACAO_LONGA = 120
+
+
+def gravar_xmls_sinteticos(pasta, quantidade):
+    os.makedirs(pasta, exist_ok=True)
+    for numero, dados in enumerate(gerar_registros_sinteticos(quantidade)):
+        if numero % DISCRIMINACAO_LONGA_A_CADA == 0:
+            dados["discriminacao"] = "|".join(
+                f"Item {linha}: manutenção preventiva de equipamentos" for linha in range(LINHAS_DISCRIMINACAO_LONGA)
+            )
+        with open(os.path.join(pasta, f"nfse_{dados['id']}.xml"), "wb") as arquivo:
+            arquivo.write(renderizar_xml_nfse(dados))
+
+
+def medir(nome, pasta, processos, todos):
+    inicio = time.perf_counter()
+    pdfs, paginas, falhas = geracao_danfse.gerar_danfses(
+        pasta, processos=processos, todos=todos, caminho_manifesto=os.path.join(pasta, "manifesto.json")
+    )
+    duracao = time.perf_counter() - inicio
+    print(
+        f"{nome:>24} | {processos or os.cpu_count():>9} | {pdfs:>6} | {paginas:>8} | {falhas:>6}"
+        f" | {duracao:8.2f}s | {paginas / duracao:9.1f}"
+    )
+    return paginas / duracao if duracao else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--quantidade", type=int, default=2000)
+    parser.add_argument("--processos", type=int, default=None, help="Processos do pool (padrão: número de CPUs).")
+    argumentos = parser.parse_args()
+    # Só o resultado de cada medição interessa aqui
+    instrumentacao.configurar(amostra=0)
+
+    with tempfile.TemporaryDirectory() as pasta:
+        gravar_xmls_sinteticos(pasta, argumentos.quantidade)
+        linhas = [
+            ("um processo", 1, True),
+            ("pool", argumentos.processos, True),
+            ("reexecução sem alteração", argumentos.processos, False),
+        ]
+        print(f"{'execução':>24} | {'processos':>9} | {'PDFs':>6} | {'páginas':>8} | {'falhas':>6} | {'tempo':>9} | páginas/s")
+        vazoes = [medir(nome, pasta, processos, todos) for nome, processos, todos in linhas]
+        print(f"Aceleração do pool: {vazoes[1] / vazoes[0]:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
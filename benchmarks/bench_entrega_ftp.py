@@ -0,0 +1,118 @@
+"""
+Benchmark da entrega por FTP (entrega_ftp) contra o servidor FTP local (servidor_ftp_local).
+
+Gera pares sintéticos nfse_<id>.xml/.pdf distribuídos em lotes e mede a entrega completa:
+uma conexão (um arquivo por vez), o pool de conexões e o pool com um zip por lote. O atraso
+por comando no servidor simula a latência da rede até a máquina do cliente. Cada execução
+começa com o manifesto e a pasta remota vazios; no fim, uma reexecução sem alterações mede
+o custo de só conferir o manifesto.
+
+Cada valor de --atrasos é medido com um servidor novo. O pool só ajuda quando a latência
+por comando domina: sem atraso (loopback) a transferência fica limitada pela CPU e o pool
+empata com uma conexão, enquanto com alguns milissegundos por comando (uma rede real) as
+conexões esperam em paralelo. O zip por lote reduz o número de comandos nos dois casos.
+
+Uso (a partir da raiz do projeto):
+    python benchmarks/bench_entrega_ftp.py --notas 500 --lotes 10 --atrasos 0 0.005 0.02
+"""
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import entrega_ftp  # noqa: E402
+import servidor_ftp_local  # noqa: E402
+
+TAMANHO_XML = 6 * 1024
+TAMANHO_PDF = 40 * 1024
+ATRASOS_PADRAO = [0.0, 0.005]
+
+
+def gerar_arquivos_sinteticos(pasta, notas, lotes, semente=7):
+    """XMLs textuais (comprimem bem) e PDFs pouco compressíveis, como os reais."""
+    aleatorio = random.Random(semente)
+    os.makedirs(pasta, exist_ok=True)
+    for indice in range(notas):
+        base = f"{indice % lotes + 1:04d}12345678000199987654"
+        id_nota = base if indice < lotes else f"{base}-{indice}"
+        with open(os.path.join(pasta, f"nfse_{id_nota}.xml"), "w", encoding="utf-8") as arquivo:
+            linha = f"<Servico><Valor>{indice}.00</Valor><Discriminacao>Serviço {indice}</Discriminacao></Servico>"
+            arquivo.write(linha * (TAMANHO_XML // len(linha)))
+        with open(os.path.join(pasta, f"nfse_{id_nota}.pdf"), "wb") as arquivo:
+            arquivo.write(aleatorio.randbytes(TAMANHO_PDF))
+
+
+def medir(nome, pasta_trabalho, pasta_arquivos, porta, conexoes, agrupar, limpar=True):
+    pasta_remota = os.path.join(pasta_trabalho, "remoto")
+    caminho_manifesto = os.path.join(pasta_trabalho, "manifesto.json")
+    if limpar:
+        shutil.rmtree(pasta_remota, ignore_errors=True)
+        os.makedirs(pasta_remota)
+        if os.path.exists(caminho_manifesto):
+            os.remove(caminho_manifesto)
+
+    manifesto = entrega_ftp.ManifestoEntrega(caminho_manifesto)
+    inicio = time.perf_counter()
+    with entrega_ftp.ClienteFtpEntrega(
+        "127.0.0.1", porta, servidor_ftp_local.USUARIO_PADRAO, servidor_ftp_local.SENHA_PADRAO,
+        conexoes=conexoes,
+    ) as cliente:
+        entregues, falhas = entrega_ftp.entregar_arquivos(
+            cliente, manifesto, pasta_arquivos, agrupar, os.path.join(pasta_trabalho, "pacotes")
+        )
+    duracao = time.perf_counter() - inicio
+    enviados = sum(os.path.getsize(os.path.join(pasta_remota, nome)) for nome in os.listdir(pasta_remota))
+    print(
+        f"{nome:>24} | {conexoes:>8} | {entregues:>9} | {falhas:>6} | {duracao:8.2f}s"
+        f" | {enviados / 1024 / 1024:8.1f} MB"
+    )
+    return duracao
+
+
+def medir_atraso(pasta, pasta_arquivos, atraso, conexoes):
+    """Mede as quatro execuções com um servidor de `atraso` s por comando; devolve as acelerações."""
+    pasta_atraso = os.path.join(pasta, f"atraso_{atraso}")
+    os.makedirs(pasta_atraso)
+    servidor, porta = servidor_ftp_local.iniciar_servidor(os.path.join(pasta_atraso, "remoto"), atraso=atraso)
+    try:
+        print(f"\nAtraso por comando: {atraso * 1000:.1f} ms")
+        print(f"{'execução':>24} | {'conexões':>8} | {'entregues':>9} | {'falhas':>6} | {'tempo':>9} | {'remoto':>11}")
+        sequencial = medir("uma conexão", pasta_atraso, pasta_arquivos, porta, 1, False)
+        pool = medir("pool", pasta_atraso, pasta_arquivos, porta, conexoes, False)
+        agrupado = medir("pool + zip por lote", pasta_atraso, pasta_arquivos, porta, conexoes, True)
+        medir("reexecução sem alteração", pasta_atraso, pasta_arquivos, porta, conexoes, True, limpar=False)
+    finally:
+        servidor.close_all()
+    return sequencial / pool, sequencial / agrupado
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--notas", type=int, default=500)
+    parser.add_argument("--lotes", type=int, default=10)
+    parser.add_argument("--conexoes", type=int, default=entrega_ftp.CONEXOES_FTP)
+    parser.add_argument(
+        "--atrasos", type=float, nargs="+", default=ATRASOS_PADRAO,
+        help="Atrasos por comando FTP no servidor (s), um servidor para cada."
+    )
+    argumentos = parser.parse_args()
+
+    aceleracoes = {}
+    with tempfile.TemporaryDirectory() as pasta:
+        pasta_arquivos = os.path.join(pasta, "pdf_xml_assinados")
+        gerar_arquivos_sinteticos(pasta_arquivos, argumentos.notas, argumentos.lotes)
+        for atraso in argumentos.atrasos:
+            aceleracoes[atraso] = medir_atraso(pasta, pasta_arquivos, atraso, argumentos.conexoes)
+
+    print(f"\n{'atraso':>9} | {'pool':>6} | {'pool + zip':>10}  (aceleração sobre uma conexão)")
+    for atraso, (pool, agrupado) in aceleracoes.items():
+        print(f"{atraso * 1000:7.1f}ms | {pool:5.1f}x | {agrupado:9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Benchmark da geração de XML de NFSe (criacao_rps).
+
+Mede XMLs/segundo do gerador padrão (ElementTree, um documento por vez) e do gerador
+rápido (template pré-montado, com e sem pool de processos), gravando em uma pasta
+temporária. Antes de medir, confere que os dois geradores produzem os mesmos bytes.
+
+Uso (a partir da raiz do projeto):
+    python benchmarks/bench_geracao_xml.py --tamanhos 1000 10000 100000 --processos 4
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from collections import deque
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import criacao_rps  # noqa: E402
+
+
+def gerar_registros_sinteticos(quantidade):
+    for numero in range(quantidade):
+        yield {
+            "id": f"bench{numero}",
+            "numero_lote": str(numero // 50),
+            "numero_rps": str(numero),
+            "data_hora_emissao": "04/12/2018 11:01",
+            "natureza_operacao": "1 - Tributação no município",
+            "regime_especial_tributacao": "1",
+            "optante_simples_nacional": "1 - Sim",
+            "incentivador_cultural": "2 - Não",
+            "valor_servicos": "1500.00",
+            "valor_deducoes": "0.00",
+            "iss_retido": "2 - Não",
+            "valor_iss": "75.00",
+            "base_calculo": "1500.00",
+            "aliquota": "0.05",
+            "valor_liquido_nfse": "1500.00",
+            "item_lista_servicos": "1505",
+            "discriminacao": f"Serviço prestado #{numero} & manutenção <mensal>",
+            "cod_municipio_servico": "4106902",
+            "cnpj_tomador": "98765432000100" if numero % 5 else "",
+            "cpf_tomador": "12345678909",
+            "razao_social_tomador": "TESTE INFORMACOES E TECNOLOGIA LTDA",
+            "endereco_tomador": "R DUTRA",
+            "numero": "5",
+            "complemento": "" if numero % 3 else "ANDAR15",
+            "bairro": "CENTRO",
+            "cod_municipio_tomador": "4125506",
+            "uf": "PR",
+            "cep": "80000000",
+            "email_tomador": "contato@teste.com.br",
+        }
+
+
+def conferir_bytes_identicos(amostra=200):
+    for dados_nfse in gerar_registros_sinteticos(amostra):
+        xml_str, _ = criacao_rps.gerar_xml_nfse(dados_nfse)
+        if xml_str.encode("utf-8") != criacao_rps.renderizar_xml_nfse(dados_nfse):
+            raise SystemExit(f"[ERRO] Saída diferente para o registro {dados_nfse['id']}.")
+
+
+def medir(nome, quantidade, funcao):
+    inicio = time.perf_counter()
+    funcao()
+    duracao = time.perf_counter() - inicio
+    print(f"{nome:>22} | {quantidade:>7} | {duracao:8.2f}s | {quantidade / duracao:10.0f} XMLs/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--tamanhos", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--processos", type=int, default=os.cpu_count())
+    parser.add_argument("--tamanho-bloco", type=int, default=criacao_rps.TAMANHO_BLOCO_PROCESSOS)
+    parser.add_argument("--sem-padrao", action="store_true", help="Não mede o gerador ElementTree.")
+    argumentos = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as pasta_saida:
+        criacao_rps.PASTA_SAIDA_XML = pasta_saida
+        conferir_bytes_identicos()
+
+        print(f"{'gerador':>22} | {'XMLs':>7} | {'tempo':>9} | {'vazão':>16}")
+        for quantidade in argumentos.tamanhos:
+            if not argumentos.sem_padrao:
+                medir("padrão (ElementTree)", quantidade, lambda: [
+                    criacao_rps.gerar_xml_nfse(dados_nfse) for dados_nfse in gerar_registros_sinteticos(quantidade)
+                ])
+            medir("rápido, 1 processo", quantidade, lambda: deque(criacao_rps.gerar_xmls_em_paralelo(
+                gerar_registros_sinteticos(quantidade), pasta_saida, processos=1
+            ), maxlen=0))
+            medir(f"rápido, {argumentos.processos} processos", quantidade, lambda: deque(
+                criacao_rps.gerar_xmls_em_paralelo(
+                    gerar_registros_sinteticos(quantidade), pasta_saida,
+                    processos=argumentos.processos, tamanho_bloco=argumentos.tamanho_bloco
+                ),
+                maxlen=0
+            ))
+
+
+if __name__ == "__main__":
+    main()
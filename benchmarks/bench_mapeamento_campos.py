@@ -0,0 +1,105 @@
+"""
+Micro-benchmark do mapeamento planilha -> JSON (passagem_lista_json).
+
+Compara o custo por linha da forma anterior (dict(zip(cabecalhos, linha)) + um .get/padrao_vazio
+por campo e sufixo do identificador procurado um a um) com o mapeamento compilado de
+compilar_mapeamento_campos e o contador de alocar_identificador, e confere que os registros
+gerados são idênticos. As linhas "só mapeamento" medem os campos sem o identificador.
+
+Uso (a partir da raiz do projeto):
+    python benchmarks/bench_mapeamento_campos.py --linhas 20000
+    python benchmarks/bench_mapeamento_campos.py --linhas 5000 --lotes 1   # todas no mesmo lote
+"""
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from acesso_api_google import (  # noqa: E402
+    MAPEAMENTO_CAMPOS,
+    atributo_identificador_unico,
+    compilar_mapeamento_campos,
+    gerar_registros_json,
+    padrao_vazio,
+    verificacao_atributo_identificador,
+)
+
+
+def registros_forma_anterior(cabecalhos, linhas):
+    identificadores_gerados = set()
+    for linha in linhas:
+        dados_linha = dict(zip(cabecalhos, linha))
+
+        numero_lote = padrao_vazio(dados_linha.get("Número do Lote"))
+        cnpj_prestador = padrao_vazio(dados_linha.get("CNPJ do Prestador"))
+        inscricao_municipal_prestador = padrao_vazio(dados_linha.get("Inscrição Municipal do Prestador"))
+
+        identificador_base = atributo_identificador_unico(numero_lote, cnpj_prestador, inscricao_municipal_prestador)
+        identificador_unico = verificacao_atributo_identificador(identificador_base, identificadores_gerados)
+        identificadores_gerados.add(identificador_unico)
+
+        estrutura_json = {"id": identificador_unico}
+        for cabecalho, chave, _ in MAPEAMENTO_CAMPOS:
+            estrutura_json[chave] = padrao_vazio(dados_linha.get(cabecalho))
+        yield estrutura_json
+
+
+def registros_compilados(cabecalhos, linhas):
+    return gerar_registros_json(cabecalhos, enumerate(linhas, start=2))
+
+
+def campos_forma_anterior(cabecalhos, linhas):
+    for linha in linhas:
+        dados_linha = dict(zip(cabecalhos, linha))
+        yield {chave: padrao_vazio(dados_linha.get(cabecalho)) for cabecalho, chave, _ in MAPEAMENTO_CAMPOS}
+
+
+def campos_compilados(cabecalhos, linhas):
+    chaves_json, transformar_linha = compilar_mapeamento_campos(cabecalhos)
+    for linha in linhas:
+        yield dict(zip(chaves_json, transformar_linha(linha)))
+
+
+def gerar_planilha_sintetica(quantidade_linhas, quantidade_lotes=None):
+    cabecalhos = [cabecalho for cabecalho, _, _ in MAPEAMENTO_CAMPOS]
+    linhas = []
+    for numero in range(quantidade_linhas):
+        linha = [f" valor {numero}-{coluna} " for coluna in range(len(cabecalhos))]
+        # Por padrão um lote por linha, isolando o custo do mapeamento
+        linha[0] = str(numero % quantidade_lotes if quantidade_lotes else numero)
+        linha[1], linha[2] = "38.057.542/0002-54", "11126723"
+        if numero % 7 == 0:
+            linha = linha[:-3]  # a API omite as células vazias no fim da linha
+        linhas.append(linha)
+    return cabecalhos, linhas
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--linhas", type=int, default=20000)
+    parser.add_argument("--lotes", type=int, default=None, help="Quantidade de lotes distintos (repete identificadores).")
+    parser.add_argument("--repeticoes", type=int, default=5)
+    argumentos = parser.parse_args()
+
+    cabecalhos, linhas = gerar_planilha_sintetica(argumentos.linhas, argumentos.lotes)
+
+    if list(registros_forma_anterior(cabecalhos, linhas)) != list(registros_compilados(cabecalhos, linhas)):
+        raise SystemExit("[ERRO] Os registros gerados diferem da forma anterior.")
+
+    if list(campos_forma_anterior(cabecalhos, linhas)) != list(campos_compilados(cabecalhos, linhas)):
+        raise SystemExit("[ERRO] Os campos mapeados diferem da forma anterior.")
+
+    for nome, funcao in (
+        ("anterior", registros_forma_anterior),
+        ("compilado", registros_compilados),
+        ("só mapeamento, anterior", campos_forma_anterior),
+        ("só mapeamento, compilado", campos_compilados),
+    ):
+        tempo = min(timeit.repeat(lambda: list(funcao(cabecalhos, linhas)), number=1, repeat=argumentos.repeticoes))
+        print(f"{nome:>24}: {tempo * 1e6 / argumentos.linhas:8.2f} µs/linha ({argumentos.linhas} linhas)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,324 @@
+"""
+Suíte de benchmark do pipeline completo, etapa por etapa, sobre planilhas sintéticas.
+
+Gera planilhas com os 42 cabeçalhos de MAPEAMENTO_CAMPOS (com lotes repetidos, linhas com
+alguns campos vazios, linhas descartadas por excesso de vazios e células vazias omitidas no
+fim da linha, como a API devolve) e mede, separadamente:
+    validacao_linhas   filtrar_linhas_validas_em_fluxo (usada por verificacao_existencia_registro)
+    mapeamento_json    gerar_registros_json (usada por passagem_lista_json)
+    geracao_xml        criacao_rps.gerar_xml_nfse
+    validacao_xsd      certifica_xml.validar_arquivo_xml_com_schema
+    assinatura         certifica_xml.assinar_xml, com uma SessaoAssinatura de um PFX descartável
+
+Para cada tamanho e etapa informa vazão, latência p50/p99 por documento e o pico de RSS da
+etapa, em JSON. Cada tamanho roda em um processo novo; no Linux o pico (VmHWM) é zerado antes
+de cada etapa por /proc/self/clear_refs, e sem esse recurso o valor é o pico do processo do
+tamanho até o fim da etapa ("medicao_memoria" no JSON diz qual dos dois foi usado). Com --comparar, aponta as etapas mais lentas que a
+execução de referência além da --tolerancia (código de saída 1).
+
+Uso (a partir da raiz do projeto):
+    python benchmarks/bench_pipeline.py --tamanhos 100 1000 10000 --saida bench_atual.json
+    python benchmarks/bench_pipeline.py --tamanhos 100 1000 10000 --comparar bench_atual.json
+"""
+import argparse
+import contextlib
+import datetime
+import json
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import acesso_api_google  # noqa: E402
+import certifica_xml  # noqa: E402
+import criacao_rps  # noqa: E402
+from bench_cache_artefatos import SENHA_PFX_DESCARTAVEL, XSD_PERMISSIVO, gerar_pfx_descartavel  # noqa: E402
+
+TAMANHOS_PADRAO = [100, 1000, 10000, 100000]
+ETAPAS = ("validacao_linhas", "mapeamento_json", "geracao_xml", "validacao_xsd", "assinatura")
+TOLERANCIA_PADRAO = 0.15
+LINHAS_POR_LOTE_REPETIDO = 50
+CAMINHO_LIMPAR_REFERENCIAS = "/proc/self/clear_refs"
+CAMINHO_STATUS_PROCESSO = "/proc/self/status"
+MEDICAO_POR_ETAPA = "VmHWM por etapa (clear_refs)"
+MEDICAO_POR_PROCESSO = "ru_maxrss do processo do tamanho, até o fim da etapa"
+
+VALORES_EXEMPLO = {
+    "cnpj_prestador": "38.057.542/0002-54",
+    "inscricao_municipal_prestador": "11126723",
+    "qntd_rps": "1",
+    "serie_rps": "A",
+    "tipo_rps": "1 - RPS",
+    "data_hora_emissao": "04/12/2018 11:01",
+    "natureza_operacao": "1 - Tributação no município",
+    "regime_especial_tributacao": "1",
+    "optante_simples_nacional": "1 - Sim",
+    "incentivador_cultural": "2 - Não",
+    "status": "1 - Normal",
+    "valor_servicos": "1500.00",
+    "iss_retido": "2 - Não",
+    "valor_iss": "75.00",
+    "base_calculo": "1500.00",
+    "aliquota": "0.05",
+    "valor_liquido_nfse": "1500.00",
+    "item_lista_servicos": "1505",
+    "cod_municipio_servico": "4106902",
+    "cnpj_tomador": "98765432000100",
+    "razao_social_tomador": "TESTE INFORMACOES E TECNOLOGIA LTDA",
+    "endereco_tomador": "R DUTRA",
+    "numero": "5",
+    "complemento": "ANDAR15",
+    "bairro": "CENTRO",
+    "cod_municipio_tomador": "4125506",
+    "uf": "PR",
+    "cep": "80000-000",
+    "email_tomador": "contato@teste.com.br",
+}
+CAMPOS_QUE_PODEM_FICAR_VAZIOS = ("complemento", "cnpj_tomador", "email_tomador", "valor_pis", "valor_cofins")
+
+
+# --- DADOS SINTÉTICOS --- #
+def gerar_planilha_sintetica(quantidade, semente=42):
+    """
+    Cabeçalho + `quantidade` linhas. Cerca de 30% das linhas dividem lotes de
+    LINHAS_POR_LOTE_REPETIDO linhas, 10% têm até 3 campos vazios e 2% têm mais de 5 vazios
+    (descartadas na validação).
+    """
+    aleatorio = random.Random(semente)
+    cabecalhos = [cabecalho for cabecalho, _, _ in acesso_api_google.MAPEAMENTO_CAMPOS]
+    chaves = [chave for _, chave, _ in acesso_api_google.MAPEAMENTO_CAMPOS]
+    planilha = [cabecalhos]
+
+    for numero in range(quantidade):
+        valores = dict(VALORES_EXEMPLO)
+        valores["numero_rps"] = str(numero + 1)
+        valores["discriminacao"] = f"Serviço prestado #{numero} & manutenção <mensal>"
+        sorteio = aleatorio.random()
+        if sorteio < 0.3:
+            valores["numero_lote"] = f"R{numero // LINHAS_POR_LOTE_REPETIDO}"
+        else:
+            valores["numero_lote"] = str(numero + 1)
+
+        linha = [f" {valores.get(chave, '0.00')} " for chave in chaves]
+        if aleatorio.random() < 0.10:
+            for chave in aleatorio.sample(CAMPOS_QUE_PODEM_FICAR_VAZIOS, aleatorio.randint(1, 3)):
+                linha[chaves.index(chave)] = ""
+        if aleatorio.random() < 0.02:
+            for indice in aleatorio.sample(range(3, len(linha)), 8):
+                linha[indice] = ""
+        while linha and linha[-1] == "":
+            linha.pop()  # a API omite as células vazias no fim da linha
+        planilha.append(linha)
+    return planilha
+
+
+# --- MEDIÇÃO --- #
+def percentil(duracoes_ordenadas, fracao):
+    if not duracoes_ordenadas:
+        return None
+    return duracoes_ordenadas[min(len(duracoes_ordenadas) - 1, int(len(duracoes_ordenadas) * fracao))]
+
+def reiniciar_pico_rss():
+    """Zera o pico de RSS do processo (Linux >= 4.0). Devolve False quando não é possível."""
+    try:
+        with open(CAMINHO_LIMPAR_REFERENCIAS, "w") as arquivo:
+            arquivo.write("5")
+        return True
+    except OSError:
+        return False
+
+def pico_rss_kb():
+    try:
+        with open(CAMINHO_STATUS_PROCESSO, "r") as arquivo:
+            for linha in arquivo:
+                if linha.startswith("VmHWM:"):
+                    return int(linha.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss  # KB no Linux
+
+def resumir_etapa(duracoes, duracao_total, falhas):
+    duracoes = sorted(duracoes)
+    return {
+        "documentos": len(duracoes),
+        "falhas": falhas,
+        "segundos": round(duracao_total, 4),
+        "por_segundo": round(len(duracoes) / duracao_total, 1) if duracao_total else None,
+        "p50_ms": round(percentil(duracoes, 0.50) * 1000, 4) if duracoes else None,
+        "p99_ms": round(percentil(duracoes, 0.99) * 1000, 4) if duracoes else None,
+        "pico_rss_kb": pico_rss_kb(),
+    }
+
+def cronometrar_fluxo(gerador):
+    """Consome o gerador e devolve (itens, duração de cada item, duração total)."""
+    itens, duracoes = [], []
+    inicio = anterior = time.perf_counter()
+    for item in gerador:
+        agora = time.perf_counter()
+        duracoes.append(agora - anterior)
+        itens.append(item)
+        anterior = agora
+    return itens, duracoes, time.perf_counter() - inicio
+
+def cronometrar_por_documento(funcao, entradas):
+    """Chama funcao(entrada) para cada entrada; devolve (resultados, durações, total, falhas)."""
+    resultados, duracoes, falhas = [], [], 0
+    inicio = time.perf_counter()
+    for entrada in entradas:
+        antes = time.perf_counter()
+        try:
+            resultados.append(funcao(entrada))
+        except Exception:
+            resultados.append(None)
+            falhas += 1
+        duracoes.append(time.perf_counter() - antes)
+    return resultados, duracoes, time.perf_counter() - inicio, falhas
+
+
+def medir_tamanho(quantidade, pasta, caminho_xsd, sessao):
+    """
+    Mede as etapas em sequência (cada uma consome a saída da anterior). Devolve
+    (etapas, medicao_memoria); o pico de RSS é zerado antes de cada etapa quando possível.
+    """
+    etapas = {}
+    planilha = gerar_planilha_sintetica(quantidade)
+    cabecalhos = planilha[0]
+
+    # As mensagens por linha da validação fazem parte do custo, mas não da saída do benchmark
+    por_etapa = reiniciar_pico_rss()
+    with open(os.devnull, "w") as nulo, contextlib.redirect_stdout(nulo):
+        linhas_validas, duracoes, total = cronometrar_fluxo(
+            acesso_api_google.filtrar_linhas_validas_em_fluxo(cabecalhos, enumerate(planilha[1:], start=2))
+        )
+    etapas["validacao_linhas"] = resumir_etapa(duracoes, total, quantidade - len(linhas_validas))
+
+    reiniciar_pico_rss()
+    registros, duracoes, total = cronometrar_fluxo(acesso_api_google.gerar_registros_json(cabecalhos, linhas_validas))
+    etapas["mapeamento_json"] = resumir_etapa(duracoes, total, 0)
+
+    criacao_rps.PASTA_SAIDA_XML = os.path.join(pasta, f"gerados_{quantidade}")
+    os.makedirs(criacao_rps.PASTA_SAIDA_XML)
+    reiniciar_pico_rss()
+    nomes, duracoes, total, falhas = cronometrar_por_documento(
+        lambda dados_nfse: criacao_rps.gerar_xml_nfse(dados_nfse)[1], registros
+    )
+    etapas["geracao_xml"] = resumir_etapa(duracoes, total, falhas)
+    caminhos = [os.path.join(criacao_rps.PASTA_SAIDA_XML, nome) for nome in nomes if nome]
+
+    reiniciar_pico_rss()
+    validador = certifica_xml.carregar_schema_xsd(caminho_xsd)
+    validacoes, duracoes, total, falhas = cronometrar_por_documento(
+        lambda caminho: certifica_xml.validar_arquivo_xml_com_schema(caminho, validador)[0], caminhos
+    )
+    etapas["validacao_xsd"] = resumir_etapa(duracoes, total, falhas + validacoes.count(False))
+
+    sessao.pasta_saida = os.path.join(pasta, f"assinados_{quantidade}")
+    reiniciar_pico_rss()
+    _, duracoes, total, falhas = cronometrar_por_documento(
+        lambda caminho: certifica_xml.assinar_xml(caminho, sessao), caminhos
+    )
+    etapas["assinatura"] = resumir_etapa(duracoes, total, falhas)
+    return etapas, MEDICAO_POR_ETAPA if por_etapa else MEDICAO_POR_PROCESSO
+
+def medir_tamanho_em_processo(quantidade, pasta, caminho_xsd, caminho_pfx):
+    """Roda medir_tamanho em um processo novo, para o pico de memória não herdar os tamanhos anteriores."""
+    contexto = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=1, mp_context=contexto) as executor:
+        return executor.submit(_medir_tamanho_no_processo, quantidade, pasta, caminho_xsd, caminho_pfx).result()
+
+def _medir_tamanho_no_processo(quantidade, pasta, caminho_xsd, caminho_pfx):
+    sessao = certifica_xml.SessaoAssinatura(caminho_pfx, SENHA_PFX_DESCARTAVEL)
+    return medir_tamanho(quantidade, pasta, caminho_xsd, sessao)
+
+
+# --- COMPARAÇÃO --- #
+def comparar_com_referencia(resultado, referencia, tolerancia):
+    """Devolve as mensagens de regressão (vazão abaixo de (1 - tolerancia) x a referência)."""
+    regressoes = []
+    referencia_por_tamanho = {item["linhas"]: item["etapas"] for item in referencia["resultados"]}
+    for item in resultado["resultados"]:
+        etapas_referencia = referencia_por_tamanho.get(item["linhas"])
+        if etapas_referencia is None:
+            continue
+        for etapa, medida in item["etapas"].items():
+            base = etapas_referencia.get(etapa, {}).get("por_segundo")
+            atual = medida["por_segundo"]
+            if base and atual is not None and atual < base * (1 - tolerancia):
+                regressoes.append(
+                    f"{item['linhas']} linhas, {etapa}: {atual:.1f}/s contra {base:.1f}/s ({atual / base - 1:+.0%})"
+                )
+    return regressoes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--tamanhos", type=int, nargs="+", default=TAMANHOS_PADRAO)
+    parser.add_argument(
+        "--xsd",
+        default=None,
+        help=f"XSD usado na validação (padrão: {certifica_xml.CAMINHO_XSD}, se existir; senão um XSD permissivo)."
+    )
+    parser.add_argument("--saida", default=None, help="Arquivo para o JSON do resultado (padrão: só imprime).")
+    parser.add_argument("--comparar", default=None, help="JSON de uma execução anterior para comparar.")
+    parser.add_argument("--tolerancia", type=float, default=TOLERANCIA_PADRAO, help="Queda de vazão aceita (0.15 = 15%%).")
+    argumentos = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as pasta:
+        caminho_xsd = argumentos.xsd
+        if caminho_xsd is None:
+            caminho_xsd = certifica_xml.CAMINHO_XSD
+            if not os.path.exists(caminho_xsd):
+                caminho_xsd = os.path.join(pasta, "permissivo.xsd")
+                with open(caminho_xsd, "w", encoding="utf-8") as f:
+                    f.write(XSD_PERMISSIVO)
+
+        caminho_pfx = gerar_pfx_descartavel(os.path.join(pasta, "descartavel.pfx"))
+
+        resultado = {
+            "data": datetime.datetime.now().isoformat(timespec="seconds"),
+            "ambiente": {
+                "python": platform.python_version(),
+                "plataforma": platform.platform(),
+                "cpus": os.cpu_count(),
+            },
+            "xsd": os.path.basename(caminho_xsd),
+            "medicao_memoria": None,
+            "resultados": [],
+        }
+        for quantidade in argumentos.tamanhos:
+            etapas, resultado["medicao_memoria"] = medir_tamanho_em_processo(quantidade, pasta, caminho_xsd, caminho_pfx)
+            resultado["resultados"].append({"linhas": quantidade, "etapas": etapas})
+            for etapa in ETAPAS:
+                medida = etapas[etapa]
+                print(
+                    f"{quantidade:>7} | {etapa:>16} | {medida['por_segundo'] or 0:10.1f}/s | "
+                    f"p50 {medida['p50_ms'] or 0:8.3f}ms | p99 {medida['p99_ms'] or 0:8.3f}ms | "
+                    f"RSS {medida['pico_rss_kb'] / 1024:7.1f} MB | falhas {medida['falhas']}",
+                    file=sys.stderr
+                )
+
+    conteudo = json.dumps(resultado, ensure_ascii=False, indent=2)
+    if argumentos.saida:
+        with open(argumentos.saida, "w", encoding="utf-8") as f:
+            f.write(conteudo)
+    else:
+        print(conteudo)
+
+    if argumentos.comparar:
+        with open(argumentos.comparar, "r", encoding="utf-8") as f:
+            regressoes = comparar_com_referencia(resultado, json.load(f), argumentos.tolerancia)
+        for mensagem in regressoes:
+            print(f"[REGRESSÃO] {mensagem}", file=sys.stderr)
+        if regressoes:
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
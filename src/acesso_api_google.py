@@ -1,19 +1,49 @@
 import os.path
 import re
 import json
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
-from googleapiclient.errors import HttpError
+import hashlib
+import argparse
+import random
+import time
+from functools import lru_cache
+from itertools import islice
+from operator import itemgetter
+
+import instrumentacao
+# As bibliotecas do Google e validacao_colunar (numpy) são importadas só nas funções que as usam
 
 
 ESCOPO_AUTORIZACAO = ["https://www.googleapis.com/auth/spreadsheets.readonly"]
 ROTA_ARQUIVO_ID_PLANILHA = "acesso_servidor_ftp/id_planilha.txt"
 ROTA_ARQUIVO_CREDENCIAIS = "acesso_servidor_ftp/client_google_api.json"
 ROTA_TOKEN = "acesso_servidor_ftp/token.json"
+ROTA_DOCUMENTO_DESCOBERTA = "acesso_servidor_ftp/descoberta_sheets_v4.json"
 DADOS_PLANILHA_SELECIONADOS = "emitirNFSe!A1:AP20000"
 CAMINHO_JSON_FINAL = "acesso_servidor_ftp/dados_gerar_rps.json"
+CAMINHO_NDJSON_FINAL = "acesso_servidor_ftp/dados_gerar_rps.ndjson"
+SUFIXO_NDJSON_CONCLUIDO = ".concluido"
+ROTA_ESTADO_SINCRONIZACAO = "acesso_servidor_ftp/estado_sincronizacao.json"
+# Estado da última leitura, só confirmado depois que a etapa seguinte consome o NDJSON
+SUFIXO_ESTADO_PENDENTE = ".pendente"
+ROTA_INDICE_IDENTIFICADORES = "acesso_servidor_ftp/indice_identificadores.json"
+PADRAO_CARACTERES_INVALIDOS_ID = re.compile(r'[^a-zA-Z0-9]')
+# Campos que identificam um RPS independentemente da posição da linha na planilha
+CABECALHOS_CHAVE_REGISTRO = ("CNPJ do Prestador", "Número do RPS", "Série do RPS")
+
+# --- LEITURA EM BLOCOS (batchGet) --- #
+ABA_PLANILHA = "emitirNFSe"
+COLUNA_INICIAL = "A"
+COLUNA_FINAL = "AP"
+LINHA_LIMITE_PLANILHA = 20000
+TAMANHO_BLOCO_LINHAS = 1000
+BLOCOS_POR_REQUISICAO = 2
+TENTATIVAS_MAXIMAS_API = 5
+ESPERA_INICIAL_SEGUNDOS = 1.0
+STATUS_HTTP_REPETIVEIS = {429, 500, 502, 503, 504}
+
+# --- VALIDAÇÃO DAS LINHAS --- #
+MAXIMO_CAMPOS_VAZIOS = 5
+TAMANHO_BLOCO_VALIDACAO = 1000
 
 
 
@@ -30,6 +60,54 @@ def padrao_vazio(valor):
 
 
 
+# --- MAPEAMENTO PLANILHA -> JSON --- #
+# (cabeçalho na planilha, chave no JSON, normalizador). A ordem define a ordem das chaves no JSON.
+MAPEAMENTO_CAMPOS = (
+    ("Número do Lote",                   "numero_lote", padrao_vazio),
+    ("CNPJ do Prestador",                "cnpj_prestador", padrao_vazio),
+    ("Inscrição Municipal do Prestador", "inscricao_municipal_prestador", padrao_vazio),
+    ("Quantidade de RPS",                "qntd_rps", padrao_vazio),
+    ("Número do RPS",                    "numero_rps", padrao_vazio),
+    ("Série do RPS",                     "serie_rps", padrao_vazio),
+    ("Tipo de RPS",                      "tipo_rps", padrao_vazio),
+    ("Data de Emissão",                  "data_hora_emissao", padrao_vazio),
+    ("Natureza da Operação",             "natureza_operacao", padrao_vazio),
+    ("Regime Especial de Tributação",    "regime_especial_tributacao", padrao_vazio),
+    ("Optante Simples Nacional",         "optante_simples_nacional", padrao_vazio),
+    ("Incentivador Cultural",            "incentivador_cultural", padrao_vazio),
+    ("Status",                           "status", padrao_vazio),
+    ("Valor dos Serviços",               "valor_servicos", padrao_vazio),
+    ("Valor das Deduções",               "valor_deducoes", padrao_vazio),
+    ("Valor PIS",                        "valor_pis", padrao_vazio),
+    ("Valor Cofins",                     "valor_cofins", padrao_vazio),
+    ("Valor INSS",                       "valor_inss", padrao_vazio),
+    ("Valor IR",                         "valor_ir", padrao_vazio),
+    ("Valor CSLL",                       "valor_csll", padrao_vazio),
+    ("ISS Retido",                       "iss_retido", padrao_vazio),
+    ("Valor ISS",                        "valor_iss", padrao_vazio),
+    ("Valor ISS Retido",                 "valor_iss_retido", padrao_vazio),
+    ("Outras Retenções",                 "outras_retencoes", padrao_vazio),
+    ("Base de Cálculo",                  "base_calculo", padrao_vazio),
+    ("Alíquota",                         "aliquota", padrao_vazio),
+    ("Valor Líquido da NFS-e",           "valor_liquido_nfse", padrao_vazio),
+    ("Desconto Incondicionado",          "desconto_incondicionado", padrao_vazio),
+    ("Desconto Condicionado",            "desconto_condicionado", padrao_vazio),
+    ("Item Lista de Serviço",            "item_lista_servicos", padrao_vazio),
+    ("Discriminação",                    "discriminacao", padrao_vazio),
+    ("Código do Município do Serviço",   "cod_municipio_servico", padrao_vazio),
+    ("CNPJ do Tomador",                  "cnpj_tomador", padrao_vazio),
+    ("Razão Social do Tomador",          "razao_social_tomador", padrao_vazio),
+    ("Endereço do Tomador",              "endereco_tomador", padrao_vazio),
+    ("Número",                           "numero", padrao_vazio),
+    ("Complemento",                      "complemento", padrao_vazio),
+    ("Bairro",                           "bairro", padrao_vazio),
+    ("Código do Município do Tomador",   "cod_municipio_tomador", padrao_vazio),
+    ("UF",                               "uf", padrao_vazio),
+    ("CEP",                              "cep", padrao_vazio),
+    ("Email do Tomador",                 "email_tomador", padrao_vazio),
+)
+
+
 def carregar_id_planilha():
     try:
         with open(ROTA_ARQUIVO_ID_PLANILHA, "r") as arquivo_id:
@@ -40,22 +118,37 @@ def carregar_id_planilha():
             else:
                 raise ValueError("Formato inválido no arquivo id_planilha.txt")
     except Exception as erro:
-        print(f"Erro ao carregar o ID da planilha: {erro}")
+        instrumentacao.informar("erro_id_planilha", f"Erro ao carregar o ID da planilha: {erro}")
         return None
 
 
 
 
-def acessar_planilha_google_sheets():
-    credenciais = None
+# --- AUTORIZAÇÃO E SERVIÇO DO SHEETS --- #
+# Mantidos em memória: em um processo de longa duração (main.py observar), as leituras
+# seguintes não releem o token nem remontam o serviço
+_credenciais = None
+_servico_planilhas = None
+
 
-    if os.path.exists(ROTA_TOKEN):
+def obter_credenciais():
+    """
+    Credenciais OAuth do token em ROTA_TOKEN. Só renova (ou pede nova autorização no navegador)
+    quando o token não vale mais, e nesse caso grava o token novo para as próximas execuções.
+    """
+    global _credenciais
+    credenciais = _credenciais
+
+    if credenciais is None and os.path.exists(ROTA_TOKEN):
+        from google.oauth2.credentials import Credentials
         credenciais = Credentials.from_authorized_user_file(ROTA_TOKEN, ESCOPO_AUTORIZACAO)
 
     if not credenciais or not credenciais.valid:
         if credenciais and credenciais.expired and credenciais.refresh_token:
+            from google.auth.transport.requests import Request
             credenciais.refresh(Request())
         else:
+            from google_auth_oauthlib.flow import InstalledAppFlow
             fluxo_autenticacao = InstalledAppFlow.from_client_secrets_file(
                 ROTA_ARQUIVO_CREDENCIAIS, ESCOPO_AUTORIZACAO
             )
@@ -64,8 +157,53 @@ def acessar_planilha_google_sheets():
         with open(ROTA_TOKEN, "w") as arquivo_token:
             arquivo_token.write(credenciais.to_json())
 
+    _credenciais = credenciais
+    return credenciais
+
+
+def carregar_documento_descoberta(caminho=ROTA_DOCUMENTO_DESCOBERTA):
+    """
+    Documento de descoberta do Sheets v4 guardado em disco; na primeira vez é copiado do que
+    acompanha o googleapiclient. None se não houver cópia nem documento local.
+    """
+    if os.path.exists(caminho):
+        with open(caminho, "r", encoding="utf-8") as arquivo:
+            return arquivo.read()
     try:
-        servico_planilhas = build('sheets', 'v4', credentials=credenciais)
+        from googleapiclient.discovery_cache import get_static_doc
+    except ImportError:  # googleapiclient 1.x: o documento vem da rede
+        return None
+    documento = get_static_doc("sheets", "v4")
+    if documento:
+        with open(caminho + ".tmp", "w", encoding="utf-8") as arquivo:
+            arquivo.write(documento)
+        os.replace(caminho + ".tmp", caminho)
+    return documento
+
+
+def construir_servico_planilhas(caminho_descoberta=ROTA_DOCUMENTO_DESCOBERTA):
+    from googleapiclient.discovery import build, build_from_document
+
+    documento = carregar_documento_descoberta(caminho_descoberta)
+    if documento:
+        return build_from_document(documento, credentials=obter_credenciais())
+    return build('sheets', 'v4', credentials=obter_credenciais())
+
+
+def obter_servico_planilhas():
+    """Serviço do Sheets montado uma vez por processo; renova o token se ele tiver expirado."""
+    global _servico_planilhas
+    obter_credenciais()
+    if _servico_planilhas is None:
+        _servico_planilhas = construir_servico_planilhas()
+    return _servico_planilhas
+
+
+def acessar_planilha_google_sheets():
+    from googleapiclient.errors import HttpError
+
+    try:
+        servico_planilhas = obter_servico_planilhas()
         planilha = servico_planilhas.spreadsheets()
 
         id_planilha = carregar_id_planilha()
@@ -79,41 +217,201 @@ def acessar_planilha_google_sheets():
             dados_planilha = resultado.get('values', [])
 
             if not dados_planilha:
-                print("Nenhum dado encontrado na planilha.")
+                instrumentacao.informar("planilha_vazia", "Nenhum dado encontrado na planilha.")
                 return []
 
-            print("Leitura da planilha concluída com sucesso.")
+            instrumentacao.informar("leitura_planilha", "Leitura da planilha concluída com sucesso.")
             return dados_planilha
 
         else:
-            print("Não foi possível carregar o ID da planilha.")
+            instrumentacao.informar("erro_id_planilha", "Não foi possível carregar o ID da planilha.")
             return []
 
     except HttpError as erro:
-        print(f"Ocorreu um erro ao acessar a API do Google Sheets: {erro}")
+        instrumentacao.informar("erro_api_sheets", f"Ocorreu um erro ao acessar a API do Google Sheets: {erro}")
         return []
 
 
+def status_http_erro(erro):
+    status = getattr(erro, "status_code", None)
+    if status is None and getattr(erro, "resp", None) is not None:
+        status = erro.resp.status
+    try:
+        return int(status)
+    except (TypeError, ValueError):
+        return None
+
+
+def executar_com_backoff(requisicao, tentativas=TENTATIVAS_MAXIMAS_API,
+                         espera_inicial=ESPERA_INICIAL_SEGUNDOS, dormir=time.sleep):
+    """
+    Executa uma requisição da API repetindo em caso de 429/5xx, com espera exponencial
+    (1s, 2s, 4s, ...) mais um pequeno valor aleatório. Outros erros são propagados.
+    """
+    from googleapiclient.errors import HttpError
+
+    for tentativa in range(tentativas):
+        try:
+            return requisicao.execute()
+        except HttpError as erro:
+            status = status_http_erro(erro)
+            if status not in STATUS_HTTP_REPETIVEIS or tentativa == tentativas - 1:
+                raise
+            espera = espera_inicial * (2 ** tentativa) + random.uniform(0, espera_inicial)
+            instrumentacao.mensagem(
+                "api_nova_tentativa",
+                f"[API] Status {status}, nova tentativa em {espera:.1f}s ({tentativa + 1}/{tentativas}).",
+                status=status, espera=round(espera, 1)
+            )
+            dormir(espera)
+
+
+def intervalo_linhas(linha_inicial, linha_final):
+    return f"{ABA_PLANILHA}!{COLUNA_INICIAL}{linha_inicial}:{COLUNA_FINAL}{linha_final}"
+
+
+def contar_linhas_aba(servico_planilhas, id_planilha, dormir=time.sleep):
+    """Quantidade de linhas da aba ABA_PLANILHA segundo gridProperties.rowCount (None se não houver)."""
+    resposta = executar_com_backoff(
+        servico_planilhas.spreadsheets().get(
+            spreadsheetId=id_planilha, fields="sheets.properties(title,gridProperties.rowCount)"
+        ),
+        dormir=dormir
+    )
+    for aba in resposta.get("sheets", []):
+        propriedades = aba.get("properties", {})
+        if propriedades.get("title") == ABA_PLANILHA:
+            return propriedades.get("gridProperties", {}).get("rowCount")
+    return None
+
+
+def ler_planilha_em_blocos(servico_planilhas, id_planilha, tamanho_bloco=TAMANHO_BLOCO_LINHAS,
+                           blocos_por_requisicao=BLOCOS_POR_REQUISICAO,
+                           linha_limite=LINHA_LIMITE_PLANILHA, dormir=time.sleep):
+    """
+    Lê a planilha em janelas de `tamanho_bloco` linhas usando values().batchGet e
+    entrega uma linha por vez como (numero_linha, linha). A primeira linha entregue é o cabeçalho.
+    Apenas as janelas da requisição atual ficam em memória.
+    A leitura vai até a última linha da aba (gridProperties.rowCount) ou até `linha_limite`;
+    janelas vazias no meio da planilha são puladas, não encerram a leitura.
+    """
+    ultima_linha = linha_limite
+    linhas_aba = contar_linhas_aba(servico_planilhas, id_planilha, dormir=dormir)
+    if linhas_aba is None:
+        instrumentacao.mensagem(
+            "aba_sem_tamanho",
+            f"[ATENÇÃO] Tamanho da aba {ABA_PLANILHA} não encontrado; lendo até a linha {linha_limite}.",
+            linha_limite=linha_limite
+        )
+    elif linhas_aba > linha_limite:
+        instrumentacao.mensagem(
+            "aba_acima_do_limite",
+            f"[ATENÇÃO] A aba {ABA_PLANILHA} tem {linhas_aba} linhas; só as {linha_limite} primeiras serão lidas.",
+            linhas_aba=linhas_aba, linha_limite=linha_limite
+        )
+    else:
+        ultima_linha = linhas_aba
+
+    valores_api = servico_planilhas.spreadsheets().values()
+    linha_inicial = 1
+
+    while linha_inicial <= ultima_linha:
+        intervalos = []
+        inicio_janela = linha_inicial
+        for _ in range(blocos_por_requisicao):
+            if inicio_janela > ultima_linha:
+                break
+            fim_janela = min(inicio_janela + tamanho_bloco - 1, ultima_linha)
+            intervalos.append((inicio_janela, fim_janela))
+            inicio_janela = fim_janela + 1
+
+        resposta = executar_com_backoff(
+            valores_api.batchGet(
+                spreadsheetId=id_planilha,
+                ranges=[intervalo_linhas(inicio, fim) for inicio, fim in intervalos],
+                majorDimension="ROWS"
+            ),
+            dormir=dormir
+        )
+
+        for (inicio, _), intervalo_valores in zip(intervalos, resposta.get("valueRanges", [])):
+            linhas = intervalo_valores.get("values", [])
+            for deslocamento, linha in enumerate(linhas):
+                yield inicio + deslocamento, linha
+
+        linha_inicial = inicio_janela
+
+
+def filtrar_linhas_validas_em_fluxo(cabecalhos, linhas_numeradas, tamanho_bloco=TAMANHO_BLOCO_VALIDACAO):
+    """
+    Aplica as mesmas regras de verificacao_existencia_registro a um fluxo de (numero_linha, linha),
+    devolvendo as linhas válidas conforme chegam. As linhas são conferidas em blocos de
+    `tamanho_bloco` por validacao_colunar, que também descarta as linhas com valores, data de
+    emissão ou totais inconsistentes e reescreve os valores em pt-BR com ponto decimal.
+    """
+    import validacao_colunar
+
+    indice_por_cabecalho = {cabecalho: indice for indice, cabecalho in enumerate(cabecalhos)}
+    colunas_por_chave = {
+        chave: indice_por_cabecalho[cabecalho]
+        for cabecalho, chave, _ in MAPEAMENTO_CAMPOS if cabecalho in indice_por_cabecalho
+    }
+    linhas_numeradas = iter(linhas_numeradas)
+    while True:
+        bloco = list(islice(linhas_numeradas, tamanho_bloco))
+        if not bloco:
+            return
+        instrumentacao.contar("linhas_lidas", len(bloco))
+        for validada in validacao_colunar.validar_bloco(cabecalhos, bloco, colunas_por_chave):
+            if len(validada.campos_vazios) > MAXIMO_CAMPOS_VAZIOS:
+                avisar_linha_ignorada(validada.numero_linha, len(validada.campos_vazios))
+                continue
+            if validada.erros:
+                instrumentacao.mensagem(
+                    "linha_invalida",
+                    f"[INVÁLIDO] Linha {validada.numero_linha} ignorada: {'; '.join(validada.erros)}",
+                    linha=validada.numero_linha, erros=validada.erros
+                )
+                continue
+            if validada.campos_vazios:
+                avisar_campos_vazios(validada.numero_linha, validada.campos_vazios)
+            yield validada.numero_linha, validada.linha
+
+
 def verificacao_existencia_registro(lista_dados_planilha):
     """
     Verifica a existência dos dados antes da geração do JSON.
     Retorna apenas as linhas consideradas válidas.
     """
     cabecalhos = lista_dados_planilha[0]
-    linhas_validas = []
+    linhas_validas = [
+        linha for _, linha in filtrar_linhas_validas_em_fluxo(
+            cabecalhos, enumerate(lista_dados_planilha[1:], start=2)
+        )
+    ]
+
+    return [cabecalhos] + linhas_validas
+
+def avisar_linha_ignorada(numero_linha, campos_vazios):
+    instrumentacao.mensagem(
+        "linha_ignorada",
+        f"[IGNORADO] Linha {numero_linha} ignorada (mais de {MAXIMO_CAMPOS_VAZIOS} campos vazios).",
+        linha=numero_linha, campos_vazios=campos_vazios
+    )
 
-    for indice_linha, linha in enumerate(lista_dados_planilha[1:]):
-        if alerta_dados_incompletos_planilha(linha, indice_linha, cabecalhos):
-            continue
-        nao_adiciona_json_dados_vazios(linha, indice_linha, cabecalhos)
-        linhas_validas.append(linha)
 
-    return [cabecalhos] + linhas_validas 
+def avisar_campos_vazios(numero_linha, campos_vazios):
+    instrumentacao.mensagem(
+        "linha_com_campos_vazios",
+        f"[ATENÇÃO] Linha {numero_linha} contém campos vazios: {', '.join(campos_vazios)}",
+        linha=numero_linha, campos=campos_vazios
+    )
+
 
 def alerta_dados_incompletos_planilha(linha, indice_linha, cabecalhos):
     campos_vazios = sum(1 for campo in linha if padrao_vazio(campo) == "")
-    if campos_vazios > 5:
-        print(f"[IGNORADO] Linha {indice_linha + 2} ignorada (mais de 5 campos vazios).")
+    if campos_vazios > MAXIMO_CAMPOS_VAZIOS:
+        avisar_linha_ignorada(indice_linha + 2, campos_vazios)
         return True
     return False
 
@@ -125,12 +423,186 @@ def nao_adiciona_json_dados_vazios(linha, indice_linha, cabecalhos):
         cabecalhos[i] for i, campo in enumerate(linha) if padrao_vazio(campo) == ""
     ]
     if campos_vazios:
-        print(f"[ATENÇÃO] Linha {indice_linha + 2} contém campos vazios: {', '.join(campos_vazios)}")
+        avisar_campos_vazios(indice_linha + 2, campos_vazios)
+
+
+def hash_linha_planilha(linha):
+    """
+    Gera o hash do conteúdo de uma linha, ignorando espaços e células vazias no final
+    (a API do Google Sheets omite as células vazias à direita).
+    """
+    valores = [str(padrao_vazio(campo)) for campo in linha]
+    while valores and valores[-1] == "":
+        valores.pop()
+    conteudo = json.dumps(valores, ensure_ascii=False)
+    return hashlib.sha256(conteudo.encode("utf-8")).hexdigest()
+
+
+def compilar_chave_registro(cabecalhos):
+    """
+    Retorna uma função (numero_linha, linha) -> chave estável do RPS: CNPJ do prestador,
+    número e série do RPS. Inserir ou remover linhas na planilha não muda a chave das demais.
+    Chaves repetidas recebem "#2", "#3"... na ordem em que aparecem; sem esses campos
+    preenchidos, a linha fica identificada pela posição ("linha:N").
+    """
+    indice_por_cabecalho = {cabecalho: indice for indice, cabecalho in enumerate(cabecalhos)}
+    indices = [indice_por_cabecalho.get(cabecalho) for cabecalho in CABECALHOS_CHAVE_REGISTRO]
+    ocorrencias = {}
+    if None in indices:
+        return lambda numero_linha, linha: f"linha:{numero_linha}"
+    seletor = itemgetter(*indices)
+    ultimo_indice = max(indices)
+
+    def chave_registro(numero_linha, linha):
+        # Sem as células finais, algum dos campos da chave está vazio
+        partes = [str(padrao_vazio(valor)) for valor in seletor(linha)] if len(linha) > ultimo_indice else ()
+        if not partes or not all(partes):
+            return f"linha:{numero_linha}"
+        chave = "|".join(partes)
+        ocorrencia = ocorrencias[chave] = ocorrencias.get(chave, 0) + 1
+        return chave if ocorrencia == 1 else f"{chave}#{ocorrencia}"
+
+    return chave_registro
+
+
+def carregar_estado_sincronizacao(caminho_estado=ROTA_ESTADO_SINCRONIZACAO):
+    # Estados antigos, com hashes por número de linha, não têm "hashes_registros": leitura completa
+    estado_vazio = {"hash_cabecalho": "", "ultima_linha": 1, "hashes_registros": {}}
+    if not os.path.exists(caminho_estado):
+        return estado_vazio
+    try:
+        with open(caminho_estado, "r", encoding="utf-8") as arquivo_estado:
+            estado = json.load(arquivo_estado)
+    except (OSError, ValueError) as erro:
+        instrumentacao.informar(
+            "erro_estado_sincronizacao",
+            f"Erro ao carregar o estado da sincronização, será feita leitura completa: {erro}"
+        )
+        return estado_vazio
+    for chave, valor in estado_vazio.items():
+        estado.setdefault(chave, valor)
+    return estado
+
+
+def salvar_json_atomico(dados, caminho):
+    caminho_temporario = f"{caminho}.tmp"
+    with open(caminho_temporario, "w", encoding="utf-8") as arquivo:
+        json.dump(dados, arquivo, ensure_ascii=False)
+    os.replace(caminho_temporario, caminho)
+
+
+def salvar_estado_sincronizacao(estado, caminho_estado=ROTA_ESTADO_SINCRONIZACAO):
+    salvar_json_atomico(estado, caminho_estado)
+
+
+def assinatura_arquivo(estatisticas):
+    """Identifica uma versão gravada de um arquivo (os.stat/os.fstat): inode, tamanho e modificação."""
+    return [estatisticas.st_ino, estatisticas.st_size, estatisticas.st_mtime_ns]
 
 
+def arquivo_sincronizacao_pendente(caminho_estado=ROTA_ESTADO_SINCRONIZACAO):
+    """Arquivo (NDJSON ou JSON) gravado pela leitura ainda não confirmada, ou None."""
+    caminho_pendente = caminho_estado + SUFIXO_ESTADO_PENDENTE
+    if not os.path.exists(caminho_pendente):
+        return None
+    try:
+        with open(caminho_pendente, "r", encoding="utf-8") as arquivo_estado:
+            return json.load(arquivo_estado).get("arquivo_gerado")
+    except (OSError, ValueError):
+        return None
+
+
+def confirmar_sincronizacao(caminho_estado=ROTA_ESTADO_SINCRONIZACAO, arquivo=None, assinatura=None):
+    """
+    Promove o estado pendente da última leitura a estado confirmado. Chamada pela etapa que
+    consome o NDJSON (pipeline, criacao_rps) quando termina sem falhas; até lá, as próximas
+    leituras continuam comparando com o estado anterior e regravam as mesmas linhas alteradas.
+    Com `arquivo`, só confirma se ele for o arquivo gravado por essa leitura e, com `assinatura`
+    (assinatura_arquivo do que foi lido), se a versão lida for a mesma; um arquivo antigo ou de
+    outro formato não marca a leitura como consumida.
+    Retorna True se o estado pendente foi confirmado.
+    """
+    caminho_pendente = caminho_estado + SUFIXO_ESTADO_PENDENTE
+    if not os.path.exists(caminho_pendente):
+        return False
+    if arquivo is not None:
+        try:
+            with open(caminho_pendente, "r", encoding="utf-8") as arquivo_estado:
+                pendente = json.load(arquivo_estado)
+        except (OSError, ValueError) as erro:
+            instrumentacao.informar(
+                "estado_pendente_ilegivel",
+                f"[ATENÇÃO] Estado pendente da sincronização ilegível, não confirmado: {erro}"
+            )
+            return False
+        # Estados pendentes gravados antes do registro do arquivo não têm como ser conferidos
+        if "arquivo_gerado" in pendente:
+            arquivo_gerado = pendente["arquivo_gerado"]
+            mesmo_arquivo = arquivo_gerado is not None and os.path.abspath(arquivo) == os.path.abspath(arquivo_gerado)
+            if not mesmo_arquivo or (assinatura is not None and assinatura != pendente.get("assinatura_arquivo")):
+                instrumentacao.informar(
+                    "sincronizacao_nao_confirmada",
+                    f"[ATENÇÃO] Sincronização não confirmada: {arquivo} não é o arquivo gravado pela última "
+                    f"leitura da planilha ({arquivo_gerado}); rode a etapa de novo sobre ele.",
+                    arquivo=arquivo
+                )
+                return False
+    os.replace(caminho_pendente, caminho_estado)
+    return True
+
+
+def filtrar_linhas_alteradas_em_fluxo(cabecalhos, linhas_numeradas, estado, novo_estado, chaves_registros=None):
+    """
+    Versão em fluxo de filtrar_linhas_alteradas: devolve (numero_linha, linha) apenas das
+    linhas novas/alteradas e preenche `novo_estado` conforme consome o fluxo.
+    Os hashes são guardados pela chave do RPS (compilar_chave_registro), não pela posição.
+    Com `chaves_registros`, a chave de cada linha entregue fica lá, por número da linha, para
+    gerar_registros_json: só aqui as linhas repetidas são contadas na planilha inteira.
+    """
+    hash_cabecalho = hash_linha_planilha(cabecalhos)
+    hashes_anteriores = estado.get("hashes_registros", {})
+    if hash_cabecalho != estado.get("hash_cabecalho"):
+        hashes_anteriores = {}
+
+    novos_hashes = {}
+    novo_estado.update(hash_cabecalho=hash_cabecalho, ultima_linha=1, hashes_registros=novos_hashes)
+    chave_registro = compilar_chave_registro(cabecalhos)
+
+    for numero_linha, linha in linhas_numeradas:
+        hash_atual = hash_linha_planilha(linha)
+        chave = chave_registro(numero_linha, linha)
+        novos_hashes[chave] = hash_atual
+        novo_estado["ultima_linha"] = numero_linha
+        if hashes_anteriores.get(chave) != hash_atual:
+            if chaves_registros is not None:
+                chaves_registros[numero_linha] = chave
+            yield numero_linha, linha
+        else:
+            instrumentacao.contar("linhas_sem_alteracao")
+
+
+def filtrar_linhas_alteradas(lista_dados_planilha, estado):
+    """
+    Compara cada linha da planilha com o hash salvo na última execução.
+    Retorna [cabecalhos] + linhas novas/alteradas e o novo estado a ser salvo.
+    Se o cabeçalho mudou, todas as linhas são consideradas alteradas.
+    """
+    cabecalhos = lista_dados_planilha[0]
+    novo_estado = {}
+    # numero_linha segue a numeração da planilha (linha 1 = cabeçalho)
+    linhas_alteradas = [
+        linha for _, linha in filtrar_linhas_alteradas_em_fluxo(
+            cabecalhos, enumerate(lista_dados_planilha[1:], start=2), estado, novo_estado
+        )
+    ]
+    return [cabecalhos] + linhas_alteradas, novo_estado
+
+
+@lru_cache(maxsize=4096)
 def atributo_identificador_unico(numero_lote, cnpj_prestador, inscricao_municipal_prestador):
+    # Muitas linhas compartilham lote/CNPJ/IM, por isso o resultado fica em cache
     texto_concatenado = f"{numero_lote}-{cnpj_prestador}-{inscricao_municipal_prestador}".lower()
-    texto_limpo = re.sub(r'[^a-zA-Z0-9]', '', texto_concatenado)
+    texto_limpo = PADRAO_CARACTERES_INVALIDOS_ID.sub('', texto_concatenado)
     return texto_limpo
 
 
@@ -144,92 +616,302 @@ def verificacao_atributo_identificador(identificador, lista_existente):
     return novo_identificador
 
 
+def novo_indice_identificadores():
+    return {"contadores": {}, "por_chave": {}}
+
+
+def carregar_indice_identificadores(caminho_indice=ROTA_INDICE_IDENTIFICADORES):
+    if not os.path.exists(caminho_indice):
+        return novo_indice_identificadores()
+    try:
+        with open(caminho_indice, "r", encoding="utf-8") as arquivo_indice:
+            indice = json.load(arquivo_indice)
+    except (OSError, ValueError) as erro:
+        instrumentacao.informar("erro_indice_identificadores", f"Erro ao carregar o índice de identificadores: {erro}")
+        raise
+    for chave, valor in novo_indice_identificadores().items():
+        indice.setdefault(chave, valor)
+    # Índices antigos guardavam o identificador pela posição da linha, que muda com inserções
+    indice.pop("por_linha", None)
+    return indice
+
+
+def salvar_indice_identificadores(indice, caminho_indice=ROTA_INDICE_IDENTIFICADORES):
+    salvar_json_atomico(indice, caminho_indice)
+
+
+def alocar_identificador(identificador_base, indice, chave_registro=None):
+    """
+    Equivalente a verificacao_atributo_identificador em O(1): cada base guarda quantos
+    identificadores já foram emitidos (base, base-2, base-3, ...). Como a base só tem
+    caracteres alfanuméricos, "base-N" nunca colide com outra base.
+    Com `chave_registro` (compilar_chave_registro), um RPS reprocessado com a mesma base
+    mantém o identificador da execução anterior, mesmo que tenha mudado de linha.
+    """
+    if chave_registro is not None:
+        anterior = indice["por_chave"].get(chave_registro)
+        if anterior is not None and anterior.split("-", 1)[0] == identificador_base:
+            return anterior
+
+    contador = indice["contadores"].get(identificador_base, 0) + 1
+    indice["contadores"][identificador_base] = contador
+    novo_identificador = identificador_base if contador == 1 else f"{identificador_base}-{contador}"
+
+    if chave_registro is not None:
+        indice["por_chave"][chave_registro] = novo_identificador
+    return novo_identificador
+
 
 
-def passagem_lista_json(lista_dados_planilha):
-    json_formatado = []
-    identificadores_gerados = set()
 
-   
+def compilar_mapeamento_campos(cabecalhos, mapeamento=MAPEAMENTO_CAMPOS):
+    """
+    Resolve o MAPEAMENTO_CAMPOS uma única vez para os índices das colunas da planilha atual
+    e retorna (chaves_json, transformador). O transformador recebe a linha crua e devolve
+    a tupla de valores já normalizados, na ordem de `chaves_json`.
+    Colunas ausentes são avisadas aqui, uma vez por execução, e produzem "".
+    """
+    # Como no dict(zip()) anterior, em cabeçalhos repetidos vale a última ocorrência
+    indice_por_cabecalho = {cabecalho: indice for indice, cabecalho in enumerate(cabecalhos)}
+    quantidade_colunas = len(cabecalhos)
+    # Posição acrescentada depois das colunas do cabeçalho, sempre "": é onde as colunas ausentes leem
+    indice_ausente = quantidade_colunas
+
+    colunas_ausentes = [cabecalho for cabecalho, _, _ in mapeamento if cabecalho not in indice_por_cabecalho]
+    if colunas_ausentes:
+        instrumentacao.mensagem(
+            "colunas_ausentes",
+            f"[ATENÇÃO] Colunas não encontradas na planilha (serão gravadas vazias): {', '.join(colunas_ausentes)}",
+            colunas=colunas_ausentes
+        )
+
+    chaves_json = tuple(chave for _, chave, _ in mapeamento)
+    normalizadores = tuple(normalizador for _, _, normalizador in mapeamento)
+    indices = [indice_por_cabecalho.get(cabecalho, indice_ausente) for cabecalho, _, _ in mapeamento]
+    seletor = itemgetter(*indices) if len(indices) > 1 else (lambda linha: (linha[indices[0]],))
+    # padrao_vazio("") == "": completar com "" dá o mesmo resultado que o None do .get()
+    preenchimento = ("",) * (quantidade_colunas + 1)
+
+    normalizador_unico = normalizadores[0] if len(set(normalizadores)) == 1 else None
+
+    def transformar_linha(linha):
+        # A API omite as células vazias no fim da linha. Com colunas ausentes, as células além do
+        # cabeçalho (títulos em branco no fim) são cortadas para não ocuparem a posição de preenchimento.
+        if colunas_ausentes or len(linha) < quantidade_colunas:
+            linha = [*linha[:quantidade_colunas], *preenchimento[min(len(linha), quantidade_colunas):]]
+        if normalizador_unico is not None:
+            return tuple(map(normalizador_unico, seletor(linha)))
+        return tuple(normalizar(valor) for normalizar, valor in zip(normalizadores, seletor(linha)))
+
+    return chaves_json, transformar_linha
+
+
+def gerar_registros_json(cabecalhos, linhas_numeradas, indice_identificadores=None, chaves_registros=None):
+    """
+    Converte as linhas (numero_linha, linha) da planilha nos registros de RPS, um por vez.
+    Sem `indice_identificadores`, os identificadores são numerados do zero nesta chamada.
+    `chaves_registros` vem de filtrar_linhas_alteradas_em_fluxo quando o fluxo já passou por
+    ele; sem isso, as chaves são calculadas aqui, sobre as linhas recebidas.
+    """
+    if indice_identificadores is None:
+        indice_identificadores = novo_indice_identificadores()
+    chaves_json, transformar_linha = compilar_mapeamento_campos(cabecalhos)
+    chave_registro = compilar_chave_registro(cabecalhos) if chaves_registros is None else None
+
+    for numero_linha, linha in linhas_numeradas:
+        if chave_registro is not None:
+            chave = chave_registro(numero_linha, linha)
+        else:
+            chave = chaves_registros.pop(numero_linha)
+        valores = transformar_linha(linha)
+        # numero_lote, cnpj_prestador e inscricao_municipal_prestador são os três primeiros campos
+        identificador_base = atributo_identificador_unico(*valores[:3])
+        identificador_unico = alocar_identificador(identificador_base, indice_identificadores, chave)
+
+        estrutura_json = {"id": identificador_unico}
+        estrutura_json.update(zip(chaves_json, valores))
+
+        yield estrutura_json
+
+
+def passagem_lista_json(lista_dados_planilha):
+    """
+    Exporta todos os registros em um único JSON indentado (CAMINHO_JSON_FINAL).
+    """
     cabecalhos = lista_dados_planilha[0]
+    json_formatado = list(gerar_registros_json(cabecalhos, enumerate(lista_dados_planilha[1:], start=2)))
+    exportar_json_indentado(json_formatado)
+    return json_formatado
 
-    for linha in lista_dados_planilha[1:]:
-        dados_linha = dict(zip(cabecalhos, linha))
-
-        numero_lote = padrao_vazio(dados_linha.get("Número do Lote"))
-        cnpj_prestador = padrao_vazio(dados_linha.get("CNPJ do Prestador"))
-        inscricao_municipal_prestador = padrao_vazio(dados_linha.get("Inscrição Municipal do Prestador"))
-
-        identificador_base = atributo_identificador_unico(numero_lote, cnpj_prestador, inscricao_municipal_prestador)
-        identificador_unico = verificacao_atributo_identificador(identificador_base, identificadores_gerados)
-        identificadores_gerados.add(identificador_unico)
-
-        estrutura_json = {
-            "id": identificador_unico,
-            "numero_lote": numero_lote,
-            "cnpj_prestador": cnpj_prestador,
-            "inscricao_municipal_prestador": padrao_vazio(dados_linha.get("Inscrição Municipal do Prestador")),
-            "qntd_rps": padrao_vazio(dados_linha.get("Quantidade de RPS")),
-            "numero_rps": padrao_vazio(dados_linha.get("Número do RPS")),
-            "serie_rps": padrao_vazio(dados_linha.get("Série do RPS")),
-            "tipo_rps": padrao_vazio(dados_linha.get("Tipo de RPS")),
-            "data_hora_emissao": padrao_vazio(dados_linha.get("Data de Emissão")),
-            "natureza_operacao": padrao_vazio(dados_linha.get("Natureza da Operação")),
-            "regime_especial_tributacao": padrao_vazio(dados_linha.get("Regime Especial de Tributação")),
-            "optante_simples_nacional": padrao_vazio(dados_linha.get("Optante Simples Nacional")),
-            "incentivador_cultural": padrao_vazio(dados_linha.get("Incentivador Cultural")),
-            "status": padrao_vazio(dados_linha.get("Status")),
-            "valor_servicos": padrao_vazio(dados_linha.get("Valor dos Serviços")),
-            "valor_deducoes": padrao_vazio(dados_linha.get("Valor das Deduções")),
-            "valor_pis": padrao_vazio(dados_linha.get("Valor PIS")),
-            "valor_cofins": padrao_vazio(dados_linha.get("Valor Cofins")),
-            "valor_inss": padrao_vazio(dados_linha.get("Valor INSS")),
-            "valor_ir": padrao_vazio(dados_linha.get("Valor IR")),
-            "valor_csll": padrao_vazio(dados_linha.get("Valor CSLL")),
-            "iss_retido": padrao_vazio(dados_linha.get("ISS Retido")),
-            "valor_iss": padrao_vazio(dados_linha.get("Valor ISS")),
-            "valor_iss_retido": padrao_vazio(dados_linha.get("Valor ISS Retido")),
-            "outras_retencoes": padrao_vazio(dados_linha.get("Outras Retenções")),
-            "base_calculo": padrao_vazio(dados_linha.get("Base de Cálculo")),
-            "aliquota": padrao_vazio(dados_linha.get("Alíquota")),
-            "valor_liquido_nfse": padrao_vazio(dados_linha.get("Valor Líquido da NFS-e")),
-            "desconto_incondicionado": padrao_vazio(dados_linha.get("Desconto Incondicionado")),
-            "desconto_condicionado": padrao_vazio(dados_linha.get("Desconto Condicionado")),
-            "item_lista_servicos": padrao_vazio(dados_linha.get("Item Lista de Serviço")),
-            "discriminacao": padrao_vazio(dados_linha.get("Discriminação")),
-            "cod_municipio_servico": padrao_vazio(dados_linha.get("Código do Município do Serviço")),
-            "cnpj_tomador": padrao_vazio(dados_linha.get("CNPJ do Tomador")),
-            "razao_social_tomador": padrao_vazio(dados_linha.get("Razão Social do Tomador")),
-            "endereco_tomador": padrao_vazio(dados_linha.get("Endereço do Tomador")),
-            "numero": padrao_vazio(dados_linha.get("Número")),
-            "complemento": padrao_vazio(dados_linha.get("Complemento")),
-            "bairro": padrao_vazio(dados_linha.get("Bairro")),
-            "cod_municipio_tomador": padrao_vazio(dados_linha.get("Código do Município do Tomador")),
-            "uf": padrao_vazio(dados_linha.get("UF")),
-            "cep": padrao_vazio(dados_linha.get("CEP")),
-            "email_tomador": padrao_vazio(dados_linha.get("Email do Tomador"))
-        }
-
-        json_formatado.append(estrutura_json)
 
+def exportar_json_indentado(json_formatado, caminho_json=CAMINHO_JSON_FINAL):
     try:
-        with open(CAMINHO_JSON_FINAL, "w", encoding="utf-8") as arquivo_json:
+        with open(caminho_json, "w", encoding="utf-8") as arquivo_json:
             json.dump(json_formatado, arquivo_json, indent=4, ensure_ascii=False)
-            print(f"Arquivo JSON salvo com sucesso em: {CAMINHO_JSON_FINAL}")
+            instrumentacao.informar(
+                "json_salvo",
+                f"Arquivo JSON salvo com sucesso em: {caminho_json}",
+                arquivo=caminho_json
+            )
     except Exception as erro:
-        print(f"Erro ao salvar o JSON: {erro}")
+        instrumentacao.informar("erro_json", f"Erro ao salvar o JSON: {erro}")
 
-    return json_formatado
 
+def marcar_ndjson_concluido(caminho_ndjson=CAMINHO_NDJSON_FINAL):
+    """
+    Cria o marcador `<arquivo>.concluido` com a assinatura_arquivo do NDJSON gravado: o leitor
+    que acompanha o arquivo só encerra com o marcador da versão que ele está lendo.
+    """
+    assinatura = assinatura_arquivo(os.stat(caminho_ndjson)) if os.path.exists(caminho_ndjson) else None
+    salvar_json_atomico(assinatura, caminho_ndjson + SUFIXO_NDJSON_CONCLUIDO)
 
 
-if __name__ == "__main__":
-    dados_planilha = acessar_planilha_google_sheets()
-    if dados_planilha:
-        dados_filtrados = verificacao_existencia_registro(dados_planilha)
-        if len(dados_filtrados) > 1:
-            passagem_lista_json(dados_filtrados)
-        else:
-            print("Nenhuma linha válida encontrada para gerar o JSON.")
+def passagem_fluxo_ndjson(cabecalhos, linhas_numeradas, caminho_ndjson=CAMINHO_NDJSON_FINAL,
+                          indice_identificadores=None, chaves_registros=None, marcar_concluido=True):
+    """
+    Grava um registro de RPS por linha (NDJSON) conforme as linhas chegam, sem acumular a lista.
+    Cada linha é descarregada no disco imediatamente, então criacao_rps pode ler o arquivo
+    enquanto ele ainda está sendo escrito. Ao terminar, cria o marcador `<arquivo>.concluido`
+    (com `marcar_concluido=False`, quem chamou cria depois, com marcar_ndjson_concluido).
+    O marcador anterior é removido antes de o arquivo ser truncado.
+    Retorna a quantidade de registros gravados.
+    """
+    caminho_concluido = caminho_ndjson + SUFIXO_NDJSON_CONCLUIDO
+    if os.path.exists(caminho_concluido):
+        os.remove(caminho_concluido)
+
+    quantidade = 0
+    try:
+        with open(caminho_ndjson, "w", encoding="utf-8") as arquivo_ndjson:
+            for registro in gerar_registros_json(cabecalhos, linhas_numeradas, indice_identificadores, chaves_registros):
+                arquivo_ndjson.write(json.dumps(registro, ensure_ascii=False) + "\n")
+                arquivo_ndjson.flush()
+                quantidade += 1
+    except OSError as erro:
+        instrumentacao.informar("erro_ndjson", f"Erro ao salvar o NDJSON: {erro}", arquivo=caminho_ndjson)
+        return quantidade
+    finally:
+        # O marcador também é criado em caso de falha para o leitor não ficar aguardando
+        if marcar_concluido:
+            marcar_ndjson_concluido(caminho_ndjson)
+
+    instrumentacao.informar(
+        "ndjson_salvo",
+        f"Arquivo NDJSON salvo com sucesso em: {caminho_ndjson} ({quantidade} registro(s))",
+        arquivo=caminho_ndjson, registros=quantidade
+    )
+    return quantidade
+
+
+
+def sincronizar_planilha(servico_planilhas, id_planilha, full=False, formato="ndjson",
+                         tamanho_bloco=TAMANHO_BLOCO_LINHAS):
+    """
+    Lê a planilha em blocos e grava os registros das linhas novas ou alteradas (todas, com
+    `full`) no NDJSON, ou no JSON indentado com formato="json". O novo estado fica pendente
+    até a etapa seguinte chamar confirmar_sincronizacao: se ela não rodar, a próxima leitura
+    grava de novo as mesmas alterações, em vez de perdê-las. Atualiza o índice de
+    identificadores. Retorna a quantidade de registros gravados.
+    Os erros da API (HttpError) seguem para quem chamou.
+    """
+    fluxo_planilha = ler_planilha_em_blocos(servico_planilhas, id_planilha, tamanho_bloco=tamanho_bloco)
+    _, cabecalhos = next(fluxo_planilha, (None, None))
+    if not cabecalhos:
+        instrumentacao.informar("planilha_vazia", "Nenhum dado encontrado na planilha.")
+        return 0
+
+    estado = {} if full else carregar_estado_sincronizacao()
+    # Na execução completa os identificadores recomeçam, como no esquema original
+    indice_identificadores = novo_indice_identificadores() if full else carregar_indice_identificadores()
+    novo_estado = {}
+    chaves_registros = {}
+    fluxo_alterado = filtrar_linhas_alteradas_em_fluxo(
+        cabecalhos, fluxo_planilha, estado, novo_estado, chaves_registros
+    )
+    fluxo_valido = filtrar_linhas_validas_em_fluxo(cabecalhos, fluxo_alterado)
+
+    arquivo_gerado = None
+    try:
+        with instrumentacao.etapa("leitura_planilha") as medicao:
+            if formato == "ndjson":
+                quantidade = passagem_fluxo_ndjson(
+                    cabecalhos, fluxo_valido, indice_identificadores=indice_identificadores,
+                    chaves_registros=chaves_registros, marcar_concluido=False
+                )
+                arquivo_gerado = CAMINHO_NDJSON_FINAL
+            else:
+                json_formatado = list(gerar_registros_json(
+                    cabecalhos, fluxo_valido, indice_identificadores, chaves_registros
+                ))
+                quantidade = len(json_formatado)
+                if json_formatado or not full:
+                    # Sem linhas, grava lista vazia para a etapa seguinte não reprocessar a execução anterior
+                    exportar_json_indentado(json_formatado)
+                    arquivo_gerado = CAMINHO_JSON_FINAL
+            medicao.itens = quantidade
+
+        if not quantidade:
+            instrumentacao.informar("sem_linhas_validas", "Nenhuma linha válida encontrada para gerar o JSON.")
+        elif not full:
+            instrumentacao.informar(
+                "sincronizacao_incremental",
+                f"Sincronização incremental: {quantidade} linha(s) válida(s) nova(s) ou alterada(s).",
+                linhas=quantidade
+            )
+
+        # O estado pendente guarda qual arquivo (e qual versão dele) a etapa seguinte precisa consumir
+        novo_estado["arquivo_gerado"] = arquivo_gerado
+        novo_estado["assinatura_arquivo"] = (
+            assinatura_arquivo(os.stat(arquivo_gerado)) if arquivo_gerado and os.path.exists(arquivo_gerado) else None
+        )
+        salvar_estado_sincronizacao(novo_estado, ROTA_ESTADO_SINCRONIZACAO + SUFIXO_ESTADO_PENDENTE)
+        salvar_indice_identificadores(indice_identificadores)
+    finally:
+        # Depois do estado pendente, para quem acompanha o NDJSON já poder confirmar a leitura
+        if formato == "ndjson":
+            marcar_ndjson_concluido()
+    return quantidade
+
+
+def main(argv=None, prog=None):
+    parser = argparse.ArgumentParser(prog=prog, description="Leitura da planilha e geração do JSON de RPS.")
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help="Ignora o estado salvo e processa todas as linhas da planilha."
+    )
+    parser.add_argument(
+        "--formato",
+        choices=["ndjson", "json"],
+        default="ndjson",
+        help="ndjson grava um RPS por linha em fluxo; json exporta o arquivo indentado completo."
+    )
+    parser.add_argument(
+        "--tamanho-bloco",
+        type=int,
+        default=TAMANHO_BLOCO_LINHAS,
+        help="Quantidade de linhas lidas por janela do batchGet."
+    )
+    instrumentacao.adicionar_argumentos(parser)
+    argumentos = parser.parse_args(argv)
+    instrumentacao.configurar_por_argumentos(argumentos)
+    from googleapiclient.errors import HttpError
+
+    id_planilha = carregar_id_planilha()
+    if not id_planilha:
+        instrumentacao.encerrar_com_erro("erro_id_planilha", "Não foi possível carregar o ID da planilha.")
 
+    try:
+        sincronizar_planilha(
+            obter_servico_planilhas(), id_planilha, full=argumentos.full, formato=argumentos.formato,
+            tamanho_bloco=argumentos.tamanho_bloco
+        )
+    except HttpError as erro:
+        instrumentacao.encerrar_com_erro(
+            "erro_api_sheets", f"Ocorreu um erro ao acessar a API do Google Sheets: {erro}"
+        )
+    instrumentacao.finalizar()
 
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,448 @@
+"""
+Acompanhamento dos protocolos devolvidos pelo RecepcionarLoteRps.
+
+Cada lote enviado fica registrado em uma tabela de protocolos pendentes (gravada em
+PASTA_PROTOCOLOS/pendentes.json) até o webservice informar uma situação final. As consultas
+de ConsultarSituacaoLoteRps rodam em um laço asyncio sobre o pool de conexões do cliente_soap:
+cada protocolo tem a sua própria data da próxima consulta, e o intervalo cresce enquanto a
+situação não muda. Quando o lote chega a uma situação final, as NFS-e geradas são buscadas
+com ConsultarLoteRps, o resultado é acrescentado em PASTA_PROTOCOLOS/resultados.ndjson e o
+protocolo sai da tabela; assim o custo de cada rodada depende só dos protocolos pendentes.
+
+Uso (a partir da raiz do projeto):
+    python src/acompanhamento_protocolos.py --enviar acesso_servidor_ftp/dados_gerar_rps.ndjson
+    python src/acompanhamento_protocolos.py --url http://127.0.0.1:8085/nfse_ws/nfsews.asmx
+"""
+import argparse
+import asyncio
+import heapq
+import json
+import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from lxml import etree
+
+import cliente_soap
+import instrumentacao
+import lote_rps
+from controle_etapas import ControleEtapas, CAMINHO_BANCO_CONTROLE
+from lote_rps import NAMESPACE_NFSE, NAMESPACE_SOAP, NSMAP_ENVELOPE, sub
+
+# --- CONSTANTES --- #
+PASTA_PROTOCOLOS = "protocolos"
+CAMINHO_PROTOCOLOS_PENDENTES = os.path.join(PASTA_PROTOCOLOS, "pendentes.json")
+CAMINHO_RESULTADOS_PROTOCOLOS = os.path.join(PASTA_PROTOCOLOS, "resultados.ndjson")
+# Situações do lote (ABRASF): 1 não recebido, 2 não processado, 3 processado com erro, 4 processado com sucesso
+SITUACOES_FINAIS = ("3", "4")
+# Situação registrada quando a consulta recusa o próprio protocolo (ex.: E86, protocolo não encontrado)
+SITUACAO_PROTOCOLO_RECUSADO = "recusado"
+INTERVALO_INICIAL_SEGUNDOS = 5.0
+FATOR_BACKOFF = 1.6
+INTERVALO_MAXIMO_SEGUNDOS = 300.0
+CONSULTAS_SIMULTANEAS = cliente_soap.CONEXOES_POR_PADRAO
+INTERVALO_GRAVACAO_SEGUNDOS = 5.0
+
+
+# --- ENVELOPES E RESPOSTAS --- #
+def montar_envelope_consulta(metodo, cnpj, inscricao_municipal, protocolo):
+    """Envelope de ConsultarSituacaoLoteRps/ConsultarLoteRps, como nos exemplos do BlueprintPHP."""
+    envelope = etree.Element(f"{{{NAMESPACE_SOAP}}}Envelope", nsmap=NSMAP_ENVELOPE)
+    etree.SubElement(envelope, f"{{{NAMESPACE_SOAP}}}Header")
+    corpo = etree.SubElement(envelope, f"{{{NAMESPACE_SOAP}}}Body")
+    envio = sub(sub(corpo, metodo), f"{metodo}Envio")
+    prestador = sub(envio, "Prestador")
+    sub(prestador, "Cnpj", cnpj)
+    sub(prestador, "InscricaoMunicipal", inscricao_municipal)
+    sub(envio, "Protocolo", protocolo)
+    return etree.tostring(envelope, encoding="utf-8")
+
+def conteudo_resultado(corpo):
+    """
+    Elemento com o conteúdo do <{Metodo}Result>. O webservice pode devolver o XML de retorno
+    como texto escapado dentro do Result; nesse caso o texto é lido como XML.
+    """
+    resultado = cliente_soap.extrair_resultado(corpo)
+    texto = (resultado.text or "").strip()
+    if len(resultado) == 0 and texto.startswith("<"):
+        return etree.fromstring(texto.encode("utf-8"))
+    return resultado
+
+def extrair_mensagens_retorno(resultado):
+    return [
+        {"codigo": mensagem.findtext("{*}Codigo"), "mensagem": mensagem.findtext("{*}Mensagem")}
+        for mensagem in resultado.iter("{*}MensagemRetorno")
+    ]
+
+def extrair_nfse_geradas(resultado):
+    return [
+        {
+            "numero_nfse": inf_nfse.findtext("{*}Numero"),
+            "codigo_verificacao": inf_nfse.findtext("{*}CodigoVerificacao"),
+            "numero_rps": inf_nfse.findtext("{*}IdentificacaoRps/{*}Numero"),
+        }
+        for inf_nfse in resultado.iter("{*}InfNfse")
+    ]
+
+
+# --- TABELA DE PROTOCOLOS --- #
+class TabelaProtocolos:
+    """
+    Protocolos pendentes (em memória e em `caminho_pendentes`) e o intervalo de consulta de
+    cada um. Os protocolos concluídos são acrescentados em `caminho_resultados` e removidos.
+    """
+
+    def __init__(self, caminho_pendentes=CAMINHO_PROTOCOLOS_PENDENTES,
+                 caminho_resultados=CAMINHO_RESULTADOS_PROTOCOLOS,
+                 intervalo_inicial=INTERVALO_INICIAL_SEGUNDOS, fator_backoff=FATOR_BACKOFF,
+                 intervalo_maximo=INTERVALO_MAXIMO_SEGUNDOS):
+        self.caminho_pendentes = caminho_pendentes
+        self.caminho_resultados = caminho_resultados
+        self.intervalo_inicial = intervalo_inicial
+        self.fator_backoff = fator_backoff
+        self.intervalo_maximo = intervalo_maximo
+        self.pendentes = {}
+        self.alterada = False
+        if os.path.exists(caminho_pendentes):
+            with open(caminho_pendentes, "r", encoding="utf-8") as arquivo:
+                self.pendentes = json.load(arquivo)
+
+    def registrar(self, protocolo, numero_lote, cnpj, inscricao_municipal, ids=None, agora=None):
+        """`ids` são os ids (controle_etapas) dos RPS do lote."""
+        agora = time.time() if agora is None else agora
+        self.pendentes[protocolo] = {
+            "numero_lote": numero_lote,
+            "cnpj": cnpj,
+            "inscricao_municipal": inscricao_municipal,
+            "ids": ids or [],
+            "situacao": None,
+            "consultas": 0,
+            "intervalo": self.intervalo_inicial,
+            "proxima_consulta": agora + self.intervalo_inicial,
+            "registrado_em": agora,
+        }
+        self.alterada = True
+
+    def adiar(self, protocolo, situacao, agora=None):
+        """
+        Agenda a próxima consulta: o intervalo volta ao inicial quando a situação muda e
+        cresce (até o máximo) enquanto ela se repete. Devolve a data da próxima consulta.
+        """
+        agora = time.time() if agora is None else agora
+        pendente = self.pendentes[protocolo]
+        if situacao is not None and situacao != pendente["situacao"]:
+            pendente["intervalo"] = self.intervalo_inicial
+        else:
+            pendente["intervalo"] = min(pendente["intervalo"] * self.fator_backoff, self.intervalo_maximo)
+        pendente["situacao"] = situacao if situacao is not None else pendente["situacao"]
+        pendente["consultas"] += 1
+        # Variação de ±10% para os protocolos registrados juntos não serem consultados juntos
+        pendente["proxima_consulta"] = agora + pendente["intervalo"] * random.uniform(0.9, 1.1)
+        self.alterada = True
+        return pendente["proxima_consulta"]
+
+    def concluir(self, protocolo, situacao, nfse, mensagens, agora=None):
+        pendente = self.pendentes.pop(protocolo)
+        registro = {
+            "protocolo": protocolo,
+            "numero_lote": pendente["numero_lote"],
+            "cnpj": pendente["cnpj"],
+            "inscricao_municipal": pendente["inscricao_municipal"],
+            "ids": pendente.get("ids", []),
+            "situacao": situacao,
+            "consultas": pendente["consultas"] + 1,
+            "registrado_em": pendente["registrado_em"],
+            "concluido_em": time.time() if agora is None else agora,
+            "nfse": nfse,
+            "mensagens": mensagens,
+        }
+        with open(self.caminho_resultados, "a", encoding="utf-8") as arquivo:
+            arquivo.write(json.dumps(registro, ensure_ascii=False) + "\n")
+        self.alterada = True
+        return registro
+
+    def gravar(self):
+        if not self.alterada:
+            return
+        caminho_temporario = f"{self.caminho_pendentes}.tmp"
+        with open(caminho_temporario, "w", encoding="utf-8") as arquivo:
+            json.dump(self.pendentes, arquivo, ensure_ascii=False)
+        os.replace(caminho_temporario, self.caminho_pendentes)
+        self.alterada = False
+
+
+# --- ENVIO DOS LOTES --- #
+def enviar_lotes(registros, cliente, tabela, sessao=None, tamanho_maximo=lote_rps.TAMANHO_MAXIMO_LOTE,
+                 controle=None):
+    """
+    Monta os lotes (lote_rps), envia por RecepcionarLoteRps e registra na tabela o Protocolo
+    de cada lote aceito. Com `controle` (ControleEtapas), só são enviados os RPS na etapa
+    "assinado" (validados e assinados, ou com envio anterior recusado) e os do lote aceito
+    passam à etapa "enviado". Um lote com envio incerto (cliente_soap.EnvioIncerto)
+    não é repetido: os RPS ficam em "enviado" com o erro, para conferência por consulta.
+    Devolve (registrados, falhas).
+    """
+    lotes_por_indice = {}
+    fora_de_etapa = []
+    if controle is not None:
+        def prontos_para_envio(registros):
+            # Só RPS validados e assinados pelo pipeline; "assinado" com erro é um envio que falhou
+            for dados_nfse in registros:
+                if (controle.situacao(dados_nfse.get("id")) or ("",))[0] == "assinado":
+                    yield dados_nfse
+                else:
+                    fora_de_etapa.append(dados_nfse.get("id"))
+        registros = prontos_para_envio(registros)
+
+    def requisicoes():
+        grupos = lote_rps.agrupar_registros_em_lotes(registros, tamanho_maximo)
+        for indice, ((numero_lote, cnpj, inscricao_municipal), parte, grupo) in enumerate(grupos):
+            numero = lote_rps.numero_lote_parte(numero_lote, parte)
+            envelope = lote_rps.montar_envelope_lote(numero, cnpj, inscricao_municipal, grupo, sessao)
+            lotes_por_indice[indice] = (numero, cnpj, inscricao_municipal, [dados_nfse.get("id") for dados_nfse in grupo])
+            yield "RecepcionarLoteRps", etree.tostring(envelope, encoding="utf-8")
+
+    registrados = falhas = 0
+    for resultado in cliente.enviar_em_lote(requisicoes()):
+        numero_lote, cnpj, inscricao_municipal, ids = lotes_por_indice.pop(resultado.indice)
+        protocolo = None
+        detalhe = resultado.erro
+        if resultado.sucesso:
+            try:
+                retorno = conteudo_resultado(resultado.corpo)
+                protocolo = retorno.findtext(".//{*}Protocolo")
+                detalhe = extrair_mensagens_retorno(retorno)
+            except (etree.XMLSyntaxError, ValueError) as erro:
+                detalhe = str(erro)
+        if protocolo:
+            tabela.registrar(protocolo, numero_lote, cnpj, inscricao_municipal, ids)
+            registrados += 1
+            if controle is not None:
+                for id_rps in ids:
+                    controle.marcar(id_rps, "enviado")
+                # Grava a cada lote aceito: um RPS enviado não pode ficar sem registro
+                tabela.gravar()
+                controle.gravar()
+        elif resultado.incerto:
+            # O webservice pode ter recebido o lote: não volta para a fila de envio
+            falhas += 1
+            if controle is not None:
+                for id_rps in ids:
+                    controle.marcar(id_rps, "enviado", erro=f"envio incerto do lote {numero_lote}: {detalhe}")
+                controle.gravar()
+            instrumentacao.mensagem(
+                "envio_incerto_lote",
+                f"  [ATENÇÃO] Lote {numero_lote}: {detalhe} Confira com ConsultarNfsePorRps antes de reenviar.",
+                numero_lote=numero_lote, ids=ids, detalhe=detalhe
+            )
+        else:
+            falhas += 1
+            instrumentacao.mensagem(
+                "falha_envio_lote", f"  [FALHA] Lote {numero_lote} (HTTP {resultado.status}): {detalhe}",
+                numero_lote=numero_lote, status=resultado.status, detalhe=detalhe
+            )
+
+    tabela.gravar()
+    if fora_de_etapa:
+        instrumentacao.mensagem(
+            "rps_fora_de_etapa",
+            f"  [ATENÇÃO] {len(fora_de_etapa)} RPS não enviado(s): não estão assinados (ou já foram enviados).",
+            ids=fora_de_etapa
+        )
+    return registrados, falhas
+
+
+def registrar_conclusao(controle, registro):
+    """
+    Lote processado com sucesso: RPS confirmados. Com erro ou protocolo recusado: voltam a
+    "assinado" com as mensagens, e o próximo enviar_lotes os envia de novo.
+    """
+    if registro["situacao"] == "4":
+        for id_rps in registro["ids"]:
+            controle.marcar(id_rps, "confirmado")
+    elif registro["situacao"] in ("3", SITUACAO_PROTOCOLO_RECUSADO):
+        erro = "; ".join(f"{mensagem['codigo']}: {mensagem['mensagem']}" for mensagem in registro["mensagens"])
+        padrao = "lote processado com erro" if registro["situacao"] == "3" else "protocolo recusado"
+        for id_rps in registro["ids"]:
+            controle.marcar(id_rps, "assinado", erro=erro or padrao)
+
+
+# --- ACOMPANHAMENTO --- #
+async def acompanhar_protocolos(tabela, cliente, simultaneas=CONSULTAS_SIMULTANEAS,
+                                intervalo_gravacao=INTERVALO_GRAVACAO_SEGUNDOS, ao_concluir=None,
+                                controle=None):
+    """
+    Consulta os protocolos pendentes até todos chegarem a uma situação final.
+    As chamadas ao webservice (bloqueantes) rodam em `simultaneas` threads; a agenda é um heap
+    ordenado pela próxima consulta, então só os protocolos vencidos são consultados a cada
+    rodada. `ao_concluir(registro)` é chamado para cada protocolo concluído; com `controle`,
+    a etapa dos RPS do lote é atualizada (registrar_conclusao).
+    """
+    loop = asyncio.get_running_loop()
+    limite = asyncio.Semaphore(simultaneas)
+    agenda = [(pendente["proxima_consulta"], protocolo) for protocolo, pendente in tabela.pendentes.items()]
+    heapq.heapify(agenda)
+    em_andamento = set()
+    acordar = asyncio.Event()
+
+    async def chamar(executor, metodo, protocolo):
+        pendente = tabela.pendentes[protocolo]
+        xml = montar_envelope_consulta(metodo, pendente["cnpj"], pendente["inscricao_municipal"], protocolo)
+        async with limite:
+            resposta = await loop.run_in_executor(executor, cliente.enviar, metodo, xml)
+        return conteudo_resultado(resposta.corpo)
+
+    async def consultar(executor, protocolo):
+        try:
+            situacao = None
+            try:
+                retorno = await chamar(executor, "ConsultarSituacaoLoteRps", protocolo)
+                situacao = retorno.findtext(".//{*}Situacao")
+                mensagens = extrair_mensagens_retorno(retorno)
+                if situacao is None and mensagens:
+                    # Protocolo recusado pelo webservice (ex.: E86, protocolo não encontrado)
+                    registro = tabela.concluir(protocolo, SITUACAO_PROTOCOLO_RECUSADO, [], mensagens)
+                elif situacao in SITUACOES_FINAIS:
+                    retorno_lote = await chamar(executor, "ConsultarLoteRps", protocolo)
+                    registro = tabela.concluir(
+                        protocolo, situacao, extrair_nfse_geradas(retorno_lote), extrair_mensagens_retorno(retorno_lote)
+                    )
+                else:
+                    registro = None
+            except Exception as erro:
+                instrumentacao.mensagem(
+                    "falha_consulta_protocolo", f"  [ATENÇÃO] Protocolo {protocolo}: {erro}",
+                    protocolo=protocolo, detalhe=str(erro)
+                )
+                registro = None
+
+            if registro is None:
+                heapq.heappush(agenda, (tabela.adiar(protocolo, situacao), protocolo))
+                return
+            if controle is not None:
+                registrar_conclusao(controle, registro)
+            if ao_concluir is not None:
+                ao_concluir(registro)
+        finally:
+            acordar.set()
+
+    with ThreadPoolExecutor(max_workers=simultaneas) as executor:
+        ultima_gravacao = time.time()
+        while agenda or em_andamento:
+            agora = time.time()
+            while agenda and agenda[0][0] <= agora:
+                _, protocolo = heapq.heappop(agenda)
+                tarefa = asyncio.create_task(consultar(executor, protocolo))
+                em_andamento.add(tarefa)
+                tarefa.add_done_callback(em_andamento.discard)
+
+            if agora - ultima_gravacao >= intervalo_gravacao:
+                tabela.gravar()
+                if controle is not None:
+                    controle.gravar()
+                ultima_gravacao = agora
+
+            espera = min(agenda[0][0] - agora, intervalo_gravacao) if agenda else intervalo_gravacao
+            acordar.clear()
+            try:
+                await asyncio.wait_for(acordar.wait(), timeout=max(espera, 0))
+            except asyncio.TimeoutError:
+                pass
+
+    tabela.gravar()
+    if controle is not None:
+        controle.gravar()
+
+
+def main(argv=None, prog=None):
+    parser = argparse.ArgumentParser(prog=prog, description="Acompanha os protocolos dos lotes de RPS enviados.")
+    parser.add_argument("--url", default=cliente_soap.URL_WEBSERVICE_PILOTO, help="Endereço do webservice.")
+    parser.add_argument(
+        "--enviar",
+        metavar="ENTRADA",
+        default=None,
+        help="Antes de acompanhar, monta, assina e envia os lotes deste .ndjson/.json."
+    )
+    parser.add_argument(
+        "--controle",
+        default=CAMINHO_BANCO_CONTROLE,
+        help=f"Banco SQLite com a etapa de cada RPS (padrão: {CAMINHO_BANCO_CONTROLE})."
+    )
+    parser.add_argument("--simultaneas", type=int, default=CONSULTAS_SIMULTANEAS, help="Consultas simultâneas.")
+    parser.add_argument(
+        "--intervalo-inicial",
+        type=float,
+        default=INTERVALO_INICIAL_SEGUNDOS,
+        help="Intervalo entre as primeiras consultas de um protocolo (s)."
+    )
+    instrumentacao.adicionar_argumentos(parser)
+    argumentos = parser.parse_args(argv)
+    instrumentacao.configurar_por_argumentos(argumentos)
+
+    if not os.path.exists(PASTA_PROTOCOLOS):
+        os.makedirs(PASTA_PROTOCOLOS)
+    tabela = TabelaProtocolos(intervalo_inicial=argumentos.intervalo_inicial)
+    contagem_situacoes = {}
+
+    def contar(registro):
+        contagem_situacoes[registro["situacao"]] = contagem_situacoes.get(registro["situacao"], 0) + 1
+        instrumentacao.contar("protocolos_concluidos")
+        instrumentacao.contar("nfse_geradas", len(registro["nfse"]))
+
+    controle = ControleEtapas(argumentos.controle)
+    try:
+        with cliente_soap.ClienteSoapNfse(argumentos.url, conexoes=argumentos.simultaneas) as cliente:
+            if argumentos.enviar:
+                import criacao_rps
+                from certifica_xml import SessaoAssinatura
+                with instrumentacao.etapa("envio_lotes") as medicao:
+                    registrados, falhas = enviar_lotes(
+                        criacao_rps.carregar_registros(argumentos.enviar), cliente, tabela, SessaoAssinatura(),
+                        controle=controle
+                    )
+                    medicao.itens = registrados
+                instrumentacao.informar(
+                    "resumo_envio",
+                    f"{registrados} lote(s) enviado(s), {falhas} com falha.",
+                    enviados=registrados, falhas=falhas
+                )
+            instrumentacao.informar(
+                "protocolos_pendentes",
+                f"Acompanhando {len(tabela.pendentes)} protocolo(s) pendente(s)...",
+                pendentes=len(tabela.pendentes)
+            )
+            with instrumentacao.etapa("acompanhamento") as medicao:
+                asyncio.run(acompanhar_protocolos(
+                    tabela, cliente, argumentos.simultaneas, ao_concluir=contar, controle=controle
+                ))
+                medicao.itens = sum(contagem_situacoes.values())
+    except KeyboardInterrupt:
+        tabela.gravar()
+        instrumentacao.encerrar_com_erro(
+            "interrompido",
+            f"[ATENÇÃO] Interrompido; {len(tabela.pendentes)} protocolo(s) continuam pendentes.",
+            pendentes=len(tabela.pendentes)
+        )
+    except Exception as erro:
+        tabela.gravar()
+        instrumentacao.encerrar_com_erro("erro", f"[ERRO] {erro}")
+    finally:
+        controle.fechar()
+
+    for situacao, quantidade in sorted(contagem_situacoes.items(), key=lambda item: str(item[0])):
+        instrumentacao.informar(
+            "situacao_lotes",
+            f"Situação {situacao}: {quantidade} lote(s).",
+            situacao=situacao, lotes=quantidade
+        )
+    instrumentacao.informar(
+        "resultados",
+        f"Resultados em {CAMINHO_RESULTADOS_PROTOCOLOS}",
+        arquivo=CAMINHO_RESULTADOS_PROTOCOLOS
+    )
+    instrumentacao.finalizar()
+
+
+if __name__ == "__main__":
+    main()
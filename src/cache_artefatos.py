@@ -0,0 +1,128 @@
+"""
+Cache dos XMLs já validados e assinados, endereçado pelo conteúdo.
+
+A chave é o sha256 de: versão do gerador, hash do XSD, impressão digital do certificado e
+o registro de entrada normalizado (ou os bytes do XML sem assinatura, quando a entrada é
+um arquivo). Um registro idêntico ao da execução anterior reaproveita os bytes assinados
+sem gerar, validar nem assinar de novo.
+
+Os artefatos ficam em PASTA_CACHE_ARTEFATOS/<2 primeiros caracteres>/<chave>.xml; a data de
+modificação é renovada a cada uso e limpar() remove os parados há mais de `idade_maxima_dias`
+e, se o total passar de `tamanho_maximo`, os usados há mais tempo.
+"""
+import hashlib
+import json
+import os
+import time
+
+from cryptography.hazmat.primitives import hashes
+
+import criacao_rps
+
+# --- CONSTANTES --- #
+PASTA_CACHE_ARTEFATOS = ".cache_artefatos"
+TAMANHO_MAXIMO_CACHE_BYTES = 512 * 1024 * 1024
+IDADE_MAXIMA_CACHE_DIAS = 30
+# Campos que não entram no XML gerado e, por isso, não entram na chave
+CAMPOS_FORA_DA_CHAVE = ("id",)
+
+
+def normalizar_registro(dados):
+    """
+    JSON canônico do registro (chaves ordenadas, sem CAMPOS_FORA_DA_CHAVE). Os valores não
+    são alterados: espaços ou formatos diferentes podem gerar XMLs diferentes.
+    """
+    return json.dumps(
+        {chave: valor for chave, valor in dados.items() if chave not in CAMPOS_FORA_DA_CHAVE},
+        sort_keys=True, ensure_ascii=False, separators=(",", ":")
+    ).encode("utf-8")
+
+def impressao_digital_certificado(certificado):
+    return certificado.fingerprint(hashes.SHA256()).hex()
+
+def versao_gerador():
+    """VERSAO_GERADOR_XML mais os dados fixos do prestador, que também vão para o XML."""
+    dados_fixos = hashlib.sha256(normalizar_registro(criacao_rps.DADOS_FIXOS_PRESTADOR)).hexdigest()
+    return f"{criacao_rps.VERSAO_GERADOR_XML}:{dados_fixos}"
+
+
+class CacheArtefatos:
+    """
+    Cache em disco, compartilhável entre os processos de um pool (gravações atômicas).
+    `versao_gerador`, `hash_xsd` e `impressao_digital` compõem todas as chaves.
+    """
+
+    def __init__(self, versao_gerador, hash_xsd, impressao_digital, pasta=PASTA_CACHE_ARTEFATOS,
+                 tamanho_maximo=TAMANHO_MAXIMO_CACHE_BYTES, idade_maxima_dias=IDADE_MAXIMA_CACHE_DIAS):
+        self.pasta = pasta
+        self.tamanho_maximo = tamanho_maximo
+        self.idade_maxima = idade_maxima_dias * 86400
+        self.prefixo_chave = f"{versao_gerador}\0{hash_xsd}\0{impressao_digital}\0".encode("utf-8")
+        self.acertos = self.falhas = 0
+
+    def chave(self, conteudo):
+        """`conteudo` é o registro (dict) ou os bytes do XML sem assinatura."""
+        if isinstance(conteudo, dict):
+            conteudo = b"registro\0" + normalizar_registro(conteudo)
+        else:
+            conteudo = b"arquivo\0" + conteudo
+        return hashlib.sha256(self.prefixo_chave + conteudo).hexdigest()
+
+    def caminho(self, chave):
+        return os.path.join(self.pasta, chave[:2], f"{chave}.xml")
+
+    def obter(self, chave):
+        caminho = self.caminho(chave)
+        try:
+            with open(caminho, "rb") as arquivo:
+                conteudo = arquivo.read()
+            os.utime(caminho)
+        except OSError:
+            self.falhas += 1
+            return None
+        self.acertos += 1
+        return conteudo
+
+    def guardar(self, chave, conteudo):
+        caminho = self.caminho(chave)
+        os.makedirs(os.path.dirname(caminho), exist_ok=True)
+        caminho_temporario = f"{caminho}.{os.getpid()}.tmp"
+        with open(caminho_temporario, "wb") as arquivo:
+            arquivo.write(conteudo)
+        os.replace(caminho_temporario, caminho)
+
+    def limpar(self, agora=None):
+        """Aplica os limites de idade e de tamanho. Devolve (removidos, bytes_restantes)."""
+        agora = time.time() if agora is None else agora
+        if not os.path.isdir(self.pasta):
+            return 0, 0
+
+        artefatos = []
+        removidos = 0
+        for subpasta in os.scandir(self.pasta):
+            if not subpasta.is_dir():
+                continue
+            for entrada in os.scandir(subpasta.path):
+                estado = entrada.stat()
+                if agora - estado.st_mtime > self.idade_maxima:
+                    os.remove(entrada.path)
+                    removidos += 1
+                else:
+                    artefatos.append((estado.st_mtime, estado.st_size, entrada.path))
+
+        total = sum(tamanho for _, tamanho, _ in artefatos)
+        if total > self.tamanho_maximo:
+            for _, tamanho, caminho in sorted(artefatos):
+                os.remove(caminho)
+                removidos += 1
+                total -= tamanho
+                if total <= self.tamanho_maximo:
+                    break
+        return removidos, total
+
+
+def criar_cache_artefatos(certificado, caminho_xsd, pasta=PASTA_CACHE_ARTEFATOS):
+    """Cache com as chaves amarradas à versão do gerador, ao XSD e ao certificado usado."""
+    with open(caminho_xsd, "rb") as arquivo_xsd:
+        hash_xsd = hashlib.sha256(arquivo_xsd.read()).hexdigest()
+    return CacheArtefatos(versao_gerador(), hash_xsd, impressao_digital_certificado(certificado), pasta=pasta)
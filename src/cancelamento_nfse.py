@@ -0,0 +1,370 @@
+"""
+Cancelamento de NFS-e em lote pelo método CancelarLoteNfse, conforme os exemplos
+manual_exemplo_sistema_prefeitura/BlueprintPHP/XML/CancelarLoteRPS.xml (lote) e
+ArquivoCancelarNfse.xml (Signature ao lado do InfPedidoCancelamento).
+
+As notas vêm de uma lista de números ou de um filtro sobre os registros da planilha
+(dados_gerar_rps). No segundo caso, o número da NFS-e de cada RPS é buscado nos resultados
+do acompanhamento_protocolos. Os pedidos são agrupados por prestador em lotes de no máximo
+`tamanho_maximo` notas. Cada InfPedidoCancelamento é assinado com a mesma SessaoAssinatura
+e os lotes são enviados pelo pool do cliente_soap, com envios simultâneos limitados.
+
+O resultado de cada nota (cancelada ou não, com as mensagens do webservice) é acrescentado em
+PASTA_CANCELAMENTOS/resultados.ndjson. As notas já canceladas em uma execução anterior ficam de
+fora da próxima. CancelarLoteNfse nunca é repetido automaticamente: se a conexão cai depois do
+envio (cliente_soap.EnvioIncerto), as notas do lote ficam registradas como "incerto" e também
+ficam de fora, até serem conferidas por consulta e pedidas de novo com --reenviar-incertas.
+
+Uso (a partir da raiz do projeto):
+    python src/cancelamento_nfse.py --numeros 1201 1202 1203 --codigo 1
+    python src/cancelamento_nfse.py --entrada acesso_servidor_ftp/dados_gerar_rps.ndjson \\
+        --filtro numero_lote=12 --filtro "data_hora_emissao=*/12/2024*"
+"""
+import argparse
+import fnmatch
+import json
+import os
+import time
+
+from lxml import etree
+
+import cliente_soap
+import criacao_rps
+import instrumentacao
+import lote_rps
+from acompanhamento_protocolos import CAMINHO_RESULTADOS_PROTOCOLOS, conteudo_resultado, extrair_mensagens_retorno
+from certifica_xml import SessaoAssinatura
+from criacao_rps import DADOS_FIXOS_PRESTADOR
+from lote_rps import NAMESPACE_SOAP, NSMAP_ENVELOPE, somente_digitos, sub
+
+# --- CONSTANTES --- #
+PASTA_CANCELAMENTOS = "cancelamentos"
+CAMINHO_RESULTADOS_CANCELAMENTO = os.path.join(PASTA_CANCELAMENTOS, "resultados.ndjson")
+TAMANHO_MAXIMO_LOTE_CANCELAMENTO = lote_rps.TAMANHO_MAXIMO_LOTE
+ENVIOS_SIMULTANEOS = cliente_soap.CONEXOES_POR_PADRAO
+# Códigos de cancelamento (ABRASF): 1 erro na emissão, 2 serviço não prestado,
+# 3 erro de assinatura, 4 duplicidade da nota, 5 erro de processamento; o modelo
+# CancelarLoteRPS.xml do manual da prefeitura usa 0, que fica como padrão
+CODIGOS_CANCELAMENTO = ("0", "1", "2", "3", "4", "5")
+CODIGO_CANCELAMENTO_PADRAO = "0"
+
+
+# --- PEDIDOS --- #
+def pedido_cancelamento(numero_nfse, cnpj, inscricao_municipal, codigo_cancelamento=CODIGO_CANCELAMENTO_PADRAO,
+                        codigo_municipio=DADOS_FIXOS_PRESTADOR["codigo_municipio"], id_rps=None):
+    return {
+        "numero_nfse": str(numero_nfse).strip(),
+        "cnpj": somente_digitos(cnpj),
+        "inscricao_municipal": somente_digitos(inscricao_municipal),
+        "codigo_municipio": codigo_municipio,
+        "codigo_cancelamento": codigo_cancelamento,
+        "id": id_rps,
+    }
+
+def pedidos_por_numeros(numeros, cnpj=DADOS_FIXOS_PRESTADOR["cnpj"],
+                        inscricao_municipal=DADOS_FIXOS_PRESTADOR["inscricao_municipal"],
+                        codigo_cancelamento=CODIGO_CANCELAMENTO_PADRAO):
+    for numero in numeros:
+        yield pedido_cancelamento(numero, cnpj, inscricao_municipal, codigo_cancelamento)
+
+def interpretar_filtros(filtros):
+    """["campo=padrao", ...] -> [(campo, padrao)]; o padrão aceita * e ? (fnmatch)."""
+    condicoes = []
+    for filtro in filtros:
+        campo, separador, padrao = filtro.partition("=")
+        if not separador or not campo.strip():
+            raise ValueError(f"Filtro inválido (use campo=valor): {filtro}")
+        condicoes.append((campo.strip(), padrao.strip()))
+    return condicoes
+
+def registro_atende(dados_nfse, condicoes):
+    return all(
+        fnmatch.fnmatchcase(str(dados_nfse.get(campo, "")).strip(), padrao) for campo, padrao in condicoes
+    )
+
+def carregar_nfse_emitidas(caminho_resultados=CAMINHO_RESULTADOS_PROTOCOLOS):
+    """(cnpj, inscrição municipal, número do RPS) -> número da NFS-e, dos protocolos concluídos."""
+    emitidas = {}
+    if not os.path.exists(caminho_resultados):
+        return emitidas
+    with open(caminho_resultados, "r", encoding="utf-8") as arquivo:
+        for linha in arquivo:
+            if not linha.strip():
+                continue
+            registro = json.loads(linha)
+            for nfse in registro.get("nfse", []):
+                if nfse.get("numero_nfse"):
+                    chave = (registro["cnpj"], registro["inscricao_municipal"], str(nfse.get("numero_rps")))
+                    emitidas[chave] = nfse["numero_nfse"]
+    return emitidas
+
+def pedidos_por_filtro(registros, condicoes, emitidas, codigo_cancelamento=CODIGO_CANCELAMENTO_PADRAO):
+    """Pedidos dos registros da planilha que atendem às condições e já têm NFS-e emitida."""
+    for dados_nfse in registros:
+        if not registro_atende(dados_nfse, condicoes):
+            continue
+        cnpj = somente_digitos(dados_nfse.get("cnpj_prestador"))
+        inscricao_municipal = somente_digitos(dados_nfse.get("inscricao_municipal_prestador"))
+        numero_rps = str(dados_nfse.get("numero_rps", ""))
+        numero_nfse = emitidas.get((cnpj, inscricao_municipal, numero_rps))
+        if numero_nfse is None:
+            instrumentacao.mensagem(
+                "rps_sem_nfse", f"  [ATENÇÃO] RPS {numero_rps} ({cnpj}) sem NFS-e emitida; ignorado.",
+                numero_rps=numero_rps, cnpj=cnpj
+            )
+            continue
+        yield pedido_cancelamento(
+            numero_nfse, cnpj, inscricao_municipal, codigo_cancelamento, id_rps=dados_nfse.get("id")
+        )
+
+def normalizar_numero_nfse(numero_nfse):
+    """Só os dígitos, sem zeros à esquerda: "000123" do retorno e "123" do pedido são a mesma nota."""
+    return somente_digitos(numero_nfse).lstrip("0") or "0"
+
+def chave_nota(pedido):
+    return pedido["cnpj"], pedido["inscricao_municipal"], normalizar_numero_nfse(pedido["numero_nfse"])
+
+def chave_prestador(pedido):
+    return pedido["cnpj"], pedido["inscricao_municipal"]
+
+
+# --- ENVELOPE E RESPOSTA --- #
+def montar_envelope_cancelamento(cnpj, inscricao_municipal, pedidos, sessao=None):
+    """
+    Envelope de CancelarLoteNfse com um PedidoCancelamento por nota. Com `sessao`, cada
+    InfPedidoCancelamento é assinado (Signature dentro do PedidoCancelamento).
+    """
+    envelope = etree.Element(f"{{{NAMESPACE_SOAP}}}Envelope", nsmap=NSMAP_ENVELOPE)
+    etree.SubElement(envelope, f"{{{NAMESPACE_SOAP}}}Header")
+    corpo = etree.SubElement(envelope, f"{{{NAMESPACE_SOAP}}}Body")
+    lote = sub(sub(sub(corpo, "CancelarLoteNfse"), "CancelarLoteNfseEnvio"), "LoteCancelamento")
+    sub(lote, "Cnpj", cnpj)
+    sub(lote, "InscricaoMunicipal", inscricao_municipal)
+    lista_pedidos = sub(lote, "PedidosCancelamento")
+
+    for pedido in pedidos:
+        pedido_cancelamento_xml = sub(lista_pedidos, "PedidoCancelamento")
+        id_pedido = f"cancelamento{somente_digitos(pedido['numero_nfse'])}"
+        inf_pedido = sub(pedido_cancelamento_xml, "InfPedidoCancelamento")
+        inf_pedido.set("Id", id_pedido)
+        identificacao = sub(inf_pedido, "IdentificacaoNfse")
+        sub(identificacao, "Numero", pedido["numero_nfse"])
+        sub(identificacao, "Cnpj", pedido["cnpj"])
+        sub(identificacao, "InscricaoMunicipal", pedido["inscricao_municipal"])
+        sub(identificacao, "CodigoMunicipio", pedido["codigo_municipio"])
+        sub(inf_pedido, "CodigoCancelamento", pedido["codigo_cancelamento"])
+        if sessao is not None:
+            sessao.assinar_referencia(pedido_cancelamento_xml, id_pedido)
+
+    return envelope
+
+def extrair_confirmacoes(resultado):
+    """
+    Número da NFS-e (normalizar_numero_nfse) -> data/hora do cancelamento, das <Confirmacao>
+    do retorno.
+    """
+    confirmacoes = {}
+    for confirmacao in resultado.iter("{*}Confirmacao"):
+        numero_nfse = confirmacao.findtext(".//{*}IdentificacaoNfse/{*}Numero")
+        confirmacoes[normalizar_numero_nfse(numero_nfse)] = confirmacao.findtext("{*}DataHora")
+    return confirmacoes
+
+
+# --- RESULTADOS --- #
+def carregar_resultados_anteriores(caminho_resultados=CAMINHO_RESULTADOS_CANCELAMENTO):
+    """
+    Devolve (canceladas, incertas): as notas já canceladas e as que tiveram por último um
+    envio incerto (podem ter sido canceladas sem que a confirmação chegasse).
+    """
+    canceladas, incertas = set(), set()
+    if not os.path.exists(caminho_resultados):
+        return canceladas, incertas
+    with open(caminho_resultados, "r", encoding="utf-8") as arquivo:
+        for linha in arquivo:
+            if linha.strip():
+                registro = json.loads(linha)
+                chave = chave_nota(registro)
+                if registro.get("cancelada"):
+                    canceladas.add(chave)
+                if registro.get("incerto"):
+                    incertas.add(chave)
+                else:
+                    incertas.discard(chave)
+    return canceladas, incertas - canceladas
+
+
+# --- ENVIO DOS LOTES --- #
+def cancelar_nfse(pedidos, cliente, sessao=None, tamanho_maximo=TAMANHO_MAXIMO_LOTE_CANCELAMENTO,
+                  caminho_resultados=CAMINHO_RESULTADOS_CANCELAMENTO, maximo_em_voo=None,
+                  reenviar_incertas=False):
+    """
+    Agrupa os pedidos por prestador, monta e assina os lotes conforme o envio os consome e
+    envia por CancelarLoteNfse. Grava o resultado de cada nota e devolve (canceladas, falhas).
+    As notas com envio incerto em uma execução anterior só são pedidas de novo com
+    `reenviar_incertas`.
+    """
+    canceladas_antes, incertas_antes = carregar_resultados_anteriores(caminho_resultados)
+    vistas = set()
+    lotes_por_indice = {}
+
+    def pendentes():
+        for pedido in pedidos:
+            chave = chave_nota(pedido)
+            if chave in canceladas_antes or chave in vistas:
+                instrumentacao.contar("nfse_ja_canceladas" if chave in canceladas_antes else "pedidos_repetidos")
+                continue
+            if chave in incertas_antes and not reenviar_incertas:
+                instrumentacao.mensagem(
+                    "cancelamento_incerto_pendente",
+                    f"  [ATENÇÃO] NFS-e {pedido['numero_nfse']} ({pedido['cnpj']}) teve envio incerto; "
+                    "confira com ConsultarNfse e use --reenviar-incertas para pedir de novo.",
+                    numero_nfse=pedido["numero_nfse"], cnpj=pedido["cnpj"]
+                )
+                continue
+            vistas.add(chave)
+            yield pedido
+
+    def requisicoes():
+        grupos = lote_rps.agrupar_registros_em_lotes(pendentes(), tamanho_maximo, chave_grupo=chave_prestador)
+        for indice, ((cnpj, inscricao_municipal), _, grupo) in enumerate(grupos):
+            envelope = montar_envelope_cancelamento(cnpj, inscricao_municipal, grupo, sessao)
+            lotes_por_indice[indice] = grupo
+            yield "CancelarLoteNfse", etree.tostring(envelope, encoding="utf-8")
+
+    canceladas = falhas = 0
+    pasta = os.path.dirname(caminho_resultados)
+    if pasta:
+        os.makedirs(pasta, exist_ok=True)
+    with open(caminho_resultados, "a", encoding="utf-8") as arquivo_resultados:
+        for resultado in cliente.enviar_em_lote(requisicoes(), maximo_em_voo):
+            grupo = lotes_por_indice.pop(resultado.indice)
+            confirmacoes, mensagens, erro = {}, [], resultado.erro
+            if resultado.sucesso:
+                try:
+                    retorno = conteudo_resultado(resultado.corpo)
+                    confirmacoes = extrair_confirmacoes(retorno)
+                    mensagens = extrair_mensagens_retorno(retorno)
+                except (etree.XMLSyntaxError, ValueError) as erro_retorno:
+                    erro = str(erro_retorno)
+            elif erro is None:
+                erro = f"HTTP {resultado.status}"
+
+            agora = time.time()
+            for pedido in grupo:
+                numero_normalizado = normalizar_numero_nfse(pedido["numero_nfse"])
+                cancelada = numero_normalizado in confirmacoes
+                registro = {
+                    "numero_nfse": pedido["numero_nfse"],
+                    "cnpj": pedido["cnpj"],
+                    "inscricao_municipal": pedido["inscricao_municipal"],
+                    "id": pedido["id"],
+                    "codigo_cancelamento": pedido["codigo_cancelamento"],
+                    "cancelada": cancelada,
+                    "incerto": resultado.incerto,
+                    "data_hora": confirmacoes.get(numero_normalizado),
+                    "mensagens": [] if cancelada else mensagens,
+                    "erro": None if cancelada else erro,
+                    "registrado_em": agora,
+                }
+                arquivo_resultados.write(json.dumps(registro, ensure_ascii=False) + "\n")
+                if cancelada:
+                    canceladas += 1
+                    instrumentacao.mensagem(
+                        "nfse_cancelada", f"  [OK] NFS-e {pedido['numero_nfse']} ({pedido['cnpj']}) cancelada.",
+                        numero_nfse=pedido["numero_nfse"], cnpj=pedido["cnpj"]
+                    )
+                elif resultado.incerto:
+                    falhas += 1
+                    instrumentacao.mensagem(
+                        "cancelamento_incerto",
+                        f"  [ATENÇÃO] NFS-e {pedido['numero_nfse']} ({pedido['cnpj']}): {erro}",
+                        numero_nfse=pedido["numero_nfse"], cnpj=pedido["cnpj"], detalhe=erro
+                    )
+                else:
+                    falhas += 1
+                    detalhe = erro or "; ".join(
+                        f"{mensagem['codigo']}: {mensagem['mensagem']}" for mensagem in mensagens
+                    ) or "sem confirmação no retorno"
+                    instrumentacao.mensagem(
+                        "falha_cancelamento", f"  [FALHA] NFS-e {pedido['numero_nfse']} ({pedido['cnpj']}): {detalhe}",
+                        numero_nfse=pedido["numero_nfse"], cnpj=pedido["cnpj"], detalhe=detalhe
+                    )
+            # Cada lote respondido fica gravado antes do próximo
+            arquivo_resultados.flush()
+
+    return canceladas, falhas
+
+
+def main(argv=None, prog=None):
+    parser = argparse.ArgumentParser(prog=prog, description="Cancela NFS-e em lote (CancelarLoteNfse).")
+    origem = parser.add_mutually_exclusive_group(required=True)
+    origem.add_argument("--numeros", nargs="+", metavar="NUMERO", help="Números das NFS-e a cancelar.")
+    origem.add_argument("--entrada", help="Registros da planilha (.ndjson/.json) filtrados por --filtro.")
+    parser.add_argument(
+        "--filtro",
+        action="append",
+        default=[],
+        metavar="CAMPO=VALOR",
+        help="Com --entrada: condição sobre um campo do registro (aceita * e ?); repetível."
+    )
+    parser.add_argument("--cnpj", default=DADOS_FIXOS_PRESTADOR["cnpj"], help="Com --numeros: CNPJ do prestador.")
+    parser.add_argument(
+        "--inscricao-municipal",
+        default=DADOS_FIXOS_PRESTADOR["inscricao_municipal"],
+        help="Com --numeros: inscrição municipal do prestador."
+    )
+    parser.add_argument("--codigo", choices=CODIGOS_CANCELAMENTO, default=CODIGO_CANCELAMENTO_PADRAO,
+                        help="Código de cancelamento.")
+    parser.add_argument("--url", default=cliente_soap.URL_WEBSERVICE_PILOTO, help="Endereço do webservice.")
+    parser.add_argument("--simultaneas", type=int, default=ENVIOS_SIMULTANEOS, help="Lotes enviados ao mesmo tempo.")
+    parser.add_argument(
+        "--tamanho-maximo",
+        type=int,
+        default=TAMANHO_MAXIMO_LOTE_CANCELAMENTO,
+        help="Máximo de notas por lote."
+    )
+    parser.add_argument("--sem-assinatura", action="store_true", help="Envia os pedidos sem assiná-los.")
+    parser.add_argument(
+        "--reenviar-incertas",
+        action="store_true",
+        help="Pede de novo as notas com envio incerto em uma execução anterior (confira antes por consulta)."
+    )
+    instrumentacao.adicionar_argumentos(parser)
+    argumentos = parser.parse_args(argv)
+    instrumentacao.configurar_por_argumentos(argumentos)
+
+    try:
+        if argumentos.numeros:
+            pedidos = pedidos_por_numeros(
+                argumentos.numeros, argumentos.cnpj, argumentos.inscricao_municipal, argumentos.codigo
+            )
+        else:
+            condicoes = interpretar_filtros(argumentos.filtro)
+            if not condicoes:
+                instrumentacao.encerrar_com_erro("erro", "[ERRO] Com --entrada, informe ao menos um --filtro.")
+            pedidos = pedidos_por_filtro(
+                criacao_rps.carregar_registros(argumentos.entrada), condicoes, carregar_nfse_emitidas(),
+                argumentos.codigo
+            )
+
+        sessao = None if argumentos.sem_assinatura else SessaoAssinatura()
+        with cliente_soap.ClienteSoapNfse(argumentos.url, conexoes=argumentos.simultaneas) as cliente:
+            with instrumentacao.etapa("cancelamento") as medicao:
+                canceladas, falhas = cancelar_nfse(
+                    pedidos, cliente, sessao, argumentos.tamanho_maximo,
+                    reenviar_incertas=argumentos.reenviar_incertas
+                )
+                medicao.itens = canceladas + falhas
+    except Exception as erro:
+        instrumentacao.encerrar_com_erro("erro", f"[ERRO] {erro}")
+
+    instrumentacao.informar(
+        "resumo_cancelamento",
+        f"{canceladas} NFS-e cancelada(s), {falhas} não cancelada(s). Resultados em {CAMINHO_RESULTADOS_CANCELAMENTO}",
+        canceladas=canceladas, falhas=falhas, arquivo=CAMINHO_RESULTADOS_CANCELAMENTO
+    )
+    instrumentacao.finalizar()
+
+
+if __name__ == "__main__":
+    main()
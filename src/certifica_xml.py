@@ -13,23 +13,155 @@ Importante:
 """
 
 import os
+import csv
+import json
+import shutil
+import hashlib
+import argparse
+import multiprocessing
+from collections import namedtuple
+from urllib.parse import urljoin
+from urllib.request import urlopen
 from lxml import etree
-from cryptography.hazmat.primitives.serialization import pkcs12, Encoding, PrivateFormat, NoEncryption
+from cryptography import x509
+from cryptography.hazmat.primitives.serialization import (
+    pkcs12, Encoding, PrivateFormat, NoEncryption, load_pem_private_key
+)
 from cryptography.hazmat.backends import default_backend
 from signxml import XMLSigner, methods
 
+import instrumentacao
+from cache_artefatos import criar_cache_artefatos
+
 # --- CONSTANTES DE CAMINHO --- #
 CAMINHO_PASTA_XML = "pdf_xml_gerados_rps"
 CAMINHO_XSD = os.path.join("certificados_schemas", "ModeloNFSeValidado.xsd")
 CAMINHO_CERT_PFX = os.path.join("certificados", "GRACINHA_DO_CARMO_GONCALVES_85475327904_1724777703229427900.pfx")
 PASTA_XML_ASSINADO = "pdf_xml_assinados"
 SENHA_PFX = b"#GRACA#28"  # Senha fornecida
+TAMANHO_BLOCO_ASSINATURA = 16
+C14N_ASSINATURA = "http://www.w3.org/TR/2001/REC-xml-c14n-20010315"
+CAMINHO_RELATORIO_VALIDACAO = "relatorio_validacao.json"
+TAMANHO_BLOCO_VALIDACAO = 64
+CAMPOS_RELATORIO_VALIDACAO = ["arquivo", "valido", "linha", "coluna", "mensagem"]
+
+# XSD com as referências (xs:include/xs:import/xs:redefine) já resolvidas, em <pasta>/<sha256 do XSD>/
+PASTA_CACHE_SCHEMAS = ".cache_schemas"
+NOME_XSD_RESOLVIDO = "0.xsd"
+NAMESPACE_XSD = "http://www.w3.org/2001/XMLSchema"
+TAGS_REFERENCIA_XSD = tuple(f"{{{NAMESPACE_XSD}}}{tag}" for tag in ("include", "import", "redefine"))
+TEMPO_LIMITE_XSD_REMOTO = 30
+
+# Schemas já compilados neste processo, pela chave (caminho, sha256 do XSD)
+_cache_schemas = {}
 
 # --- FUNÇÕES AUXILIARES DE VALIDAÇÃO --- #
-def carregar_schema_xsd(caminho_arquivo_xsd):
+def hash_arquivo(caminho_arquivo):
+    with open(caminho_arquivo, 'rb') as arquivo:
+        return hashlib.sha256(arquivo.read()).hexdigest()
+
+def origem_remota(origem):
+    return "://" in origem
+
+def ler_origem_xsd(origem):
+    if origem_remota(origem):
+        with urlopen(origem, timeout=TEMPO_LIMITE_XSD_REMOTO) as resposta:
+            return resposta.read()
+    with open(origem, 'rb') as arquivo:
+        return arquivo.read()
+
+def resolver_referencia_xsd(origem, local):
+    if origem_remota(origem) or origem_remota(local):
+        return urljoin(origem, local)
+    return os.path.normpath(os.path.join(os.path.dirname(origem), local))
+
+def resolver_schema_xsd(caminho_arquivo_xsd, pasta_cache=PASTA_CACHE_SCHEMAS, conteudo_xsd=None):
+    """
+    Copia o XSD e todos os schemas que ele referencia (xs:include, xs:import, xs:redefine,
+    inclusive remotos) para `pasta_cache`/<sha256 do XSD>/, com os schemaLocation apontando
+    para as cópias, e devolve o caminho do XSD principal copiado. As execuções seguintes
+    com o mesmo XSD compilam das cópias, sem procurar nem baixar as referências de novo.
+    O manifesto guarda o hash de cada arquivo local usado: se algum mudar, tudo é refeito.
+    """
+    if conteudo_xsd is None:
+        conteudo_xsd = ler_origem_xsd(caminho_arquivo_xsd)
+    destino = os.path.join(pasta_cache, hashlib.sha256(conteudo_xsd).hexdigest())
+    caminho_resolvido = os.path.join(destino, NOME_XSD_RESOLVIDO)
+    try:
+        with open(os.path.join(destino, "manifesto.json"), "r", encoding="utf-8") as arquivo:
+            fontes_locais = json.load(arquivo)["fontes_locais"]
+        if all(hash_arquivo(origem) == hash_origem for origem, hash_origem in fontes_locais.items()):
+            return caminho_resolvido
+    except (OSError, ValueError, KeyError):
+        pass
+
+    # Montado em uma pasta temporária: os processos de um pool podem resolver ao mesmo tempo
+    temporaria = f"{destino}.{os.getpid()}.tmp"
+    shutil.rmtree(temporaria, ignore_errors=True)
+    os.makedirs(temporaria)
+    try:
+        origem_principal = os.path.abspath(caminho_arquivo_xsd)
+        nomes = {origem_principal: NOME_XSD_RESOLVIDO}
+        pendentes = [(origem_principal, conteudo_xsd)]
+        fontes_locais = {}
+        while pendentes:
+            origem, conteudo = pendentes.pop()
+            if not origem_remota(origem):
+                fontes_locais[origem] = hashlib.sha256(conteudo).hexdigest()
+            raiz = etree.fromstring(conteudo, base_url=origem)
+            for referencia in raiz.iter(*TAGS_REFERENCIA_XSD):
+                local = referencia.get("schemaLocation")
+                if not local:
+                    continue
+                alvo = resolver_referencia_xsd(origem, local)
+                if alvo not in nomes:
+                    nomes[alvo] = f"{len(nomes)}.xsd"
+                    pendentes.append((alvo, ler_origem_xsd(alvo)))
+                referencia.set("schemaLocation", nomes[alvo])
+            with open(os.path.join(temporaria, nomes[origem]), 'wb') as arquivo:
+                arquivo.write(etree.tostring(raiz.getroottree(), xml_declaration=True, encoding="utf-8"))
+        with open(os.path.join(temporaria, "manifesto.json"), "w", encoding="utf-8") as arquivo:
+            json.dump({"fontes_locais": fontes_locais}, arquivo, ensure_ascii=False, indent=2)
+    except BaseException:
+        shutil.rmtree(temporaria, ignore_errors=True)
+        raise
+
+    shutil.rmtree(destino, ignore_errors=True)
+    try:
+        os.replace(temporaria, destino)
+    except OSError:
+        # Outro processo gravou o mesmo conjunto primeiro
+        shutil.rmtree(temporaria, ignore_errors=True)
+    return caminho_resolvido
+
+def carregar_schema_xsd(caminho_arquivo_xsd, pasta_cache=PASTA_CACHE_SCHEMAS):
+    """
+    Compila o XSD uma vez por processo, a partir das cópias já resolvidas por
+    resolver_schema_xsd em `pasta_cache` (None compila direto do original). O XMLSchema do
+    lxml não pode ser serializado (nem em disco, nem para um pool): entre execuções, o que
+    fica pronto é o conjunto de schemas resolvido; a compilação é refeita em cada processo,
+    e só uma vez nele. Os dois caches são indexados pelo hash do XSD, então uma alteração
+    no arquivo é percebida na próxima chamada.
+    """
     with open(caminho_arquivo_xsd, 'rb') as arquivo_xsd:
-        schema_doc = etree.parse(arquivo_xsd)
-        return etree.XMLSchema(schema_doc)
+        conteudo_xsd = arquivo_xsd.read()
+
+    chave = (os.path.abspath(caminho_arquivo_xsd), hashlib.sha256(conteudo_xsd).hexdigest())
+    validador = _cache_schemas.get(chave)
+    if validador is None:
+        caminho_compilado = caminho_arquivo_xsd
+        if pasta_cache is not None:
+            try:
+                caminho_compilado = resolver_schema_xsd(caminho_arquivo_xsd, pasta_cache, conteudo_xsd)
+            except (OSError, ValueError, etree.XMLSyntaxError) as erro:
+                instrumentacao.informar(
+                    "xsd_nao_copiado",
+                    f"[ATENÇÃO] XSD não copiado para {pasta_cache} ({erro}); compilando do original."
+                )
+        # O caminho vira o base_url: xs:include/xs:import são resolvidos a partir da pasta do XSD
+        schema_doc = etree.parse(caminho_compilado)
+        validador = _cache_schemas[chave] = etree.XMLSchema(schema_doc)
+    return validador
 
 def listar_arquivos_xml_validos(pasta):
     return [
@@ -42,11 +174,103 @@ def validar_arquivo_xml_com_schema(caminho_xml, validador):
     try:
         with open(caminho_xml, 'rb') as arquivo:
             xml_doc = etree.parse(arquivo)
-            validador.assertValid(xml_doc)
-            return True, "Validação bem-sucedida."
-    except (etree.DocumentInvalid, etree.XMLSyntaxError) as erro:
+    except etree.XMLSyntaxError as erro:
+        return False, str(erro)
+    return validar_arvore_xml_com_schema(xml_doc, validador)
+
+def validar_arvore_xml_com_schema(xml_doc, validador):
+    try:
+        validador.assertValid(xml_doc)
+        return True, "Validação bem-sucedida."
+    except etree.DocumentInvalid as erro:
         return False, str(erro)
 
+# --- VALIDAÇÃO EM LOTE (SEM ASSINATURA) --- #
+def detalhar_validacao_arquivo(caminho_xml, validador):
+    """
+    Valida um arquivo e devolve uma linha do relatório: arquivo, valido, linha, coluna, mensagem.
+    Em caso de erro, linha/coluna/mensagem são as do primeiro erro encontrado.
+    """
+    linha_relatorio = {"arquivo": caminho_xml, "valido": True, "linha": None, "coluna": None, "mensagem": ""}
+    try:
+        xml_doc = etree.parse(caminho_xml)
+    except (OSError, etree.XMLSyntaxError) as erro:
+        linha, coluna = getattr(erro, "position", (None, None))
+        linha_relatorio.update(valido=False, linha=linha, coluna=coluna, mensagem=str(erro))
+        return linha_relatorio
+
+    if not validador.validate(xml_doc):
+        primeiro_erro = validador.error_log[0]
+        linha_relatorio.update(
+            valido=False,
+            linha=primeiro_erro.line,
+            coluna=primeiro_erro.column,
+            mensagem=primeiro_erro.message
+        )
+    return linha_relatorio
+
+_validador_processo = None
+
+def _inicializar_processo_validacao(caminho_xsd):
+    global _validador_processo
+    _validador_processo = carregar_schema_xsd(caminho_xsd)
+
+def _validar_no_processo(caminho_xml):
+    return detalhar_validacao_arquivo(caminho_xml, _validador_processo)
+
+def validar_arquivos_em_paralelo(caminhos_xml, caminho_xsd=CAMINHO_XSD, processos=None,
+                                 tamanho_bloco=TAMANHO_BLOCO_VALIDACAO):
+    """
+    Somente valida, sem assinar. Cada processo do pool compila o XSD uma vez.
+    Com processos=1 valida no processo atual. Devolve as linhas do relatório na ordem dos arquivos.
+    """
+    if processos == 1:
+        validador = carregar_schema_xsd(caminho_xsd)
+        return [detalhar_validacao_arquivo(caminho_xml, validador) for caminho_xml in caminhos_xml]
+
+    with multiprocessing.Pool(
+        processes=processos,
+        initializer=_inicializar_processo_validacao,
+        initargs=(caminho_xsd,)
+    ) as pool:
+        return pool.map(_validar_no_processo, caminhos_xml, chunksize=tamanho_bloco)
+
+def gravar_relatorio_validacao(linhas_relatorio, caminho_relatorio=CAMINHO_RELATORIO_VALIDACAO):
+    """Grava o relatório em JSON ou, se o caminho terminar em .csv, em CSV."""
+    if caminho_relatorio.lower().endswith(".csv"):
+        with open(caminho_relatorio, "w", encoding="utf-8", newline="") as arquivo:
+            escritor = csv.DictWriter(arquivo, fieldnames=CAMPOS_RELATORIO_VALIDACAO)
+            escritor.writeheader()
+            escritor.writerows(linhas_relatorio)
+    else:
+        with open(caminho_relatorio, "w", encoding="utf-8") as arquivo:
+            json.dump(linhas_relatorio, arquivo, indent=4, ensure_ascii=False)
+    return caminho_relatorio
+
+def somente_validar_xmls(pasta=CAMINHO_PASTA_XML, processos=None, caminho_relatorio=CAMINHO_RELATORIO_VALIDACAO):
+    if not os.path.exists(pasta):
+        instrumentacao.informar("erro", f"[ERRO] Pasta de entrada não encontrada: {pasta}")
+        return None
+
+    arquivos = listar_arquivos_xml_validos(pasta)
+    try:
+        with instrumentacao.etapa("validacao_xsd") as medicao:
+            linhas_relatorio = validar_arquivos_em_paralelo(arquivos, processos=processos)
+            medicao.itens = len(linhas_relatorio)
+    except (OSError, etree.XMLSchemaParseError, etree.XMLSyntaxError) as erro:
+        instrumentacao.informar("erro", f"[ERRO] Erro ao carregar o XSD: {erro}")
+        return None
+
+    invalidos = sum(1 for linha in linhas_relatorio if not linha["valido"])
+    instrumentacao.contar("falhas_validacao", invalidos)
+    gravar_relatorio_validacao(linhas_relatorio, caminho_relatorio)
+    instrumentacao.informar(
+        "resumo_validacao",
+        f"{len(linhas_relatorio)} XML(s) validado(s), {invalidos} inválido(s). Relatório: {caminho_relatorio}",
+        validados=len(linhas_relatorio), invalidos=invalidos, arquivo=caminho_relatorio
+    )
+    return linhas_relatorio
+
 # --- EXTRAÇÃO DE CERTIFICADO DO PFX --- #
 def extrair_cert_e_chave_de_pfx(caminho_pfx, senha_pfx):
     if not os.path.exists(caminho_pfx):
@@ -73,74 +297,242 @@ def extrair_cert_e_chave_de_pfx(caminho_pfx, senha_pfx):
 
     return cert_pem, key_pem
 
-# --- FUNÇÃO DE ASSINATURA DIGITAL --- #
-def assinar_xml(xml_path):
-    with open(xml_path, 'rb') as arquivo:
-        xml = etree.parse(arquivo)
-
-    elemento_alvo = xml.find(".//Nfse")
-    if elemento_alvo is None:
-        raise ValueError("Elemento <Nfse> não encontrado no XML.")
-
-    cert, key = extrair_cert_e_chave_de_pfx(CAMINHO_CERT_PFX, SENHA_PFX)
+# --- SESSÃO DE ASSINATURA --- #
+ResultadoAssinatura = namedtuple("ResultadoAssinatura", ["caminho_xml", "sucesso", "detalhe"])
 
-    signer = XMLSigner(
+def criar_signer():
+    return XMLSigner(
         method=methods.enveloped,
         digest_algorithm="sha256",
-        c14n_algorithm="http://www.w3.org/TR/2001/REC-xml-c14n-20010315"
+        c14n_algorithm=C14N_ASSINATURA
     )
 
-    xml_assinado = signer.sign(
-        data=elemento_alvo,
-        key=key,
-        cert=cert,
-        always_add_key_value=False
-    )
+class SessaoAssinatura:
+    """
+    Descriptografa o PFX uma única vez e reaproveita a chave privada, o certificado e o
+    XMLSigner carregados para assinar vários documentos.
+    """
+
+    def __init__(self, caminho_pfx=CAMINHO_CERT_PFX, senha_pfx=SENHA_PFX, pasta_saida=PASTA_XML_ASSINADO,
+                 cert_pem=None, key_pem=None):
+        if cert_pem is None or key_pem is None:
+            cert_pem, key_pem = extrair_cert_e_chave_de_pfx(caminho_pfx, senha_pfx)
+        self.cert_pem = cert_pem
+        self.key_pem = key_pem
+        self.pasta_saida = pasta_saida
+        self.certificado = x509.load_pem_x509_certificate(cert_pem)
+        self.chave_privada = load_pem_private_key(key_pem, password=None)
+        self.signer = criar_signer()
+
+    def assinar_arvore(self, xml):
+        """
+        Assina o elemento <Nfse> do documento (ElementTree ou elemento raiz do lxml) e
+        devolve a raiz com o <Nfse> assinado no lugar do original.
+        """
+        raiz = xml.getroot() if hasattr(xml, "getroot") else xml
+        elemento_alvo = raiz if raiz.tag == "Nfse" else raiz.find(".//Nfse")
+        if elemento_alvo is None:
+            raise ValueError("Elemento <Nfse> não encontrado no XML.")
+
+        # O signxml assina uma cópia do elemento; ela substitui o original na árvore
+        nfse_assinada = self.signer.sign(
+            data=elemento_alvo,
+            key=self.chave_privada,
+            cert=[self.certificado],
+            always_add_key_value=False
+        )
+
+        pai = elemento_alvo.getparent()
+        if pai is None:
+            return nfse_assinada
+        pai.replace(elemento_alvo, nfse_assinada)
+        return raiz
+
+    def assinar_referencia(self, elemento, id_referencia):
+        """
+        Assina o elemento com Id=`id_referencia` contido em `elemento` e insere a <Signature>
+        como último filho de `elemento` (ex.: InfRps dentro de Rps, LoteRps dentro de
+        EnviarLoteRpsEnvio). Devolve o elemento assinado, já no lugar do original na árvore.
+        """
+        elemento_assinado = self.signer.sign(
+            data=elemento,
+            key=self.chave_privada,
+            cert=[self.certificado],
+            reference_uri=f"#{id_referencia}",
+            always_add_key_value=False
+        )
+        pai = elemento.getparent()
+        if pai is not None:
+            pai.replace(elemento, elemento_assinado)
+        return elemento_assinado
+
+    def serializar(self, raiz):
+        return etree.tostring(raiz, encoding='utf-8', xml_declaration=True, pretty_print=True)
+
+    def assinar_arquivo(self, xml_path):
+        with open(xml_path, 'rb') as arquivo:
+            xml = etree.parse(arquivo)
+
+        raiz_assinada = self.assinar_arvore(xml)
+
+        if not os.path.exists(self.pasta_saida):
+            os.makedirs(self.pasta_saida, exist_ok=True)
+
+        caminho_saida = os.path.join(self.pasta_saida, os.path.basename(xml_path))
+        with open(caminho_saida, 'wb') as f:
+            f.write(self.serializar(raiz_assinada))
+
+        return caminho_saida
+
+    def assinar_lote(self, caminhos_xml, processos=None, tamanho_bloco=TAMANHO_BLOCO_ASSINATURA):
+        """
+        Assina vários arquivos e devolve um ResultadoAssinatura por arquivo, na mesma ordem.
+        Com processos=1 assina no processo atual; caso contrário usa um pool em que cada
+        processo carrega a chave uma única vez na inicialização.
+        """
+        if processos == 1:
+            return [_assinar_com_sessao(self, caminho_xml) for caminho_xml in caminhos_xml]
+
+        with multiprocessing.Pool(
+            processes=processos,
+            initializer=_inicializar_processo_assinatura,
+            initargs=(self.cert_pem, self.key_pem, self.pasta_saida)
+        ) as pool:
+            return pool.map(_assinar_no_processo, caminhos_xml, chunksize=tamanho_bloco)
 
-    nome_arquivo = os.path.basename(xml_path)
-    caminho_saida = os.path.join(PASTA_XML_ASSINADO, nome_arquivo)
+def _assinar_com_sessao(sessao, caminho_xml):
+    try:
+        return ResultadoAssinatura(caminho_xml, True, sessao.assinar_arquivo(caminho_xml))
+    except Exception as erro:
+        return ResultadoAssinatura(caminho_xml, False, str(erro))
 
-    if not os.path.exists(PASTA_XML_ASSINADO):
-        os.makedirs(PASTA_XML_ASSINADO)
+_sessao_processo = None
 
-    with open(caminho_saida, 'wb') as f:
-        f.write(etree.tostring(xml.getroot(), encoding='utf-8', xml_declaration=True, pretty_print=True))
+def _inicializar_processo_assinatura(cert_pem, key_pem, pasta_saida):
+    global _sessao_processo
+    _sessao_processo = SessaoAssinatura(cert_pem=cert_pem, key_pem=key_pem, pasta_saida=pasta_saida)
 
-    return caminho_saida
+def _assinar_no_processo(caminho_xml):
+    return _assinar_com_sessao(_sessao_processo, caminho_xml)
+
+# --- FUNÇÃO DE ASSINATURA DIGITAL --- #
+def assinar_xml(xml_path, sessao=None):
+    if sessao is None:
+        sessao = SessaoAssinatura()
+    return sessao.assinar_arquivo(xml_path)
 
 # --- FLUXO COMPLETO --- #
-def validar_e_assinar_xmls():
+def validar_e_assinar_xmls(processos=None, usar_cache=True):
     if not os.path.exists(CAMINHO_PASTA_XML):
-        print(f"[ERRO] Pasta de entrada não encontrada: {CAMINHO_PASTA_XML}")
+        instrumentacao.informar("erro", f"[ERRO] Pasta de entrada não encontrada: {CAMINHO_PASTA_XML}")
         return
 
     try:
         validador = carregar_schema_xsd(CAMINHO_XSD)
     except Exception as erro:
-        print(f"[ERRO] Erro ao carregar o XSD: {erro}")
+        instrumentacao.informar("erro", f"[ERRO] Erro ao carregar o XSD: {erro}")
         return
 
     arquivos = listar_arquivos_xml_validos(CAMINHO_PASTA_XML)
     if not arquivos:
-        print("[INFO] Nenhum arquivo XML para validar/assinar.")
+        instrumentacao.informar("nada_a_processar", "[INFO] Nenhum arquivo XML para validar/assinar.")
+        return
+
+    try:
+        sessao = SessaoAssinatura()
+    except Exception as erro:
+        instrumentacao.informar("erro", f"[ERRO] Erro ao carregar o certificado: {erro}")
         return
 
-    for caminho_xml in arquivos:
-        nome_arquivo = os.path.basename(caminho_xml)
-        print(f"Validando {nome_arquivo}...")
+    # XMLs iguais aos de uma execução anterior (mesmo XSD e certificado) já estão assinados no cache
+    cache = criar_cache_artefatos(sessao.certificado, CAMINHO_XSD) if usar_cache else None
+    chaves_cache = {}
 
-        valido, mensagem = validar_arquivo_xml_com_schema(caminho_xml, validador)
-        if not valido:
-            print(f"  [ERRO] Validação falhou: {mensagem}")
-            continue
+    arquivos_validos = []
+    with instrumentacao.etapa("validacao_xsd") as medicao:
+        for caminho_xml in arquivos:
+            nome_arquivo = os.path.basename(caminho_xml)
+            if cache is not None:
+                with open(caminho_xml, 'rb') as arquivo:
+                    chave = cache.chave(arquivo.read())
+                xml_assinado = cache.obter(chave)
+                if xml_assinado is not None:
+                    os.makedirs(sessao.pasta_saida, exist_ok=True)
+                    with open(os.path.join(sessao.pasta_saida, nome_arquivo), 'wb') as f:
+                        f.write(xml_assinado)
+                    instrumentacao.mensagem(
+                        "xml_do_cache", f"[CACHE] {nome_arquivo} sem alterações; XML assinado reaproveitado.",
+                        arquivo=nome_arquivo
+                    )
+                    continue
+                chaves_cache[caminho_xml] = chave
 
-        print("  [OK] Validação bem-sucedida. Assinando...")
+            medicao.itens += 1
+            valido, mensagem = validar_arquivo_xml_com_schema(caminho_xml, validador)
+            if not valido:
+                instrumentacao.mensagem(
+                    "falha_validacao", f"  [ERRO] {nome_arquivo}: validação falhou: {mensagem}",
+                    arquivo=nome_arquivo, detalhe=mensagem
+                )
+                continue
+
+            instrumentacao.mensagem("xml_valido", f"  [OK] {nome_arquivo}: validação bem-sucedida.", arquivo=nome_arquivo)
+            arquivos_validos.append(caminho_xml)
+
+    instrumentacao.informar(
+        "inicio_assinatura",
+        f"Assinando {len(arquivos_validos)} XML(s)...",
+        arquivos=len(arquivos_validos)
+    )
+    with instrumentacao.etapa("assinatura") as medicao:
+        for resultado in sessao.assinar_lote(arquivos_validos, processos=processos):
+            nome_arquivo = os.path.basename(resultado.caminho_xml)
+            if resultado.sucesso:
+                medicao.itens += 1
+                instrumentacao.mensagem(
+                    "xml_assinado", f"  [SUCESSO] {nome_arquivo} assinado e salvo em: {resultado.detalhe}",
+                    arquivo=nome_arquivo, destino=resultado.detalhe
+                )
+                if cache is not None:
+                    with open(resultado.detalhe, 'rb') as arquivo:
+                        cache.guardar(chaves_cache[resultado.caminho_xml], arquivo.read())
+            else:
+                instrumentacao.mensagem(
+                    "falha_assinatura", f"  [FALHA] Erro ao assinar {nome_arquivo}: {resultado.detalhe}",
+                    arquivo=nome_arquivo, detalhe=resultado.detalhe
+                )
+
+    if cache is not None:
+        cache.limpar()
+
+def main(argv=None, prog=None):
+    parser = argparse.ArgumentParser(prog=prog, description="Validação e assinatura dos XMLs de NFSe.")
+    parser.add_argument(
+        "--processos",
+        type=int,
+        default=None,
+        help="Processos usados na assinatura/validação (padrão: número de CPUs; 1 roda sem pool)."
+    )
+    parser.add_argument(
+        "--somente-validar",
+        action="store_true",
+        help="Apenas valida os XMLs contra o XSD, sem assinar, e grava o relatório."
+    )
+    parser.add_argument(
+        "--relatorio",
+        default=CAMINHO_RELATORIO_VALIDACAO,
+        help="Com --somente-validar: caminho do relatório (.json ou .csv)."
+    )
+    parser.add_argument("--sem-cache", action="store_true", help="Valida e assina tudo de novo, sem usar o cache.")
+    instrumentacao.adicionar_argumentos(parser)
+    argumentos = parser.parse_args(argv)
+    instrumentacao.configurar_por_argumentos(argumentos)
+    if argumentos.somente_validar:
+        somente_validar_xmls(processos=argumentos.processos, caminho_relatorio=argumentos.relatorio)
+    else:
+        validar_e_assinar_xmls(processos=argumentos.processos, usar_cache=not argumentos.sem_cache)
+    instrumentacao.finalizar()
 
-        try:
-            caminho_assinado = assinar_xml(caminho_xml)
-            print(f"  [SUCESSO] XML assinado salvo em: {caminho_assinado}")
-        except Exception as erro_ass:
-            print(f"  [FALHA] Erro ao assinar XML: {erro_ass}")
 
 if __name__ == "__main__":
-    validar_e_assinar_xmls()
+    main()
@@ -0,0 +1,279 @@
+"""
+Cliente SOAP do webservice de NFS-e da Prefeitura de Curitiba (nfsews.asmx), equivalente ao
+manual_exemplo_sistema_prefeitura/BlueprintPHP/Blueprint.php, com TLS mútuo a partir do mesmo
+PFX lido por certifica_xml.extrair_cert_e_chave_de_pfx.
+
+Diferente do Blueprint, que abre uma conexão cURL por chamada, as conexões ficam abertas
+(keep-alive) em um pool e são reaproveitadas; enviar_em_lote mantém no máximo
+`maximo_em_voo` requisições em andamento ao mesmo tempo.
+
+Os métodos de METODOS_NAO_IDEMPOTENTES só são repetidos quando a requisição nem chegou a ser
+escrita por inteiro em uma conexão ociosa do pool; se a conexão cair depois disso, o servidor
+pode ter processado o envio, e o erro é EnvioIncerto: consulte antes de enviar de novo.
+"""
+import http.client
+import os
+import queue
+import select
+import ssl
+import tempfile
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, as_completed, wait
+from urllib.parse import urlsplit
+
+from lxml import etree
+
+from certifica_xml import CAMINHO_CERT_PFX, SENHA_PFX, extrair_cert_e_chave_de_pfx
+
+# --- CONSTANTES --- #
+URL_WEBSERVICE_PILOTO = "https://piloto-iss.curitiba.pr.gov.br/nfse_ws/nfsews.asmx"
+NAMESPACE_NFSE = "http://www.e-governeapps2.com.br/"
+METODOS_WEBSERVICE = (
+    "CancelarLoteNfse",
+    "CancelarLoteRps",
+    "CancelarNfse",
+    "ConsultarLoteRps",
+    "ConsultarNfse",
+    "ConsultarNfsePorRps",
+    "ConsultarSituacaoLoteRps",
+    "RecepcionarLoteRps",
+    "RecepcionarXml",
+    "ValidarXml",
+)
+# Envios que o webservice processa a cada chamada (uma repetição gera lote/cancelamento em dobro)
+METODOS_NAO_IDEMPOTENTES = (
+    "CancelarLoteNfse",
+    "CancelarLoteRps",
+    "CancelarNfse",
+    "RecepcionarLoteRps",
+    "RecepcionarXml",
+)
+CONEXOES_POR_PADRAO = 4
+TIMEOUT_SEGUNDOS = 60
+ERROS_CONEXAO_REPETIVEIS = (
+    http.client.RemoteDisconnected,
+    http.client.BadStatusLine,
+    ConnectionResetError,
+    BrokenPipeError,
+)
+
+RespostaSoap = namedtuple("RespostaSoap", ["status", "corpo", "duracao"])
+# incerto: a conexão caiu depois do envio de um método não idempotente (EnvioIncerto)
+ResultadoEnvio = namedtuple(
+    "ResultadoEnvio", ["indice", "metodo", "sucesso", "status", "corpo", "duracao", "erro", "incerto"],
+    defaults=(False,)
+)
+
+
+class EnvioIncerto(Exception):
+    """
+    A requisição de um método não idempotente foi escrita por inteiro, mas a resposta não
+    chegou: o servidor pode tê-la processado. Não é repetida automaticamente.
+    """
+
+    def __init__(self, metodo, erro):
+        super().__init__(f"{metodo}: conexão perdida após o envio ({erro!r}); confirme por consulta antes de reenviar.")
+        self.metodo = metodo
+
+
+# --- CONTEXTO TLS --- #
+def criar_contexto_tls(caminho_pfx=CAMINHO_CERT_PFX, senha_pfx=SENHA_PFX, verificar_servidor=True,
+                       cert_pem=None, key_pem=None):
+    """
+    Carrega o certificado do cliente no SSLContext uma única vez. O ssl só aceita a cadeia
+    a partir de arquivos, então os PEM são gravados em uma pasta temporária (permissão 0600)
+    e apagados assim que o contexto os carrega.
+    """
+    if cert_pem is None or key_pem is None:
+        cert_pem, key_pem = extrair_cert_e_chave_de_pfx(caminho_pfx, senha_pfx)
+
+    contexto = ssl.create_default_context(ssl.Purpose.SERVER_AUTH)
+    if not verificar_servidor:
+        # Mesmo comportamento do Blueprint (CURLOPT_SSL_VERIFYPEER = False)
+        contexto.check_hostname = False
+        contexto.verify_mode = ssl.CERT_NONE
+
+    with tempfile.TemporaryDirectory() as pasta_temporaria:
+        caminho_cert = os.path.join(pasta_temporaria, "cert.pem")
+        caminho_chave = os.path.join(pasta_temporaria, "key.pem")
+        for caminho, conteudo in ((caminho_cert, cert_pem), (caminho_chave, key_pem)):
+            descritor = os.open(caminho, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+            with os.fdopen(descritor, "wb") as arquivo:
+                arquivo.write(conteudo)
+        contexto.load_cert_chain(caminho_cert, caminho_chave)
+
+    return contexto
+
+
+# --- RESPOSTAS --- #
+def extrair_resultado(corpo):
+    """Devolve o elemento <{Metodo}Result> da resposta SOAP (ou o primeiro filho do Body)."""
+    raiz = etree.fromstring(corpo)
+    corpo_soap = raiz.find("{*}Body")
+    if corpo_soap is None or len(corpo_soap) == 0:
+        raise ValueError("Resposta SOAP sem Body.")
+    resposta = corpo_soap[0]
+    if etree.QName(resposta).localname == "Fault":
+        raise ValueError(f"SOAP Fault: {''.join(resposta.itertext()).strip()}")
+    resultado = next(iter(resposta), None)
+    return resultado if resultado is not None else resposta
+
+
+# --- CLIENTE --- #
+def conexao_encerrada(conexao):
+    """
+    Uma conexão ociosa não deveria ter nada para ler: socket legível significa que o servidor
+    a fechou (ou mandou algo fora de hora), e ela não deve ser reaproveitada.
+    """
+    if conexao.sock is None:
+        return False  # ainda não conectada; request() abre a conexão
+    try:
+        legiveis, _, _ = select.select([conexao.sock], [], [], 0)
+    except (OSError, ValueError):
+        return True
+    return bool(legiveis)
+
+
+class ClienteSoapNfse:
+    """
+    Cliente com pool de conexões persistentes. Para https, usa TLS mútuo com o certificado A1;
+    para http (servidor local de testes), dispensa o certificado.
+    """
+
+    def __init__(self, url=URL_WEBSERVICE_PILOTO, caminho_pfx=CAMINHO_CERT_PFX, senha_pfx=SENHA_PFX,
+                 conexoes=CONEXOES_POR_PADRAO, timeout=TIMEOUT_SEGUNDOS, verificar_servidor=True,
+                 contexto_tls=None):
+        partes_url = urlsplit(url)
+        self.url = url
+        self.host = partes_url.hostname
+        self.porta = partes_url.port
+        self.caminho = partes_url.path or "/"
+        self.https = partes_url.scheme == "https"
+        self.timeout = timeout
+        self.conexoes = conexoes
+        self.contexto_tls = None
+        if self.https:
+            self.contexto_tls = contexto_tls or criar_contexto_tls(
+                caminho_pfx, senha_pfx, verificar_servidor=verificar_servidor
+            )
+        self._pool = queue.LifoQueue()
+        self._semaforo = threading.BoundedSemaphore(conexoes)
+
+    def _nova_conexao(self):
+        if self.https:
+            return http.client.HTTPSConnection(self.host, self.porta, timeout=self.timeout, context=self.contexto_tls)
+        return http.client.HTTPConnection(self.host, self.porta, timeout=self.timeout)
+
+    def _obter_conexao(self):
+        """Devolve (conexao, reaproveitada); conexões ociosas já fechadas pelo servidor são descartadas."""
+        self._semaforo.acquire()
+        while True:
+            try:
+                conexao = self._pool.get_nowait()
+            except queue.Empty:
+                return self._nova_conexao(), False
+            if not conexao_encerrada(conexao):
+                return conexao, True
+            conexao.close()
+
+    def _devolver_conexao(self, conexao, reutilizavel=True):
+        if reutilizavel:
+            self._pool.put(conexao)
+        else:
+            conexao.close()
+        self._semaforo.release()
+
+    def enviar(self, metodo, xml):
+        """
+        Envia um envelope SOAP (bytes ou str) para `metodo` e devolve RespostaSoap.
+        Um método não idempotente só é repetido se a falha aconteceu antes de a requisição
+        ser escrita por inteiro em uma conexão reaproveitada; caso a conexão caia depois
+        disso, levanta EnvioIncerto.
+        """
+        if metodo not in METODOS_WEBSERVICE:
+            raise ValueError(f"Método desconhecido: {metodo}")
+        idempotente = metodo not in METODOS_NAO_IDEMPOTENTES
+        corpo = xml.encode("utf-8") if isinstance(xml, str) else xml
+        cabecalhos = {
+            "Content-Type": "text/xml; charset=utf-8",
+            "SOAPAction": f'"{NAMESPACE_NFSE}{metodo}"',
+            "Connection": "keep-alive",
+        }
+
+        inicio = time.perf_counter()
+        for tentativa in range(2):
+            conexao, reaproveitada = self._obter_conexao()
+            try:
+                conexao.request("POST", self.caminho, body=corpo, headers=cabecalhos)
+            except ERROS_CONEXAO_REPETIVEIS:
+                # O servidor não recebeu a requisição inteira: repetir não duplica o envio
+                self._devolver_conexao(conexao, reutilizavel=False)
+                if tentativa == 0 and (reaproveitada or idempotente):
+                    continue
+                raise
+            except Exception:
+                self._devolver_conexao(conexao, reutilizavel=False)
+                raise
+
+            try:
+                resposta = conexao.getresponse()
+                conteudo = resposta.read()
+            except ERROS_CONEXAO_REPETIVEIS as erro:
+                self._devolver_conexao(conexao, reutilizavel=False)
+                if not idempotente:
+                    raise EnvioIncerto(metodo, erro) from erro
+                # Consulta: conexão ociosa fechada pelo servidor; tenta uma vez com uma conexão nova
+                if tentativa == 1:
+                    raise
+                continue
+            except Exception as erro:
+                self._devolver_conexao(conexao, reutilizavel=False)
+                if not idempotente:
+                    raise EnvioIncerto(metodo, erro) from erro
+                raise
+            self._devolver_conexao(conexao, reutilizavel=not resposta.will_close)
+            return RespostaSoap(resposta.status, conteudo, time.perf_counter() - inicio)
+
+    def enviar_em_lote(self, requisicoes, maximo_em_voo=None):
+        """
+        Envia (metodo, xml) de `requisicoes` (pode ser um gerador) com no máximo `maximo_em_voo`
+        requisições em andamento (padrão: tamanho do pool). Entrega um ResultadoEnvio por
+        requisição, na ordem em que terminam; `indice` é a posição na entrada. Um resultado
+        com `incerto` pode ter sido processado pelo servidor e não deve ser reenviado às cegas.
+        """
+        maximo_em_voo = maximo_em_voo or self.conexoes
+
+        def enviar_item(indice, metodo, xml):
+            try:
+                resposta = self.enviar(metodo, xml)
+            except Exception as erro:
+                return ResultadoEnvio(indice, metodo, False, None, b"", 0.0, str(erro), isinstance(erro, EnvioIncerto))
+            return ResultadoEnvio(
+                indice, metodo, 200 <= resposta.status < 300, resposta.status, resposta.corpo, resposta.duracao, None
+            )
+
+        with ThreadPoolExecutor(max_workers=maximo_em_voo) as executor:
+            em_voo = set()
+            for indice, (metodo, xml) in enumerate(requisicoes):
+                if len(em_voo) >= maximo_em_voo:
+                    concluidas, em_voo = wait(em_voo, return_when=FIRST_COMPLETED)
+                    for futura in concluidas:
+                        yield futura.result()
+                em_voo.add(executor.submit(enviar_item, indice, metodo, xml))
+            for futura in as_completed(em_voo):
+                yield futura.result()
+
+    def fechar(self):
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except queue.Empty:
+                break
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.fechar()
@@ -0,0 +1,127 @@
+"""
+Controle das etapas de cada RPS em um banco SQLite, para retomar uma execução interrompida.
+
+Cada RPS é identificado pelo "id" gerado em acesso_api_google.passagem_lista_json e guarda a
+última etapa concluída (ETAPAS), o hash do registro de entrada e a data da última alteração;
+a tabela `eventos` guarda a data de cada etapa. As gravações ficam acumuladas em memória e
+vão para o banco em uma única transação a cada `tamanho_transacao` alterações (ou em gravar()).
+"""
+import hashlib
+import json
+import sqlite3
+from datetime import datetime
+
+# --- CONSTANTES --- #
+CAMINHO_BANCO_CONTROLE = "controle_etapas.sqlite3"
+ETAPAS = ("obtido", "gerado", "validado", "assinado", "enviado", "confirmado")
+TAMANHO_TRANSACAO = 500
+
+SQL_CRIAR_TABELAS = """
+CREATE TABLE IF NOT EXISTS rps (
+    id TEXT PRIMARY KEY,
+    etapa TEXT NOT NULL,
+    hash_conteudo TEXT,
+    erro TEXT,
+    criado_em TEXT NOT NULL,
+    atualizado_em TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS eventos (
+    id TEXT NOT NULL,
+    etapa TEXT NOT NULL,
+    erro TEXT,
+    em TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS eventos_por_id ON eventos (id);
+"""
+SQL_GRAVAR_RPS = """
+INSERT INTO rps (id, etapa, hash_conteudo, erro, criado_em, atualizado_em) VALUES (?, ?, ?, ?, ?, ?)
+ON CONFLICT (id) DO UPDATE SET
+    etapa = excluded.etapa,
+    hash_conteudo = COALESCE(excluded.hash_conteudo, rps.hash_conteudo),
+    erro = excluded.erro,
+    atualizado_em = excluded.atualizado_em
+"""
+SQL_GRAVAR_EVENTO = "INSERT INTO eventos (id, etapa, erro, em) VALUES (?, ?, ?, ?)"
+
+
+def hash_registro(dados):
+    """Hash do registro de entrada (dict da planilha ou bytes de um XML já gerado)."""
+    if isinstance(dados, bytes):
+        return hashlib.sha256(dados).hexdigest()
+    conteudo = json.dumps(dados, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(conteudo.encode("utf-8")).hexdigest()
+
+def indice_etapa(etapa):
+    return ETAPAS.index(etapa) if etapa in ETAPAS else -1
+
+
+class ControleEtapas:
+    """
+    Situação de todos os RPS já vistos, carregada uma vez na abertura e mantida em memória;
+    marcar() atualiza a memória na hora e o banco em lotes.
+    Situação de um id: (etapa, hash_conteudo, erro).
+    """
+
+    def __init__(self, caminho=CAMINHO_BANCO_CONTROLE, tamanho_transacao=TAMANHO_TRANSACAO):
+        self.caminho = caminho
+        self.tamanho_transacao = tamanho_transacao
+        self.conexao = sqlite3.connect(caminho)
+        self.conexao.execute("PRAGMA journal_mode=WAL")
+        self.conexao.execute("PRAGMA synchronous=NORMAL")
+        self.conexao.executescript(SQL_CRIAR_TABELAS)
+        self.situacoes = {
+            id_rps: (etapa, hash_conteudo, erro)
+            for id_rps, etapa, hash_conteudo, erro in self.conexao.execute(
+                "SELECT id, etapa, hash_conteudo, erro FROM rps"
+            )
+        }
+        self._alteracoes = []
+
+    def situacao(self, id_rps):
+        return self.situacoes.get(id_rps)
+
+    def marcar(self, id_rps, etapa, hash_conteudo=None, erro=None):
+        """
+        Registra que o RPS chegou a `etapa` (ou, com `erro`, que falhou na etapa seguinte a ela).
+        Sem `hash_conteudo`, mantém o hash já registrado.
+        """
+        if etapa not in ETAPAS:
+            raise ValueError(f"Etapa desconhecida: {etapa}")
+        anterior = self.situacoes.get(id_rps)
+        if hash_conteudo is None and anterior is not None:
+            hash_conteudo = anterior[1]
+        self.situacoes[id_rps] = (etapa, hash_conteudo, erro)
+        self._alteracoes.append((id_rps, etapa, hash_conteudo, erro, datetime.now().isoformat(timespec="milliseconds")))
+        if len(self._alteracoes) >= self.tamanho_transacao:
+            self.gravar()
+
+    def gravar(self):
+        if not self._alteracoes:
+            return
+        alteracoes, self._alteracoes = self._alteracoes, []
+        with self.conexao:  # uma transação para o lote inteiro
+            self.conexao.executemany(SQL_GRAVAR_RPS, (
+                (id_rps, etapa, hash_conteudo, erro, em, em)
+                for id_rps, etapa, hash_conteudo, erro, em in alteracoes
+            ))
+            self.conexao.executemany(SQL_GRAVAR_EVENTO, (
+                (id_rps, etapa, erro, em)
+                for id_rps, etapa, _, erro, em in alteracoes
+            ))
+
+    def contagem_por_etapa(self):
+        contagem = {}
+        for etapa, _, erro in self.situacoes.values():
+            chave = f"{etapa} (com erro)" if erro else etapa
+            contagem[chave] = contagem.get(chave, 0) + 1
+        return contagem
+
+    def fechar(self):
+        self.gravar()
+        self.conexao.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.fechar()
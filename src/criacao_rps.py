@@ -4,12 +4,28 @@ Baseado no modelo 'ArrayOfTcCompNfse' fornecido.
 """
 import json
 import os
+import re
+import time
+import argparse
+import multiprocessing
+from collections import deque
+from itertools import islice
 from xml.etree import ElementTree as et
 from datetime import datetime
 
+import instrumentacao
+
 # --- CONSTANTES --- #
 CAMINHO_JSON = "acesso_servidor_ftp/dados_gerar_rps.json"
+CAMINHO_NDJSON = "acesso_servidor_ftp/dados_gerar_rps.ndjson"
+SUFIXO_NDJSON_CONCLUIDO = ".concluido"
+INTERVALO_ESPERA_NDJSON = 0.2
 PASTA_SAIDA_XML = "pdf_xml_gerados_rps"
+TAMANHO_BLOCO_PROCESSOS = 256
+# Blocos enviados ao pool e ainda não devolvidos, por processo: limita a memória com entradas grandes
+BLOCOS_EM_ANDAMENTO_POR_PROCESSO = 2
+# Incrementar sempre que o XML gerado para os mesmos dados mudar (invalida o cache_artefatos)
+VERSAO_GERADOR_XML = 1
 NAMESPACES = {
     "xsi": "http://www.w3.org/2001/XMLSchema-instance",
     "xsd": "http://www.w3.org/2001/XMLSchema"
@@ -46,8 +62,56 @@ def criar_elemento_xml(pai, nome, texto=None):
         elemento.text = str(texto)
     return elemento
 
+# --- VALORES VARIÁVEIS DE CADA RPS --- #
+def extrair_valores_nfse(dados_nfse):
+    """
+    Reúne, já convertidos, todos os valores que mudam de uma NFSe para outra.
+    O restante do documento é fixo e fica em montar_arvore_nfse.
+    """
+    data_emissao = formatar_data_iso(dados_nfse.get("data_hora_emissao"))
+    return {
+        "numero_rps": dados_nfse.get("numero_rps", ""),
+        "data_emissao": data_emissao,
+        "natureza_operacao": extrair_codigo(dados_nfse.get("natureza_operacao", "1")),
+        "regime_especial_tributacao": dados_nfse.get("regime_especial_tributacao", "0"),
+        "optante_simples_nacional": extrair_codigo(dados_nfse.get("optante_simples_nacional", "1")),
+        "incentivador_cultural": extrair_codigo(dados_nfse.get("incentivador_cultural", "2")),
+        "valor_servicos": dados_nfse.get("valor_servicos", "0.00"),
+        "valor_deducoes": dados_nfse.get("valor_deducoes", "0.00"),
+        "valor_pis": dados_nfse.get("valor_pis", "0.00"),
+        "valor_cofins": dados_nfse.get("valor_cofins", "0.00"),
+        "valor_inss": dados_nfse.get("valor_inss", "0.00"),
+        "valor_ir": dados_nfse.get("valor_ir", "0.00"),
+        "valor_csll": dados_nfse.get("valor_csll", "0.00"),
+        "iss_retido": extrair_codigo(dados_nfse.get("iss_retido", "2")),
+        "valor_iss": dados_nfse.get("valor_iss", "0.00"),
+        "valor_iss_retido": dados_nfse.get("valor_iss_retido", "0.00"),
+        "outras_retencoes": dados_nfse.get("outras_retencoes", "0.00"),
+        "base_calculo": dados_nfse.get("base_calculo", "0.00"),
+        "aliquota": dados_nfse.get("aliquota", "0.00"),
+        "valor_liquido_nfse": dados_nfse.get("valor_liquido_nfse", "0.00"),
+        "desconto_incondicionado": dados_nfse.get("desconto_incondicionado", "0.00"),
+        "desconto_condicionado": dados_nfse.get("desconto_condicionado", "0.00"),
+        "item_lista_servicos": dados_nfse.get("item_lista_servicos", ""),
+        "discriminacao": dados_nfse.get("discriminacao", ""),
+        "cod_municipio_servico": dados_nfse.get("cod_municipio_servico", "0"),
+        "valor_credito": dados_nfse.get("valor_credito", "0.00"),
+        "tomador_com_cnpj": bool(dados_nfse.get("cnpj_tomador")),
+        "cnpj_tomador": dados_nfse.get("cnpj_tomador"),
+        "cpf_tomador": dados_nfse.get("cpf_tomador", ""),
+        "razao_social_tomador": dados_nfse.get("razao_social_tomador", ""),
+        "endereco_tomador": dados_nfse.get("endereco_tomador", ""),
+        "numero": dados_nfse.get("numero", ""),
+        "complemento": dados_nfse.get("complemento", ""),
+        "bairro": dados_nfse.get("bairro", ""),
+        "cod_municipio_tomador": dados_nfse.get("cod_municipio_tomador", "0"),
+        "uf": dados_nfse.get("uf", ""),
+        "cep": dados_nfse.get("cep", ""),
+        "email_tomador": dados_nfse.get("email_tomador", ""),
+    }
+
 # --- GERADOR XML (MODELO ArrayOfTcCompNfse) --- #
-def gerar_xml_nfse(dados_nfse):
+def montar_arvore_nfse(valores):
     root = et.Element("ArrayOfTcCompNfse", attrib={
         "xmlns:xsi": NAMESPACES["xsi"],
         "xmlns:xsd": NAMESPACES["xsd"]
@@ -56,41 +120,41 @@ def gerar_xml_nfse(dados_nfse):
     nfse = criar_elemento_xml(tc_comp_nfse, "Nfse")
     inf_nfse = criar_elemento_xml(nfse, "InfNfse")
 
-    criar_elemento_xml(inf_nfse, "Numero", dados_nfse.get("numero_rps", ""))
+    criar_elemento_xml(inf_nfse, "Numero", valores["numero_rps"])
     criar_elemento_xml(inf_nfse, "CodigoVerificacao", "ZAWB3F0M")
-    criar_elemento_xml(inf_nfse, "DataEmissao", formatar_data_iso(dados_nfse.get("data_hora_emissao")))
-    criar_elemento_xml(inf_nfse, "DataEmissaoRps", formatar_data_iso(dados_nfse.get("data_hora_emissao")))
-    criar_elemento_xml(inf_nfse, "NaturezaOperacao", extrair_codigo(dados_nfse.get("natureza_operacao", "1")))
-    criar_elemento_xml(inf_nfse, "RegimeEspecialTributacao", dados_nfse.get("regime_especial_tributacao", "0"))
-    criar_elemento_xml(inf_nfse, "OptanteSimplesNacional", extrair_codigo(dados_nfse.get("optante_simples_nacional", "1")))
-    criar_elemento_xml(inf_nfse, "IncentivadorCultural", extrair_codigo(dados_nfse.get("incentivador_cultural", "2")))
-    criar_elemento_xml(inf_nfse, "Competencia", formatar_data_iso(dados_nfse.get("data_hora_emissao")))
+    criar_elemento_xml(inf_nfse, "DataEmissao", valores["data_emissao"])
+    criar_elemento_xml(inf_nfse, "DataEmissaoRps", valores["data_emissao"])
+    criar_elemento_xml(inf_nfse, "NaturezaOperacao", valores["natureza_operacao"])
+    criar_elemento_xml(inf_nfse, "RegimeEspecialTributacao", valores["regime_especial_tributacao"])
+    criar_elemento_xml(inf_nfse, "OptanteSimplesNacional", valores["optante_simples_nacional"])
+    criar_elemento_xml(inf_nfse, "IncentivadorCultural", valores["incentivador_cultural"])
+    criar_elemento_xml(inf_nfse, "Competencia", valores["data_emissao"])
     criar_elemento_xml(inf_nfse, "NfseSubstituida", "0")
 
     servico = criar_elemento_xml(inf_nfse, "Servico")
-    valores = criar_elemento_xml(servico, "Valores")
-    criar_elemento_xml(valores, "ValorServicos", dados_nfse.get("valor_servicos", "0.00"))
-    criar_elemento_xml(valores, "ValorDeducoes", dados_nfse.get("valor_deducoes", "0.00"))
-    criar_elemento_xml(valores, "ValorPis", dados_nfse.get("valor_pis", "0.00"))
-    criar_elemento_xml(valores, "ValorCofins", dados_nfse.get("valor_cofins", "0.00"))
-    criar_elemento_xml(valores, "ValorInss", dados_nfse.get("valor_inss", "0.00"))
-    criar_elemento_xml(valores, "ValorIr", dados_nfse.get("valor_ir", "0.00"))
-    criar_elemento_xml(valores, "ValorCsll", dados_nfse.get("valor_csll", "0.00"))
-    criar_elemento_xml(valores, "IssRetido", extrair_codigo(dados_nfse.get("iss_retido", "2")))
-    criar_elemento_xml(valores, "ValorIss", dados_nfse.get("valor_iss", "0.00"))
-    criar_elemento_xml(valores, "ValorIssRetido", dados_nfse.get("valor_iss_retido", "0.00"))
-    criar_elemento_xml(valores, "OutrasRetencoes", dados_nfse.get("outras_retencoes", "0.00"))
-    criar_elemento_xml(valores, "BaseCalculo", dados_nfse.get("base_calculo", "0.00"))
-    criar_elemento_xml(valores, "Aliquota", dados_nfse.get("aliquota", "0.00"))
-    criar_elemento_xml(valores, "ValorLiquidoNfse", dados_nfse.get("valor_liquido_nfse", "0.00"))
-    criar_elemento_xml(valores, "DescontoIncondicionado", dados_nfse.get("desconto_incondicionado", "0.00"))
-    criar_elemento_xml(valores, "DescontoCondicionado", dados_nfse.get("desconto_condicionado", "0.00"))
-    criar_elemento_xml(servico, "ItemListaServico", dados_nfse.get("item_lista_servicos", ""))
+    valores_servico = criar_elemento_xml(servico, "Valores")
+    criar_elemento_xml(valores_servico, "ValorServicos", valores["valor_servicos"])
+    criar_elemento_xml(valores_servico, "ValorDeducoes", valores["valor_deducoes"])
+    criar_elemento_xml(valores_servico, "ValorPis", valores["valor_pis"])
+    criar_elemento_xml(valores_servico, "ValorCofins", valores["valor_cofins"])
+    criar_elemento_xml(valores_servico, "ValorInss", valores["valor_inss"])
+    criar_elemento_xml(valores_servico, "ValorIr", valores["valor_ir"])
+    criar_elemento_xml(valores_servico, "ValorCsll", valores["valor_csll"])
+    criar_elemento_xml(valores_servico, "IssRetido", valores["iss_retido"])
+    criar_elemento_xml(valores_servico, "ValorIss", valores["valor_iss"])
+    criar_elemento_xml(valores_servico, "ValorIssRetido", valores["valor_iss_retido"])
+    criar_elemento_xml(valores_servico, "OutrasRetencoes", valores["outras_retencoes"])
+    criar_elemento_xml(valores_servico, "BaseCalculo", valores["base_calculo"])
+    criar_elemento_xml(valores_servico, "Aliquota", valores["aliquota"])
+    criar_elemento_xml(valores_servico, "ValorLiquidoNfse", valores["valor_liquido_nfse"])
+    criar_elemento_xml(valores_servico, "DescontoIncondicionado", valores["desconto_incondicionado"])
+    criar_elemento_xml(valores_servico, "DescontoCondicionado", valores["desconto_condicionado"])
+    criar_elemento_xml(servico, "ItemListaServico", valores["item_lista_servicos"])
     criar_elemento_xml(servico, "CodigoCnae", "0")
-    criar_elemento_xml(servico, "Discriminacao", dados_nfse.get("discriminacao", ""))
-    criar_elemento_xml(servico, "CodigoMunicipio", dados_nfse.get("cod_municipio_servico", "0"))
+    criar_elemento_xml(servico, "Discriminacao", valores["discriminacao"])
+    criar_elemento_xml(servico, "CodigoMunicipio", valores["cod_municipio_servico"])
 
-    criar_elemento_xml(inf_nfse, "ValorCredito", dados_nfse.get("valor_credito", "0.00"))
+    criar_elemento_xml(inf_nfse, "ValorCredito", valores["valor_credito"])
 
     prestador = criar_elemento_xml(inf_nfse, "PrestadorServico")
     identificacao_prestador = criar_elemento_xml(prestador, "IdentificacaoPrestador")
@@ -108,21 +172,26 @@ def gerar_xml_nfse(dados_nfse):
     tomador = criar_elemento_xml(inf_nfse, "TomadorServico")
     identificacao_tomador = criar_elemento_xml(tomador, "IdentificacaoTomador")
     cpf_cnpj = criar_elemento_xml(identificacao_tomador, "CpfCnpj")
-    if dados_nfse.get("cnpj_tomador"):
-        criar_elemento_xml(cpf_cnpj, "Cnpj", dados_nfse.get("cnpj_tomador"))
+    if valores["tomador_com_cnpj"]:
+        criar_elemento_xml(cpf_cnpj, "Cnpj", valores["cnpj_tomador"])
     else:
-        criar_elemento_xml(cpf_cnpj, "Cpf", dados_nfse.get("cpf_tomador", ""))
-    criar_elemento_xml(tomador, "RazaoSocial", dados_nfse.get("razao_social_tomador", ""))
+        criar_elemento_xml(cpf_cnpj, "Cpf", valores["cpf_tomador"])
+    criar_elemento_xml(tomador, "RazaoSocial", valores["razao_social_tomador"])
     endereco_tomador = criar_elemento_xml(tomador, "Endereco")
-    criar_elemento_xml(endereco_tomador, "Endereco", dados_nfse.get("endereco_tomador", ""))
-    criar_elemento_xml(endereco_tomador, "Numero", dados_nfse.get("numero", ""))
-    criar_elemento_xml(endereco_tomador, "Complemento", dados_nfse.get("complemento", ""))
-    criar_elemento_xml(endereco_tomador, "Bairro", dados_nfse.get("bairro", ""))
-    criar_elemento_xml(endereco_tomador, "CodigoMunicipio", dados_nfse.get("cod_municipio_tomador", "0"))
-    criar_elemento_xml(endereco_tomador, "Uf", dados_nfse.get("uf", ""))
-    criar_elemento_xml(endereco_tomador, "Cep", dados_nfse.get("cep", ""))
+    criar_elemento_xml(endereco_tomador, "Endereco", valores["endereco_tomador"])
+    criar_elemento_xml(endereco_tomador, "Numero", valores["numero"])
+    criar_elemento_xml(endereco_tomador, "Complemento", valores["complemento"])
+    criar_elemento_xml(endereco_tomador, "Bairro", valores["bairro"])
+    criar_elemento_xml(endereco_tomador, "CodigoMunicipio", valores["cod_municipio_tomador"])
+    criar_elemento_xml(endereco_tomador, "Uf", valores["uf"])
+    criar_elemento_xml(endereco_tomador, "Cep", valores["cep"])
     contato = criar_elemento_xml(tomador, "Contato")
-    criar_elemento_xml(contato, "Email", dados_nfse.get("email_tomador", ""))
+    criar_elemento_xml(contato, "Email", valores["email_tomador"])
+
+    return root
+
+def gerar_xml_nfse(dados_nfse):
+    root = montar_arvore_nfse(extrair_valores_nfse(dados_nfse))
 
     et.indent(root, space="    ")
     xml_str = et.tostring(root, encoding="utf-8", xml_declaration=True).decode()
@@ -133,19 +202,296 @@ def gerar_xml_nfse(dados_nfse):
 
     return xml_str, nome_arquivo
 
-def gerar_nfse_a_partir_de_json():
-    try:
-        with open(CAMINHO_JSON, "r", encoding="utf-8") as f:
-            dados = json.load(f)
-    except Exception as e:
-        print(f"Erro ao ler JSON: {e}")
+# --- GERADOR RÁPIDO (TEMPLATE PRÉ-MONTADO) --- #
+MARCADOR_CAMPO = "\x00{}\x00"
+PADRAO_CAMPO_TEMPLATE = re.compile(r">\x00(\w+)\x00(</[^>]+>)")
+_templates_nfse = {}
+
+class _ValoresMarcadores(dict):
+    """Devolve um marcador no lugar de cada valor, para serializar o esqueleto do documento."""
+    def __missing__(self, chave):
+        return MARCADOR_CAMPO.format(chave)
+
+def montar_template_nfse(tomador_com_cnpj):
+    """
+    Serializa a estrutura de montar_arvore_nfse uma única vez (inclusive o bloco fixo do
+    prestador) e a divide em trechos literais e campos variáveis.
+    Retorna (trecho_inicial, [(chave, fechamento, trecho_seguinte), ...]).
+    """
+    root = montar_arvore_nfse(_ValoresMarcadores(tomador_com_cnpj=tomador_com_cnpj))
+    et.indent(root, space="    ")
+    xml_template = et.tostring(root, encoding="utf-8", xml_declaration=True).decode()
+
+    partes = PADRAO_CAMPO_TEMPLATE.split(xml_template)
+    campos = [
+        (partes[i], partes[i + 1], partes[i + 2])
+        for i in range(1, len(partes), 3)
+    ]
+    return partes[0], campos
+
+def obter_template_nfse(tomador_com_cnpj):
+    template = _templates_nfse.get(tomador_com_cnpj)
+    if template is None:
+        template = _templates_nfse[tomador_com_cnpj] = montar_template_nfse(tomador_com_cnpj)
+    return template
+
+def escapar_texto_xml(texto):
+    # Mesmo escape do ElementTree para o conteúdo de texto
+    if "&" in texto:
+        texto = texto.replace("&", "&amp;")
+    if "<" in texto:
+        texto = texto.replace("<", "&lt;")
+    if ">" in texto:
+        texto = texto.replace(">", "&gt;")
+    return texto
+
+def renderizar_xml_nfse(dados_nfse):
+    """
+    Gera os mesmos bytes de gerar_xml_nfse preenchendo o template pré-montado,
+    sem criar a árvore de elementos.
+    """
+    valores = extrair_valores_nfse(dados_nfse)
+    trecho_inicial, campos = obter_template_nfse(valores["tomador_com_cnpj"])
+
+    partes = [trecho_inicial]
+    for chave, fechamento, trecho_seguinte in campos:
+        valor = valores[chave]
+        texto = "" if valor is None else str(valor)
+        if texto:
+            partes.append(">")
+            partes.append(escapar_texto_xml(texto))
+            partes.append(fechamento)
+        else:
+            partes.append(" />")  # elemento sem texto, como o ElementTree serializa
+        partes.append(trecho_seguinte)
+    return "".join(partes).encode("utf-8")
+
+def gravar_xml_nfse_rapido(dados_nfse, pasta_saida=PASTA_SAIDA_XML):
+    nome_arquivo = f"nfse_{dados_nfse['id']}.xml"
+    with open(os.path.join(pasta_saida, nome_arquivo), "wb") as f:
+        f.write(renderizar_xml_nfse(dados_nfse))
+    return nome_arquivo
+
+_pasta_saida_processo = PASTA_SAIDA_XML
+
+def _inicializar_processo_geracao(pasta_saida):
+    global _pasta_saida_processo
+    _pasta_saida_processo = pasta_saida
+    obter_template_nfse(True)
+    obter_template_nfse(False)
+
+def _gravar_xml_no_processo(dados_nfse):
+    return gravar_xml_nfse_rapido(dados_nfse, _pasta_saida_processo)
+
+def mapear_em_blocos(pool, funcao, itens, tamanho_bloco, processos=None):
+    """
+    Como pool.imap(funcao, itens, chunksize=tamanho_bloco), mas consumindo `itens` aos poucos:
+    o imap lê o iterável inteiro de uma vez, enquanto aqui no máximo
+    BLOCOS_EM_ANDAMENTO_POR_PROCESSO blocos por processo ficam aguardando. Os resultados saem
+    na ordem dos itens, um por vez.
+    """
+    limite_em_andamento = BLOCOS_EM_ANDAMENTO_POR_PROCESSO * (processos or os.cpu_count() or 1)
+    itens = iter(itens)
+    em_andamento = deque()
+    while True:
+        while len(em_andamento) < limite_em_andamento:
+            bloco = list(islice(itens, tamanho_bloco))
+            if not bloco:
+                break
+            em_andamento.append(pool.map_async(funcao, bloco, chunksize=len(bloco)))
+        if not em_andamento:
+            return
+        yield from em_andamento.popleft().get()
+
+def gerar_xmls_em_paralelo(registros, pasta_saida=PASTA_SAIDA_XML, processos=None,
+                           tamanho_bloco=TAMANHO_BLOCO_PROCESSOS):
+    """
+    Gera e grava os XMLs dos registros em um pool de processos usando o template pré-montado.
+    `registros` pode ser um gerador (por exemplo, ler_registros_ndjson): é lido em blocos,
+    conforme os processos terminam os anteriores, e a memória não cresce com o arquivo.
+    Com processos=1 roda no processo atual. Produz os nomes dos arquivos gerados, na ordem.
+    """
+    if processos == 1:
+        for dados_nfse in registros:
+            yield gravar_xml_nfse_rapido(dados_nfse, pasta_saida)
         return
 
-    for nfse in dados:
-        xml_str, nome_arquivo = gerar_xml_nfse(nfse)
-        print(f"XML gerado: {nome_arquivo}")
+    with multiprocessing.Pool(
+        processes=processos,
+        initializer=_inicializar_processo_geracao,
+        initargs=(pasta_saida,)
+    ) as pool:
+        yield from mapear_em_blocos(pool, _gravar_xml_no_processo, registros, tamanho_bloco, processos)
 
-if __name__ == "__main__":
+def marcador_conclui_arquivo(caminho_concluido, arquivo):
+    """
+    True se o marcador `.concluido` existe e foi criado para a versão do NDJSON aberta em
+    `arquivo` (mesma assinatura_arquivo). Um marcador vazio, de versões anteriores, vale para qualquer versão.
+    """
+    from acesso_api_google import assinatura_arquivo
+
+    try:
+        with open(caminho_concluido, "r", encoding="utf-8") as marcador:
+            conteudo = marcador.read()
+    except OSError:
+        return False
+    if not conteudo.strip():
+        return True
+    try:
+        assinatura = json.loads(conteudo)
+    except ValueError:
+        return False
+    return assinatura is None or assinatura == assinatura_arquivo(os.fstat(arquivo.fileno()))
+
+def ler_registros_ndjson(caminho_ndjson, acompanhar=False, intervalo_espera=INTERVALO_ESPERA_NDJSON, leitura=None):
+    """
+    Lê um registro de RPS por linha do NDJSON, sem carregar o arquivo inteiro.
+    Com `acompanhar=True`, continua aguardando novas linhas até o escritor criar
+    o marcador `<arquivo>.concluido` desta versão do arquivo, permitindo gerar XMLs
+    enquanto o arquivo é escrito; se o arquivo for truncado por uma nova leitura da
+    planilha no meio do caminho, levanta ValueError.
+    Ao terminar, grava em `leitura["assinatura"]` a assinatura_arquivo da versão lida.
+    """
+    from acesso_api_google import assinatura_arquivo
+
+    caminho_concluido = caminho_ndjson + SUFIXO_NDJSON_CONCLUIDO
+    while acompanhar and not os.path.exists(caminho_ndjson):
+        time.sleep(intervalo_espera)
+
+    with open(caminho_ndjson, "r", encoding="utf-8") as f:
+        pendente = ""
+        concluido = False
+        while True:
+            trecho = f.readline()
+            if trecho:
+                pendente += trecho
+                if pendente.endswith("\n"):
+                    if pendente.strip():
+                        yield json.loads(pendente)
+                    pendente = ""
+                continue  # sem "\n" a linha ainda está sendo escrita
+
+            if not acompanhar or concluido:
+                break
+            if marcador_conclui_arquivo(caminho_concluido, f):
+                concluido = True  # uma última volta lê o que foi gravado antes do marcador
+                continue
+            if os.fstat(f.fileno()).st_size < f.tell():
+                raise ValueError(f"{caminho_ndjson} foi regravado por outra leitura da planilha durante a leitura.")
+            time.sleep(intervalo_espera)
+
+        if pendente.strip():
+            yield json.loads(pendente)
+        if leitura is not None:
+            leitura["assinatura"] = assinatura_arquivo(os.fstat(f.fileno()))
+
+
+def carregar_registros(caminho, acompanhar=False, leitura=None):
+    """
+    Registros do .ndjson (em fluxo) ou do .json. Com `leitura` (dict), recebe em "assinatura"
+    a assinatura_arquivo da versão lida, para confirmar_sincronizacao conferir.
+    """
+    if caminho.endswith(".ndjson"):
+        return ler_registros_ndjson(caminho, acompanhar=acompanhar, leitura=leitura)
+    with open(caminho, "r", encoding="utf-8") as f:
+        registros = json.load(f)
+        if leitura is not None:
+            from acesso_api_google import assinatura_arquivo
+            leitura["assinatura"] = assinatura_arquivo(os.fstat(f.fileno()))
+    return registros
+
+
+def entrada_padrao():
+    """
+    Arquivo de registros usado quando --entrada não é informado: o que a última leitura da
+    planilha ainda não confirmada gravou; senão, o mais recente entre o NDJSON e o JSON.
+    """
+    from acesso_api_google import arquivo_sincronizacao_pendente
+
+    arquivo_pendente = arquivo_sincronizacao_pendente()
+    if arquivo_pendente and os.path.exists(arquivo_pendente):
+        return arquivo_pendente
+    existentes = [caminho for caminho in (CAMINHO_NDJSON, CAMINHO_JSON) if os.path.exists(caminho)]
+    if not existentes:
+        return CAMINHO_JSON
+    return max(existentes, key=os.path.getmtime)
+
+
+def gerar_nfse_a_partir_de_json(caminho=CAMINHO_JSON, acompanhar=False, rapido=False,
+                                processos=None, tamanho_bloco=TAMANHO_BLOCO_PROCESSOS, leitura=None):
+    """
+    Gera os XMLs dos registros em `caminho`. Retorna False se a leitura falhar.
+    `leitura` é repassado a carregar_registros.
+    """
+    try:
+        dados = carregar_registros(caminho, acompanhar=acompanhar, leitura=leitura)
+        with instrumentacao.etapa("geracao_xml") as medicao:
+            if rapido:
+                for _ in gerar_xmls_em_paralelo(dados, processos=processos, tamanho_bloco=tamanho_bloco):
+                    medicao.itens += 1
+                instrumentacao.informar("resumo_geracao", f"{medicao.itens} XML(s) gerado(s).", xmls=medicao.itens)
+                return True
+            for nfse in dados:
+                xml_str, nome_arquivo = gerar_xml_nfse(nfse)
+                medicao.itens += 1
+                instrumentacao.mensagem("xml_gerado", f"XML gerado: {nome_arquivo}", arquivo=nome_arquivo)
+    except (OSError, ValueError) as e:
+        instrumentacao.informar("erro", f"Erro ao ler JSON: {e}")
+        return False
+    return True
+
+def main(argv=None, prog=None):
+    parser = argparse.ArgumentParser(prog=prog, description="Geração dos XMLs de NFSe a partir dos registros de RPS.")
+    parser.add_argument(
+        "--entrada",
+        default=None,
+        help="Arquivo .ndjson (um RPS por linha) ou .json exportado (padrão: o gravado pela última "
+             "leitura da planilha)."
+    )
+    parser.add_argument(
+        "--acompanhar",
+        action="store_true",
+        help="Para .ndjson: gera os XMLs enquanto o arquivo ainda está sendo escrito."
+    )
+    parser.add_argument(
+        "--rapido",
+        action="store_true",
+        help="Usa o template pré-montado e um pool de processos (mesmos bytes do gerador padrão)."
+    )
+    parser.add_argument(
+        "--processos",
+        type=int,
+        default=None,
+        help="Com --rapido: quantidade de processos (padrão: número de CPUs; 1 roda sem pool)."
+    )
+    parser.add_argument(
+        "--tamanho-bloco",
+        type=int,
+        default=TAMANHO_BLOCO_PROCESSOS,
+        help="Com --rapido: registros enviados por vez a cada processo."
+    )
+    instrumentacao.adicionar_argumentos(parser)
+    argumentos = parser.parse_args(argv)
+    instrumentacao.configurar_por_argumentos(argumentos)
+
+    entrada = argumentos.entrada or entrada_padrao()
     if not os.path.exists(PASTA_SAIDA_XML):
         os.makedirs(PASTA_SAIDA_XML)
-    gerar_nfse_a_partir_de_json()
\ No newline at end of file
+    leitura = {}
+    concluido = gerar_nfse_a_partir_de_json(
+        entrada,
+        acompanhar=argumentos.acompanhar,
+        rapido=argumentos.rapido,
+        processos=argumentos.processos,
+        tamanho_bloco=argumentos.tamanho_bloco,
+        leitura=leitura
+    )
+    if concluido and entrada in (CAMINHO_NDJSON, CAMINHO_JSON):
+        # O arquivo exportado pela leitura da planilha foi consumido (se for a versão gravada por ela)
+        from acesso_api_google import confirmar_sincronizacao
+        confirmar_sincronizacao(arquivo=entrada, assinatura=leitura.get("assinatura"))
+    instrumentacao.finalizar()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,422 @@
+"""
+Entrega por FTP dos XMLs assinados e PDFs (pdf_xml_assinados/) na máquina do cliente.
+
+As conexões ficam logadas em um pool (como as do cliente_soap) e vários arquivos sobem ao
+mesmo tempo, uma transferência por conexão; o ganho vem da latência por comando (com 2 a 5 ms
+por comando, 4 conexões entregam cerca de 3,5x mais rápido que uma, e sem latência empatam;
+ver benchmarks/bench_entrega_ftp.py). Com `agrupar`, os arquivos de um mesmo lote/prestador
+(a base do id em nfse_<id>.xml) vão juntos em um único lote_<base>.zip, com muito menos comandos.
+
+Cada arquivo sobe como <nome>.<hash>.parcial e só é renomeado para o nome final quando o
+tamanho no servidor confere; uma transferência interrompida continua de onde parou (REST)
+na execução seguinte. O manifesto (tamanho e sha256 do que já foi entregue) evita reenviar
+o que não mudou.
+
+A configuração fica em acesso_servidor_ftp/servidor_ftp.txt, no formato CHAVE=valor:
+    HOST=ftp.cliente.com.br
+    PORTA=21
+    USUARIO=nfse
+    SENHA=...
+    PASTA_REMOTA=/entrada/nfse
+    TLS=0
+
+Uso (a partir da raiz do projeto):
+    python src/entrega_ftp.py --agrupar --conexoes 4
+"""
+import argparse
+import ftplib
+import hashlib
+import json
+import os
+import queue
+import threading
+import time
+import zipfile
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, as_completed, wait
+from datetime import datetime
+
+import instrumentacao
+
+# --- CONSTANTES --- #
+PASTA_ARQUIVOS_ASSINADOS = "pdf_xml_assinados"
+ROTA_CONFIGURACAO_FTP = "acesso_servidor_ftp/servidor_ftp.txt"
+CAMINHO_MANIFESTO_ENTREGA = "acesso_servidor_ftp/manifesto_entrega.json"
+PASTA_PACOTES_ENTREGA = "acesso_servidor_ftp/pacotes"
+EXTENSOES_ENTREGA = (".xml", ".pdf")
+PREFIXO_ARQUIVO_NFSE = "nfse_"
+CONEXOES_FTP = 4
+TIMEOUT_FTP_SEGUNDOS = 60
+TENTATIVAS_ENVIO = 3
+TAMANHO_BLOCO_ENVIO = 64 * 1024
+SUFIXO_PARCIAL = ".parcial"
+GRAVAR_MANIFESTO_A_CADA = 100
+# Data fixa nas entradas do zip: o mesmo conteúdo gera sempre o mesmo pacote (e o mesmo hash)
+DATA_ENTRADAS_ZIP = (1980, 1, 1, 0, 0, 0)
+
+ItemEntrega = namedtuple("ItemEntrega", ["nome_remoto", "caminho_local", "tamanho", "sha256", "conteudo", "temporario"])
+ResultadoEntrega = namedtuple("ResultadoEntrega", ["item", "sucesso", "retomado", "duracao", "erro"])
+
+
+class ErroEntrega(Exception):
+    pass
+
+
+# --- CONFIGURAÇÃO --- #
+def carregar_configuracao_ftp(caminho=ROTA_CONFIGURACAO_FTP):
+    configuracao = {"PORTA": "21", "PASTA_REMOTA": "", "TLS": "0"}
+    with open(caminho, "r", encoding="utf-8") as arquivo:
+        for linha in arquivo:
+            linha = linha.strip()
+            if linha and not linha.startswith("#"):
+                chave, valor = linha.split("=", 1)
+                configuracao[chave.strip().upper()] = valor.strip()
+    faltando = [chave for chave in ("HOST", "USUARIO", "SENHA") if not configuracao.get(chave)]
+    if faltando:
+        raise ValueError(f"Configuração FTP incompleta em {caminho}: falta {', '.join(faltando)}")
+    return configuracao
+
+
+# --- MANIFESTO --- #
+def sha256_arquivo(caminho):
+    resumo = hashlib.sha256()
+    with open(caminho, "rb") as arquivo:
+        for bloco in iter(lambda: arquivo.read(TAMANHO_BLOCO_ENVIO), b""):
+            resumo.update(bloco)
+    return resumo.hexdigest()
+
+
+class ManifestoEntrega:
+    """
+    O que já foi entregue (nome remoto -> tamanho, sha256, conteúdo) e a impressão dos arquivos
+    locais (nome -> tamanho, mtime, sha256), para não recalcular o hash de arquivos sem alteração.
+    """
+
+    def __init__(self, caminho=CAMINHO_MANIFESTO_ENTREGA):
+        self.caminho = caminho
+        self.entregues = {}
+        self.arquivos = {}
+        if os.path.exists(caminho):
+            with open(caminho, "r", encoding="utf-8") as arquivo:
+                dados = json.load(arquivo)
+            self.entregues = dados.get("entregues", {})
+            self.arquivos = dados.get("arquivos", {})
+
+    def impressao(self, caminho):
+        """(tamanho, sha256) do arquivo; o hash só é recalculado se o tamanho ou o mtime mudou."""
+        estado = os.stat(caminho)
+        nome = os.path.basename(caminho)
+        anterior = self.arquivos.get(nome)
+        if anterior and anterior["tamanho"] == estado.st_size and anterior["mtime_ns"] == estado.st_mtime_ns:
+            return anterior["tamanho"], anterior["sha256"]
+        sha256 = sha256_arquivo(caminho)
+        self.arquivos[nome] = {"tamanho": estado.st_size, "mtime_ns": estado.st_mtime_ns, "sha256": sha256}
+        return estado.st_size, sha256
+
+    def entregue(self, nome_remoto, conteudo):
+        return self.entregues.get(nome_remoto, {}).get("conteudo") == conteudo
+
+    def registrar(self, item):
+        self.entregues[item.nome_remoto] = {
+            "tamanho": item.tamanho,
+            "sha256": item.sha256,
+            "conteudo": item.conteudo,
+            "entregue_em": datetime.now().isoformat(timespec="seconds"),
+        }
+
+    def gravar(self):
+        pasta = os.path.dirname(self.caminho)
+        if pasta:
+            os.makedirs(pasta, exist_ok=True)
+        caminho_temporario = self.caminho + ".tmp"
+        with open(caminho_temporario, "w", encoding="utf-8") as arquivo:
+            json.dump({"entregues": self.entregues, "arquivos": self.arquivos}, arquivo, ensure_ascii=False)
+        os.replace(caminho_temporario, self.caminho)
+
+
+# --- SELEÇÃO DOS ARQUIVOS --- #
+def chave_agrupamento(nome_arquivo):
+    """nfse_<base>-2.xml -> <base>: a base do id é o lote + CNPJ + inscrição municipal."""
+    raiz = os.path.splitext(nome_arquivo)[0]
+    if raiz.startswith(PREFIXO_ARQUIVO_NFSE):
+        raiz = raiz[len(PREFIXO_ARQUIVO_NFSE):]
+    return raiz.split("-", 1)[0]
+
+def listar_arquivos_entrega(pasta=PASTA_ARQUIVOS_ASSINADOS):
+    return sorted(
+        os.path.join(pasta, nome) for nome in os.listdir(pasta)
+        if nome.lower().endswith(EXTENSOES_ENTREGA)
+    )
+
+def montar_pacote_zip(caminho_zip, caminhos):
+    """Zip determinístico: entradas em ordem e com data fixa."""
+    os.makedirs(os.path.dirname(caminho_zip), exist_ok=True)
+    caminho_temporario = caminho_zip + ".tmp"
+    with zipfile.ZipFile(caminho_temporario, "w", zipfile.ZIP_DEFLATED) as pacote:
+        for caminho in caminhos:
+            entrada = zipfile.ZipInfo(os.path.basename(caminho), DATA_ENTRADAS_ZIP)
+            entrada.compress_type = zipfile.ZIP_DEFLATED
+            with open(caminho, "rb") as arquivo:
+                pacote.writestr(entrada, arquivo.read())
+    os.replace(caminho_temporario, caminho_zip)
+
+def itens_para_entrega(manifesto, pasta=PASTA_ARQUIVOS_ASSINADOS, agrupar=False, pasta_pacotes=PASTA_PACOTES_ENTREGA):
+    """
+    Gera os ItemEntrega ainda não entregues (ou alterados desde a entrega). Com `agrupar`, os
+    pacotes são montados aqui, conforme o envio os consome.
+    """
+    caminhos = listar_arquivos_entrega(pasta)
+    if not agrupar:
+        for caminho in caminhos:
+            tamanho, sha256 = manifesto.impressao(caminho)
+            nome_remoto = os.path.basename(caminho)
+            if manifesto.entregue(nome_remoto, sha256):
+                instrumentacao.contar("arquivos_ja_entregues")
+                continue
+            yield ItemEntrega(nome_remoto, caminho, tamanho, sha256, sha256, False)
+        return
+
+    grupos = {}
+    for caminho in caminhos:
+        grupos.setdefault(chave_agrupamento(os.path.basename(caminho)), []).append(caminho)
+    for chave, caminhos_grupo in grupos.items():
+        nome_remoto = f"lote_{chave}.zip"
+        # O conteúdo do pacote é identificado pelos nomes e hashes dos arquivos, sem montar o zip
+        membros = "\n".join(
+            f"{os.path.basename(caminho)}:{manifesto.impressao(caminho)[1]}" for caminho in caminhos_grupo
+        )
+        conteudo = hashlib.sha256(membros.encode("utf-8")).hexdigest()
+        if manifesto.entregue(nome_remoto, conteudo):
+            instrumentacao.contar("arquivos_ja_entregues", len(caminhos_grupo))
+            continue
+        caminho_zip = os.path.join(pasta_pacotes, nome_remoto)
+        montar_pacote_zip(caminho_zip, caminhos_grupo)
+        yield ItemEntrega(
+            nome_remoto, caminho_zip, os.path.getsize(caminho_zip), sha256_arquivo(caminho_zip), conteudo, True
+        )
+
+
+# --- CLIENTE --- #
+class ClienteFtpEntrega:
+    """Pool de conexões FTP (ou FTPS, com `tls`) já logadas e posicionadas na pasta remota."""
+
+    def __init__(self, host, porta=21, usuario="anonymous", senha="", pasta_remota="",
+                 conexoes=CONEXOES_FTP, timeout=TIMEOUT_FTP_SEGUNDOS, tls=False):
+        self.host = host
+        self.porta = int(porta)
+        self.usuario = usuario
+        self.senha = senha
+        self.pasta_remota = pasta_remota
+        self.conexoes = conexoes
+        self.timeout = timeout
+        self.tls = tls
+        self._pool = queue.LifoQueue()
+        self._semaforo = threading.BoundedSemaphore(conexoes)
+
+    @classmethod
+    def a_partir_de_configuracao(cls, configuracao, conexoes=CONEXOES_FTP):
+        return cls(
+            configuracao["HOST"], configuracao["PORTA"], configuracao["USUARIO"], configuracao["SENHA"],
+            configuracao["PASTA_REMOTA"], conexoes=conexoes, tls=configuracao["TLS"] in ("1", "sim", "true"),
+        )
+
+    def _nova_conexao(self):
+        conexao = ftplib.FTP_TLS(timeout=self.timeout) if self.tls else ftplib.FTP(timeout=self.timeout)
+        conexao.connect(self.host, self.porta)
+        conexao.login(self.usuario, self.senha)
+        if self.tls:
+            conexao.prot_p()
+        conexao.voidcmd("TYPE I")
+        if self.pasta_remota:
+            self._entrar_na_pasta(conexao, self.pasta_remota)
+        return conexao
+
+    @staticmethod
+    def _entrar_na_pasta(conexao, pasta_remota):
+        if pasta_remota.startswith("/"):
+            conexao.cwd("/")
+        for parte in filter(None, pasta_remota.split("/")):
+            try:
+                conexao.cwd(parte)
+            except ftplib.error_perm:
+                try:
+                    conexao.mkd(parte)
+                except ftplib.error_perm:
+                    pass  # criada ao mesmo tempo por outra conexão do pool
+                conexao.cwd(parte)
+
+    def _obter_conexao(self):
+        self._semaforo.acquire()
+        try:
+            return self._pool.get_nowait()
+        except queue.Empty:
+            try:
+                return self._nova_conexao()
+            except BaseException:
+                self._semaforo.release()
+                raise
+
+    def _devolver_conexao(self, conexao, reutilizavel=True):
+        if reutilizavel:
+            self._pool.put(conexao)
+        else:
+            try:
+                conexao.close()
+            except OSError:
+                pass
+        self._semaforo.release()
+
+    @staticmethod
+    def _tamanho_remoto(conexao, nome):
+        try:
+            return conexao.size(nome)
+        except ftplib.error_perm:
+            return None
+
+    def _transferir(self, conexao, item):
+        """Sobe o item em <nome>.<hash>.parcial, retomando o que já está lá, e renomeia. Devolve os bytes retomados."""
+        nome_parcial = f"{item.nome_remoto}.{item.sha256[:12]}{SUFIXO_PARCIAL}"
+        retomado = self._tamanho_remoto(conexao, nome_parcial) or 0
+        if retomado > item.tamanho:
+            conexao.delete(nome_parcial)
+            retomado = 0
+        if retomado < item.tamanho or item.tamanho == 0:
+            with open(item.caminho_local, "rb") as arquivo:
+                arquivo.seek(retomado)
+                conexao.storbinary(f"STOR {nome_parcial}", arquivo, TAMANHO_BLOCO_ENVIO, rest=retomado or None)
+
+        tamanho_remoto = self._tamanho_remoto(conexao, nome_parcial)
+        if tamanho_remoto != item.tamanho:
+            raise ErroEntrega(f"{item.nome_remoto}: {tamanho_remoto} byte(s) no servidor, esperado {item.tamanho}")
+        if self._tamanho_remoto(conexao, item.nome_remoto) is not None:
+            conexao.delete(item.nome_remoto)
+        conexao.rename(nome_parcial, item.nome_remoto)
+        return retomado
+
+    def enviar(self, item, tentativas=TENTATIVAS_ENVIO):
+        """Entrega um ItemEntrega; em erro de conexão, tenta de novo com outra conexão (retomando)."""
+        inicio = time.perf_counter()
+        for tentativa in range(tentativas):
+            conexao = self._obter_conexao()
+            try:
+                retomado = self._transferir(conexao, item)
+            except (ftplib.error_temp, ftplib.error_reply, EOFError, OSError):
+                self._devolver_conexao(conexao, reutilizavel=False)
+                if tentativa == tentativas - 1:
+                    raise
+                continue
+            except Exception:
+                self._devolver_conexao(conexao, reutilizavel=False)
+                raise
+            self._devolver_conexao(conexao)
+            return ResultadoEntrega(item, True, retomado, time.perf_counter() - inicio, None)
+
+    def enviar_em_lote(self, itens, maximo_em_voo=None):
+        """
+        Entrega os itens (pode ser um gerador) com no máximo `maximo_em_voo` transferências ao
+        mesmo tempo (padrão: tamanho do pool), na ordem em que terminam.
+        """
+        maximo_em_voo = maximo_em_voo or self.conexoes
+
+        def enviar_item(item):
+            try:
+                return self.enviar(item)
+            except Exception as erro:
+                return ResultadoEntrega(item, False, 0, 0.0, str(erro))
+
+        with ThreadPoolExecutor(max_workers=maximo_em_voo) as executor:
+            em_voo = set()
+            for item in itens:
+                if len(em_voo) >= maximo_em_voo:
+                    concluidas, em_voo = wait(em_voo, return_when=FIRST_COMPLETED)
+                    for futura in concluidas:
+                        yield futura.result()
+                em_voo.add(executor.submit(enviar_item, item))
+            for futura in as_completed(em_voo):
+                yield futura.result()
+
+    def fechar(self):
+        while True:
+            try:
+                conexao = self._pool.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                conexao.quit()
+            except ftplib.all_errors:
+                conexao.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.fechar()
+
+
+# --- FLUXO COMPLETO --- #
+def entregar_arquivos(cliente, manifesto, pasta=PASTA_ARQUIVOS_ASSINADOS, agrupar=False,
+                      pasta_pacotes=PASTA_PACOTES_ENTREGA):
+    """Entrega o que falta de `pasta` e devolve (entregues, falhas). O manifesto é gravado a cada GRAVAR_MANIFESTO_A_CADA."""
+    entregues = falhas = 0
+    try:
+        with instrumentacao.etapa("entrega_ftp") as medicao:
+            itens = itens_para_entrega(manifesto, pasta, agrupar, pasta_pacotes)
+            for resultado in cliente.enviar_em_lote(itens):
+                item = resultado.item
+                if not resultado.sucesso:
+                    falhas += 1
+                    instrumentacao.mensagem(
+                        "falha_entrega", f"  [FALHA] {item.nome_remoto}: {resultado.erro}",
+                        arquivo=item.nome_remoto, detalhe=resultado.erro
+                    )
+                    continue
+                entregues += 1
+                medicao.itens += 1
+                instrumentacao.contar("bytes_enviados", item.tamanho - resultado.retomado)
+                if resultado.retomado:
+                    instrumentacao.contar("bytes_retomados", resultado.retomado)
+                instrumentacao.mensagem(
+                    "arquivo_entregue", f"  [OK] {item.nome_remoto} entregue ({item.tamanho} bytes).",
+                    arquivo=item.nome_remoto, tamanho=item.tamanho, retomado=resultado.retomado
+                )
+                manifesto.registrar(item)
+                if item.temporario:
+                    os.remove(item.caminho_local)
+                if entregues % GRAVAR_MANIFESTO_A_CADA == 0:
+                    manifesto.gravar()
+    finally:
+        manifesto.gravar()
+    return entregues, falhas
+
+
+def main(argv=None, prog=None):
+    parser = argparse.ArgumentParser(prog=prog, description="Entrega por FTP dos XMLs assinados e PDFs.")
+    parser.add_argument("--pasta", default=PASTA_ARQUIVOS_ASSINADOS, help="Pasta com os arquivos a entregar.")
+    parser.add_argument("--agrupar", action="store_true", help="Um zip por lote/prestador em vez de arquivo a arquivo.")
+    parser.add_argument("--conexoes", type=int, default=CONEXOES_FTP, help="Conexões FTP simultâneas.")
+    parser.add_argument("--configuracao", default=ROTA_CONFIGURACAO_FTP, help="Arquivo CHAVE=valor do servidor FTP.")
+    parser.add_argument("--manifesto", default=CAMINHO_MANIFESTO_ENTREGA, help="Manifesto das entregas já feitas.")
+    instrumentacao.adicionar_argumentos(parser)
+    argumentos = parser.parse_args(argv)
+    instrumentacao.configurar_por_argumentos(argumentos)
+
+    if not os.path.isdir(argumentos.pasta):
+        instrumentacao.encerrar_com_erro("erro", f"[ERRO] Pasta de entrada não encontrada: {argumentos.pasta}")
+    try:
+        configuracao = carregar_configuracao_ftp(argumentos.configuracao)
+        manifesto = ManifestoEntrega(argumentos.manifesto)
+        with ClienteFtpEntrega.a_partir_de_configuracao(configuracao, argumentos.conexoes) as cliente:
+            entregues, falhas = entregar_arquivos(cliente, manifesto, argumentos.pasta, argumentos.agrupar)
+    except (OSError, ValueError, ftplib.all_errors) as erro:
+        instrumentacao.encerrar_com_erro("erro", f"[ERRO] {erro}")
+
+    instrumentacao.informar(
+        "resumo_entrega",
+        f"{entregues} arquivo(s) entregue(s), {falhas} com falha.",
+        entregues=entregues, falhas=falhas
+    )
+    instrumentacao.finalizar()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,580 @@
+"""
+Geração do DANFSE (Documento Auxiliar da NFS-e) em PDF a partir dos XMLs assinados.
+
+Cada <InfNfse> de um ArrayOfTcCompNfse vira uma ou mais páginas do PDF nfse_<id>.pdf, gravado
+ao lado do XML em pdf_xml_assinados/ (de onde a entrega_ftp envia os dois). O XML é lido com
+iterparse, guardando só os campos usados no documento; o bloco do prestador vem de
+DADOS_FIXOS_PRESTADOR.
+
+A renderização roda em um pool de processos. Cada processo carrega uma única vez os recursos
+fixos do layout: fontes (TTF opcionais em recursos_danfse/), logotipo e as linhas já
+formatadas do prestador. Os PDFs são gerados sem data de criação, então o mesmo XML gera
+sempre os mesmos bytes.
+
+O manifesto guarda o hash de cada XML renderizado e a assinatura do layout; sem --todos, só
+os XMLs novos ou alterados (ou todos, se o layout mudou) são renderizados de novo.
+
+Uso (a partir da raiz do projeto):
+    python src/geracao_danfse.py --processos 4
+"""
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import time
+from collections import namedtuple
+from datetime import datetime
+
+from lxml import etree
+from reportlab import rl_config
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.utils import ImageReader, simpleSplit
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+
+import instrumentacao
+from criacao_rps import DADOS_FIXOS_PRESTADOR
+
+# --- CONSTANTES --- #
+PASTA_ARQUIVOS_ASSINADOS = "pdf_xml_assinados"
+CAMINHO_MANIFESTO_DANFSE = "manifesto_danfse.json"
+PASTA_RECURSOS_DANFSE = "recursos_danfse"
+CAMINHO_LOGO = os.path.join(PASTA_RECURSOS_DANFSE, "logo.png")
+CAMINHO_FONTE = os.path.join(PASTA_RECURSOS_DANFSE, "fonte.ttf")
+CAMINHO_FONTE_NEGRITO = os.path.join(PASTA_RECURSOS_DANFSE, "fonte_negrito.ttf")
+FONTE_PADRAO = "Helvetica"
+FONTE_NEGRITO_PADRAO = "Helvetica-Bold"
+# Incrementar sempre que o desenho do DANFSE mudar (renderiza todos de novo)
+VERSAO_LAYOUT_DANFSE = 1
+TAMANHO_BLOCO_PROCESSOS = 8
+
+# Caminho relativo ao <InfNfse> -> campo usado no DANFSE; o resto do XML é ignorado
+CAMPOS_DANFSE = {
+    "Numero": "numero",
+    "CodigoVerificacao": "codigo_verificacao",
+    "DataEmissao": "data_emissao",
+    "Competencia": "competencia",
+    "NaturezaOperacao": "natureza_operacao",
+    "OptanteSimplesNacional": "optante_simples_nacional",
+    "Servico/Valores/ValorServicos": "valor_servicos",
+    "Servico/Valores/ValorDeducoes": "valor_deducoes",
+    "Servico/Valores/ValorPis": "valor_pis",
+    "Servico/Valores/ValorCofins": "valor_cofins",
+    "Servico/Valores/ValorInss": "valor_inss",
+    "Servico/Valores/ValorIr": "valor_ir",
+    "Servico/Valores/ValorCsll": "valor_csll",
+    "Servico/Valores/IssRetido": "iss_retido",
+    "Servico/Valores/ValorIss": "valor_iss",
+    "Servico/Valores/ValorIssRetido": "valor_iss_retido",
+    "Servico/Valores/OutrasRetencoes": "outras_retencoes",
+    "Servico/Valores/BaseCalculo": "base_calculo",
+    "Servico/Valores/Aliquota": "aliquota",
+    "Servico/Valores/ValorLiquidoNfse": "valor_liquido_nfse",
+    "Servico/Valores/DescontoIncondicionado": "desconto_incondicionado",
+    "Servico/Valores/DescontoCondicionado": "desconto_condicionado",
+    "Servico/ItemListaServico": "item_lista_servico",
+    "Servico/Discriminacao": "discriminacao",
+    "Servico/CodigoMunicipio": "codigo_municipio_servico",
+    "TomadorServico/IdentificacaoTomador/CpfCnpj/Cnpj": "cnpj_tomador",
+    "TomadorServico/IdentificacaoTomador/CpfCnpj/Cpf": "cpf_tomador",
+    "TomadorServico/RazaoSocial": "razao_social_tomador",
+    "TomadorServico/Endereco/Endereco": "endereco_tomador",
+    "TomadorServico/Endereco/Numero": "numero_tomador",
+    "TomadorServico/Endereco/Complemento": "complemento_tomador",
+    "TomadorServico/Endereco/Bairro": "bairro_tomador",
+    "TomadorServico/Endereco/CodigoMunicipio": "codigo_municipio_tomador",
+    "TomadorServico/Endereco/Uf": "uf_tomador",
+    "TomadorServico/Endereco/Cep": "cep_tomador",
+    "TomadorServico/Contato/Email": "email_tomador",
+}
+NATUREZAS_OPERACAO = {
+    "1": "Tributação no município",
+    "2": "Tributação fora do município",
+    "3": "Isenção",
+    "4": "Imune",
+    "5": "Exigibilidade suspensa por decisão judicial",
+    "6": "Exigibilidade suspensa por procedimento administrativo",
+}
+NOMES_MUNICIPIOS = {"4106902": "Curitiba"}
+# (rótulo, campo) do quadro de valores, em linhas de quatro colunas
+QUADRO_VALORES = [
+    [("Valor dos serviços", "valor_servicos"), ("Deduções", "valor_deducoes"),
+     ("Desconto incondicionado", "desconto_incondicionado"), ("Desconto condicionado", "desconto_condicionado")],
+    [("Base de cálculo", "base_calculo"), ("Alíquota", "aliquota"),
+     ("Valor do ISS", "valor_iss"), ("ISS retido", "valor_iss_retido")],
+    [("PIS", "valor_pis"), ("COFINS", "valor_cofins"), ("INSS", "valor_inss"), ("IR", "valor_ir")],
+    [("CSLL", "valor_csll"), ("Outras retenções", "outras_retencoes"),
+     ("Retenção de ISS", "iss_retido"), ("Valor líquido", "valor_liquido_nfse")],
+]
+
+# --- LAYOUT (pontos, A4 retrato) --- #
+LARGURA_PAGINA, ALTURA_PAGINA = A4
+MARGEM = 28
+LARGURA_UTIL = LARGURA_PAGINA - 2 * MARGEM
+ALTURA_CABECALHO = 70
+ALTURA_PRESTADOR = 74
+ALTURA_TOMADOR = 86
+ALTURA_VALORES = 124
+ALTURA_RODAPE = 40
+ALTURA_TITULO_CAIXA = 13
+TAMANHO_TEXTO = 8.5
+ENTRELINHA = 10.5
+TAMANHO_DISCRIMINACAO = 8.5
+ENTRELINHA_DISCRIMINACAO = 10.5
+
+# Conteúdo das páginas só comprimido, sem a codificação ASCII85: PDF menor e gerado mais rápido
+rl_config.useA85 = 0
+
+ResultadoDanfse = namedtuple("ResultadoDanfse", ["caminho_xml", "sucesso", "detalhe", "paginas"])
+
+
+# --- LEITURA DO XML --- #
+def ler_documentos_nfse(caminho_xml):
+    """
+    Gera um dicionário com os CAMPOS_DANFSE de cada <InfNfse> do arquivo. Os elementos são
+    descartados conforme o iterparse avança, então o consumo de memória não cresce com o arquivo.
+    """
+    caminho = []
+    documento = None
+    for evento, elemento in etree.iterparse(caminho_xml, events=("start", "end"), remove_blank_text=True):
+        tag = elemento.tag.rpartition("}")[2]
+        if evento == "start":
+            if documento is not None:
+                caminho.append(tag)
+            elif tag == "InfNfse":
+                documento = {}
+            continue
+
+        if documento is None:
+            if tag == "tcCompNfse":
+                elemento.clear()
+                while elemento.getprevious() is not None:
+                    del elemento.getparent()[0]
+            continue
+        if tag == "InfNfse" and not caminho:
+            yield documento
+            documento = None
+            continue
+        campo = CAMPOS_DANFSE.get("/".join(caminho))
+        if campo is not None:
+            documento[campo] = (elemento.text or "").strip()
+        caminho.pop()
+
+
+# --- FORMATAÇÃO --- #
+def formatar_moeda(valor):
+    try:
+        numero = float(valor)
+    except (TypeError, ValueError):
+        return valor or "-"
+    texto = f"{numero:,.2f}".replace(",", "_").replace(".", ",").replace("_", ".")
+    return f"R$ {texto}"
+
+def formatar_aliquota(valor):
+    try:
+        numero = float(valor)
+    except (TypeError, ValueError):
+        return valor or "-"
+    # A alíquota vem como fração (0.05); valores acima de 1 já estão em percentual
+    percentual = numero * 100 if numero <= 1 else numero
+    return f"{percentual:.2f}".replace(".", ",") + "%"
+
+def formatar_documento(cnpj=None, cpf=None):
+    if cnpj and len(cnpj) == 14 and cnpj.isdigit():
+        return f"CNPJ: {cnpj[:2]}.{cnpj[2:5]}.{cnpj[5:8]}/{cnpj[8:12]}-{cnpj[12:]}"
+    if cpf and len(cpf) == 11 and cpf.isdigit():
+        return f"CPF: {cpf[:3]}.{cpf[3:6]}.{cpf[6:9]}-{cpf[9:]}"
+    return f"CNPJ: {cnpj}" if cnpj else f"CPF: {cpf or '-'}"
+
+def formatar_cep(cep):
+    return f"{cep[:5]}-{cep[5:]}" if cep and len(cep) == 8 and cep.isdigit() else (cep or "-")
+
+def formatar_data_hora(valor):
+    try:
+        return datetime.strptime(valor.split(".")[0], "%Y-%m-%dT%H:%M:%S").strftime("%d/%m/%Y %H:%M")
+    except (AttributeError, ValueError):
+        return valor or "-"
+
+def formatar_competencia(valor):
+    try:
+        return datetime.strptime(valor[:10], "%Y-%m-%d").strftime("%m/%Y")
+    except (TypeError, ValueError):
+        return valor or "-"
+
+def nome_municipio(codigo, uf=""):
+    nome = NOMES_MUNICIPIOS.get(codigo, f"Município {codigo}" if codigo else "-")
+    return f"{nome}/{uf}" if uf else nome
+
+def valor_do_quadro(documento, campo):
+    valor = documento.get(campo, "")
+    if campo == "aliquota":
+        return formatar_aliquota(valor)
+    if campo == "iss_retido":
+        return "Sim" if valor == "1" else "Não"
+    return formatar_moeda(valor)
+
+
+# --- RECURSOS FIXOS DO LAYOUT --- #
+class RecursosDanfse:
+    """
+    Tudo o que é igual em todos os DANFSE: fontes registradas, logotipo já decodificado e as
+    linhas do prestador. Criado uma vez por processo.
+    """
+
+    def __init__(self, caminho_logo=CAMINHO_LOGO, caminho_fonte=CAMINHO_FONTE,
+                 caminho_fonte_negrito=CAMINHO_FONTE_NEGRITO):
+        self.fonte = self._registrar_fonte("FonteDanfse", caminho_fonte, FONTE_PADRAO)
+        self.fonte_negrito = self._registrar_fonte("FonteDanfseNegrito", caminho_fonte_negrito, FONTE_NEGRITO_PADRAO)
+        self.logo = ImageReader(caminho_logo) if caminho_logo and os.path.exists(caminho_logo) else None
+        self.linhas_prestador = self._linhas_prestador()
+
+    @staticmethod
+    def _registrar_fonte(nome, caminho, fonte_padrao):
+        if not caminho or not os.path.exists(caminho):
+            return fonte_padrao
+        if nome not in pdfmetrics.getRegisteredFontNames():
+            pdfmetrics.registerFont(TTFont(nome, caminho))
+        return nome
+
+    @staticmethod
+    def _linhas_prestador():
+        prestador = DADOS_FIXOS_PRESTADOR
+        return [
+            " ".join(prestador["nome_fantasia"].split()),
+            f"{formatar_documento(prestador['cnpj'])}    Inscrição municipal: {prestador['inscricao_municipal']}",
+            f"{prestador['endereco']}, {prestador['numero']} - {prestador['bairro']}"
+            f" - CEP {formatar_cep(prestador['cep'])} - {nome_municipio(prestador['codigo_municipio'], prestador['uf'])}",
+        ]
+
+def assinatura_layout(caminho_logo=CAMINHO_LOGO, caminho_fonte=CAMINHO_FONTE,
+                      caminho_fonte_negrito=CAMINHO_FONTE_NEGRITO):
+    """Muda quando o desenho, o prestador, o logotipo ou as fontes mudam."""
+    resumo = hashlib.sha256()
+    resumo.update(f"{VERSAO_LAYOUT_DANFSE}\n".encode("utf-8"))
+    resumo.update(json.dumps(DADOS_FIXOS_PRESTADOR, sort_keys=True).encode("utf-8"))
+    for caminho in (caminho_logo, caminho_fonte, caminho_fonte_negrito):
+        if caminho and os.path.exists(caminho):
+            with open(caminho, "rb") as arquivo:
+                resumo.update(hashlib.sha256(arquivo.read()).digest())
+    return resumo.hexdigest()
+
+
+# --- DESENHO --- #
+def _caixa(pdf, recursos, y_topo, altura, titulo=None):
+    """Desenha o retângulo (e a faixa de título) e devolve o y da primeira linha de texto."""
+    pdf.rect(MARGEM, y_topo - altura, LARGURA_UTIL, altura)
+    if titulo is None:
+        return y_topo - ENTRELINHA
+    pdf.setFillGray(0.9)
+    pdf.rect(MARGEM, y_topo - ALTURA_TITULO_CAIXA, LARGURA_UTIL, ALTURA_TITULO_CAIXA, stroke=1, fill=1)
+    pdf.setFillGray(0)
+    pdf.setFont(recursos.fonte_negrito, 7.5)
+    pdf.drawString(MARGEM + 4, y_topo - ALTURA_TITULO_CAIXA + 4, titulo)
+    return y_topo - ALTURA_TITULO_CAIXA - ENTRELINHA
+
+def _linhas(pdf, fonte, tamanho, x, y, linhas, entrelinha=ENTRELINHA):
+    pdf.setFont(fonte, tamanho)
+    for linha in linhas:
+        pdf.drawString(x, y, linha)
+        y -= entrelinha
+    return y
+
+def _cabecalho(pdf, recursos, documento):
+    y_topo = ALTURA_PAGINA - MARGEM
+    _caixa(pdf, recursos, y_topo, ALTURA_CABECALHO)
+    x_titulo = MARGEM + 8
+    if recursos.logo is not None:
+        pdf.drawImage(recursos.logo, MARGEM + 6, y_topo - ALTURA_CABECALHO + 6, 58, 58,
+                      preserveAspectRatio=True, mask="auto")
+        x_titulo += 62
+    pdf.setFont(recursos.fonte_negrito, 11)
+    pdf.drawString(x_titulo, y_topo - 24, "PREFEITURA MUNICIPAL DE CURITIBA")
+    pdf.setFont(recursos.fonte, 9)
+    pdf.drawString(x_titulo, y_topo - 38, "DANFSE - Documento Auxiliar da Nota Fiscal de Serviço Eletrônica")
+
+    x_quadro = LARGURA_PAGINA - MARGEM - 150
+    pdf.line(x_quadro, y_topo, x_quadro, y_topo - ALTURA_CABECALHO)
+    _linhas(pdf, recursos.fonte, TAMANHO_TEXTO, x_quadro + 6, y_topo - 14, [
+        f"Número da NFS-e: {documento.get('numero') or '-'}",
+        f"Emissão: {formatar_data_hora(documento.get('data_emissao'))}",
+        f"Competência: {formatar_competencia(documento.get('competencia'))}",
+        f"Código de verificação: {documento.get('codigo_verificacao') or '-'}",
+    ], entrelinha=13)
+    return y_topo - ALTURA_CABECALHO
+
+def _rodape(pdf, recursos, pagina, total_paginas):
+    pdf.setFont(recursos.fonte, 7)
+    pdf.drawString(
+        MARGEM, MARGEM + 4,
+        "Documento auxiliar; a autenticidade pode ser conferida no site da prefeitura com o código de verificação."
+    )
+    pdf.drawRightString(LARGURA_PAGINA - MARGEM, MARGEM + 4, f"Página {pagina} de {total_paginas}")
+
+def linhas_discriminacao(documento, recursos):
+    texto = (documento.get("discriminacao") or "-").replace("|", "\n")
+    return simpleSplit(texto, recursos.fonte, TAMANHO_DISCRIMINACAO, LARGURA_UTIL - 8) or ["-"]
+
+def _capacidade_discriminacao(altura):
+    return max(1, int((altura - ALTURA_TITULO_CAIXA - 6) // ENTRELINHA_DISCRIMINACAO))
+
+ALTURA_DISCRIMINACAO_PRIMEIRA = (
+    ALTURA_PAGINA - 2 * MARGEM - ALTURA_CABECALHO - ALTURA_PRESTADOR - ALTURA_TOMADOR - ALTURA_VALORES - ALTURA_RODAPE
+)
+ALTURA_DISCRIMINACAO_CONTINUACAO = ALTURA_PAGINA - 2 * MARGEM - ALTURA_CABECALHO - ALTURA_RODAPE
+LINHAS_PRIMEIRA_PAGINA = _capacidade_discriminacao(ALTURA_DISCRIMINACAO_PRIMEIRA)
+LINHAS_PAGINA_CONTINUACAO = _capacidade_discriminacao(ALTURA_DISCRIMINACAO_CONTINUACAO)
+
+def desenhar_documento(pdf, recursos, documento):
+    """Desenha as páginas de um <InfNfse> no canvas e devolve quantas foram."""
+    linhas = linhas_discriminacao(documento, recursos)
+    restantes = max(0, len(linhas) - LINHAS_PRIMEIRA_PAGINA)
+    total_paginas = 1 + -(-restantes // LINHAS_PAGINA_CONTINUACAO)
+
+    y = _cabecalho(pdf, recursos, documento)
+    y_texto = _caixa(pdf, recursos, y, ALTURA_PRESTADOR, "PRESTADOR DE SERVIÇOS")
+    _linhas(pdf, recursos.fonte, TAMANHO_TEXTO, MARGEM + 6, y_texto, recursos.linhas_prestador)
+    y -= ALTURA_PRESTADOR
+
+    y_texto = _caixa(pdf, recursos, y, ALTURA_TOMADOR, "TOMADOR DE SERVIÇOS")
+    endereco = ", ".join(filter(None, (
+        documento.get("endereco_tomador"), documento.get("numero_tomador"), documento.get("complemento_tomador")
+    )))
+    _linhas(pdf, recursos.fonte, TAMANHO_TEXTO, MARGEM + 6, y_texto, [
+        documento.get("razao_social_tomador") or "-",
+        formatar_documento(documento.get("cnpj_tomador"), documento.get("cpf_tomador")),
+        f"{endereco or '-'} - {documento.get('bairro_tomador') or '-'}"
+        f" - CEP {formatar_cep(documento.get('cep_tomador'))}",
+        nome_municipio(documento.get("codigo_municipio_tomador"), documento.get("uf_tomador")),
+        f"E-mail: {documento.get('email_tomador') or '-'}",
+    ])
+    y -= ALTURA_TOMADOR
+
+    y_texto = _caixa(pdf, recursos, y, ALTURA_DISCRIMINACAO_PRIMEIRA, "DISCRIMINAÇÃO DOS SERVIÇOS")
+    _linhas(pdf, recursos.fonte, TAMANHO_DISCRIMINACAO, MARGEM + 4, y_texto,
+            linhas[:LINHAS_PRIMEIRA_PAGINA], ENTRELINHA_DISCRIMINACAO)
+    y -= ALTURA_DISCRIMINACAO_PRIMEIRA
+
+    y_texto = _caixa(pdf, recursos, y, ALTURA_VALORES, "VALORES E TRIBUTOS")
+    largura_coluna = LARGURA_UTIL / 4
+    for linha_quadro in QUADRO_VALORES:
+        for coluna, (rotulo, campo) in enumerate(linha_quadro):
+            x = MARGEM + 6 + coluna * largura_coluna
+            pdf.setFont(recursos.fonte, 6.5)
+            pdf.drawString(x, y_texto, rotulo)
+            pdf.setFont(recursos.fonte_negrito, TAMANHO_TEXTO)
+            pdf.drawString(x, y_texto - 9, valor_do_quadro(documento, campo))
+        y_texto -= 22
+    natureza = documento.get("natureza_operacao", "")
+    _linhas(pdf, recursos.fonte, 7, MARGEM + 6, y_texto, [
+        f"Natureza da operação: {NATUREZAS_OPERACAO.get(natureza, natureza or '-')}    "
+        f"Item da lista de serviços: {documento.get('item_lista_servico') or '-'}    "
+        f"Local da prestação: {nome_municipio(documento.get('codigo_municipio_servico'))}",
+    ])
+    _rodape(pdf, recursos, 1, total_paginas)
+
+    for pagina in range(2, total_paginas + 1):
+        pdf.showPage()
+        y = _cabecalho(pdf, recursos, documento)
+        y_texto = _caixa(pdf, recursos, y, ALTURA_DISCRIMINACAO_CONTINUACAO, "DISCRIMINAÇÃO DOS SERVIÇOS (CONTINUAÇÃO)")
+        inicio = LINHAS_PRIMEIRA_PAGINA + (pagina - 2) * LINHAS_PAGINA_CONTINUACAO
+        _linhas(pdf, recursos.fonte, TAMANHO_DISCRIMINACAO, MARGEM + 4, y_texto,
+                linhas[inicio:inicio + LINHAS_PAGINA_CONTINUACAO], ENTRELINHA_DISCRIMINACAO)
+        _rodape(pdf, recursos, pagina, total_paginas)
+    pdf.showPage()
+    return total_paginas
+
+def caminho_pdf_de(caminho_xml, pasta_saida):
+    return os.path.join(pasta_saida, os.path.splitext(os.path.basename(caminho_xml))[0] + ".pdf")
+
+def renderizar_danfse(caminho_xml, recursos, pasta_saida=PASTA_ARQUIVOS_ASSINADOS):
+    """Gera o PDF de um XML assinado e devolve (caminho do PDF, páginas)."""
+    caminho_pdf = caminho_pdf_de(caminho_xml, pasta_saida)
+    caminho_temporario = caminho_pdf + ".tmp"
+    # invariant: sem data de criação nem id aleatório, o mesmo XML gera os mesmos bytes
+    pdf = canvas.Canvas(caminho_temporario, pagesize=A4, invariant=1)
+    pdf.setTitle(f"DANFSE {os.path.basename(caminho_xml)}")
+    paginas = 0
+    for documento in ler_documentos_nfse(caminho_xml):
+        paginas += desenhar_documento(pdf, recursos, documento)
+    if not paginas:
+        raise ValueError("Nenhum <InfNfse> encontrado no XML.")
+    pdf.save()
+    os.replace(caminho_temporario, caminho_pdf)
+    return caminho_pdf, paginas
+
+
+# --- POOL DE PROCESSOS --- #
+def _renderizar_com_recursos(recursos, caminho_xml, pasta_saida):
+    try:
+        caminho_pdf, paginas = renderizar_danfse(caminho_xml, recursos, pasta_saida)
+        return ResultadoDanfse(caminho_xml, True, caminho_pdf, paginas)
+    except Exception as erro:
+        caminho_temporario = caminho_pdf_de(caminho_xml, pasta_saida) + ".tmp"
+        if os.path.exists(caminho_temporario):
+            os.remove(caminho_temporario)
+        return ResultadoDanfse(caminho_xml, False, str(erro), 0)
+
+_recursos_processo = None
+_pasta_saida_processo = None
+
+def _inicializar_processo_danfse(pasta_saida, caminho_logo, caminho_fonte, caminho_fonte_negrito):
+    global _recursos_processo, _pasta_saida_processo
+    _recursos_processo = RecursosDanfse(caminho_logo, caminho_fonte, caminho_fonte_negrito)
+    _pasta_saida_processo = pasta_saida
+
+def _renderizar_no_processo(caminho_xml):
+    return _renderizar_com_recursos(_recursos_processo, caminho_xml, _pasta_saida_processo)
+
+def renderizar_em_paralelo(caminhos_xml, pasta_saida=PASTA_ARQUIVOS_ASSINADOS, processos=None,
+                           caminho_logo=CAMINHO_LOGO, caminho_fonte=CAMINHO_FONTE,
+                           caminho_fonte_negrito=CAMINHO_FONTE_NEGRITO, tamanho_bloco=TAMANHO_BLOCO_PROCESSOS):
+    """
+    Gera um ResultadoDanfse por XML, na ordem dos arquivos, conforme ficam prontos. Com
+    processos=1 renderiza no processo atual; caso contrário usa um pool em que cada processo
+    carrega os recursos do layout uma única vez.
+    """
+    if processos == 1:
+        recursos = RecursosDanfse(caminho_logo, caminho_fonte, caminho_fonte_negrito)
+        for caminho_xml in caminhos_xml:
+            yield _renderizar_com_recursos(recursos, caminho_xml, pasta_saida)
+        return
+
+    with multiprocessing.Pool(
+        processes=processos,
+        initializer=_inicializar_processo_danfse,
+        initargs=(pasta_saida, caminho_logo, caminho_fonte, caminho_fonte_negrito)
+    ) as pool:
+        yield from pool.imap(_renderizar_no_processo, caminhos_xml, chunksize=tamanho_bloco)
+
+
+# --- MANIFESTO (SÓ O QUE MUDOU) --- #
+class ManifestoDanfse:
+    """
+    XMLs já renderizados (nome -> tamanho, mtime e sha256) com a assinatura do layout usado.
+    Um XML com o mesmo tamanho e mtime não tem o hash recalculado.
+    """
+
+    def __init__(self, caminho=CAMINHO_MANIFESTO_DANFSE, assinatura=None):
+        self.caminho = caminho
+        self.assinatura = assinatura
+        self.documentos = {}
+        if os.path.exists(caminho):
+            with open(caminho, "r", encoding="utf-8") as arquivo:
+                dados = json.load(arquivo)
+            # Com outro layout, nenhum PDF anterior serve
+            if dados.get("assinatura") == assinatura:
+                self.documentos = dados.get("documentos", {})
+
+    def impressao(self, caminho_xml):
+        estado = os.stat(caminho_xml)
+        anterior = self.documentos.get(os.path.basename(caminho_xml))
+        if anterior and anterior["tamanho"] == estado.st_size and anterior["mtime_ns"] == estado.st_mtime_ns:
+            return anterior
+        with open(caminho_xml, "rb") as arquivo:
+            sha256 = hashlib.sha256(arquivo.read()).hexdigest()
+        return {"tamanho": estado.st_size, "mtime_ns": estado.st_mtime_ns, "sha256": sha256}
+
+    def alterado(self, caminho_xml, caminho_pdf, impressao):
+        anterior = self.documentos.get(os.path.basename(caminho_xml))
+        return anterior is None or anterior["sha256"] != impressao["sha256"] or not os.path.exists(caminho_pdf)
+
+    def registrar(self, caminho_xml, impressao):
+        self.documentos[os.path.basename(caminho_xml)] = impressao
+
+    def gravar(self):
+        pasta = os.path.dirname(self.caminho)
+        if pasta:
+            os.makedirs(pasta, exist_ok=True)
+        caminho_temporario = self.caminho + ".tmp"
+        with open(caminho_temporario, "w", encoding="utf-8") as arquivo:
+            json.dump({"assinatura": self.assinatura, "documentos": self.documentos}, arquivo, ensure_ascii=False)
+        os.replace(caminho_temporario, self.caminho)
+
+
+# --- FLUXO COMPLETO --- #
+def gerar_danfses(pasta=PASTA_ARQUIVOS_ASSINADOS, pasta_saida=None, processos=None, todos=False,
+                  caminho_manifesto=CAMINHO_MANIFESTO_DANFSE):
+    """Renderiza os DANFSE dos XMLs de `pasta` e devolve (pdfs, paginas, falhas)."""
+    pasta_saida = pasta_saida or pasta
+    if not os.path.exists(pasta):
+        instrumentacao.informar("erro", f"[ERRO] Pasta de entrada não encontrada: {pasta}")
+        return None
+    os.makedirs(pasta_saida, exist_ok=True)
+
+    manifesto = ManifestoDanfse(caminho_manifesto, assinatura_layout())
+    impressoes = {}
+    pendentes = []
+    for nome in sorted(os.listdir(pasta)):
+        if not nome.lower().endswith(".xml"):
+            continue
+        caminho_xml = os.path.join(pasta, nome)
+        impressao = impressoes[caminho_xml] = manifesto.impressao(caminho_xml)
+        if todos or manifesto.alterado(caminho_xml, caminho_pdf_de(caminho_xml, pasta_saida), impressao):
+            pendentes.append(caminho_xml)
+        else:
+            instrumentacao.contar("danfse_sem_alteracao")
+
+    if not pendentes:
+        instrumentacao.informar("nada_a_processar", "[INFO] Nenhum XML novo ou alterado para gerar o DANFSE.")
+        return 0, 0, 0
+
+    instrumentacao.informar("inicio_danfse", f"Gerando {len(pendentes)} DANFSE(s)...", pendentes=len(pendentes))
+    pdfs = paginas = falhas = 0
+    inicio = time.perf_counter()
+    try:
+        with instrumentacao.etapa("renderizacao_danfse") as medicao:
+            for resultado in renderizar_em_paralelo(pendentes, pasta_saida, processos):
+                nome_arquivo = os.path.basename(resultado.caminho_xml)
+                if not resultado.sucesso:
+                    falhas += 1
+                    instrumentacao.mensagem(
+                        "falha_danfse", f"  [FALHA] {nome_arquivo}: {resultado.detalhe}",
+                        arquivo=nome_arquivo, detalhe=resultado.detalhe
+                    )
+                    continue
+                pdfs += 1
+                paginas += resultado.paginas
+                # A vazão da etapa é em páginas por segundo
+                medicao.itens += resultado.paginas
+                manifesto.registrar(resultado.caminho_xml, impressoes[resultado.caminho_xml])
+                instrumentacao.mensagem(
+                    "danfse_gerado", f"  [OK] {nome_arquivo} -> {resultado.detalhe} ({resultado.paginas} página(s))",
+                    arquivo=nome_arquivo, destino=resultado.detalhe, paginas=resultado.paginas
+                )
+    finally:
+        manifesto.gravar()
+
+    duracao = time.perf_counter() - inicio
+    instrumentacao.contar("paginas_danfse", paginas)
+    instrumentacao.informar(
+        "resumo_danfse",
+        f"{pdfs} PDF(s) com {paginas} página(s) em {duracao:.2f}s"
+        f" ({paginas / duracao if duracao else 0:.1f} páginas/s), {falhas} com falha.",
+        pdfs=pdfs, paginas=paginas, falhas=falhas
+    )
+    return pdfs, paginas, falhas
+
+
+def main(argv=None, prog=None):
+    parser = argparse.ArgumentParser(prog=prog, description="Geração dos DANFSE (PDF) a partir dos XMLs assinados.")
+    parser.add_argument("--pasta", default=PASTA_ARQUIVOS_ASSINADOS, help="Pasta com os XMLs assinados.")
+    parser.add_argument("--saida", default=None, help="Pasta dos PDFs (padrão: a mesma dos XMLs).")
+    parser.add_argument(
+        "--processos",
+        type=int,
+        default=None,
+        help="Processos usados na renderização (padrão: número de CPUs; 1 roda sem pool)."
+    )
+    parser.add_argument("--todos", action="store_true", help="Renderiza todos os XMLs, mesmo os sem alteração.")
+    parser.add_argument("--manifesto", default=CAMINHO_MANIFESTO_DANFSE, help="Manifesto dos DANFSE já gerados.")
+    instrumentacao.adicionar_argumentos(parser)
+    argumentos = parser.parse_args(argv)
+    instrumentacao.configurar_por_argumentos(argumentos)
+    gerar_danfses(argumentos.pasta, argumentos.saida, argumentos.processos, argumentos.todos, argumentos.manifesto)
+    instrumentacao.finalizar()
+
+
+if __name__ == "__main__":
+    main()
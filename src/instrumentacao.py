@@ -0,0 +1,269 @@
+"""
+Instrumentação das etapas: tempos, contadores, mensagens agregadas e perfil opcional.
+
+As mensagens por linha/arquivo (ex.: "[IGNORADO] Linha 12 ...", "XML gerado: ...") passam por
+mensagem(): todas são contadas por categoria, mas só as `amostra` primeiras de cada categoria
+(e, com `a_cada`, uma a cada N) são exibidas. As mensagens avulsas de cada execução (erros,
+totais, "[INFO] ...") passam por informar(), que sempre as exibe. No fim, finalizar() mostra
+o resumo com os totais, o tempo e a vazão de cada etapa.
+
+Com formato "json", cada mensagem exibida, cada etapa concluída e o resumo final viram uma
+linha JSON (no arquivo de `caminho_log` ou na saída padrão, que então só recebe JSON). Com
+`perfil`, a execução roda sob cProfile (estatísticas gravadas em `caminho_perfil`) ou
+tracemalloc (maiores alocações).
+
+Cada processo tem as suas métricas; as etapas em pool de processos são medidas no processo
+principal, que recebe os resultados.
+"""
+import cProfile
+import io
+import json
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+
+# --- CONSTANTES --- #
+AMOSTRA_MENSAGENS_PADRAO = 5
+CAMINHO_PERFIL_PADRAO = "perfil_execucao.prof"
+PERFIS = ("cprofile", "tracemalloc")
+LINHAS_RESUMO_PERFIL = 15
+
+
+class Metricas:
+    def __init__(self, formato="texto", caminho_log=None, amostra=AMOSTRA_MENSAGENS_PADRAO, a_cada=0,
+                 perfil=None, caminho_perfil=CAMINHO_PERFIL_PADRAO):
+        if perfil not in (None,) + PERFIS:
+            raise ValueError(f"Perfil desconhecido: {perfil}")
+        self.formato = formato
+        self.amostra = amostra
+        self.a_cada = a_cada
+        self.perfil = perfil
+        self.caminho_perfil = caminho_perfil
+        self.saida_log = sys.stdout
+        self.log_em_arquivo = formato == "json" and caminho_log not in (None, "-")
+        if self.log_em_arquivo:
+            self.saida_log = open(caminho_log, "a", encoding="utf-8")
+        self.trava = threading.Lock()
+        self.inicio = time.perf_counter()
+        self.etapas = {}
+        self.contadores = {}
+        self.mensagens = {}
+        self.perfilador = None
+        self.perfil_ativo = perfil is not None
+        if perfil == "cprofile":
+            self.perfilador = cProfile.Profile()
+            self.perfilador.enable()
+        elif perfil == "tracemalloc":
+            tracemalloc.start()
+
+    def _registrar_evento(self, evento):
+        evento = {"ts": datetime.now().isoformat(timespec="milliseconds"), **evento}
+        self.saida_log.write(json.dumps(evento, ensure_ascii=False, default=str) + "\n")
+        self.saida_log.flush()
+
+    def mensagem(self, categoria, texto, **campos):
+        with self.trava:
+            contagem = self.mensagens.setdefault(categoria, {"total": 0, "exibidas": 0})
+            contagem["total"] += 1
+            total = contagem["total"]
+            exibir = (
+                self.amostra < 0
+                or total <= self.amostra
+                or (self.a_cada and total % self.a_cada == 0)
+            )
+            if exibir:
+                contagem["exibidas"] += 1
+        if exibir:
+            self.informar(categoria, texto, **campos)
+
+    def informar(self, categoria, texto, **campos):
+        """Exibe a mensagem sem amostragem nem contagem (para as mensagens avulsas da execução)."""
+        if self.formato == "json":
+            self._registrar_evento({"tipo": "mensagem", "categoria": categoria, "mensagem": texto.strip(), **campos})
+        else:
+            print(texto)
+
+    def contar(self, nome, quantidade=1):
+        with self.trava:
+            self.contadores[nome] = self.contadores.get(nome, 0) + quantidade
+
+    @contextmanager
+    def etapa(self, nome):
+        medicao = MedicaoEtapa(nome)
+        inicio = time.perf_counter()
+        try:
+            yield medicao
+        finally:
+            segundos = time.perf_counter() - inicio
+            with self.trava:
+                acumulado = self.etapas.setdefault(nome, {"segundos": 0.0, "itens": 0, "execucoes": 0})
+                acumulado["segundos"] += segundos
+                acumulado["itens"] += medicao.itens
+                acumulado["execucoes"] += 1
+            if self.formato == "json":
+                self._registrar_evento({
+                    "tipo": "etapa", "etapa": nome, "segundos": round(segundos, 4), "itens": medicao.itens,
+                    "por_segundo": round(medicao.itens / segundos, 1) if segundos and medicao.itens else None,
+                })
+
+    def resumo(self):
+        etapas = {
+            nome: dict(
+                acumulado,
+                segundos=round(acumulado["segundos"], 4),
+                por_segundo=round(acumulado["itens"] / acumulado["segundos"], 1)
+                if acumulado["segundos"] and acumulado["itens"] else None,
+            )
+            for nome, acumulado in self.etapas.items()
+        }
+        return {
+            "duracao_segundos": round(time.perf_counter() - self.inicio, 4),
+            "etapas": etapas,
+            "contadores": dict(self.contadores),
+            "mensagens": {categoria: dict(contagem) for categoria, contagem in self.mensagens.items()},
+        }
+
+    def _finalizar_perfil(self, resumo):
+        if not self.perfil_ativo:
+            return None
+        self.perfil_ativo = False
+        if self.perfil == "cprofile":
+            self.perfilador.disable()
+            self.perfilador.dump_stats(self.caminho_perfil)
+            texto = io.StringIO()
+            pstats.Stats(self.perfilador, stream=texto).sort_stats("cumulative").print_stats(LINHAS_RESUMO_PERFIL)
+            resumo["perfil"] = {"tipo": "cprofile", "arquivo": self.caminho_perfil}
+            return texto.getvalue()
+        if self.perfil == "tracemalloc":
+            atual, pico = tracemalloc.get_traced_memory()
+            maiores = tracemalloc.take_snapshot().statistics("lineno")[:LINHAS_RESUMO_PERFIL]
+            tracemalloc.stop()
+            resumo["perfil"] = {
+                "tipo": "tracemalloc",
+                "memoria_atual_kb": atual // 1024,
+                "memoria_pico_kb": pico // 1024,
+                "maiores_alocacoes": [str(estatistica) for estatistica in maiores],
+            }
+            return "\n".join(resumo["perfil"]["maiores_alocacoes"])
+        return None
+
+    def finalizar(self):
+        resumo = self.resumo()
+        texto_perfil = self._finalizar_perfil(resumo)
+
+        if self.formato == "json":
+            self._registrar_evento({"tipo": "resumo", **resumo})
+            self.fechar()
+            return resumo
+
+        print("--- RESUMO DA EXECUÇÃO ---")
+        for nome, etapa in resumo["etapas"].items():
+            vazao = f" ({etapa['por_segundo']:.1f}/s)" if etapa["por_segundo"] else ""
+            print(f"Etapa {nome}: {etapa['itens']} item(ns) em {etapa['segundos']:.2f}s{vazao}")
+        for nome, valor in resumo["contadores"].items():
+            print(f"{nome}: {valor}")
+        for categoria, contagem in resumo["mensagens"].items():
+            ocultas = contagem["total"] - contagem["exibidas"]
+            sufixo = f" ({ocultas} não exibida(s))" if ocultas else ""
+            print(f"Mensagens {categoria}: {contagem['total']}{sufixo}")
+        if texto_perfil:
+            print(texto_perfil)
+        print(f"Duração total: {resumo['duracao_segundos']:.2f}s")
+        return resumo
+
+    def fechar(self):
+        """Interrompe o perfil ainda ativo e fecha o arquivo de log, sem emitir o resumo."""
+        if self.perfil_ativo:
+            self.perfil_ativo = False
+            if self.perfil == "cprofile":
+                self.perfilador.disable()
+            else:
+                tracemalloc.stop()
+        if self.log_em_arquivo and not self.saida_log.closed:
+            self.saida_log.close()
+
+
+class MedicaoEtapa:
+    """Devolvida por etapa(); some em `itens` o que foi processado para o cálculo da vazão."""
+
+    def __init__(self, nome):
+        self.nome = nome
+        self.itens = 0
+
+
+# --- INSTÂNCIA DO PROCESSO --- #
+# Sem configurar(), as mensagens seguem em texto, com amostragem padrão
+_metricas = Metricas()
+
+def configurar(formato="texto", caminho_log=None, amostra=AMOSTRA_MENSAGENS_PADRAO, a_cada=0,
+               perfil=None, caminho_perfil=CAMINHO_PERFIL_PADRAO):
+    """Reinicia as métricas do processo com as opções da execução, fechando as da anterior."""
+    global _metricas
+    _metricas.fechar()
+    _metricas = Metricas(formato, caminho_log, amostra, a_cada, perfil, caminho_perfil)
+    return _metricas
+
+def mensagem(categoria, texto, **campos):
+    _metricas.mensagem(categoria, texto, **campos)
+
+def informar(categoria, texto, **campos):
+    _metricas.informar(categoria, texto, **campos)
+
+def contar(nome, quantidade=1):
+    _metricas.contar(nome, quantidade)
+
+def etapa(nome):
+    return _metricas.etapa(nome)
+
+def resumo():
+    return _metricas.resumo()
+
+def finalizar():
+    return _metricas.finalizar()
+
+def encerrar_com_erro(categoria, texto, **campos):
+    """Exibe o erro, emite o resumo da execução (fechando o log) e encerra com código 1."""
+    informar(categoria, texto, **campos)
+    finalizar()
+    raise SystemExit(1)
+
+
+# --- LINHA DE COMANDO --- #
+def adicionar_argumentos(parser):
+    grupo = parser.add_argument_group("instrumentação")
+    grupo.add_argument(
+        "--log-json",
+        nargs="?",
+        const="-",
+        default=None,
+        metavar="CAMINHO",
+        help="Mensagens, etapas e resumo em JSON, uma linha por evento (sem caminho: saída padrão)."
+    )
+    grupo.add_argument(
+        "--amostra-mensagens",
+        type=int,
+        default=AMOSTRA_MENSAGENS_PADRAO,
+        help="Mensagens exibidas por categoria antes de só contar (-1 exibe todas)."
+    )
+    grupo.add_argument(
+        "--mensagens-a-cada",
+        type=int,
+        default=0,
+        help="Depois da amostra, exibe uma mensagem a cada N de cada categoria."
+    )
+    grupo.add_argument("--perfil", choices=PERFIS, default=None, help="Roda a execução sob cProfile ou tracemalloc.")
+    grupo.add_argument("--arquivo-perfil", default=CAMINHO_PERFIL_PADRAO, help="Com --perfil cprofile: arquivo .prof.")
+
+def configurar_por_argumentos(argumentos):
+    return configurar(
+        formato="json" if argumentos.log_json else "texto",
+        caminho_log=argumentos.log_json,
+        amostra=argumentos.amostra_mensagens,
+        a_cada=argumentos.mensagens_a_cada,
+        perfil=argumentos.perfil,
+        caminho_perfil=argumentos.arquivo_perfil,
+    )
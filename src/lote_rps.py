@@ -0,0 +1,312 @@
+"""
+Montagem dos lotes de RPS (EnviarLoteRpsEnvio) para o método RecepcionarLoteRps do webservice
+da Prefeitura de Curitiba, conforme o envelope de exemplo em
+manual_exemplo_sistema_prefeitura/BlueprintPHP/XML/Arquivo.xml.
+
+Os registros de dados_gerar_rps (.json ou .ndjson) são agrupados por
+numero_lote/cnpj_prestador/inscricao_municipal_prestador, divididos em lotes de no máximo
+`tamanho_maximo` RPS, e cada InfRps e cada LoteRps são assinados com a mesma SessaoAssinatura.
+As partes de um lote dividido recebem números derivados do número do lote e do índice da parte
+(numero_lote_parte), na faixa a partir de INICIO_NUMERACAO_PARTES; os números de lote da planilha
+devem ficar abaixo dessa faixa. Reexecutar com os mesmos registros gera os mesmos números.
+"""
+import argparse
+import os
+import re
+from lxml import etree
+
+import criacao_rps
+import instrumentacao
+from certifica_xml import SessaoAssinatura
+from criacao_rps import extrair_codigo, extrair_valores_nfse
+
+# --- CONSTANTES --- #
+NAMESPACE_SOAP = "http://www.w3.org/2003/05/soap-envelope"
+NAMESPACE_NFSE = "http://www.e-governeapps2.com.br/"
+NAMESPACE_DS = "http://www.w3.org/2000/09/xmldsig#"
+NSMAP_ENVELOPE = {"soap": NAMESPACE_SOAP, "e": NAMESPACE_NFSE}
+PASTA_LOTES = "lotes_rps"
+CAMINHO_MODELO_LOTE = os.path.join(
+    "manual_exemplo_sistema_prefeitura", "BlueprintPHP", "XML", "Arquivo.xml"
+)
+TAMANHO_MAXIMO_LOTE = 50
+# Faixa reservada às partes de lotes divididos (NumeroLote tem até 15 dígitos); a planilha usa os menores
+INICIO_NUMERACAO_PARTES = 900_000_000_000_000
+# Parte p do lote n: INICIO_NUMERACAO_PARTES + n * PARTES_POR_LOTE + p, com n < LIMITE_LOTE_DIVIDIDO
+PARTES_POR_LOTE = 1000
+LIMITE_LOTE_DIVIDIDO = (10 ** 15 - INICIO_NUMERACAO_PARTES) // PARTES_POR_LOTE
+PADRAO_NAO_DIGITOS = re.compile(r"\D")
+# O atributo Id é um xs:ID: só letras, dígitos, "-", "_" e "."
+PADRAO_CARACTERES_ID = re.compile(r"[^\w.-]", re.ASCII)
+
+
+# --- FUNÇÕES AUXILIARES --- #
+def somente_digitos(valor):
+    return PADRAO_NAO_DIGITOS.sub("", str(valor or ""))
+
+def sub(pai, nome, texto=None):
+    elemento = etree.SubElement(pai, f"{{{NAMESPACE_NFSE}}}{nome}")
+    if texto is not None:
+        elemento.text = str(texto)
+    return elemento
+
+def chave_lote(dados_nfse):
+    return (
+        dados_nfse.get("numero_lote", ""),
+        somente_digitos(dados_nfse.get("cnpj_prestador")),
+        somente_digitos(dados_nfse.get("inscricao_municipal_prestador")),
+    )
+
+def numero_lote_parte(numero_lote, parte):
+    """
+    Número do lote enviado: o da planilha quando o lote não foi dividido; senão,
+    INICIO_NUMERACAO_PARTES + numero_lote * PARTES_POR_LOTE + parte. O número depende só do lote
+    e da parte, então uma nova execução com os mesmos registros reenvia os mesmos números, e
+    duas partes (de lotes iguais ou diferentes) nunca coincidem entre si nem com a planilha.
+    """
+    numero = int(somente_digitos(numero_lote) or 0)
+    if numero >= INICIO_NUMERACAO_PARTES:
+        raise ValueError(
+            f"Número de lote {numero_lote} na faixa reservada aos lotes divididos (>= {INICIO_NUMERACAO_PARTES})."
+        )
+    if parte is None:
+        return str(numero_lote)
+    if numero >= LIMITE_LOTE_DIVIDIDO or not 1 <= parte < PARTES_POR_LOTE:
+        raise ValueError(
+            f"O lote {numero_lote} não pode ser dividido na parte {parte}: só lotes abaixo de "
+            f"{LIMITE_LOTE_DIVIDIDO} e até {PARTES_POR_LOTE - 1} partes têm número reservado."
+        )
+    return str(INICIO_NUMERACAO_PARTES + numero * PARTES_POR_LOTE + parte)
+
+
+# --- AGRUPAMENTO --- #
+def agrupar_registros_em_lotes(registros, tamanho_maximo=TAMANHO_MAXIMO_LOTE, chave_grupo=chave_lote):
+    """
+    Agrupa os registros por `chave_grupo` (padrão: numero_lote, cnpj, inscrição municipal) e
+    entrega (chave, parte, registros) a cada `tamanho_maximo` registros de um mesmo grupo.
+    Apenas os grupos ainda abertos ficam em memória. `parte` é None quando o grupo
+    coube inteiro em um único lote e 1, 2, ... quando precisou ser dividido.
+    """
+    grupos_abertos = {}
+    partes_emitidas = {}
+
+    for dados_nfse in registros:
+        chave = chave_grupo(dados_nfse)
+        grupo = grupos_abertos.setdefault(chave, [])
+        if len(grupo) == tamanho_maximo:
+            # Só agora se sabe que o grupo não cabe em um lote: emite a parte cheia
+            partes_emitidas[chave] = partes_emitidas.get(chave, 0) + 1
+            yield chave, partes_emitidas[chave], grupo
+            grupo = grupos_abertos[chave] = []
+        grupo.append(dados_nfse)
+
+    for chave, grupo in grupos_abertos.items():
+        parte = partes_emitidas[chave] + 1 if chave in partes_emitidas else None
+        yield chave, parte, grupo
+
+
+# --- MONTAGEM DO XML --- #
+def id_inf_rps(dados_nfse):
+    """
+    Id do InfRps a partir do "id" único do registro (acesso_api_google.alocar_identificador),
+    para que duas linhas com o mesmo número/série não gerem a mesma referência assinada.
+    """
+    identificador = dados_nfse.get("id")
+    if not identificador:
+        raise ValueError(f"Registro sem id (RPS {dados_nfse.get('numero_rps')}); gere os registros novamente.")
+    return f"rps{PADRAO_CARACTERES_ID.sub('', str(identificador))}"
+
+def montar_inf_rps(rps, dados_nfse, cnpj_prestador, inscricao_municipal):
+    valores = extrair_valores_nfse(dados_nfse)
+    identificador_inf_rps = id_inf_rps(dados_nfse)
+
+    inf_rps = sub(rps, "InfRps")
+    inf_rps.set("Id", identificador_inf_rps)
+    identificacao_rps = sub(inf_rps, "IdentificacaoRps")
+    sub(identificacao_rps, "Numero", valores["numero_rps"])
+    sub(identificacao_rps, "Serie", dados_nfse.get("serie_rps", ""))
+    sub(identificacao_rps, "Tipo", extrair_codigo(dados_nfse.get("tipo_rps", "1")))
+    sub(inf_rps, "DataEmissao", valores["data_emissao"])
+    sub(inf_rps, "NaturezaOperacao", valores["natureza_operacao"])
+    sub(inf_rps, "RegimeEspecialTributacao", extrair_codigo(valores["regime_especial_tributacao"]))
+    sub(inf_rps, "OptanteSimplesNacional", valores["optante_simples_nacional"])
+    sub(inf_rps, "IncentivadorCultural", valores["incentivador_cultural"])
+    sub(inf_rps, "Status", extrair_codigo(dados_nfse.get("status", "1")) or "1")
+
+    servico = sub(inf_rps, "Servico")
+    valores_servico = sub(servico, "Valores")
+    for nome, chave in (
+        ("ValorServicos", "valor_servicos"),
+        ("ValorDeducoes", "valor_deducoes"),
+        ("ValorPis", "valor_pis"),
+        ("ValorCofins", "valor_cofins"),
+        ("ValorInss", "valor_inss"),
+        ("ValorIr", "valor_ir"),
+        ("ValorCsll", "valor_csll"),
+        ("IssRetido", "iss_retido"),
+        ("ValorIss", "valor_iss"),
+        ("ValorIssRetido", "valor_iss_retido"),
+        ("OutrasRetencoes", "outras_retencoes"),
+        ("BaseCalculo", "base_calculo"),
+        ("Aliquota", "aliquota"),
+        ("ValorLiquidoNfse", "valor_liquido_nfse"),
+        ("DescontoIncondicionado", "desconto_incondicionado"),
+        ("DescontoCondicionado", "desconto_condicionado"),
+    ):
+        sub(valores_servico, nome, valores[chave])
+    sub(servico, "ItemListaServico", valores["item_lista_servicos"])
+    sub(servico, "Discriminacao", valores["discriminacao"])
+    sub(servico, "CodigoMunicipio", valores["cod_municipio_servico"])
+
+    prestador = sub(inf_rps, "Prestador")
+    sub(prestador, "Cnpj", cnpj_prestador)
+    sub(prestador, "InscricaoMunicipal", inscricao_municipal)
+
+    tomador = sub(inf_rps, "Tomador")
+    identificacao_tomador = sub(tomador, "IdentificacaoTomador")
+    cpf_cnpj = sub(identificacao_tomador, "CpfCnpj")
+    if valores["tomador_com_cnpj"]:
+        sub(cpf_cnpj, "Cnpj", somente_digitos(valores["cnpj_tomador"]))
+    else:
+        sub(cpf_cnpj, "Cpf", somente_digitos(valores["cpf_tomador"]))
+    sub(tomador, "RazaoSocial", valores["razao_social_tomador"])
+    endereco = sub(tomador, "Endereco")
+    sub(endereco, "Endereco", valores["endereco_tomador"])
+    sub(endereco, "Numero", valores["numero"])
+    sub(endereco, "Complemento", valores["complemento"])
+    sub(endereco, "Bairro", valores["bairro"])
+    sub(endereco, "CodigoMunicipio", valores["cod_municipio_tomador"])
+    sub(endereco, "Uf", valores["uf"])
+    sub(endereco, "Cep", somente_digitos(valores["cep"]))
+    contato = sub(tomador, "Contato")
+    sub(contato, "Email", valores["email_tomador"])
+
+    return identificador_inf_rps
+
+def montar_envelope_lote(numero_lote, cnpj_prestador, inscricao_municipal, registros, sessao=None):
+    """
+    Monta o envelope SOAP de RecepcionarLoteRps com QuantidadeRps = len(registros).
+    Um Id de InfRps repetido no lote gera ValueError antes de qualquer assinatura.
+    Com `sessao`, assina cada InfRps (Signature dentro de Rps) e, por último, o LoteRps
+    (Signature dentro de EnviarLoteRpsEnvio). Devolve o elemento raiz do envelope.
+    """
+    envelope = etree.Element(f"{{{NAMESPACE_SOAP}}}Envelope", nsmap=NSMAP_ENVELOPE)
+    etree.SubElement(envelope, f"{{{NAMESPACE_SOAP}}}Header")
+    corpo = etree.SubElement(envelope, f"{{{NAMESPACE_SOAP}}}Body")
+    enviar_lote = sub(sub(corpo, "RecepcionarLoteRps"), "EnviarLoteRpsEnvio")
+
+    id_lote = f"lote{PADRAO_CARACTERES_ID.sub('', str(numero_lote))}"
+    lote = sub(enviar_lote, "LoteRps")
+    lote.set("Id", id_lote)
+    sub(lote, "NumeroLote", numero_lote)
+    sub(lote, "Cnpj", cnpj_prestador)
+    sub(lote, "InscricaoMunicipal", inscricao_municipal)
+    sub(lote, "QuantidadeRps", len(registros))
+    lista_rps = sub(lote, "ListaRps")
+
+    ids_inf_rps = set()
+    for dados_nfse in registros:
+        rps = sub(lista_rps, "Rps")
+        id_rps = montar_inf_rps(rps, dados_nfse, cnpj_prestador, inscricao_municipal)
+        if id_rps in ids_inf_rps:
+            # Duas assinaturas apontariam para o mesmo Id; recusa antes de assinar
+            raise ValueError(f"Id {id_rps} repetido no lote {numero_lote}.")
+        ids_inf_rps.add(id_rps)
+        if sessao is not None:
+            sessao.assinar_referencia(rps, id_rps)
+
+    if sessao is not None:
+        sessao.assinar_referencia(enviar_lote, id_lote)
+
+    return envelope
+
+def gerar_lotes(registros, sessao=None, tamanho_maximo=TAMANHO_MAXIMO_LOTE):
+    """
+    Entrega (numero_lote, envelope) para cada lote montado a partir dos registros; as partes
+    dos lotes divididos são numeradas por numero_lote_parte.
+    """
+    for (numero_lote, cnpj, inscricao), parte, grupo in agrupar_registros_em_lotes(registros, tamanho_maximo):
+        numero = numero_lote_parte(numero_lote, parte)
+        yield numero, montar_envelope_lote(numero, cnpj, inscricao, grupo, sessao)
+
+def gravar_lotes(registros, pasta_saida=PASTA_LOTES, sessao=None, tamanho_maximo=TAMANHO_MAXIMO_LOTE):
+    if not os.path.exists(pasta_saida):
+        os.makedirs(pasta_saida)
+
+    caminhos = []
+    for numero_lote, envelope in gerar_lotes(registros, sessao, tamanho_maximo):
+        caminho = os.path.join(pasta_saida, f"lote_{numero_lote}.xml")
+        with open(caminho, "wb") as f:
+            f.write(etree.tostring(envelope, encoding="utf-8", xml_declaration=True))
+        caminhos.append(caminho)
+    return caminhos
+
+
+# --- CONFERÊNCIA COM O ENVELOPE DE EXEMPLO --- #
+def estrutura_elemento(elemento, caminho=""):
+    """
+    Conjunto de caminhos de tags (sem repetição) de um XML, ignorando as assinaturas.
+    Serve para comparar um lote gerado com o envelope de exemplo da prefeitura.
+    """
+    caminhos = set()
+    if elemento.tag == f"{{{NAMESPACE_DS}}}Signature":
+        return caminhos
+    caminho_atual = f"{caminho}/{etree.QName(elemento).localname}"
+    caminhos.add(caminho_atual)
+    for filho in elemento.iterchildren(tag=etree.Element):
+        caminhos |= estrutura_elemento(filho, caminho_atual)
+    return caminhos
+
+def conferir_estrutura_modelo(envelope, caminho_modelo=CAMINHO_MODELO_LOTE):
+    """
+    Compara o envelope com o modelo e devolve (faltando, sobrando): caminhos de tags do
+    modelo ausentes no envelope e caminhos do envelope que o modelo não tem.
+    """
+    modelo = etree.parse(caminho_modelo).getroot()
+    estrutura_modelo = estrutura_elemento(modelo)
+    estrutura_envelope = estrutura_elemento(envelope)
+    return sorted(estrutura_modelo - estrutura_envelope), sorted(estrutura_envelope - estrutura_modelo)
+
+
+def main(argv=None, prog=None):
+    parser = argparse.ArgumentParser(prog=prog, description="Monta e assina os lotes de RPS (EnviarLoteRpsEnvio).")
+    parser.add_argument(
+        "--entrada",
+        default=None,
+        help="Arquivo .ndjson ou .json de registros (padrão: o gravado pela última leitura da planilha)."
+    )
+    parser.add_argument("--tamanho-maximo", type=int, default=TAMANHO_MAXIMO_LOTE, help="Máximo de RPS por lote.")
+    parser.add_argument("--sem-assinatura", action="store_true", help="Monta os lotes sem assiná-los.")
+    parser.add_argument(
+        "--conferir-modelo",
+        action="store_true",
+        help=f"Confere a estrutura de cada lote com {CAMINHO_MODELO_LOTE}."
+    )
+    instrumentacao.adicionar_argumentos(parser)
+    argumentos = parser.parse_args(argv)
+    instrumentacao.configurar_por_argumentos(argumentos)
+
+    try:
+        registros = criacao_rps.carregar_registros(argumentos.entrada or criacao_rps.entrada_padrao())
+        sessao = None if argumentos.sem_assinatura else SessaoAssinatura()
+        with instrumentacao.etapa("montagem_lotes") as medicao:
+            caminhos = gravar_lotes(registros, sessao=sessao, tamanho_maximo=argumentos.tamanho_maximo)
+            medicao.itens = len(caminhos)
+    except Exception as erro:
+        instrumentacao.encerrar_com_erro("erro", f"[ERRO] Erro ao montar os lotes: {erro}")
+
+    for caminho in caminhos:
+        instrumentacao.mensagem("lote_gerado", f"Lote gerado: {caminho}", arquivo=caminho)
+        if argumentos.conferir_modelo:
+            faltando, sobrando = conferir_estrutura_modelo(etree.parse(caminho).getroot())
+            if faltando or sobrando:
+                instrumentacao.mensagem(
+                    "lote_fora_do_modelo",
+                    f"  [ATENÇÃO] {caminho}: estrutura diferente do modelo. Faltando: {faltando} Sobrando: {sobrando}",
+                    arquivo=caminho, faltando=faltando, sobrando=sobrando
+                )
+    instrumentacao.finalizar()
+
+
+if __name__ == "__main__":
+    main()
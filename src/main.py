@@ -0,0 +1,190 @@
+"""
+Linha de comando única das etapas da emissão, com um subcomando por etapa.
+
+Cada etapa só é importada quando o seu subcomando é chamado: a ajuda e as etapas leves não
+carregam o cliente do Google, o signxml, o cryptography nem o reportlab. Sem subcomando,
+roda o pipeline em memória (pipeline.py), como antes.
+
+O subcomando `observar` fica em execução e repete o pipeline sempre que a entrada muda
+(opcionalmente sincronizando a planilha antes), mantendo carregados entre um ciclo e outro
+o certificado, o XSD compilado, o cache, o controle de etapas e o serviço do Sheets.
+
+Uso (a partir da raiz do projeto):
+    python src/main.py planilha
+    python src/main.py pipeline --processos 4
+    python src/main.py observar --planilha --intervalo 60
+    python src/main.py entregar -h
+"""
+import argparse
+import importlib
+import os
+import sys
+import time
+
+# --- CONSTANTES --- #
+# subcomando: (módulo com main(argv, prog), descrição)
+SUBCOMANDOS = {
+    "planilha": ("acesso_api_google", "Lê a planilha (incremental) e grava o NDJSON de RPS."),
+    "gerar": ("criacao_rps", "Gera os XMLs de NFSe a partir dos registros."),
+    "certificar": ("certifica_xml", "Valida e assina os XMLs gerados."),
+    "pipeline": ("pipeline", "Gera, valida e assina em memória (padrão sem subcomando)."),
+    "lotes": ("lote_rps", "Monta e assina os lotes de RPS."),
+    "acompanhar": ("acompanhamento_protocolos", "Envia os lotes e acompanha os protocolos."),
+    "danfse": ("geracao_danfse", "Gera os DANFSE (PDF) dos XMLs assinados."),
+    "entregar": ("entrega_ftp", "Entrega por FTP os XMLs assinados e PDFs."),
+    "cancelar": ("cancelamento_nfse", "Cancela NFS-e em lote."),
+    "observar": (None, "Repete o pipeline a cada alteração da entrada, sem recarregar certificado e XSD."),
+}
+SUBCOMANDO_PADRAO = "pipeline"
+INTERVALO_OBSERVACAO_SEGUNDOS = 30.0
+
+
+# --- MODO DE OBSERVAÇÃO --- #
+def assinatura_entrada(caminho):
+    """
+    Tamanho e data de modificação do arquivo de registros (ou dos .xml da pasta), para saber
+    se a entrada mudou desde o último ciclo. None se ela ainda não existir.
+    """
+    if os.path.isdir(caminho):
+        return tuple(sorted(
+            (entrada.name, entrada.stat().st_size, entrada.stat().st_mtime_ns)
+            for entrada in os.scandir(caminho) if entrada.name.endswith(".xml")
+        ))
+    if not os.path.exists(caminho):
+        return None
+    estado = os.stat(caminho)
+    return estado.st_size, estado.st_mtime_ns
+
+
+def observar(argv=None, prog=None):
+    import certifica_xml
+    import criacao_rps
+    import instrumentacao
+    import pipeline
+    from cache_artefatos import criar_cache_artefatos
+    from controle_etapas import ControleEtapas
+
+    parser = argparse.ArgumentParser(prog=prog, description=SUBCOMANDOS["observar"][1])
+    pipeline.adicionar_argumentos_pipeline(parser)
+    parser.add_argument(
+        "--intervalo",
+        type=float,
+        default=INTERVALO_OBSERVACAO_SEGUNDOS,
+        help="Segundos entre uma verificação da entrada e a seguinte."
+    )
+    parser.add_argument(
+        "--planilha",
+        action="store_true",
+        help="A cada ciclo, sincroniza antes a planilha (só as linhas novas ou alteradas)."
+    )
+    parser.add_argument("--ciclos", type=int, default=0, help="Encerra depois de N ciclos (padrão: até Ctrl+C).")
+    instrumentacao.adicionar_argumentos(parser)
+    argumentos = parser.parse_args(argv)
+    if argumentos.planilha and argumentos.da_pasta:
+        parser.error("--planilha não pode ser usado com --da-pasta.")
+    instrumentacao.configurar_por_argumentos(argumentos)
+
+    if argumentos.da_pasta:
+        caminho_entrada = argumentos.entrada or certifica_xml.CAMINHO_PASTA_XML
+    elif argumentos.planilha:
+        caminho_entrada = argumentos.entrada or criacao_rps.CAMINHO_NDJSON
+    else:
+        caminho_entrada = argumentos.entrada or criacao_rps.entrada_padrao()
+    argumentos.entrada = caminho_entrada
+
+    # Carregados uma única vez; o XSD compilado fica no cache de schemas do certifica_xml
+    controle = None if argumentos.sem_controle else ControleEtapas(argumentos.controle)
+    cache = None
+    try:
+        sessao = certifica_xml.SessaoAssinatura()
+        certifica_xml.carregar_schema_xsd(certifica_xml.CAMINHO_XSD)
+        if not argumentos.sem_cache:
+            cache = criar_cache_artefatos(sessao.certificado, certifica_xml.CAMINHO_XSD, argumentos.cache)
+        if argumentos.planilha:
+            import acesso_api_google
+            id_planilha = acesso_api_google.carregar_id_planilha()
+            if not id_planilha:
+                raise ValueError("Não foi possível carregar o ID da planilha.")
+            acesso_api_google.obter_servico_planilhas()
+    except Exception as erro:
+        if controle is not None:
+            controle.fechar()
+        instrumentacao.encerrar_com_erro("erro", f"[ERRO] {erro}")
+
+    instrumentacao.informar(
+        "inicio_observacao",
+        f"[INFO] Observando {caminho_entrada} a cada {argumentos.intervalo:g}s (Ctrl+C para encerrar).",
+        entrada=caminho_entrada
+    )
+    assinatura_anterior = None
+    ciclo = 0
+    try:
+        while True:
+            ciclo += 1
+            try:
+                if argumentos.planilha:
+                    acesso_api_google.sincronizar_planilha(acesso_api_google.obter_servico_planilhas(), id_planilha)
+                assinatura = assinatura_entrada(caminho_entrada)
+                if assinatura is not None and assinatura != assinatura_anterior:
+                    leitura = {}
+                    contagens = pipeline.executar_por_argumentos(argumentos, sessao, controle, cache, leitura)
+                    pipeline.imprimir_resumo(*contagens, cache)
+                    pipeline.confirmar_leitura_planilha(argumentos, contagens[3], leitura)
+                    assinatura_anterior = assinatura
+            except Exception as erro:
+                # A entrada é conferida de novo no próximo ciclo
+                instrumentacao.informar("erro", f"[ERRO] Ciclo {ciclo}: {erro}", ciclo=ciclo)
+            if argumentos.ciclos and ciclo >= argumentos.ciclos:
+                break
+            time.sleep(argumentos.intervalo)
+    except KeyboardInterrupt:
+        instrumentacao.informar(
+            "fim_observacao",
+            f"[INFO] Observação encerrada depois de {ciclo} ciclo(s).",
+            ciclos=ciclo
+        )
+    finally:
+        if controle is not None:
+            controle.fechar()
+    instrumentacao.finalizar()
+
+
+# --- LINHA DE COMANDO --- #
+def criar_parser(prog=None):
+    """Só para a ajuda geral e os erros de subcomando; as opções de cada etapa ficam no seu módulo."""
+    return argparse.ArgumentParser(
+        prog=prog,
+        usage="%(prog)s [SUBCOMANDO] [opções]",
+        description="Etapas da emissão das NFS-e.",
+        epilog="subcomandos:\n"
+               + "\n".join(f"  {nome:<12}{descricao}" for nome, (_, descricao) in SUBCOMANDOS.items())
+               + "\n\nOpções de cada subcomando: %(prog)s SUBCOMANDO -h",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else list(argv)
+    parser = criar_parser()
+    if argv and argv[0] in ("-h", "--help"):
+        parser.print_help()
+        return
+
+    # Sem subcomando (ou começando por uma opção), as opções são as do pipeline
+    if not argv or argv[0].startswith("-"):
+        comando = SUBCOMANDO_PADRAO
+    else:
+        comando, argv = argv[0], argv[1:]
+        if comando not in SUBCOMANDOS:
+            parser.error(f"subcomando desconhecido: {comando}")
+
+    prog = f"{parser.prog} {comando}"
+    nome_modulo = SUBCOMANDOS[comando][0]
+    if nome_modulo is None:
+        observar(argv, prog)
+    else:
+        importlib.import_module(nome_modulo).main(argv, prog)
+
+
+if __name__ == "__main__":
+    main()
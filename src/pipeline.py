@@ -0,0 +1,397 @@
+"""
+Pipeline em memória: gera, valida e assina cada RPS sem passar pelos arquivos intermediários.
+
+O XML gerado por criacao_rps é lido uma única vez pelo lxml e a mesma árvore segue para a
+validação no XSD e para a assinatura; só o XML assinado é gravado em PASTA_XML_ASSINADO.
+Com --debug, o XML sem assinatura também é gravado em PASTA_SAIDA_XML.
+Os arquivos já existentes em pdf_xml_gerados_rps/ continuam aceitos como entrada (--da-pasta).
+
+A etapa de cada RPS fica registrada em controle_etapas; uma nova execução só processa os
+registros novos, alterados ou que não chegaram a ser assinados. Os XMLs assinados ficam
+também em cache_artefatos, pelo conteúdo: um registro igual a um já assinado (mesmo XSD e
+mesmo certificado) reaproveita os bytes prontos.
+
+Uso (a partir da raiz do projeto):
+    python src/main.py pipeline --processos 4
+"""
+import argparse
+import multiprocessing
+import os
+from collections import deque, namedtuple
+
+from lxml import etree
+
+import criacao_rps
+import certifica_xml
+import instrumentacao
+from cache_artefatos import PASTA_CACHE_ARTEFATOS, criar_cache_artefatos
+from controle_etapas import ControleEtapas, CAMINHO_BANCO_CONTROLE, hash_registro, indice_etapa
+
+TAMANHO_BLOCO_PIPELINE = 16
+# Última etapa concluída (controle_etapas) conforme a etapa em que o documento parou
+ETAPA_CONTROLE_POR_RESULTADO = {
+    "concluido": "assinado",
+    "cache": "assinado",
+    "geracao": "obtido",
+    "leitura": "gerado",
+    "validacao": "gerado",
+    "assinatura": "validado",
+}
+
+ResultadoDocumento = namedtuple("ResultadoDocumento", ["nome_arquivo", "sucesso", "etapa", "detalhe"])
+
+
+# --- PROCESSAMENTO DE UM DOCUMENTO --- #
+def processar_documento(nome_arquivo, xml_bytes, validador, sessao, pasta_debug=None, cache=None, chave=None):
+    """
+    Valida e assina um XML já em memória. Devolve um ResultadoDocumento com a etapa
+    em que o documento parou ("leitura", "validacao", "assinatura" ou "concluido";
+    processar_registro também pode devolver "geracao", e ambos "cache").
+    Com `cache`, o XML assinado é guardado sob `chave`.
+    """
+    if pasta_debug:
+        with open(os.path.join(pasta_debug, nome_arquivo), "wb") as f:
+            f.write(xml_bytes)
+
+    try:
+        raiz = etree.fromstring(xml_bytes)
+    except etree.XMLSyntaxError as erro:
+        return ResultadoDocumento(nome_arquivo, False, "leitura", str(erro))
+
+    valido, mensagem = certifica_xml.validar_arvore_xml_com_schema(raiz, validador)
+    if not valido:
+        return ResultadoDocumento(nome_arquivo, False, "validacao", mensagem)
+
+    try:
+        xml_assinado = sessao.serializar(sessao.assinar_arvore(raiz))
+        caminho_saida = os.path.join(sessao.pasta_saida, nome_arquivo)
+        with open(caminho_saida, "wb") as f:
+            f.write(xml_assinado)
+    except Exception as erro:
+        return ResultadoDocumento(nome_arquivo, False, "assinatura", str(erro))
+
+    if cache is not None:
+        cache.guardar(chave, xml_assinado)
+    return ResultadoDocumento(nome_arquivo, True, "concluido", caminho_saida)
+
+
+def reaproveitar_do_cache(nome_arquivo, cache, chave, sessao):
+    """Grava o XML assinado do cache na pasta de saída; None se a chave não estiver no cache."""
+    xml_assinado = cache.obter(chave)
+    if xml_assinado is None:
+        return None
+    caminho_saida = os.path.join(sessao.pasta_saida, nome_arquivo)
+    with open(caminho_saida, "wb") as f:
+        f.write(xml_assinado)
+    return ResultadoDocumento(nome_arquivo, True, "cache", caminho_saida)
+
+
+def processar_registro(dados_nfse, validador, sessao, pasta_debug=None, cache=None):
+    nome_arquivo = f"nfse_{dados_nfse['id']}.xml"
+    chave = None
+    if cache is not None:
+        chave = cache.chave(dados_nfse)
+        resultado = reaproveitar_do_cache(nome_arquivo, cache, chave, sessao)
+        if resultado is not None:
+            return resultado
+    try:
+        xml_bytes = criacao_rps.renderizar_xml_nfse(dados_nfse)
+    except Exception as erro:
+        return ResultadoDocumento(nome_arquivo, False, "geracao", str(erro))
+    return processar_documento(nome_arquivo, xml_bytes, validador, sessao, pasta_debug, cache, chave)
+
+
+def processar_arquivo(caminho_xml, validador, sessao, pasta_debug=None, cache=None):
+    nome_arquivo = os.path.basename(caminho_xml)
+    try:
+        with open(caminho_xml, "rb") as f:
+            xml_bytes = f.read()
+    except OSError as erro:
+        return ResultadoDocumento(nome_arquivo, False, "leitura", str(erro))
+    chave = None
+    if cache is not None:
+        chave = cache.chave(xml_bytes)
+        resultado = reaproveitar_do_cache(nome_arquivo, cache, chave, sessao)
+        if resultado is not None:
+            return resultado
+    # O arquivo de entrada já é o XML sem assinatura; não há o que gravar em modo debug
+    return processar_documento(nome_arquivo, xml_bytes, validador, sessao, cache=cache, chave=chave)
+
+
+# --- EXECUÇÃO EM POOL DE PROCESSOS --- #
+_contexto_processo = None
+
+def _inicializar_processo_pipeline(caminho_xsd, cert_pem, key_pem, pasta_saida, pasta_debug, cache):
+    global _contexto_processo
+    _contexto_processo = (
+        certifica_xml.carregar_schema_xsd(caminho_xsd),
+        certifica_xml.SessaoAssinatura(cert_pem=cert_pem, key_pem=key_pem, pasta_saida=pasta_saida),
+        pasta_debug,
+        cache,
+    )
+
+def _processar_registro_no_processo(dados_nfse):
+    return processar_registro(dados_nfse, *_contexto_processo)
+
+def _processar_arquivo_no_processo(caminho_xml):
+    return processar_arquivo(caminho_xml, *_contexto_processo)
+
+
+# --- RETOMADA PELO CONTROLE DE ETAPAS --- #
+def id_do_arquivo(nome_arquivo):
+    nome = os.path.splitext(nome_arquivo)[0]
+    return nome[len("nfse_"):] if nome.startswith("nfse_") else nome
+
+def filtrar_itens_pendentes(itens, controle, da_pasta, pasta_saida, refazer, descartados, hashes):
+    """
+    Deixa passar só os itens que precisam ser processados, guardando o hash de cada um em
+    `hashes` até o resultado chegar. Os que não mudaram desde a assinatura (ou que mudaram
+    depois de enviados) vão para `descartados` como ResultadoDocumento.
+    Só lê o controle; as etapas são gravadas por registrar_resultado, conforme os resultados chegam.
+    """
+    for item in itens:
+        if da_pasta:
+            nome_arquivo = os.path.basename(item)
+            id_rps = id_do_arquivo(nome_arquivo)
+            hash_conteudo = certifica_xml.hash_arquivo(item)
+        else:
+            nome_arquivo = f"nfse_{item['id']}.xml"
+            id_rps = item["id"]
+            hash_conteudo = hash_registro(item)
+
+        situacao = controle.situacao(id_rps)
+        if situacao is not None and not refazer:
+            etapa, hash_anterior, erro = situacao
+            if indice_etapa(etapa) >= indice_etapa("enviado"):
+                if hash_anterior != hash_conteudo:
+                    descartados.append(ResultadoDocumento(
+                        nome_arquivo, False, "controle",
+                        f"registro alterado depois de {etapa}; não é reprocessado automaticamente."
+                    ))
+                else:
+                    descartados.append(ResultadoDocumento(nome_arquivo, True, "ignorado", etapa))
+                continue
+            if (hash_anterior == hash_conteudo and etapa == "assinado" and not erro
+                    and os.path.exists(os.path.join(pasta_saida, nome_arquivo))):
+                descartados.append(ResultadoDocumento(nome_arquivo, True, "ignorado", "sem alterações"))
+                continue
+
+        hashes[id_rps] = hash_conteudo
+        yield item
+
+def registrar_resultado(controle, resultado, hashes):
+    id_rps = id_do_arquivo(resultado.nome_arquivo)
+    controle.marcar(
+        id_rps,
+        ETAPA_CONTROLE_POR_RESULTADO[resultado.etapa],
+        hashes.pop(id_rps, None),
+        erro=None if resultado.sucesso else resultado.detalhe
+    )
+
+
+# --- FLUXO COMPLETO --- #
+def executar_pipeline(entrada=None, da_pasta=False, debug=False, processos=1,
+                      tamanho_bloco=TAMANHO_BLOCO_PIPELINE, caminho_xsd=certifica_xml.CAMINHO_XSD,
+                      sessao=None, controle=None, refazer=False, cache=None, leitura=None):
+    """
+    Gera (ou lê de pdf_xml_gerados_rps/), valida e assina os documentos.
+    `entrada` é o .ndjson/.json de registros (ou os próprios registros, já carregados);
+    com `da_pasta=True` é a pasta de XMLs gerados.
+    Produz um ResultadoDocumento por documento, conforme vão sendo concluídos.
+    Com `controle` (ControleEtapas), pula o que já foi assinado sem alterações (etapa
+    "ignorado"), a não ser com `refazer=True`, e registra a etapa de cada documento.
+    Com `cache` (criar_cache_artefatos), reaproveita os XMLs já assinados com o mesmo conteúdo.
+    `leitura` é repassado a criacao_rps.carregar_registros (versão do arquivo lido).
+    """
+    pasta_debug = criacao_rps.PASTA_SAIDA_XML if debug and not da_pasta else None
+    if da_pasta:
+        itens = certifica_xml.listar_arquivos_xml_validos(entrada or certifica_xml.CAMINHO_PASTA_XML)
+        processar, processar_no_processo = processar_arquivo, _processar_arquivo_no_processo
+    else:
+        if entrada is None or isinstance(entrada, str):
+            itens = criacao_rps.carregar_registros(entrada or criacao_rps.entrada_padrao(), leitura=leitura)
+        else:
+            itens = entrada
+        processar, processar_no_processo = processar_registro, _processar_registro_no_processo
+
+    if sessao is None:
+        sessao = certifica_xml.SessaoAssinatura()
+    for pasta in (sessao.pasta_saida, pasta_debug):
+        if pasta and not os.path.exists(pasta):
+            os.makedirs(pasta)
+
+    descartados = deque()
+    hashes = {}
+    if controle is not None:
+        itens = filtrar_itens_pendentes(itens, controle, da_pasta, sessao.pasta_saida, refazer, descartados, hashes)
+
+    def acompanhar(resultados):
+        for resultado in resultados:
+            while descartados:
+                yield descartados.popleft()
+            if controle is not None:
+                registrar_resultado(controle, resultado, hashes)
+            yield resultado
+        while descartados:
+            yield descartados.popleft()
+
+    try:
+        if processos == 1:
+            validador = certifica_xml.carregar_schema_xsd(caminho_xsd)
+            yield from acompanhar(processar(item, validador, sessao, pasta_debug, cache) for item in itens)
+            return
+
+        with multiprocessing.Pool(
+            processes=processos,
+            initializer=_inicializar_processo_pipeline,
+            initargs=(caminho_xsd, sessao.cert_pem, sessao.key_pem, sessao.pasta_saida, pasta_debug, cache)
+        ) as pool:
+            yield from acompanhar(criacao_rps.mapear_em_blocos(
+                pool, processar_no_processo, itens, tamanho_bloco, processos
+            ))
+    finally:
+        if controle is not None:
+            controle.gravar()
+
+
+# --- LINHA DE COMANDO --- #
+def adicionar_argumentos_pipeline(parser):
+    """Opções do pipeline, compartilhadas com o modo de observação (main.py observar)."""
+    parser.add_argument(
+        "--entrada",
+        default=None,
+        help="Arquivo .ndjson/.json de registros (padrão: o gravado pela última leitura da planilha) "
+             "ou, com --da-pasta, a pasta de XMLs gerados."
+    )
+    parser.add_argument(
+        "--da-pasta",
+        action="store_true",
+        help=f"Lê os XMLs já gerados em {certifica_xml.CAMINHO_PASTA_XML}/ em vez dos registros."
+    )
+    parser.add_argument(
+        "--debug",
+        action="store_true",
+        help=f"Também grava os XMLs sem assinatura em {criacao_rps.PASTA_SAIDA_XML}/."
+    )
+    parser.add_argument(
+        "--processos",
+        type=int,
+        default=1,
+        help="Processos usados (padrão 1; 0 usa o número de CPUs)."
+    )
+    parser.add_argument(
+        "--controle",
+        default=CAMINHO_BANCO_CONTROLE,
+        help=f"Banco SQLite com a etapa de cada RPS (padrão: {CAMINHO_BANCO_CONTROLE})."
+    )
+    parser.add_argument("--sem-controle", action="store_true", help="Processa tudo sem consultar nem gravar o controle.")
+    parser.add_argument(
+        "--refazer",
+        action="store_true",
+        help="Reprocessa também os registros já assinados e sem alterações (os já enviados continuam de fora)."
+    )
+    parser.add_argument(
+        "--cache",
+        default=PASTA_CACHE_ARTEFATOS,
+        help=f"Pasta do cache de XMLs assinados (padrão: {PASTA_CACHE_ARTEFATOS})."
+    )
+    parser.add_argument("--sem-cache", action="store_true", help="Gera, valida e assina tudo de novo, sem usar o cache.")
+
+
+def executar_por_argumentos(argumentos, sessao, controle=None, cache=None, leitura=None):
+    """
+    Roda o pipeline com as opções de adicionar_argumentos_pipeline, exibindo as falhas.
+    Sem --entrada, usa criacao_rps.entrada_padrao() e guarda o caminho em argumentos.entrada.
+    Devolve (concluidos, do_cache, ignorados, falhas).
+    """
+    if not argumentos.da_pasta and argumentos.entrada is None:
+        argumentos.entrada = criacao_rps.entrada_padrao()
+    resultados = executar_pipeline(
+        entrada=argumentos.entrada,
+        da_pasta=argumentos.da_pasta,
+        debug=argumentos.debug,
+        processos=argumentos.processos or None,
+        sessao=sessao,
+        controle=controle,
+        refazer=argumentos.refazer,
+        cache=cache,
+        leitura=leitura
+    )
+    concluidos = do_cache = ignorados = falhas = 0
+    with instrumentacao.etapa("pipeline") as medicao:
+        for resultado in resultados:
+            if resultado.etapa == "ignorado":
+                ignorados += 1
+            elif resultado.sucesso:
+                concluidos += 1
+                do_cache += resultado.etapa == "cache"
+            else:
+                falhas += 1
+                instrumentacao.mensagem(
+                    f"falha_{resultado.etapa}",
+                    f"  [FALHA] {resultado.nome_arquivo} ({resultado.etapa}): {resultado.detalhe}",
+                    arquivo=resultado.nome_arquivo, detalhe=resultado.detalhe
+                )
+            medicao.itens = concluidos
+    instrumentacao.contar("xmls_do_cache", do_cache)
+    instrumentacao.contar("registros_sem_alteracao", ignorados)
+    return concluidos, do_cache, ignorados, falhas
+
+
+def imprimir_resumo(concluidos, do_cache, ignorados, falhas, cache=None):
+    instrumentacao.informar(
+        "resumo_pipeline",
+        f"{concluidos} XML(s) assinado(s) ({do_cache} do cache), {ignorados} sem alterações, {falhas} com falha.",
+        assinados=concluidos, do_cache=do_cache, sem_alteracoes=ignorados, falhas=falhas
+    )
+    if cache is not None:
+        removidos, tamanho_restante = cache.limpar()
+        if removidos:
+            instrumentacao.informar(
+                "limpeza_cache",
+                f"[INFO] Cache: {removidos} artefato(s) removido(s), {tamanho_restante / 1024 / 1024:.1f} MB em uso.",
+                removidos=removidos, bytes_em_uso=tamanho_restante
+            )
+
+
+def confirmar_leitura_planilha(argumentos, falhas, leitura=None):
+    """
+    Com o arquivo gravado pela leitura da planilha processado sem falhas, confirma o estado
+    da sincronização; com falhas, a próxima leitura grava de novo as mesmas linhas.
+    `leitura` é o dict preenchido por executar_por_argumentos (versão do arquivo lido).
+    """
+    arquivos_planilha = (criacao_rps.CAMINHO_NDJSON, criacao_rps.CAMINHO_JSON)
+    if falhas or argumentos.da_pasta or argumentos.entrada not in arquivos_planilha:
+        return
+    from acesso_api_google import confirmar_sincronizacao
+    confirmar_sincronizacao(arquivo=argumentos.entrada, assinatura=(leitura or {}).get("assinatura"))
+
+
+def main(argv=None, prog=None):
+    parser = argparse.ArgumentParser(prog=prog, description="Gera, valida e assina as NFSe em memória.")
+    adicionar_argumentos_pipeline(parser)
+    instrumentacao.adicionar_argumentos(parser)
+    argumentos = parser.parse_args(argv)
+    instrumentacao.configurar_por_argumentos(argumentos)
+
+    controle = None if argumentos.sem_controle else ControleEtapas(argumentos.controle)
+    cache = None
+    try:
+        sessao = certifica_xml.SessaoAssinatura()
+        if not argumentos.sem_cache:
+            cache = criar_cache_artefatos(sessao.certificado, certifica_xml.CAMINHO_XSD, argumentos.cache)
+        leitura = {}
+        contagens = executar_por_argumentos(argumentos, sessao, controle, cache, leitura)
+    except Exception as erro:
+        instrumentacao.encerrar_com_erro("erro", f"[ERRO] {erro}")
+    finally:
+        if controle is not None:
+            controle.fechar()
+
+    imprimir_resumo(*contagens, cache)
+    confirmar_leitura_planilha(argumentos, contagens[3], leitura)
+    instrumentacao.finalizar()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Servidor FTP local (pyftpdlib) para testar e medir a entrega_ftp sem a máquina do cliente.
+
+Um usuário com permissão de escrita em uma pasta local; cada conexão é atendida na sua
+própria thread, e o atraso artificial por comando simula a latência de um servidor remoto.
+
+Uso (a partir da raiz do projeto):
+    python src/servidor_ftp_local.py --pasta /tmp/ftp_cliente --porta 2121 --atraso 0.02
+"""
+import argparse
+import logging
+import os
+import threading
+import time
+
+from pyftpdlib.authorizers import DummyAuthorizer
+from pyftpdlib.handlers import FTPHandler
+from pyftpdlib.log import config_logging
+from pyftpdlib.servers import ThreadedFTPServer
+
+# --- CONSTANTES --- #
+PORTA_PADRAO = 2121
+USUARIO_PADRAO = "nfse"
+SENHA_PADRAO = "nfse"
+# Listar, ler, criar pasta, gravar, continuar (APPE/REST), apagar e renomear
+PERMISSOES_USUARIO = "elradfmw"
+
+
+class ManipuladorFtpLocal(FTPHandler):
+    atraso = 0.0
+
+    def pre_process_command(self, line, cmd, arg):
+        if self.atraso:
+            time.sleep(self.atraso)
+        super().pre_process_command(line, cmd, arg)
+
+
+def iniciar_servidor(pasta, porta=0, usuario=USUARIO_PADRAO, senha=SENHA_PADRAO, atraso=0.0,
+                     registrar_comandos=False):
+    """
+    Sobe o servidor em uma thread e devolve (servidor, porta). porta=0 escolhe uma porta livre.
+    Sem `registrar_comandos`, o pyftpdlib só registra avisos e erros.
+    Para encerrar: servidor.close_all().
+    """
+    nivel = logging.INFO if registrar_comandos else logging.WARNING
+    if not logging.getLogger("pyftpdlib").handlers:
+        config_logging(level=nivel)
+    logging.getLogger("pyftpdlib").setLevel(nivel)
+    os.makedirs(pasta, exist_ok=True)
+    autorizador = DummyAuthorizer()
+    autorizador.add_user(usuario, senha, pasta, perm=PERMISSOES_USUARIO)
+    manipulador = type("ManipuladorConfigurado", (ManipuladorFtpLocal,), {
+        "authorizer": autorizador,
+        "atraso": atraso,
+        "banner": "servidor_ftp_local pronto.",
+    })
+    servidor = ThreadedFTPServer(("127.0.0.1", porta), manipulador)
+    threading.Thread(target=servidor.serve_forever, kwargs={"handle_exit": False}, daemon=True).start()
+    return servidor, servidor.address[1]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Servidor FTP local para testar a entrega dos arquivos.")
+    parser.add_argument("--pasta", required=True, help="Pasta que recebe os arquivos.")
+    parser.add_argument("--porta", type=int, default=PORTA_PADRAO)
+    parser.add_argument("--usuario", default=USUARIO_PADRAO)
+    parser.add_argument("--senha", default=SENHA_PADRAO)
+    parser.add_argument("--atraso", type=float, default=0.0, help="Atraso artificial por comando (s).")
+    argumentos = parser.parse_args()
+
+    servidor, porta = iniciar_servidor(
+        argumentos.pasta, argumentos.porta, argumentos.usuario, argumentos.senha, argumentos.atraso,
+        registrar_comandos=True
+    )
+    print(f"Servidor FTP local em 127.0.0.1:{porta}, pasta {argumentos.pasta} (Ctrl+C para encerrar)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        servidor.close_all()
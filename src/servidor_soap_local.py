@@ -0,0 +1,191 @@
+"""
+Servidor local que imita o nfsews.asmx da prefeitura, para testar e medir o cliente_soap
+sem acesso ao ambiente piloto.
+
+Aceita os mesmos envelopes dos exemplos em manual_exemplo_sistema_prefeitura/BlueprintPHP/XML/
+(o benchmark reenvia esses arquivos) e responde com conexões keep-alive (HTTP/1.1):
+- RecepcionarLoteRps: guarda os números dos RPS e devolve um Protocolo novo;
+- ConsultarSituacaoLoteRps: Situacao 2 (não processado) nas primeiras consultas, depois 4;
+- ConsultarLoteRps: a ListaNfse com um número de NFS-e para cada RPS do lote;
+- CancelarNfse/CancelarLoteNfse: uma Confirmacao por NFS-e pedida;
+- demais métodos: o exemplo correspondente é devolvido como resultado.
+
+Uso (a partir da raiz do projeto):
+    python src/servidor_soap_local.py --porta 8085 --atraso 0.05
+"""
+import argparse
+import itertools
+import os
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from xml.sax.saxutils import escape
+
+from lxml import etree
+
+# --- CONSTANTES --- #
+PASTA_EXEMPLOS_XML = os.path.join("manual_exemplo_sistema_prefeitura", "BlueprintPHP", "XML")
+EXEMPLOS_POR_METODO = {
+    "RecepcionarLoteRps": "Arquivo.xml",
+    "CancelarNfse": "ArquivoCancelarNfse.xml",
+    "ConsultarLoteRps": "ArquivoConsultaLoteRPS.xml",
+    "ConsultarSituacaoLoteRps": "ArquivoConsultaSituacaoLote.xml",
+    "CancelarLoteNfse": "CancelarLoteRPS.xml",
+    "ValidarXml": "ValidarXML.xml",
+}
+NAMESPACE_NFSE = "http://www.e-governeapps2.com.br/"
+CONSULTAS_ATE_PROCESSAR = 2
+PORTA_PADRAO = 8085
+
+
+def envelope_resposta(metodo, conteudo_resultado):
+    return (
+        '<?xml version="1.0" encoding="utf-8"?>'
+        '<soap:Envelope xmlns:soap="http://www.w3.org/2003/05/soap-envelope">'
+        f'<soap:Body><{metodo}Response xmlns="{NAMESPACE_NFSE}">'
+        f'<{metodo}Result>{conteudo_resultado}</{metodo}Result>'
+        f'</{metodo}Response></soap:Body></soap:Envelope>'
+    ).encode("utf-8")
+
+
+def textos(raiz, nome_local):
+    return [elemento.text or "" for elemento in raiz.iter(f"{{{NAMESPACE_NFSE}}}{nome_local}")]
+
+
+class EstadoServidor:
+    """Protocolos recebidos e o andamento de cada um, compartilhados entre as threads."""
+
+    def __init__(self, consultas_ate_processar=CONSULTAS_ATE_PROCESSAR, atraso=0.0,
+                 pasta_exemplos=PASTA_EXEMPLOS_XML):
+        self.consultas_ate_processar = consultas_ate_processar
+        self.atraso = atraso
+        self.trava = threading.Lock()
+        self.protocolos = {}
+        self.sequencia_protocolo = itertools.count(636809081476534394)
+        self.sequencia_nfse = itertools.count(1)
+        self.exemplos = {}
+        for metodo, nome_arquivo in EXEMPLOS_POR_METODO.items():
+            caminho = os.path.join(pasta_exemplos, nome_arquivo)
+            if os.path.exists(caminho):
+                with open(caminho, "rb") as arquivo:
+                    self.exemplos[metodo] = arquivo.read()
+
+    def responder(self, metodo, raiz):
+        if metodo == "RecepcionarLoteRps":
+            numero_lote = (textos(raiz, "NumeroLote") or [""])[0]
+            numeros_rps = [
+                identificacao.findtext(f"{{{NAMESPACE_NFSE}}}Numero")
+                for identificacao in raiz.iter(f"{{{NAMESPACE_NFSE}}}IdentificacaoRps")
+            ]
+            with self.trava:
+                protocolo = str(next(self.sequencia_protocolo))
+                self.protocolos[protocolo] = {"rps": numeros_rps, "consultas": 0, "nfse": None}
+            return (
+                f"<NumeroLote>{escape(numero_lote)}</NumeroLote>"
+                f"<DataRecebimento>{datetime.now().isoformat(timespec='seconds')}</DataRecebimento>"
+                f"<Protocolo>{protocolo}</Protocolo>"
+            )
+
+        if metodo in ("ConsultarSituacaoLoteRps", "ConsultarLoteRps"):
+            protocolo = (textos(raiz, "Protocolo") or [""])[0]
+            with self.trava:
+                lote = self.protocolos.get(protocolo)
+                if lote is None:
+                    return "<ListaMensagemRetorno><MensagemRetorno><Codigo>E86</Codigo>" \
+                           "<Mensagem>Número do protocolo não encontrado.</Mensagem></MensagemRetorno></ListaMensagemRetorno>"
+                if metodo == "ConsultarSituacaoLoteRps":
+                    lote["consultas"] += 1
+                    situacao = 4 if lote["consultas"] > self.consultas_ate_processar else 2
+                    return f"<Situacao>{situacao}</Situacao>"
+                if lote["nfse"] is None:
+                    lote["nfse"] = [(numero_rps, next(self.sequencia_nfse)) for numero_rps in lote["rps"]]
+            return "<ListaNfse>" + "".join(
+                "<CompNfse><Nfse><InfNfse>"
+                f"<Numero>{numero_nfse}</Numero><CodigoVerificacao>LOCAL{numero_nfse:04d}</CodigoVerificacao>"
+                f"<IdentificacaoRps><Numero>{escape(numero_rps or '')}</Numero></IdentificacaoRps>"
+                "</InfNfse></Nfse></CompNfse>"
+                for numero_rps, numero_nfse in lote["nfse"]
+            ) + "</ListaNfse>"
+
+        if metodo in ("CancelarNfse", "CancelarLoteNfse"):
+            data_hora = datetime.now().isoformat(timespec="seconds")
+            return "<RetCancelamento>" + "".join(
+                "<NfseCancelamento><Confirmacao>"
+                f"<Pedido><InfPedidoCancelamento><IdentificacaoNfse><Numero>{escape(numero)}</Numero>"
+                "</IdentificacaoNfse></InfPedidoCancelamento></Pedido>"
+                f"<DataHora>{data_hora}</DataHora></Confirmacao></NfseCancelamento>"
+                for numero in (
+                    identificacao.findtext(f"{{{NAMESPACE_NFSE}}}Numero") or ""
+                    for identificacao in raiz.iter(f"{{{NAMESPACE_NFSE}}}IdentificacaoNfse")
+                )
+            ) + "</RetCancelamento>"
+
+        exemplo = self.exemplos.get(metodo, b"")
+        return escape(exemplo.decode("utf-8-sig"))
+
+
+class ManipuladorSoap(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # mantém a conexão aberta entre as requisições
+    # Cabeçalho e corpo saem em duas escritas; sem isso o Nagle segura o corpo até o ACK do cliente
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        estado = self.server.estado
+        tamanho = int(self.headers.get("Content-Length", 0))
+        corpo = self.rfile.read(tamanho)
+        metodo = self.headers.get("SOAPAction", "").strip('"').rsplit("/", 1)[-1]
+
+        if estado.atraso:
+            time.sleep(estado.atraso)
+
+        try:
+            raiz = etree.fromstring(corpo)
+            resposta = envelope_resposta(metodo, estado.responder(metodo, raiz))
+            status = 200
+        except etree.XMLSyntaxError as erro:
+            resposta = (
+                '<soap:Envelope xmlns:soap="http://www.w3.org/2003/05/soap-envelope"><soap:Body><soap:Fault>'
+                f'<soap:Reason><soap:Text>{escape(str(erro))}</soap:Text></soap:Reason>'
+                '</soap:Fault></soap:Body></soap:Envelope>'
+            ).encode("utf-8")
+            status = 500
+
+        self.send_response(status)
+        self.send_header("Content-Type", "text/xml; charset=utf-8")
+        self.send_header("Content-Length", str(len(resposta)))
+        self.end_headers()
+        self.wfile.write(resposta)
+
+    def log_message(self, *_):
+        pass  # sem uma linha no console por requisição
+
+
+def iniciar_servidor(porta=0, atraso=0.0, consultas_ate_processar=CONSULTAS_ATE_PROCESSAR,
+                     pasta_exemplos=PASTA_EXEMPLOS_XML):
+    """
+    Sobe o servidor em uma thread e devolve (servidor, url). porta=0 escolhe uma porta livre.
+    Para encerrar: servidor.shutdown().
+    """
+    servidor = ThreadingHTTPServer(("127.0.0.1", porta), ManipuladorSoap)
+    servidor.daemon_threads = True
+    servidor.estado = EstadoServidor(consultas_ate_processar, atraso, pasta_exemplos)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{servidor.server_address[1]}/nfse_ws/nfsews.asmx"
+    return servidor, url
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Servidor local que imita o webservice de NFS-e.")
+    parser.add_argument("--porta", type=int, default=PORTA_PADRAO)
+    parser.add_argument("--atraso", type=float, default=0.0, help="Atraso artificial por requisição (s).")
+    parser.add_argument("--consultas-ate-processar", type=int, default=CONSULTAS_ATE_PROCESSAR)
+    argumentos = parser.parse_args()
+
+    servidor, url = iniciar_servidor(argumentos.porta, argumentos.atraso, argumentos.consultas_ate_processar)
+    print(f"Servidor local em {url} (Ctrl+C para encerrar)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        servidor.shutdown()
@@ -0,0 +1,376 @@
+"""
+Validação em colunas das linhas da planilha, antes de gerar e assinar os XMLs.
+
+As colunas conferidas de um bloco de linhas viram matrizes (numpy) e cada regra roda de uma
+vez sobre a coluna inteira:
+    - campos vazios de cada linha (as mesmas células de nao_adiciona_json_dados_vazios);
+    - valores monetários e alíquota em pt-BR ("1.234,56", "R$ 75,00", "5%") ou com ponto
+      decimal ("1500.00"), que são os únicos aceitos no XML;
+    - data de emissão no formato da planilha (dd/mm/aaaa hh:mm, o de formatar_data_iso);
+    - valor_iss ≈ base_calculo × aliquota e valor_liquido_nfse ≈ valor_servicos menos
+      retenções e descontos, com tolerância de TOLERANCIA_VALORES.
+Os erros são devolvidos por linha. Valores monetários em pt-BR válidos são reescritos com
+ponto decimal e duas casas; os que já estão com ponto decimal ficam como estão. A alíquota é
+sempre reescrita como fração com quatro casas ("5%", "5,00", "5" e "0.05" viram "0.0500").
+
+Sem vírgula, o ponto é sempre o separador decimal: "1.500" é lido como 1,5 (a conferência
+dos totais costuma apontar esse caso).
+
+Sem numpy, validar_bloco aplica as mesmas regras linha a linha (validar_linha), com o mesmo
+resultado e as mesmas mensagens.
+"""
+from collections import namedtuple
+from datetime import datetime
+from itertools import chain
+from operator import itemgetter
+
+try:
+    import numpy as np
+except ImportError:  # sem numpy, as regras rodam linha a linha (validar_linha)
+    np = None
+
+# --- CONSTANTES --- #
+TOLERANCIA_VALORES = 0.01
+NAN = float("nan")
+# Valores mais longos que isso são inválidos; "R$" e espaços são ignorados
+LARGURA_MAXIMA_VALOR = 20
+CARACTERES_IGNORADOS_VALOR = " R$"
+CAMPO_DATA_EMISSAO = "data_hora_emissao"
+CAMPO_ALIQUOTA = "aliquota"
+CAMPOS_MONETARIOS = (
+    "valor_servicos", "valor_deducoes", "valor_pis", "valor_cofins", "valor_inss", "valor_ir",
+    "valor_csll", "valor_iss", "valor_iss_retido", "outras_retencoes", "base_calculo",
+    "valor_liquido_nfse", "desconto_incondicionado", "desconto_condicionado",
+)
+# valor_liquido_nfse = valor_servicos - (soma destes campos), como no manual ABRASF
+CAMPOS_DESCONTADOS_DO_LIQUIDO = (
+    "valor_pis", "valor_cofins", "valor_inss", "valor_ir", "valor_csll", "outras_retencoes",
+    "valor_iss_retido", "desconto_incondicionado", "desconto_condicionado",
+)
+# Posições dos dígitos e dos separadores em "dd/mm/aaaa hh:mm"
+POSICOES_DIGITOS_DATA = (0, 1, 3, 4, 6, 7, 8, 9, 11, 12, 14, 15)
+SEPARADORES_DATA = ((2, "/"), (5, "/"), (10, " "), (13, ":"))
+DIAS_POR_MES = (31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31)
+
+LinhaValidada = namedtuple("LinhaValidada", "numero_linha linha campos_vazios erros")
+
+
+# --- CONVERSÕES POR COLUNA --- #
+def mascara_vazias(linhas, largura):
+    """
+    Células vazias ou só com espaços (linhas × largura). As células omitidas no fim da linha
+    (a API não as devolve) não contam como vazias, como em nao_adiciona_json_dados_vazios.
+    """
+    comprimentos = np.fromiter((min(len(linha), largura) for linha in linhas), dtype=np.int64, count=len(linhas))
+    celulas = chain.from_iterable(linha[:largura] for linha in linhas)
+    preenchidas = np.fromiter(map(bool, map(str.strip, celulas)), dtype=bool, count=int(comprimentos.sum()))
+    vazias = np.zeros((len(linhas), largura), dtype=bool)
+    vazias[np.arange(largura) < comprimentos[:, None]] = ~preenchidas
+    return vazias
+
+def colunas_de_texto(linhas, indices):
+    """Só as colunas `indices`, como matriz de texto (linhas × len(indices)); as omitidas ficam ""."""
+    largura = max(indices) + 1
+    completar = [""] * largura
+    seletor = itemgetter(*indices) if len(indices) > 1 else (lambda linha: (linha[indices[0]],))
+    preenchidas = (linha if len(linha) >= largura else list(linha) + completar[len(linha):] for linha in linhas)
+    return np.array([seletor(linha) for linha in preenchidas], dtype=str).reshape(len(linhas), len(indices))
+
+def codigos_unicode(celulas, largura):
+    """
+    Os caracteres das células como códigos inteiros, com a posição do caractere no primeiro
+    eixo (largura, ...); 0 preenche o fim do texto.
+    """
+    codigos = np.ascontiguousarray(celulas.astype(f"U{largura}")).view(np.int32)
+    return np.ascontiguousarray(np.moveaxis(codigos.reshape(celulas.shape + (largura,)), -1, 0))
+
+def converter_decimais(celulas, ignorados=CARACTERES_IGNORADOS_VALOR):
+    """
+    Converte as células (coluna ou submatriz) em números, dígito a dígito sobre os códigos
+    dos caracteres. Devolve (valores, vazios, invalidos, pt_br): valores é NaN onde a célula
+    está vazia ou inválida; pt_br marca os valores válidos escritos com vírgula decimal.
+    """
+    codigos = codigos_unicode(celulas, LARGURA_MAXIMA_VALOR)
+    digito = (codigos >= ord("0")) & (codigos <= ord("9"))
+    virgula = codigos == ord(",")
+    ponto = codigos == ord(".")
+    ignorado = codigos == 0
+    for caractere in ignorados:
+        ignorado |= codigos == ord(caractere)
+
+    # Com vírgula, ela é o separador decimal e os pontos (só antes dela) separam os milhares
+    com_virgula = virgula.any(axis=0)
+    separador = np.where(com_virgula, virgula, ponto)
+
+    # Uma passada por posição de caractere: mantissa inteira e casas depois do separador
+    mantissa = np.zeros(celulas.shape)
+    casas = np.zeros(celulas.shape, dtype=np.int64)
+    separadores = np.zeros(celulas.shape, dtype=np.int64)
+    ponto_apos_virgula = np.zeros(celulas.shape, dtype=bool)
+    for posicao in range(LARGURA_MAXIMA_VALOR):
+        eh_digito = digito[posicao]
+        apos_separador = separadores > 0
+        mantissa = np.where(eh_digito, mantissa * 10 + (codigos[posicao] - ord("0")), mantissa)
+        casas += eh_digito & apos_separador
+        ponto_apos_virgula |= ponto[posicao] & apos_separador & com_virgula
+        separadores += separador[posicao]
+
+    longas = np.char.str_len(celulas) > LARGURA_MAXIMA_VALOR
+    vazios = ignorado.all(axis=0) & ~longas
+    validos = (
+        (digito | virgula | ponto | ignorado).all(axis=0) & digito.any(axis=0)
+        & (separadores <= 1) & ~ponto_apos_virgula & ~longas
+    )
+    valores = np.where(validos, mantissa / np.power(10.0, casas), np.nan)
+    return valores, vazios, ~validos & ~vazios, com_virgula & validos
+
+def converter_aliquotas(coluna):
+    """
+    Como converter_decimais, mas devolve a alíquota como fração: com "%" ou acima de 1 ("5%",
+    "5,00", "5") o valor é percentual e vira 0.05; abaixo de 1 ("0.05") já é a fração. Sem "%",
+    1 é ambíguo (100% ou 1%) e fica inválido. O último item marca todas as alíquotas válidas,
+    que são reescritas na mesma forma.
+    """
+    percentual = np.char.find(coluna, "%") >= 0
+    valores, vazios, invalidos, _ = converter_decimais(coluna, CARACTERES_IGNORADOS_VALOR + "%")
+    ambiguas = ~percentual & (valores == 1)
+    invalidos = invalidos | ambiguas
+    valores = np.where(ambiguas, np.nan, np.where(percentual | (valores > 1), valores / 100, valores))
+    return valores, vazios, invalidos, ~invalidos & ~vazios
+
+def datas_invalidas(coluna):
+    """Máscara das datas que não são dd/mm/aaaa hh:mm válidas; datas ISO (com "T") são conferidas uma a uma."""
+    codigos = codigos_unicode(coluna, 16)
+    formato_ok = np.char.str_len(coluna) == 16
+    for posicao, separador in SEPARADORES_DATA:
+        formato_ok &= codigos[posicao] == ord(separador)
+    digitos = codigos[list(POSICOES_DIGITOS_DATA)] - ord("0")
+    formato_ok &= ((digitos >= 0) & (digitos <= 9)).all(axis=0)
+
+    dia = digitos[0] * 10 + digitos[1]
+    mes = digitos[2] * 10 + digitos[3]
+    ano = digitos[4] * 1000 + digitos[5] * 100 + digitos[6] * 10 + digitos[7]
+    hora = digitos[8] * 10 + digitos[9]
+    minuto = digitos[10] * 10 + digitos[11]
+    bissexto = (ano % 4 == 0) & ((ano % 100 != 0) | (ano % 400 == 0))
+    ultimo_dia = np.array(DIAS_POR_MES)[np.clip(mes, 1, 12) - 1] + ((mes == 2) & bissexto)
+    validas = (
+        formato_ok & (mes >= 1) & (mes <= 12) & (dia >= 1) & (dia <= ultimo_dia)
+        & (hora < 24) & (minuto < 60) & (ano > 1900)
+    )
+
+    for indice in np.flatnonzero(~validas & (np.char.find(coluna, "T") >= 0)):
+        try:
+            datetime.fromisoformat(str(coluna[indice]).split(".")[0])
+            validas[indice] = True
+        except ValueError:
+            pass
+    return ~validas
+
+
+# --- CONVERSÕES POR CÉLULA (SEM NUMPY) --- #
+def converter_decimal(texto, ignorados=CARACTERES_IGNORADOS_VALOR):
+    """converter_decimais de uma só célula: (valor, vazio, invalido, pt_br), com valor NaN se vazia ou inválida."""
+    if len(texto) > LARGURA_MAXIMA_VALOR:
+        return NAN, False, True, False
+    com_virgula = "," in texto
+    separador = "," if com_virgula else "."
+    mantissa = 0.0
+    casas = separadores = 0
+    tem_digito, valido = False, True
+    for caractere in texto:
+        if "0" <= caractere <= "9":
+            mantissa = mantissa * 10 + (ord(caractere) - ord("0"))
+            casas += separadores > 0
+            tem_digito = True
+        elif caractere == separador:
+            separadores += 1
+        elif caractere == "." and separadores:  # ponto depois da vírgula
+            valido = False
+        elif caractere not in ignorados and caractere not in ",.":
+            valido = False
+    if all(caractere in ignorados for caractere in texto):
+        return NAN, True, False, False
+    if not (valido and tem_digito and separadores <= 1):
+        return NAN, False, True, False
+    return mantissa / 10.0 ** casas, False, False, com_virgula
+
+def converter_aliquota(texto):
+    """converter_aliquotas de uma só célula, com as mesmas regras de percentual e fração."""
+    valor, vazio, invalido, _ = converter_decimal(texto, CARACTERES_IGNORADOS_VALOR + "%")
+    if vazio or invalido:
+        return valor, vazio, invalido, False
+    if "%" in texto or valor > 1:
+        return valor / 100, False, False, True
+    if valor == 1:
+        return NAN, False, True, False
+    return valor, False, False, True
+
+def data_invalida(texto):
+    """datas_invalidas de uma só data."""
+    if (
+        len(texto) == 16
+        and all(texto[posicao] == separador for posicao, separador in SEPARADORES_DATA)
+        and all("0" <= texto[posicao] <= "9" for posicao in POSICOES_DIGITOS_DATA)
+    ):
+        digitos = [ord(texto[posicao]) - ord("0") for posicao in POSICOES_DIGITOS_DATA]
+        dia = digitos[0] * 10 + digitos[1]
+        mes = digitos[2] * 10 + digitos[3]
+        ano = digitos[4] * 1000 + digitos[5] * 100 + digitos[6] * 10 + digitos[7]
+        hora = digitos[8] * 10 + digitos[9]
+        minuto = digitos[10] * 10 + digitos[11]
+        bissexto = ano % 4 == 0 and (ano % 100 != 0 or ano % 400 == 0)
+        if (
+            1 <= mes <= 12 and 1 <= dia <= DIAS_POR_MES[mes - 1] + (mes == 2 and bissexto)
+            and hora < 24 and minuto < 60 and ano > 1900
+        ):
+            return False
+    if "T" in texto:
+        try:
+            datetime.fromisoformat(texto.split(".")[0])
+            return False
+        except ValueError:
+            pass
+    return True
+
+
+# --- VALIDAÇÃO DO BLOCO --- #
+def mensagem_valor_iss(valor_iss, esperado):
+    return f"valor_iss {valor_iss:.2f} difere de base_calculo × aliquota ({esperado:.2f})"
+
+def mensagem_valor_liquido(valor_liquido, esperado):
+    return (
+        f"valor_liquido_nfse {valor_liquido:.2f} difere de valor_servicos "
+        f"menos retenções e descontos ({esperado:.2f})"
+    )
+
+def validar_bloco(cabecalhos, linhas_numeradas, colunas_por_chave):
+    """
+    Valida uma lista de (numero_linha, linha) e devolve um LinhaValidada por linha, na mesma
+    ordem. `colunas_por_chave` liga a chave do JSON (ex.: "valor_iss") ao índice da coluna;
+    as regras dos campos que não estão na planilha são ignoradas. Sem numpy, cada linha passa
+    por validar_linha.
+    """
+    if np is None:
+        return [
+            validar_linha(cabecalhos, numero_linha, linha, colunas_por_chave)
+            for numero_linha, linha in linhas_numeradas
+        ]
+    if not linhas_numeradas:
+        return []
+    linhas = [linha for _, linha in linhas_numeradas]
+    vazias = mascara_vazias(linhas, len(cabecalhos))
+    campos_vazios = [[] for _ in linhas]
+    for indice, posicao in zip(*np.nonzero(vazias)):
+        campos_vazios[indice].append(cabecalhos[posicao])
+    erros = [[] for _ in linhas]
+    normalizados = {}
+
+    def reportar(mascara, montar_mensagem):
+        for indice in np.flatnonzero(mascara):
+            erros[indice].append(montar_mensagem(indice))
+
+    # Só as colunas conferidas viram matriz de texto: monetárias, alíquota e data de emissão
+    chaves = [chave for chave in CAMPOS_MONETARIOS + (CAMPO_ALIQUOTA, CAMPO_DATA_EMISSAO) if chave in colunas_por_chave]
+    if not chaves:
+        return [
+            LinhaValidada(numero, linha, vazios_linha, [])
+            for (numero, linha), vazios_linha in zip(linhas_numeradas, campos_vazios)
+        ]
+    texto = colunas_de_texto(linhas, [colunas_por_chave[chave] for chave in chaves])
+    posicao_texto = {chave: posicao for posicao, chave in enumerate(chaves)}
+
+    def coluna(chave):
+        return texto[:, posicao_texto[chave]]
+
+    valores = {}
+    conversoes = []
+    monetarios = [chave for chave in CAMPOS_MONETARIOS if chave in posicao_texto]
+    if monetarios:
+        conversoes.append((monetarios, "{:.2f}", converter_decimais(texto[:, :len(monetarios)])))
+    if CAMPO_ALIQUOTA in posicao_texto:
+        conversoes.append(([CAMPO_ALIQUOTA], "{:.4f}", converter_aliquotas(coluna(CAMPO_ALIQUOTA)[:, None])))
+
+    for chaves_convertidas, formato, (numeros, vazios, invalidos, reescrever) in conversoes:
+        for posicao, chave in enumerate(chaves_convertidas):
+            reportar(invalidos[:, posicao], lambda i, chave=chave: f"{chave} inválido ({str(coluna(chave)[i]).strip()!r})")
+            for indice in np.flatnonzero(reescrever[:, posicao]):
+                normalizados.setdefault(indice, {})[colunas_por_chave[chave]] = formato.format(numeros[indice, posicao])
+            # Vazio vale zero nas conferências; inválido fica NaN e a conferência é pulada
+            valores[chave] = np.where(vazios[:, posicao], 0.0, numeros[:, posicao])
+
+    if CAMPO_DATA_EMISSAO in posicao_texto:
+        datas = np.char.strip(coluna(CAMPO_DATA_EMISSAO))
+        vazias_data = datas == ""
+        reportar(vazias_data, lambda i: f"{CAMPO_DATA_EMISSAO} vazia")
+        reportar(datas_invalidas(datas) & ~vazias_data, lambda i: f"{CAMPO_DATA_EMISSAO} inválida ({str(datas[i])!r})")
+
+    if all(chave in valores for chave in ("valor_iss", "base_calculo", CAMPO_ALIQUOTA)):
+        esperado = valores["base_calculo"] * valores[CAMPO_ALIQUOTA]
+        divergentes = np.abs(valores["valor_iss"] - esperado) > TOLERANCIA_VALORES + 1e-9
+        reportar(divergentes, lambda i: mensagem_valor_iss(valores["valor_iss"][i], esperado[i]))
+
+    if "valor_liquido_nfse" in valores and "valor_servicos" in valores:
+        esperado = valores["valor_servicos"] - sum(
+            valores[chave] for chave in CAMPOS_DESCONTADOS_DO_LIQUIDO if chave in valores
+        )
+        divergentes = np.abs(valores["valor_liquido_nfse"] - esperado) > TOLERANCIA_VALORES + 1e-9
+        reportar(divergentes, lambda i: mensagem_valor_liquido(valores["valor_liquido_nfse"][i], esperado[i]))
+
+    resultado = []
+    for indice, (numero_linha, linha) in enumerate(linhas_numeradas):
+        if indice in normalizados:
+            linha = list(linha)
+            for posicao, valor in normalizados[indice].items():
+                linha[posicao] = valor
+        resultado.append(LinhaValidada(numero_linha, linha, campos_vazios[indice], erros[indice]))
+    return resultado
+
+
+def validar_linha(cabecalhos, numero_linha, linha, colunas_por_chave):
+    """As regras de validar_bloco para uma única linha, sem numpy; devolve o LinhaValidada."""
+    campos_vazios = [cabecalhos[posicao] for posicao, campo in enumerate(linha[:len(cabecalhos)]) if not campo.strip()]
+    erros = []
+    normalizados = {}
+
+    def celula(chave):
+        posicao = colunas_por_chave[chave]
+        return linha[posicao] if posicao < len(linha) else ""
+
+    conversoes = [(chave, "{:.2f}", converter_decimal) for chave in CAMPOS_MONETARIOS if chave in colunas_por_chave]
+    if CAMPO_ALIQUOTA in colunas_por_chave:
+        conversoes.append((CAMPO_ALIQUOTA, "{:.4f}", converter_aliquota))
+
+    valores = {}
+    for chave, formato, converter in conversoes:
+        numero, vazio, invalido, reescrever = converter(celula(chave))
+        if invalido:
+            erros.append(f"{chave} inválido ({celula(chave).strip()!r})")
+        if reescrever:
+            normalizados[colunas_por_chave[chave]] = formato.format(numero)
+        valores[chave] = 0.0 if vazio else numero
+
+    if CAMPO_DATA_EMISSAO in colunas_por_chave:
+        data = celula(CAMPO_DATA_EMISSAO).strip()
+        if not data:
+            erros.append(f"{CAMPO_DATA_EMISSAO} vazia")
+        elif data_invalida(data):
+            erros.append(f"{CAMPO_DATA_EMISSAO} inválida ({data!r})")
+
+    if all(chave in valores for chave in ("valor_iss", "base_calculo", CAMPO_ALIQUOTA)):
+        esperado = valores["base_calculo"] * valores[CAMPO_ALIQUOTA]
+        if abs(valores["valor_iss"] - esperado) > TOLERANCIA_VALORES + 1e-9:
+            erros.append(mensagem_valor_iss(valores["valor_iss"], esperado))
+
+    if "valor_liquido_nfse" in valores and "valor_servicos" in valores:
+        esperado = valores["valor_servicos"] - sum(
+            valores[chave] for chave in CAMPOS_DESCONTADOS_DO_LIQUIDO if chave in valores
+        )
+        if abs(valores["valor_liquido_nfse"] - esperado) > TOLERANCIA_VALORES + 1e-9:
+            erros.append(mensagem_valor_liquido(valores["valor_liquido_nfse"], esperado))
+
+    if normalizados:
+        linha = list(linha)
+        for posicao, valor in normalizados.items():
+            linha[posicao] = valor
+    return LinhaValidada(numero_linha, linha, campos_vazios, erros)
@@ -0,0 +1,152 @@
+"""
+Configuração comum dos testes: os módulos de src/ são importados diretamente, como nos
+benchmarks, e cada teste roda em uma pasta temporária (os caminhos dos módulos são relativos).
+
+Uso (a partir da raiz do projeto):
+    python -m pytest -q
+"""
+import datetime
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+CAMINHO_MANUAL = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "manual_exemplo_sistema_prefeitura")
+SENHA_PFX_TESTE = b"teste"
+# O XSD da prefeitura não acompanha o repositório: este só confere a estrutura de fora do documento
+XSD_ESTRUTURA_TESTE = """<xs:schema xmlns:xs="http://www.w3.org/2001/XMLSchema">
+  <xs:element name="ArrayOfTcCompNfse">
+    <xs:complexType><xs:sequence>
+      <xs:element name="tcCompNfse" maxOccurs="unbounded">
+        <xs:complexType><xs:sequence>
+          <xs:any processContents="skip" maxOccurs="unbounded"/>
+        </xs:sequence></xs:complexType>
+      </xs:element>
+    </xs:sequence></xs:complexType>
+  </xs:element>
+</xs:schema>
+"""
+
+# Uma linha válida da planilha emitirNFSe, por chave do JSON
+VALORES_LINHA_PLANILHA = {
+    "numero_lote": "1",
+    "cnpj_prestador": "38.057.542/0002-54",
+    "inscricao_municipal_prestador": "11126723",
+    "qntd_rps": "1",
+    "numero_rps": "1",
+    "serie_rps": "A",
+    "tipo_rps": "1 - RPS",
+    "data_hora_emissao": "04/12/2018 11:01",
+    "natureza_operacao": "1 - Tributação no município",
+    "regime_especial_tributacao": "1",
+    "optante_simples_nacional": "1 - Sim",
+    "incentivador_cultural": "2 - Não",
+    "status": "1 - Normal",
+    "valor_servicos": "1500.00",
+    "valor_deducoes": "0.00",
+    "valor_pis": "0.00",
+    "valor_cofins": "0.00",
+    "valor_inss": "0.00",
+    "valor_ir": "0.00",
+    "valor_csll": "0.00",
+    "iss_retido": "2 - Não",
+    "valor_iss": "75.00",
+    "valor_iss_retido": "0.00",
+    "outras_retencoes": "0.00",
+    "base_calculo": "1500.00",
+    "aliquota": "0.05",
+    "valor_liquido_nfse": "1500.00",
+    "desconto_incondicionado": "0.00",
+    "desconto_condicionado": "0.00",
+    "item_lista_servicos": "1505",
+    "discriminacao": "Serviço prestado & manutenção <mensal>",
+    "cod_municipio_servico": "4106902",
+    "cnpj_tomador": "98765432000100",
+    "razao_social_tomador": "TESTE INFORMACOES E TECNOLOGIA LTDA",
+    "endereco_tomador": "R DUTRA",
+    "numero": "5",
+    "complemento": "ANDAR15",
+    "bairro": "CENTRO",
+    "cod_municipio_tomador": "4125506",
+    "uf": "PR",
+    "cep": "80000-000",
+    "email_tomador": "contato@teste.com.br",
+}
+
+
+@pytest.fixture
+def pasta_trabalho(tmp_path, monkeypatch):
+    """Pasta temporária como diretório atual, com as subpastas que os módulos esperam."""
+    for pasta in ("acesso_servidor_ftp", "certificados", "certificados_schemas"):
+        (tmp_path / pasta).mkdir()
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+@pytest.fixture
+def cabecalhos_planilha():
+    import acesso_api_google
+    return [cabecalho for cabecalho, _, _ in acesso_api_google.MAPEAMENTO_CAMPOS]
+
+
+@pytest.fixture
+def linha_planilha():
+    """Fábrica de linhas da planilha: linha_planilha(numero_rps="7") devolve a lista de células."""
+    import acesso_api_google
+    chaves = [chave for _, chave, _ in acesso_api_google.MAPEAMENTO_CAMPOS]
+
+    def criar(**campos):
+        valores = dict(VALORES_LINHA_PLANILHA, **campos)
+        return [valores[chave] for chave in chaves]
+
+    return criar
+
+
+@pytest.fixture(scope="session")
+def pfx_descartavel(tmp_path_factory):
+    """Certificado autoassinado (RSA 2048) em um .pfx com a senha SENHA_PFX_TESTE."""
+    from cryptography import x509
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import rsa
+    from cryptography.hazmat.primitives.serialization import pkcs12
+    from cryptography.x509.oid import NameOID
+
+    chave = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    nome = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "teste integracao_rps_nfse")])
+    agora = datetime.datetime.now(datetime.timezone.utc)
+    certificado = (
+        x509.CertificateBuilder()
+        .subject_name(nome)
+        .issuer_name(nome)
+        .public_key(chave.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(agora - datetime.timedelta(minutes=5))
+        .not_valid_after(agora + datetime.timedelta(days=1))
+        .sign(chave, hashes.SHA256())
+    )
+    caminho = tmp_path_factory.mktemp("pfx") / "teste.pfx"
+    caminho.write_bytes(pkcs12.serialize_key_and_certificates(
+        b"teste", chave, certificado, None, serialization.BestAvailableEncryption(SENHA_PFX_TESTE)
+    ))
+    return str(caminho)
+
+
+@pytest.fixture
+def espaco_emissao(pasta_trabalho, pfx_descartavel):
+    """
+    pasta_trabalho com o certificado nos caminho e senha padrão do certifica_xml e o
+    XSD_ESTRUTURA_TESTE no lugar do XSD da prefeitura. Devolve o PEM do certificado.
+    """
+    import certifica_xml
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.serialization import pkcs12
+
+    with open(pfx_descartavel, "rb") as arquivo:
+        chave, certificado, _ = pkcs12.load_key_and_certificates(arquivo.read(), SENHA_PFX_TESTE)
+    (pasta_trabalho / certifica_xml.CAMINHO_CERT_PFX).write_bytes(pkcs12.serialize_key_and_certificates(
+        b"padrao", chave, certificado, None, serialization.BestAvailableEncryption(certifica_xml.SENHA_PFX)
+    ))
+    (pasta_trabalho / certifica_xml.CAMINHO_XSD).write_text(XSD_ESTRUTURA_TESTE, encoding="utf-8")
+    return certificado.public_bytes(serialization.Encoding.PEM)
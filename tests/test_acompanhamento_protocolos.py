@@ -0,0 +1,78 @@
+import asyncio
+
+import acesso_api_google
+import cliente_soap
+from acompanhamento_protocolos import TabelaProtocolos, acompanhar_protocolos, enviar_lotes
+from controle_etapas import ControleEtapas
+from servidor_soap_local import envelope_resposta
+
+RESPOSTA_PROTOCOLO_RECUSADO = (
+    "<ConsultarSituacaoLoteRpsResposta><ListaMensagemRetorno><MensagemRetorno>"
+    "<Codigo>E86</Codigo><Mensagem>Protocolo não encontrado</Mensagem>"
+    "</MensagemRetorno></ListaMensagemRetorno></ConsultarSituacaoLoteRpsResposta>"
+)
+
+
+class ClienteFalso:
+    """Responde RecepcionarLoteRps com protocolos numerados e as consultas com `respostas[metodo]`."""
+
+    def __init__(self, respostas=None):
+        self.respostas = respostas or {}
+        self.enviados = []
+
+    def enviar(self, metodo, xml):
+        return cliente_soap.RespostaSoap(200, envelope_resposta(metodo, self.respostas[metodo]), 0.0)
+
+    def enviar_em_lote(self, requisicoes):
+        for indice, (metodo, xml) in enumerate(requisicoes):
+            self.enviados.append(xml)
+            corpo = envelope_resposta(metodo, f"<Protocolo>P{indice}</Protocolo>")
+            yield cliente_soap.ResultadoEnvio(indice, metodo, True, 200, corpo, 0.0, None)
+
+
+def criar_tabela(pasta):
+    return TabelaProtocolos(str(pasta / "pendentes.json"), str(pasta / "resultados.ndjson"), intervalo_inicial=0)
+
+
+def test_protocolo_recusado_volta_para_envio(pasta_trabalho, cabecalhos_planilha, linha_planilha):
+    (dados_nfse,) = acesso_api_google.gerar_registros_json(cabecalhos_planilha, [(2, linha_planilha())])
+    tabela = criar_tabela(pasta_trabalho)
+    with ControleEtapas(str(pasta_trabalho / "controle.sqlite3")) as controle:
+        controle.marcar(dados_nfse["id"], "assinado")
+        assert enviar_lotes([dados_nfse], ClienteFalso(), tabela, controle=controle) == (1, 0)
+        assert controle.situacao(dados_nfse["id"])[0] == "enviado"
+
+        cliente = ClienteFalso({"ConsultarSituacaoLoteRps": RESPOSTA_PROTOCOLO_RECUSADO})
+        asyncio.run(acompanhar_protocolos(tabela, cliente, simultaneas=1, controle=controle))
+
+        etapa, _, erro = controle.situacao(dados_nfse["id"])
+        assert tabela.pendentes == {}
+        assert etapa == "assinado"
+        assert "E86" in erro
+
+        # O protocolo recusado não prende o RPS: o próximo envio o inclui
+        novo_cliente = ClienteFalso()
+        assert enviar_lotes([dados_nfse], novo_cliente, tabela, controle=controle) == (1, 0)
+        assert len(novo_cliente.enviados) == 1
+
+
+def test_so_envia_rps_assinados(pasta_trabalho, cabecalhos_planilha, linha_planilha):
+    linhas = [linha_planilha(numero_rps=str(numero)) for numero in range(1, 5)]
+    registros = list(acesso_api_google.gerar_registros_json(
+        cabecalhos_planilha, enumerate(linhas, 2), acesso_api_google.novo_indice_identificadores()
+    ))
+    cliente = ClienteFalso()
+    with ControleEtapas(str(pasta_trabalho / "controle.sqlite3")) as controle:
+        controle.marcar(registros[0]["id"], "assinado")
+        controle.marcar(registros[1]["id"], "gerado", erro="falha na validação")
+        controle.marcar(registros[2]["id"], "enviado")
+        # registros[3] nunca passou pelo pipeline
+
+        enviar_lotes(registros, cliente, criar_tabela(pasta_trabalho), controle=controle)
+
+        assert [controle.situacao(dados_nfse["id"])[0] for dados_nfse in registros[:3]] == [
+            "enviado", "gerado", "enviado"
+        ]
+        assert controle.situacao(registros[3]["id"]) is None
+    assert len(cliente.enviados) == 1
+    assert f'Id="rps{registros[0]["id"]}"'.encode() in cliente.enviados[0]
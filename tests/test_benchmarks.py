@@ -0,0 +1,56 @@
+import copy
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+CAMINHO_BENCH_PIPELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "benchmarks", "bench_pipeline.py")
+
+
+def rodar_bench_pipeline(*argumentos):
+    return subprocess.run(
+        [sys.executable, CAMINHO_BENCH_PIPELINE, "--tamanhos", "30", *argumentos],
+        capture_output=True, text=True, timeout=300
+    )
+
+
+@pytest.fixture(scope="module")
+def resultado_bench(tmp_path_factory):
+    caminho = tmp_path_factory.mktemp("bench") / "atual.json"
+    execucao = rodar_bench_pipeline("--saida", str(caminho))
+    assert execucao.returncode == 0, execucao.stderr
+    return caminho, json.loads(caminho.read_text(encoding="utf-8"))
+
+
+def test_bench_pipeline_mede_todas_as_etapas(resultado_bench):
+    _, resultado = resultado_bench
+
+    (item,) = resultado["resultados"]
+    assert item["linhas"] == 30
+    assert list(item["etapas"]) == ["validacao_linhas", "mapeamento_json", "geracao_xml", "validacao_xsd", "assinatura"]
+    for medida in item["etapas"].values():
+        assert medida["documentos"] > 0
+        assert medida["p50_ms"] <= medida["p99_ms"]
+        assert medida["pico_rss_kb"] > 0
+    # Só a validação de linhas descarta (as linhas com excesso de vazios); o resto não falha
+    assert [medida["falhas"] for medida in list(item["etapas"].values())[1:]] == [0, 0, 0, 0]
+
+
+def test_bench_pipeline_aponta_regressao(resultado_bench, tmp_path):
+    caminho, resultado = resultado_bench
+    resultado = copy.deepcopy(resultado)
+    for medida in resultado["resultados"][0]["etapas"].values():
+        medida["por_segundo"] *= 100
+    referencia = tmp_path / "referencia.json"
+    referencia.write_text(json.dumps(resultado), encoding="utf-8")
+
+    # Tolerância larga: com 30 linhas a vazão varia muito entre execuções
+    tolerancia = ("--tolerancia", "0.9")
+    de_novo = rodar_bench_pipeline("--saida", str(tmp_path / "de_novo.json"), "--comparar", str(caminho), *tolerancia)
+    assert de_novo.returncode == 0, de_novo.stderr
+    execucao = rodar_bench_pipeline("--saida", str(tmp_path / "lento.json"), "--comparar", str(referencia), *tolerancia)
+
+    assert execucao.returncode == 1
+    assert execucao.stderr.count("[REGRESSÃO]") == 5
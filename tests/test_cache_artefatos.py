@@ -0,0 +1,92 @@
+import os
+
+import pytest
+
+import cache_artefatos
+import criacao_rps
+from cache_artefatos import CacheArtefatos, criar_cache_artefatos
+from certifica_xml import SessaoAssinatura
+from conftest import SENHA_PFX_TESTE, VALORES_LINHA_PLANILHA
+
+
+@pytest.fixture
+def cache(pasta_trabalho):
+    return CacheArtefatos("v1", "xsd", "cert", pasta=str(pasta_trabalho / "cache"))
+
+
+def test_chave_ignora_ordem_dos_campos_e_o_id(cache):
+    registro = dict(VALORES_LINHA_PLANILHA, id="abc")
+    reordenado = dict(reversed(list(registro.items())))
+    reordenado["id"] = "outro-id"
+
+    assert cache.chave(registro) == cache.chave(reordenado)
+
+
+@pytest.mark.parametrize("campo, valor", [
+    ("valor_servicos", "1500.01"),
+    ("discriminacao", "Serviço prestado & manutenção <mensal> "),  # espaço muda o XML
+    ("complemento", ""),
+])
+def test_chave_muda_com_o_conteudo(cache, campo, valor):
+    assert cache.chave(VALORES_LINHA_PLANILHA) != cache.chave(dict(VALORES_LINHA_PLANILHA, **{campo: valor}))
+
+
+def test_registro_e_arquivo_nao_compartilham_chaves(cache):
+    conteudo = cache_artefatos.normalizar_registro(VALORES_LINHA_PLANILHA)
+
+    assert cache.chave(VALORES_LINHA_PLANILHA) != cache.chave(conteudo)
+
+
+@pytest.mark.parametrize("versao, hash_xsd, impressao_digital", [
+    ("v2", "xsd", "cert"),
+    ("v1", "xsd2", "cert"),
+    ("v1", "xsd", "cert2"),
+])
+def test_chave_amarrada_a_gerador_xsd_e_certificado(cache, versao, hash_xsd, impressao_digital):
+    outro = CacheArtefatos(versao, hash_xsd, impressao_digital, pasta=cache.pasta)
+
+    assert outro.chave(VALORES_LINHA_PLANILHA) != cache.chave(VALORES_LINHA_PLANILHA)
+
+
+def test_versao_do_gerador_inclui_dados_fixos_do_prestador(monkeypatch):
+    versao = cache_artefatos.versao_gerador()
+    monkeypatch.setitem(criacao_rps.DADOS_FIXOS_PRESTADOR, "cnpj", "00000000000000")
+
+    assert cache_artefatos.versao_gerador() != versao
+
+
+def test_criar_cache_reflete_alteracao_do_xsd(pasta_trabalho, pfx_descartavel):
+    certificado = SessaoAssinatura(pfx_descartavel, SENHA_PFX_TESTE).certificado
+    caminho_xsd = pasta_trabalho / "modelo.xsd"
+    caminho_xsd.write_text("<xs:schema xmlns:xs='http://www.w3.org/2001/XMLSchema'/>")
+    antes = criar_cache_artefatos(certificado, str(caminho_xsd)).chave(VALORES_LINHA_PLANILHA)
+
+    caminho_xsd.write_text("<xs:schema xmlns:xs='http://www.w3.org/2001/XMLSchema' version='2'/>")
+
+    assert criar_cache_artefatos(certificado, str(caminho_xsd)).chave(VALORES_LINHA_PLANILHA) != antes
+
+
+def test_guardar_e_obter(cache):
+    chave = cache.chave(VALORES_LINHA_PLANILHA)
+
+    assert cache.obter(chave) is None
+    cache.guardar(chave, b"<assinado/>")
+
+    assert cache.obter(chave) == b"<assinado/>"
+    assert (cache.acertos, cache.falhas) == (1, 1)
+    assert os.path.dirname(cache.caminho(chave)).endswith(chave[:2])
+
+
+def test_limpar_por_idade_e_por_tamanho(cache):
+    cache.tamanho_maximo = 20
+    chaves = [cache.chave({"numero_rps": str(numero)}) for numero in range(4)]
+    for chave in chaves:
+        cache.guardar(chave, b"0123456789")
+    agora = os.stat(cache.caminho(chaves[0])).st_mtime
+    os.utime(cache.caminho(chaves[0]), (agora - cache.idade_maxima - 1,) * 2)  # parado há muito tempo
+    os.utime(cache.caminho(chaves[1]), (agora - 10,) * 2)  # o usado há mais tempo
+
+    removidos, restantes = cache.limpar(agora=agora)
+
+    assert (removidos, restantes) == (2, 20)
+    assert [cache.obter(chave) is not None for chave in chaves] == [False, False, True, True]
@@ -0,0 +1,188 @@
+import json
+import os
+
+from lxml import etree
+
+import cancelamento_nfse
+import cliente_soap
+import lote_rps
+from cancelamento_nfse import cancelar_nfse, montar_envelope_cancelamento, pedidos_por_numeros
+from certifica_xml import SessaoAssinatura
+from conftest import CAMINHO_MANUAL, SENHA_PFX_TESTE
+from servidor_soap_local import envelope_resposta
+from test_cliente_soap import ServidorRoteirizado
+from test_lote_rps import verificar_assinaturas
+
+CAMINHO_MODELO_CANCELAMENTO = os.path.join(CAMINHO_MANUAL, "BlueprintPHP", "XML", "CancelarLoteRPS.xml")
+
+
+def retorno_cancelamento(*numeros):
+    return "<RetCancelamento>" + "".join(
+        "<NfseCancelamento><Confirmacao><Pedido><InfPedidoCancelamento><IdentificacaoNfse>"
+        f"<Numero>{numero}</Numero></IdentificacaoNfse></InfPedidoCancelamento></Pedido>"
+        "<DataHora>2024-12-10T10:00:00</DataHora></Confirmacao></NfseCancelamento>"
+        for numero in numeros
+    ) + "</RetCancelamento>"
+
+
+class ClienteCancelamentoFalso:
+    """
+    Confirma `confirmados` (como o webservice os escreve) em cada CancelarLoteNfse; com
+    incerto=True, responde como o cliente_soap quando a conexão cai depois do envio.
+    """
+
+    def __init__(self, *confirmados, incerto=False):
+        self.confirmados = confirmados
+        self.incerto = incerto
+        self.envios = []
+
+    def enviar_em_lote(self, requisicoes, maximo_em_voo=None):
+        for indice, (metodo, xml) in enumerate(requisicoes):
+            self.envios.append(xml)
+            if self.incerto:
+                yield cliente_soap.ResultadoEnvio(indice, metodo, False, None, b"", 0.0, "conexão perdida", True)
+                continue
+            corpo = envelope_resposta(metodo, retorno_cancelamento(*self.confirmados))
+            yield cliente_soap.ResultadoEnvio(indice, metodo, True, 200, corpo, 0.0, None)
+
+
+def ler_resultados(caminho):
+    with open(caminho, encoding="utf-8") as arquivo:
+        return [json.loads(linha) for linha in arquivo]
+
+
+def test_numero_da_confirmacao_com_zeros_a_esquerda(pasta_trabalho):
+    caminho = str(pasta_trabalho / "resultados.ndjson")
+    cliente = ClienteCancelamentoFalso("000000000001201", "1202")
+
+    canceladas, falhas = cancelar_nfse(pedidos_por_numeros(["1201", " 0001202 ", "1203"]), cliente,
+                                       caminho_resultados=caminho)
+
+    assert (canceladas, falhas) == (2, 1)
+    assert [(registro["numero_nfse"], registro["cancelada"]) for registro in ler_resultados(caminho)] == [
+        ("1201", True), ("0001202", True), ("1203", False)
+    ]
+
+
+def test_nota_ja_cancelada_com_outra_escrita_nao_e_reenviada(pasta_trabalho):
+    caminho = str(pasta_trabalho / "resultados.ndjson")
+    cancelar_nfse(pedidos_por_numeros(["1201"]), ClienteCancelamentoFalso("1201"), caminho_resultados=caminho)
+
+    cliente = ClienteCancelamentoFalso()
+    assert cancelar_nfse(pedidos_por_numeros(["0001201", "1201"]), cliente, caminho_resultados=caminho) == (0, 0)
+    assert cliente.envios == []
+
+
+def test_normalizar_numero_nfse():
+    assert cancelamento_nfse.normalizar_numero_nfse("000123") == "123"
+    assert cancelamento_nfse.normalizar_numero_nfse(" 2024.000.123 ") == "2024000123"
+    assert cancelamento_nfse.normalizar_numero_nfse("000") == "0"
+    assert cancelamento_nfse.normalizar_numero_nfse(None) == "0"
+
+
+def test_envio_incerto_nao_e_repetido_na_proxima_execucao(pasta_trabalho, capsys):
+    caminho = str(pasta_trabalho / "resultados.ndjson")
+    assert cancelar_nfse(pedidos_por_numeros(["1201", "1202"]), ClienteCancelamentoFalso(incerto=True),
+                         caminho_resultados=caminho) == (0, 2)
+    assert [registro["incerto"] for registro in ler_resultados(caminho)] == [True, True]
+
+    cliente = ClienteCancelamentoFalso("1201", "1203")
+    assert cancelar_nfse(pedidos_por_numeros(["1201", "1203"]), cliente, caminho_resultados=caminho) == (1, 0)
+    assert len(cliente.envios) == 1
+    assert b"<e:Numero>1201</e:Numero>" not in cliente.envios[0]
+    assert "1201" in capsys.readouterr().out
+
+    # Conferido por consulta, o pedido é refeito explicitamente
+    cliente = ClienteCancelamentoFalso("1201")
+    assert cancelar_nfse(pedidos_por_numeros(["1201"]), cliente, caminho_resultados=caminho,
+                         reenviar_incertas=True) == (1, 0)
+    assert cancelamento_nfse.carregar_resultados_anteriores(caminho) == (
+        {("38057542000254", "11126723", "1201"), ("38057542000254", "11126723", "1203")},
+        {("38057542000254", "11126723", "1202")},
+    )
+
+
+def test_conexao_perdida_envia_o_lote_uma_unica_vez(pasta_trabalho):
+    servidor = ServidorRoteirizado(["fechar"])
+    try:
+        with cliente_soap.ClienteSoapNfse(servidor.url, conexoes=1) as cliente:
+            resultado = cancelar_nfse(pedidos_por_numeros(["1201"]), cliente,
+                                      caminho_resultados=str(pasta_trabalho / "resultados.ndjson"))
+    finally:
+        servidor.fechar()
+
+    assert resultado == (0, 1)
+    assert servidor.recebidas == [f'"{cliente_soap.NAMESPACE_NFSE}CancelarLoteNfse"']
+
+
+def test_envelope_segue_o_modelo_e_assinaturas_conferem(pfx_descartavel):
+    sessao = SessaoAssinatura(pfx_descartavel, SENHA_PFX_TESTE)
+    pedidos = list(pedidos_por_numeros(["1201", "1202", "1203"], codigo_cancelamento="2"))
+
+    envelope = montar_envelope_cancelamento("38057542000254", "11126723", pedidos, sessao)
+    envelope = etree.fromstring(etree.tostring(envelope, encoding="utf-8"))
+
+    assert lote_rps.conferir_estrutura_modelo(envelope, CAMINHO_MODELO_CANCELAMENTO) == ([], [])
+    assert envelope.findtext(".//{*}LoteCancelamento/{*}Cnpj") == "38057542000254"
+    assert [inf.findtext("{*}IdentificacaoNfse/{*}Numero") for inf in envelope.iter("{*}InfPedidoCancelamento")] == [
+        "1201", "1202", "1203"
+    ]
+    assert {inf.findtext("{*}CodigoCancelamento") for inf in envelope.iter("{*}InfPedidoCancelamento")} == {"2"}
+    assert verificar_assinaturas(envelope, sessao.cert_pem) == [
+        "cancelamento1201", "cancelamento1202", "cancelamento1203"
+    ]
+
+
+def test_codigo_padrao_e_o_do_modelo_da_prefeitura(pfx_descartavel):
+    sessao = SessaoAssinatura(pfx_descartavel, SENHA_PFX_TESTE)
+    codigo_modelo = etree.parse(CAMINHO_MODELO_CANCELAMENTO).findtext(".//{*}CodigoCancelamento")
+
+    envelope = montar_envelope_cancelamento(
+        "38057542000254", "11126723", list(pedidos_por_numeros(["1201"])), sessao
+    )
+
+    assert codigo_modelo in cancelamento_nfse.CODIGOS_CANCELAMENTO
+    assert envelope.findtext(".//{*}CodigoCancelamento") == codigo_modelo
+
+
+def test_pedidos_agrupados_por_prestador_e_tamanho(pasta_trabalho):
+    pedidos = (
+        list(pedidos_por_numeros(["1", "2", "3"]))
+        + list(pedidos_por_numeros(["10"], cnpj="11.222.333/0001-81", inscricao_municipal="999"))
+        + list(pedidos_por_numeros(["1"]))  # repetido
+    )
+    cliente = ClienteCancelamentoFalso("1", "2", "3", "10")
+
+    resultado = cancelar_nfse(iter(pedidos), cliente, tamanho_maximo=2,
+                              caminho_resultados=str(pasta_trabalho / "resultados.ndjson"))
+
+    lotes = [etree.fromstring(xml) for xml in cliente.envios]
+    assert resultado == (4, 0)
+    assert [
+        (lote.findtext(".//{*}LoteCancelamento/{*}Cnpj"), [numero.text for numero in lote.iter("{*}Numero")])
+        for lote in lotes
+    ] == [
+        ("38057542000254", ["1", "2"]),
+        ("38057542000254", ["3"]),
+        ("11222333000181", ["10"]),
+    ]
+
+
+def test_pedidos_por_filtro_usam_as_nfse_emitidas(capsys):
+    emitidas = {("38057542000254", "11126723", "7"): "1207"}
+    registros = [
+        {"numero_lote": "12", "numero_rps": "7", "cnpj_prestador": "38.057.542/0002-54",
+         "inscricao_municipal_prestador": "11126723", "id": "a"},
+        {"numero_lote": "12", "numero_rps": "8", "cnpj_prestador": "38.057.542/0002-54",
+         "inscricao_municipal_prestador": "11126723", "id": "b"},
+        {"numero_lote": "13", "numero_rps": "7", "cnpj_prestador": "38.057.542/0002-54",
+         "inscricao_municipal_prestador": "11126723", "id": "c"},
+    ]
+    condicoes = cancelamento_nfse.interpretar_filtros(["numero_lote=12"])
+
+    pedidos = list(cancelamento_nfse.pedidos_por_filtro(registros, condicoes, emitidas, "4"))
+
+    assert [(pedido["numero_nfse"], pedido["id"], pedido["codigo_cancelamento"]) for pedido in pedidos] == [
+        ("1207", "a", "4")
+    ]
+    assert "RPS 8" in capsys.readouterr().out
@@ -0,0 +1,93 @@
+import os
+
+import pytest
+from lxml import etree
+
+import certifica_xml
+
+XSD_PRINCIPAL = """<xs:schema xmlns:xs="http://www.w3.org/2001/XMLSchema" xmlns:t="urn:tipos">
+  <xs:import namespace="urn:tipos" schemaLocation="{local_tipos}"/>
+  <xs:include schemaLocation="comum/elementos.xsd"/>
+  <xs:element name="Lote">
+    <xs:complexType><xs:sequence>
+      <xs:element ref="Rps" maxOccurs="unbounded"/>
+      <xs:element name="Valor" type="t:Valor"/>
+    </xs:sequence></xs:complexType>
+  </xs:element>
+</xs:schema>
+"""
+XSD_ELEMENTOS = """<xs:schema xmlns:xs="http://www.w3.org/2001/XMLSchema">
+  <xs:element name="Rps" type="xs:{tipo_rps}"/>
+</xs:schema>
+"""
+XSD_TIPOS = """<xs:schema xmlns:xs="http://www.w3.org/2001/XMLSchema" targetNamespace="urn:tipos">
+  <xs:simpleType name="Valor"><xs:restriction base="xs:decimal"/></xs:simpleType>
+</xs:schema>
+"""
+
+
+@pytest.fixture
+def schemas(tmp_path):
+    """XSD com xs:include relativo e xs:import por URL file://, como os schemas remotos."""
+    pasta = tmp_path / "schemas"
+    (pasta / "comum").mkdir(parents=True)
+    tipos = tmp_path / "remoto" / "tipos.xsd"
+    tipos.parent.mkdir()
+    tipos.write_text(XSD_TIPOS)
+    (pasta / "comum" / "elementos.xsd").write_text(XSD_ELEMENTOS.format(tipo_rps="integer"))
+    principal = pasta / "principal.xsd"
+    principal.write_text(XSD_PRINCIPAL.format(local_tipos=tipos.as_uri()))
+    return principal, tipos
+
+
+def valido(validador, rps, valor="1.50"):
+    return validador.validate(etree.fromstring(f"<Lote><Rps>{rps}</Rps><Valor>{valor}</Valor></Lote>"))
+
+
+def test_schema_resolvido_valida_como_o_original(schemas, tmp_path):
+    principal, _ = schemas
+    caminho_resolvido = certifica_xml.resolver_schema_xsd(str(principal), str(tmp_path / "cache"))
+
+    original = etree.XMLSchema(etree.parse(str(principal)))
+    resolvido = etree.XMLSchema(etree.parse(caminho_resolvido))
+
+    for rps, valor in (("7", "1.50"), ("sete", "1.50"), ("7", "um")):
+        assert valido(resolvido, rps, valor) == valido(original, rps, valor)
+    locais = {
+        referencia.get("schemaLocation")
+        for referencia in etree.parse(caminho_resolvido).getroot().iter(*certifica_xml.TAGS_REFERENCIA_XSD)
+    }
+    assert locais == {"1.xsd", "2.xsd"}
+
+
+def test_execucao_seguinte_nao_busca_as_referencias_de_novo(schemas, tmp_path):
+    principal, tipos = schemas
+    pasta_cache = str(tmp_path / "cache")
+    primeiro = certifica_xml.resolver_schema_xsd(str(principal), pasta_cache)
+    tipos.unlink()  # a referência remota não é baixada de novo
+
+    assert certifica_xml.resolver_schema_xsd(str(principal), pasta_cache) == primeiro
+    assert valido(etree.XMLSchema(etree.parse(primeiro)), "7")
+
+
+def test_alteracao_em_schema_incluido_refaz_as_copias(schemas, tmp_path):
+    principal, _ = schemas
+    pasta_cache = str(tmp_path / "cache")
+    caminho_resolvido = certifica_xml.resolver_schema_xsd(str(principal), pasta_cache)
+    assert not valido(etree.XMLSchema(etree.parse(caminho_resolvido)), "sete")
+
+    (principal.parent / "comum" / "elementos.xsd").write_text(XSD_ELEMENTOS.format(tipo_rps="string"))
+    caminho_resolvido = certifica_xml.resolver_schema_xsd(str(principal), pasta_cache)
+
+    assert valido(etree.XMLSchema(etree.parse(caminho_resolvido)), "sete")
+    assert [nome for nome in os.listdir(pasta_cache) if nome.endswith(".tmp")] == []
+
+
+def test_carregar_schema_compila_uma_vez_por_processo(schemas, tmp_path, monkeypatch):
+    principal, _ = schemas
+    monkeypatch.setattr(certifica_xml, "_cache_schemas", {})
+
+    validador = certifica_xml.carregar_schema_xsd(str(principal), str(tmp_path / "cache"))
+
+    assert certifica_xml.carregar_schema_xsd(str(principal), str(tmp_path / "cache")) is validador
+    assert valido(validador, "7") and not valido(validador, "sete")
@@ -0,0 +1,111 @@
+import socket
+import threading
+import time
+
+import pytest
+
+import cliente_soap
+
+RESPOSTA_OK = b"HTTP/1.1 200 OK\r\nContent-Type: text/xml; charset=utf-8\r\nContent-Length: 5\r\n\r\n<ok/>"
+
+
+class ServidorRoteirizado:
+    """
+    Servidor HTTP mínimo: para cada requisição recebida consome uma ação do roteiro.
+    "responder" devolve 200 e mantém a conexão; "fechar" lê a requisição e fecha sem responder;
+    "responder_e_fechar" responde e fecha a conexão logo depois (como um servidor que encerra
+    conexões ociosas).
+    """
+
+    def __init__(self, roteiro):
+        self.roteiro = list(roteiro)
+        self.recebidas = []
+        self.soquete = socket.create_server(("127.0.0.1", 0))
+        self.url = f"http://127.0.0.1:{self.soquete.getsockname()[1]}/nfse_ws/nfsews.asmx"
+        threading.Thread(target=self._aceitar, daemon=True).start()
+
+    def _aceitar(self):
+        while True:
+            try:
+                conexao, _ = self.soquete.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._atender, args=(conexao,), daemon=True).start()
+
+    def _atender(self, conexao):
+        with conexao:
+            arquivo = conexao.makefile("rb")
+            while True:
+                linha = arquivo.readline()
+                if not linha:
+                    return
+                cabecalhos = {}
+                while (linha := arquivo.readline()) not in (b"\r\n", b""):
+                    nome, _, valor = linha.decode().partition(":")
+                    cabecalhos[nome.strip().lower()] = valor.strip()
+                arquivo.read(int(cabecalhos.get("content-length", 0)))
+                self.recebidas.append(cabecalhos.get("soapaction"))
+                acao = self.roteiro.pop(0) if self.roteiro else "responder"
+                if acao == "fechar":
+                    return
+                conexao.sendall(RESPOSTA_OK)
+                if acao == "responder_e_fechar":
+                    return
+
+    def fechar(self):
+        self.soquete.close()
+
+
+@pytest.fixture
+def servidor():
+    servidores = []
+
+    def criar(*roteiro):
+        servidores.append(ServidorRoteirizado(roteiro))
+        return servidores[-1]
+
+    yield criar
+    for servidor_criado in servidores:
+        servidor_criado.fechar()
+
+
+def test_envio_nao_idempotente_nao_e_repetido(servidor):
+    servidor_local = servidor("fechar")
+
+    with cliente_soap.ClienteSoapNfse(servidor_local.url) as cliente:
+        with pytest.raises(cliente_soap.EnvioIncerto):
+            cliente.enviar("RecepcionarLoteRps", b"<lote/>")
+
+    assert len(servidor_local.recebidas) == 1
+
+
+def test_consulta_e_repetida_em_conexao_nova(servidor):
+    servidor_local = servidor("fechar")
+
+    with cliente_soap.ClienteSoapNfse(servidor_local.url) as cliente:
+        resposta = cliente.enviar("ConsultarSituacaoLoteRps", b"<consulta/>")
+
+    assert resposta.status == 200
+    assert len(servidor_local.recebidas) == 2
+
+
+def test_conexao_ociosa_fechada_pelo_servidor_nao_e_usada(servidor):
+    servidor_local = servidor("responder_e_fechar")
+
+    with cliente_soap.ClienteSoapNfse(servidor_local.url, conexoes=1) as cliente:
+        cliente.enviar("ConsultarSituacaoLoteRps", b"<consulta/>")
+        time.sleep(0.05)  # o fechamento chega enquanto a conexão está no pool
+        resposta = cliente.enviar("RecepcionarLoteRps", b"<lote/>")
+
+    assert resposta.status == 200
+    assert len(servidor_local.recebidas) == 2
+
+
+def test_resultado_em_lote_marca_envio_incerto(servidor):
+    servidor_local = servidor("fechar")
+
+    with cliente_soap.ClienteSoapNfse(servidor_local.url, conexoes=1) as cliente:
+        resultados = list(cliente.enviar_em_lote([("CancelarLoteNfse", b"<cancelamento/>")]))
+
+    assert [(resultado.sucesso, resultado.incerto) for resultado in resultados] == [(False, True)]
+    assert len(servidor_local.recebidas) == 1
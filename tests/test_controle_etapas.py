@@ -0,0 +1,82 @@
+import sqlite3
+
+import pytest
+
+from controle_etapas import ETAPAS, ControleEtapas, hash_registro, indice_etapa
+
+
+@pytest.fixture
+def caminho_banco(pasta_trabalho):
+    return str(pasta_trabalho / "controle.sqlite3")
+
+
+def eventos(caminho_banco, id_rps):
+    with sqlite3.connect(caminho_banco) as conexao:
+        return [linha for linha in conexao.execute(
+            "SELECT etapa, erro FROM eventos WHERE id = ? ORDER BY rowid", (id_rps,)
+        )]
+
+
+def test_transicoes_sao_retomadas_de_outra_execucao(caminho_banco):
+    with ControleEtapas(caminho_banco) as controle:
+        controle.marcar("a", "obtido", hash_registro({"numero_rps": "1"}))
+        controle.marcar("a", "gerado")
+        controle.marcar("a", "validado")
+        controle.marcar("a", "assinado")
+        controle.marcar("b", "gerado", hash_registro(b"<xml/>"), erro="falha na validação")
+
+    with ControleEtapas(caminho_banco) as controle:
+        assert controle.situacao("a") == ("assinado", hash_registro({"numero_rps": "1"}), None)
+        assert controle.situacao("b") == ("gerado", hash_registro(b"<xml/>"), "falha na validação")
+        assert controle.situacao("c") is None
+        assert controle.contagem_por_etapa() == {"assinado": 1, "gerado (com erro)": 1}
+
+    assert eventos(caminho_banco, "a") == [("obtido", None), ("gerado", None), ("validado", None), ("assinado", None)]
+
+
+def test_erro_e_limpo_na_etapa_seguinte(caminho_banco):
+    with ControleEtapas(caminho_banco) as controle:
+        controle.marcar("a", "assinado", "h1")
+        controle.marcar("a", "assinado", erro="E10: lote processado com erro")
+        controle.marcar("a", "enviado")
+        controle.marcar("a", "confirmado")
+
+        assert controle.situacao("a") == ("confirmado", "h1", None)
+    assert [etapa for etapa, _ in eventos(caminho_banco, "a")] == ["assinado", "assinado", "enviado", "confirmado"]
+
+
+def test_novo_hash_substitui_o_anterior(caminho_banco):
+    with ControleEtapas(caminho_banco) as controle:
+        controle.marcar("a", "assinado", "h1")
+        controle.marcar("a", "obtido", "h2")
+
+    with ControleEtapas(caminho_banco) as controle:
+        assert controle.situacao("a") == ("obtido", "h2", None)
+
+
+def ids_gravados(caminho_banco):
+    with ControleEtapas(caminho_banco) as controle:
+        return set(controle.situacoes)
+
+
+def test_gravacao_em_transacoes_do_tamanho_configurado(caminho_banco):
+    with ControleEtapas(caminho_banco, tamanho_transacao=3) as controle:
+        controle.marcar("a", "obtido")
+        controle.marcar("b", "obtido")
+        assert ids_gravados(caminho_banco) == set()
+
+        controle.marcar("c", "obtido")
+        assert ids_gravados(caminho_banco) == {"a", "b", "c"}
+
+
+def test_etapa_desconhecida_e_recusada(caminho_banco):
+    with ControleEtapas(caminho_banco) as controle:
+        with pytest.raises(ValueError):
+            controle.marcar("a", "cancelado")
+        assert controle.situacao("a") is None
+
+
+def test_ordem_das_etapas():
+    assert [indice_etapa(etapa) for etapa in ETAPAS] == list(range(len(ETAPAS)))
+    assert indice_etapa("assinado") < indice_etapa("enviado") < indice_etapa("confirmado")
+    assert indice_etapa("") == -1
@@ -0,0 +1,123 @@
+import logging
+import os
+import re
+import zipfile
+
+import pytest
+
+import entrega_ftp
+import instrumentacao
+import servidor_ftp_local
+from entrega_ftp import ClienteFtpEntrega, ManifestoEntrega
+
+
+@pytest.fixture
+def servidor_ftp(tmp_path):
+    """Servidor FTP local (pyftpdlib); devolve uma fábrica de ClienteFtpEntrega para ele e a pasta remota."""
+    pasta_remota = tmp_path / "remoto"
+    servidor, porta = servidor_ftp_local.iniciar_servidor(str(pasta_remota), registrar_comandos=True)
+
+    def cliente(**opcoes):
+        return ClienteFtpEntrega(
+            "127.0.0.1", porta, servidor_ftp_local.USUARIO_PADRAO, servidor_ftp_local.SENHA_PADRAO,
+            "entrada/nfse", conexoes=2, timeout=10, **opcoes
+        )
+
+    yield cliente, pasta_remota / "entrada" / "nfse"
+    servidor.close_all()
+
+
+@pytest.fixture
+def arquivos_assinados(tmp_path):
+    """Pasta com XMLs e PDFs de dois lotes (ids L1-1, L1-2 e L2), como a pdf_xml_assinados."""
+    pasta = tmp_path / "assinados"
+    pasta.mkdir()
+    for nome in ("nfse_L1-1.xml", "nfse_L1-2.xml", "nfse_L2.xml", "nfse_L1-1.pdf"):
+        (pasta / nome).write_bytes(f"<conteudo de {nome}>".encode() * 2000)
+    (pasta / "ignorado.txt").write_text("fora das extensões entregues")
+    return pasta
+
+
+def entregar(cliente_ftp, pasta, caminho_manifesto, agrupar=False, pasta_pacotes=None):
+    manifesto = ManifestoEntrega(str(caminho_manifesto))
+    with cliente_ftp() as cliente:
+        return entrega_ftp.entregar_arquivos(
+            cliente, manifesto, str(pasta), agrupar, str(pasta_pacotes or pasta.parent / "pacotes")
+        )
+
+
+def conteudo_remoto(pasta_remota):
+    return {nome: (pasta_remota / nome).read_bytes() for nome in sorted(os.listdir(pasta_remota))}
+
+
+def test_entrega_arquivo_a_arquivo(servidor_ftp, arquivos_assinados, tmp_path):
+    cliente_ftp, pasta_remota = servidor_ftp
+
+    assert entregar(cliente_ftp, arquivos_assinados, tmp_path / "manifesto.json") == (4, 0)
+
+    locais = {
+        nome: (arquivos_assinados / nome).read_bytes()
+        for nome in os.listdir(arquivos_assinados) if nome.endswith((".xml", ".pdf"))
+    }
+    assert conteudo_remoto(pasta_remota) == locais  # sem sobras .parcial
+
+
+def test_manifesto_evita_reenviar_o_que_nao_mudou(servidor_ftp, arquivos_assinados, tmp_path):
+    cliente_ftp, pasta_remota = servidor_ftp
+    caminho_manifesto = tmp_path / "manifesto.json"
+    entregar(cliente_ftp, arquivos_assinados, caminho_manifesto)
+
+    assert entregar(cliente_ftp, arquivos_assinados, caminho_manifesto) == (0, 0)
+
+    (arquivos_assinados / "nfse_L2.xml").write_bytes(b"<alterado/>")
+    assert entregar(cliente_ftp, arquivos_assinados, caminho_manifesto) == (1, 0)
+    assert (pasta_remota / "nfse_L2.xml").read_bytes() == b"<alterado/>"
+
+
+def test_envio_parcial_continua_de_onde_parou(servidor_ftp, arquivos_assinados, tmp_path, caplog):
+    cliente_ftp, pasta_remota = servidor_ftp
+    local = arquivos_assinados / "nfse_L2.xml"
+    for nome in os.listdir(arquivos_assinados):
+        if nome != local.name:
+            os.remove(arquivos_assinados / nome)
+    conteudo = local.read_bytes()
+    # Uma execução anterior interrompida deixou a primeira metade no servidor
+    pasta_remota.mkdir(parents=True)
+    nome_parcial = f"{local.name}.{entrega_ftp.sha256_arquivo(str(local))[:12]}{entrega_ftp.SUFIXO_PARCIAL}"
+    metade = len(conteudo) // 2
+    (pasta_remota / nome_parcial).write_bytes(conteudo[:metade])
+    instrumentacao.configurar()
+    caplog.set_level(logging.INFO, logger="pyftpdlib")
+
+    assert entregar(cliente_ftp, arquivos_assinados, tmp_path / "manifesto.json") == (1, 0)
+
+    assert conteudo_remoto(pasta_remota) == {local.name: conteudo}
+    # Com REST, só a segunda metade trafegou
+    transferidos = [
+        int(re.search(r"bytes=(\d+)", registro.getMessage()).group(1))
+        for registro in caplog.records if " STOR " in registro.getMessage()
+    ]
+    assert transferidos == [len(conteudo) - metade]
+    assert instrumentacao.resumo()["contadores"]["bytes_retomados"] == metade
+
+
+def test_pacotes_por_lote_sao_deterministicos(servidor_ftp, arquivos_assinados, tmp_path):
+    cliente_ftp, pasta_remota = servidor_ftp
+    pasta_pacotes = tmp_path / "pacotes"
+
+    assert entregar(cliente_ftp, arquivos_assinados, tmp_path / "manifesto.json", True, pasta_pacotes) == (2, 0)
+
+    pacotes = conteudo_remoto(pasta_remota)
+    assert sorted(pacotes) == ["lote_L1.zip", "lote_L2.zip"]
+    with zipfile.ZipFile(pasta_remota / "lote_L1.zip") as pacote:
+        assert pacote.namelist() == ["nfse_L1-1.pdf", "nfse_L1-1.xml", "nfse_L1-2.xml"]
+        assert pacote.read("nfse_L1-2.xml") == (arquivos_assinados / "nfse_L1-2.xml").read_bytes()
+    assert os.listdir(pasta_pacotes) == []  # os pacotes temporários são apagados depois da entrega
+
+    # Com outra data de modificação e outro manifesto, o mesmo conteúdo gera os mesmos bytes
+    for nome in os.listdir(arquivos_assinados):
+        os.utime(arquivos_assinados / nome, (0, 0))
+    for nome in pacotes:
+        os.remove(pasta_remota / nome)
+    assert entregar(cliente_ftp, arquivos_assinados, tmp_path / "outro.json", True, pasta_pacotes) == (2, 0)
+    assert conteudo_remoto(pasta_remota) == pacotes
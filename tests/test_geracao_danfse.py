@@ -0,0 +1,120 @@
+import os
+import re
+
+import pytest
+from PIL import Image
+
+import acesso_api_google
+import criacao_rps
+import geracao_danfse
+
+
+def paginas_do_pdf(caminho_pdf):
+    with open(caminho_pdf, "rb") as arquivo:
+        return len(re.findall(rb"/Type /Page\b", arquivo.read()))
+
+
+@pytest.fixture
+def pasta_assinados(pasta_trabalho, cabecalhos_planilha, linha_planilha):
+    """
+    pdf_xml_assinados com três XMLs ArrayOfTcCompNfse (do mesmo gerador do criacao_rps); o do
+    RPS 3 tem discriminação longa, que ocupa três páginas.
+    """
+    discriminacao_longa = "|".join(
+        f"Item {linha}: manutenção preventiva"
+        for linha in range(geracao_danfse.LINHAS_PRIMEIRA_PAGINA + geracao_danfse.LINHAS_PAGINA_CONTINUACAO + 1)
+    )
+    linhas = [
+        linha_planilha(numero_rps="1"),
+        linha_planilha(numero_rps="2", cnpj_tomador=""),
+        linha_planilha(numero_rps="3", discriminacao=discriminacao_longa),
+    ]
+    pasta = pasta_trabalho / geracao_danfse.PASTA_ARQUIVOS_ASSINADOS
+    pasta.mkdir()
+    for dados_nfse in acesso_api_google.gerar_registros_json(
+        cabecalhos_planilha, enumerate(linhas, 2), acesso_api_google.novo_indice_identificadores()
+    ):
+        (pasta / f"nfse_{dados_nfse['id']}.xml").write_bytes(criacao_rps.renderizar_xml_nfse(dados_nfse))
+    return pasta
+
+
+def pdfs_gerados(pasta):
+    return {nome: (pasta / nome).read_bytes() for nome in sorted(os.listdir(pasta)) if nome.endswith(".pdf")}
+
+
+def gerar(pasta, processos=1, todos=False):
+    return geracao_danfse.gerar_danfses(
+        str(pasta), processos=processos, todos=todos, caminho_manifesto=str(pasta.parent / "manifesto_danfse.json")
+    )
+
+
+def test_leitura_guarda_so_os_campos_do_danfse(pasta_assinados):
+    documentos = {
+        documento["numero"]: documento
+        for caminho_xml in pasta_assinados.iterdir()
+        for documento in geracao_danfse.ler_documentos_nfse(str(caminho_xml))
+    }
+
+    assert sorted(documentos) == ["1", "2", "3"]
+    documento = documentos["1"]
+    assert set(documento) <= set(geracao_danfse.CAMPOS_DANFSE.values())
+    assert documento["discriminacao"] == "Serviço prestado & manutenção <mensal>"
+    assert documento["cnpj_tomador"] == "98765432000100"
+    assert (documento["valor_servicos"], documento["aliquota"]) == ("1500.00", "0.05")
+    # O endereço do prestador tem as mesmas tags do tomador, mas não entra no documento
+    assert documento["endereco_tomador"] == "R DUTRA"
+    assert documento["numero_tomador"] == "5"
+    assert "cnpj_tomador" not in documentos["2"]
+    assert documentos["3"]["discriminacao"].count("|") == (
+        geracao_danfse.LINHAS_PRIMEIRA_PAGINA + geracao_danfse.LINHAS_PAGINA_CONTINUACAO
+    )
+
+
+def test_um_pdf_por_xml_com_discriminacao_em_varias_paginas(pasta_assinados):
+    assert gerar(pasta_assinados) == (3, 5, 0)
+
+    paginas = {nome: paginas_do_pdf(pasta_assinados / nome) for nome in pdfs_gerados(pasta_assinados)}
+    assert sorted(paginas.values()) == [1, 1, 3]
+    assert [nome for nome in os.listdir(pasta_assinados) if nome.endswith(".tmp")] == []
+
+
+def test_mesmo_xml_gera_os_mesmos_bytes(pasta_assinados):
+    gerar(pasta_assinados)
+    primeira = pdfs_gerados(pasta_assinados)
+
+    assert gerar(pasta_assinados, todos=True) == (3, 5, 0)
+    assert pdfs_gerados(pasta_assinados) == primeira
+    # No pool de processos também
+    assert gerar(pasta_assinados, processos=2, todos=True) == (3, 5, 0)
+    assert pdfs_gerados(pasta_assinados) == primeira
+
+
+def test_manifesto_so_renderiza_o_que_mudou(pasta_assinados, cabecalhos_planilha, linha_planilha):
+    gerar(pasta_assinados)
+
+    assert gerar(pasta_assinados) == (0, 0, 0)
+
+    caminho_xml = min(pasta_assinados.glob("*.xml"))
+    dados_nfse = next(acesso_api_google.gerar_registros_json(
+        cabecalhos_planilha, [(2, linha_planilha(razao_social_tomador="OUTRO TOMADOR LTDA"))]
+    ))
+    caminho_xml.write_bytes(criacao_rps.renderizar_xml_nfse(dados_nfse))
+    assert gerar(pasta_assinados) == (1, 1, 0)
+    # Um PDF apagado também é gerado de novo
+    os.remove(geracao_danfse.caminho_pdf_de(str(caminho_xml), str(pasta_assinados)))
+    assert gerar(pasta_assinados) == (1, 1, 0)
+
+
+def test_layout_alterado_renderiza_todos_de_novo(pasta_assinados):
+    gerar(pasta_assinados)
+    sem_logo = pdfs_gerados(pasta_assinados)
+    assinatura_anterior = geracao_danfse.assinatura_layout()
+
+    os.makedirs(geracao_danfse.PASTA_RECURSOS_DANFSE)
+    Image.new("RGB", (16, 16), "navy").save(geracao_danfse.CAMINHO_LOGO)
+
+    assert geracao_danfse.assinatura_layout() != assinatura_anterior
+    assert gerar(pasta_assinados) == (3, 5, 0)
+    com_logo = pdfs_gerados(pasta_assinados)
+    assert sorted(com_logo) == sorted(sem_logo)
+    assert all(com_logo[nome] != sem_logo[nome] for nome in com_logo)
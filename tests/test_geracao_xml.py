@@ -0,0 +1,78 @@
+from multiprocessing.pool import ThreadPool
+
+import pytest
+
+import acesso_api_google
+import criacao_rps
+
+
+def registro(cabecalhos, linha):
+    return next(acesso_api_google.gerar_registros_json(cabecalhos, [(2, linha)]))
+
+
+@pytest.fixture
+def pasta_xml(pasta_trabalho, monkeypatch):
+    pasta = pasta_trabalho / criacao_rps.PASTA_SAIDA_XML
+    pasta.mkdir()
+    monkeypatch.setattr(criacao_rps, "PASTA_SAIDA_XML", str(pasta))
+    return pasta
+
+
+@pytest.mark.parametrize("campos", [
+    {},
+    {"cnpj_tomador": ""},
+    {"complemento": "", "email_tomador": ""},
+    {"discriminacao": "Aluguel \"sala\" 'B' & <anexo> > 100% — ção"},
+    {"razao_social_tomador": "A&B <C>", "cnpj_tomador": ""},
+])
+def test_template_gera_os_mesmos_bytes_da_arvore(pasta_xml, cabecalhos_planilha, linha_planilha, campos):
+    dados_nfse = registro(cabecalhos_planilha, linha_planilha(**campos))
+
+    xml_str, _ = criacao_rps.gerar_xml_nfse(dados_nfse)
+
+    assert xml_str.encode("utf-8") == criacao_rps.renderizar_xml_nfse(dados_nfse)
+
+
+@pytest.mark.parametrize("processos", [1, 2])
+def test_arquivos_em_paralelo_iguais_aos_da_arvore(pasta_xml, cabecalhos_planilha, linha_planilha, processos):
+    linhas = [
+        linha_planilha(numero_rps=str(numero), cnpj_tomador="" if numero % 2 else "98765432000100")
+        for numero in range(1, 7)
+    ]
+    registros = list(acesso_api_google.gerar_registros_json(
+        cabecalhos_planilha, enumerate(linhas, 2), acesso_api_google.novo_indice_identificadores()
+    ))
+    esperados = {}
+    for dados_nfse in registros:
+        xml_str, nome_arquivo = criacao_rps.gerar_xml_nfse(dados_nfse)
+        esperados[nome_arquivo] = xml_str.encode("utf-8")
+
+    pasta_rapida = pasta_xml / "rapido"
+    pasta_rapida.mkdir()
+    nomes = list(criacao_rps.gerar_xmls_em_paralelo(
+        iter(registros), str(pasta_rapida), processos=processos, tamanho_bloco=2
+    ))
+
+    assert nomes == [f"nfse_{dados_nfse['id']}.xml" for dados_nfse in registros]
+    assert sorted(nomes) == sorted(esperados)
+    for nome_arquivo in nomes:
+        assert (pasta_rapida / nome_arquivo).read_bytes() == esperados[nome_arquivo]
+
+
+def test_blocos_em_andamento_sao_limitados():
+    consumidos = 0
+
+    def itens():
+        nonlocal consumidos
+        for numero in range(200):
+            consumidos += 1
+            yield numero
+
+    with ThreadPool(2) as pool:
+        resultados = []
+        for resultado in criacao_rps.mapear_em_blocos(pool, lambda numero: numero * 2, itens(), 5, processos=2):
+            # Além do bloco em mãos, no máximo BLOCOS_EM_ANDAMENTO_POR_PROCESSO blocos por processo
+            assert consumidos - len(resultados) <= 5 * criacao_rps.BLOCOS_EM_ANDAMENTO_POR_PROCESSO * 2
+            resultados.append(resultado)
+
+    assert resultados == [numero * 2 for numero in range(200)]
@@ -0,0 +1,57 @@
+import json
+import tracemalloc
+
+import pytest
+
+import acesso_api_google
+import cancelamento_nfse
+import instrumentacao
+import main
+from test_pipeline import sincronizar
+
+
+@pytest.fixture(autouse=True)
+def metricas_em_texto():
+    """As métricas do processo voltam ao padrão depois de cada teste."""
+    yield
+    instrumentacao.configurar()
+
+
+def test_log_json_na_saida_padrao_so_tem_json(espaco_emissao, cabecalhos_planilha, linha_planilha, capsys):
+    sincronizar(cabecalhos_planilha, linha_planilha, 3)
+    capsys.readouterr()
+
+    main.main(["pipeline", "--log-json"])
+
+    eventos = [json.loads(linha) for linha in capsys.readouterr().out.splitlines()]
+    resumo_pipeline, = [evento for evento in eventos if evento.get("categoria") == "resumo_pipeline"]
+    assert (resumo_pipeline["assinados"], resumo_pipeline["falhas"]) == (3, 0)
+    assert eventos[-1]["tipo"] == "resumo"
+
+
+@pytest.mark.parametrize("executar, categoria", [
+    (lambda: main.main(["lotes", "--entrada", "inexistente.ndjson", "--log-json"]), "erro"),
+    (lambda: cancelamento_nfse.main(["--entrada", "registros.ndjson", "--log-json"]), "erro"),
+    (lambda: acesso_api_google.main(["--log-json"]), "erro_id_planilha"),
+])
+def test_erro_com_log_json_sai_em_json_e_com_o_resumo(pasta_trabalho, capsys, executar, categoria):
+    with pytest.raises(SystemExit) as saida:
+        executar()
+
+    assert saida.value.code == 1
+    eventos = [json.loads(linha) for linha in capsys.readouterr().out.splitlines()]
+    assert eventos[-2]["categoria"] == categoria
+    assert eventos[-1]["tipo"] == "resumo"
+
+
+def test_configurar_fecha_o_log_e_o_perfil_anteriores(tmp_path):
+    anterior = instrumentacao.configurar("json", str(tmp_path / "log.ndjson"), perfil="tracemalloc")
+    assert tracemalloc.is_tracing()
+
+    instrumentacao.configurar(perfil="cprofile")
+
+    assert anterior.saida_log.closed
+    assert not tracemalloc.is_tracing()
+    # O cProfile da configuração anterior também é desligado antes do próximo
+    instrumentacao.configurar(perfil="cprofile", caminho_perfil=str(tmp_path / "perfil.prof"))
+    assert instrumentacao.finalizar()["perfil"]["tipo"] == "cprofile"
@@ -0,0 +1,126 @@
+import os
+
+import pytest
+from lxml import etree
+from signxml import SignatureConfiguration, XMLVerifier
+
+import acesso_api_google
+import lote_rps
+from certifica_xml import SessaoAssinatura
+from conftest import CAMINHO_MANUAL, SENHA_PFX_TESTE
+
+CAMINHO_MODELO = os.path.join(CAMINHO_MANUAL, "BlueprintPHP", "XML", "Arquivo.xml")
+TAG_ASSINATURA = f"{{{lote_rps.NAMESPACE_DS}}}Signature"
+
+
+@pytest.fixture
+def registros(cabecalhos_planilha, linha_planilha):
+    """Fábrica de registros com ids alocados como em acesso_api_google."""
+    def criar(quantidade, **campos):
+        linhas = [linha_planilha(numero_rps=str(numero), **campos) for numero in range(1, quantidade + 1)]
+        return list(acesso_api_google.gerar_registros_json(
+            cabecalhos_planilha, enumerate(linhas, 2), acesso_api_google.novo_indice_identificadores()
+        ))
+    return criar
+
+
+def verificar_assinaturas(envelope, cert_pem):
+    """Verifica cada Signature no elemento pai (Rps ou EnviarLoteRpsEnvio) e devolve os Ids assinados."""
+    configuracao = SignatureConfiguration(location="./")
+    ids_assinados = []
+    for assinatura in envelope.iter(TAG_ASSINATURA):
+        pai = etree.fromstring(etree.tostring(assinatura.getparent()))
+        resultado = XMLVerifier().verify(pai, x509_cert=cert_pem, expect_config=configuracao)
+        ids_assinados.append(resultado.signed_xml.get("Id"))
+    return ids_assinados
+
+
+def test_lote_de_500_rps_assinado_segue_o_modelo(pasta_trabalho, pfx_descartavel, registros):
+    sessao = SessaoAssinatura(pfx_descartavel, SENHA_PFX_TESTE)
+    grupo = registros(500)
+
+    (numero_lote, envelope), = lote_rps.gerar_lotes(grupo, sessao, tamanho_maximo=500)
+    # Como será enviado: serializado e lido de novo
+    envelope = etree.fromstring(etree.tostring(envelope, encoding="utf-8", xml_declaration=True))
+
+    assert lote_rps.conferir_estrutura_modelo(envelope, CAMINHO_MODELO) == ([], [])
+    assert numero_lote == "1"
+    assert envelope.findtext(".//{*}LoteRps/{*}QuantidadeRps") == "500"
+    assert len(envelope.findall(".//{*}ListaRps/{*}Rps")) == 500
+
+    ids_assinados = verificar_assinaturas(envelope, sessao.cert_pem)
+    assert ids_assinados[-1] == "lote1"
+    assert ids_assinados[:-1] == [f"rps{dados_nfse['id']}" for dados_nfse in grupo]
+    assert len(set(ids_assinados)) == 501
+
+
+def test_assinatura_nao_confere_apos_alteracao(pasta_trabalho, pfx_descartavel, registros):
+    sessao = SessaoAssinatura(pfx_descartavel, SENHA_PFX_TESTE)
+    envelope = lote_rps.montar_envelope_lote("1", "38057542000254", "11126723", registros(2), sessao)
+    envelope.find(".//{*}ValorServicos").text = "1.00"
+
+    with pytest.raises(Exception):
+        verificar_assinaturas(envelope, sessao.cert_pem)
+
+
+def test_rps_com_mesmo_numero_e_serie_tem_ids_distintos(cabecalhos_planilha, linha_planilha):
+    linhas = [linha_planilha(numero_rps="5"), linha_planilha(numero_rps="5")]
+    grupo = list(acesso_api_google.gerar_registros_json(
+        cabecalhos_planilha, enumerate(linhas, 2), acesso_api_google.novo_indice_identificadores()
+    ))
+
+    envelope = lote_rps.montar_envelope_lote("1", "38057542000254", "11126723", grupo)
+
+    ids = [inf_rps.get("Id") for inf_rps in envelope.iter("{*}InfRps")]
+    assert ids == [f"rps{dados_nfse['id']}" for dados_nfse in grupo]
+    assert len(set(ids)) == 2
+
+
+def test_id_repetido_no_lote_e_recusado(registros):
+    grupo = registros(1) * 2
+
+    with pytest.raises(ValueError, match="repetido"):
+        lote_rps.montar_envelope_lote("1", "38057542000254", "11126723", grupo)
+
+
+def test_divisao_mantem_ordem_e_limite(registros):
+    grupo = registros(120)
+    outro_prestador = registros(3, cnpj_prestador="11.222.333/0001-81")
+
+    partes = list(lote_rps.agrupar_registros_em_lotes(grupo + outro_prestador, tamanho_maximo=50))
+
+    assert [(chave[1], parte, len(itens)) for chave, parte, itens in partes] == [
+        ("38057542000254", 1, 50),
+        ("38057542000254", 2, 50),
+        ("38057542000254", 3, 20),
+        ("11222333000181", None, 3),
+    ]
+    assert [dados_nfse for _, _, itens in partes[:3] for dados_nfse in itens] == grupo
+
+
+def test_partes_numeradas_pelo_lote_e_indice(registros):
+    numeros = [[numero for numero, _ in lote_rps.gerar_lotes(registros(5), tamanho_maximo=2)] for _ in range(2)]
+
+    # Duas execuções com os mesmos registros numeram as partes do mesmo jeito
+    assert numeros[0] == numeros[1]
+    base = lote_rps.INICIO_NUMERACAO_PARTES + 1 * lote_rps.PARTES_POR_LOTE
+    assert numeros[0] == [str(base + 1), str(base + 2), str(base + 3)]
+    assert [numero for numero, _ in lote_rps.gerar_lotes(registros(2), tamanho_maximo=2)] == ["1"]
+    assert lote_rps.numero_lote_parte("2", 1) != lote_rps.numero_lote_parte("1", 1)
+
+
+def test_numero_reservado_ou_fora_da_faixa_de_partes_e_recusado(registros):
+    with pytest.raises(ValueError, match="reservada"):
+        list(lote_rps.gerar_lotes(registros(1, numero_lote=str(lote_rps.INICIO_NUMERACAO_PARTES))))
+    with pytest.raises(ValueError, match="dividido"):
+        list(lote_rps.gerar_lotes(registros(3, numero_lote=str(lote_rps.LIMITE_LOTE_DIVIDIDO)), tamanho_maximo=2))
+    with pytest.raises(ValueError, match="dividido"):
+        lote_rps.numero_lote_parte("1", lote_rps.PARTES_POR_LOTE)
+
+
+def test_id_do_lote_so_tem_caracteres_de_xs_id(pasta_trabalho, pfx_descartavel, registros):
+    sessao = SessaoAssinatura(pfx_descartavel, SENHA_PFX_TESTE)
+    envelope = lote_rps.montar_envelope_lote("12 /A", "38057542000254", "11126723", registros(1), sessao)
+
+    assert envelope.find(".//{*}LoteRps").get("Id") == "lote12A"
+    assert verificar_assinaturas(envelope, sessao.cert_pem)[-1] == "lote12A"
@@ -0,0 +1,104 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+import acesso_api_google
+import acompanhamento_protocolos
+import controle_etapas
+import lote_rps
+import main
+import servidor_soap_local
+from conftest import CAMINHO_MANUAL
+from test_pipeline import sincronizar, xmls_assinados
+
+CAMINHO_SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+MODULOS_PESADOS = ("googleapiclient", "signxml", "cryptography", "reportlab")
+
+
+def modulos_pesados_carregados(*argumentos):
+    """Roda main.main(argumentos) em outro processo e devolve os MODULOS_PESADOS que ele importou."""
+    codigo = "\n".join([
+        "import json, sys",
+        f"sys.path.insert(0, {CAMINHO_SRC!r})",
+        "import main",
+        "try:",
+        f"    main.main({list(argumentos)!r})",
+        "except SystemExit:",  # a ajuda dos subcomandos sai pelo argparse
+        "    pass",
+        f"print(json.dumps(sorted(nome for nome in {MODULOS_PESADOS!r} if nome in sys.modules)))",
+    ])
+    execucao = subprocess.run([sys.executable, "-c", codigo], capture_output=True, text=True, timeout=60)
+    assert execucao.returncode == 0, execucao.stderr
+    return json.loads(execucao.stdout.splitlines()[-1])
+
+
+@pytest.fixture
+def servidor_soap():
+    servidor, url = servidor_soap_local.iniciar_servidor(
+        consultas_ate_processar=1, pasta_exemplos=os.path.join(CAMINHO_MANUAL, "BlueprintPHP", "XML")
+    )
+    yield url
+    servidor.shutdown()
+
+
+def test_ajuda_lista_os_subcomandos(capsys):
+    main.main(["-h"])
+
+    saida = capsys.readouterr().out
+    for subcomando in main.SUBCOMANDOS:
+        assert f"  {subcomando}" in saida
+
+
+def test_subcomando_desconhecido(capsys):
+    with pytest.raises(SystemExit) as saida:
+        main.main(["emitir"])
+
+    assert saida.value.code == 2
+    assert "subcomando desconhecido: emitir" in capsys.readouterr().err
+
+
+def test_ajuda_nao_carrega_as_etapas():
+    assert modulos_pesados_carregados("-h") == []
+    # A ajuda de um subcomando só carrega o módulo dele
+    assert "googleapiclient" not in modulos_pesados_carregados("pipeline", "-h")
+
+
+def test_observar_um_ciclo(espaco_emissao, cabecalhos_planilha, linha_planilha, capsys):
+    sincronizar(cabecalhos_planilha, linha_planilha, 3)
+
+    main.main(["observar", "--ciclos", "1", "--intervalo", "0"])
+
+    saida = capsys.readouterr().out
+    assert "[INFO] Observando" in saida
+    assert "3 XML(s) assinado(s) (0 do cache), 0 sem alterações, 0 com falha." in saida
+    assert len(xmls_assinados()) == 3
+    # Como no pipeline, a leitura da planilha fica confirmada depois do ciclo
+    assert os.path.exists(acesso_api_google.ROTA_ESTADO_SINCRONIZACAO)
+
+
+def test_lotes_e_acompanhamento_no_servidor_local(espaco_emissao, cabecalhos_planilha, linha_planilha,
+                                                  servidor_soap, capsys):
+    sincronizar(cabecalhos_planilha, linha_planilha, 3)
+    main.main(["pipeline"])
+    # --conferir-modelo procura o manual a partir da raiz do projeto
+    os.symlink(CAMINHO_MANUAL, "manual_exemplo_sistema_prefeitura")
+
+    main.main(["lotes", "--entrada", acesso_api_google.CAMINHO_NDJSON_FINAL, "--conferir-modelo"])
+
+    assert len(os.listdir(lote_rps.PASTA_LOTES)) == 1
+    assert "[ATENÇÃO]" not in capsys.readouterr().out
+
+    main.main([
+        "acompanhar", "--enviar", acesso_api_google.CAMINHO_NDJSON_FINAL, "--url", servidor_soap,
+        "--intervalo-inicial", "0"
+    ])
+
+    assert "1 lote(s) enviado(s), 0 com falha." in capsys.readouterr().out
+    with open(acompanhamento_protocolos.CAMINHO_RESULTADOS_PROTOCOLOS, encoding="utf-8") as arquivo:
+        resultado, = [json.loads(linha) for linha in arquivo]
+    assert len(resultado["nfse"]) == 3
+    with controle_etapas.ControleEtapas(controle_etapas.CAMINHO_BANCO_CONTROLE) as controle:
+        assert {controle.situacao(id_rps)[0] for id_rps in resultado["ids"]} == {"confirmado"}
@@ -0,0 +1,47 @@
+import acesso_api_google
+from acesso_api_google import MAPEAMENTO_CAMPOS, compilar_mapeamento_campos, padrao_vazio
+
+
+def mapear_forma_anterior(cabecalhos, linha):
+    dados_linha = dict(zip(cabecalhos, linha))
+    return tuple(padrao_vazio(dados_linha.get(cabecalho)) for cabecalho, _, _ in MAPEAMENTO_CAMPOS)
+
+
+def test_linha_completa_e_linha_sem_celulas_finais(cabecalhos_planilha, linha_planilha):
+    chaves_json, transformar_linha = compilar_mapeamento_campos(cabecalhos_planilha)
+    linha = [f"  {valor} " for valor in linha_planilha()]
+
+    assert chaves_json == tuple(chave for _, chave, _ in MAPEAMENTO_CAMPOS)
+    for celulas in (linha, linha[:-4], linha[:3]):
+        assert transformar_linha(celulas) == mapear_forma_anterior(cabecalhos_planilha, celulas)
+
+
+def test_valores_que_nao_sao_texto_passam_por_padrao_vazio(cabecalhos_planilha, linha_planilha):
+    _, transformar_linha = compilar_mapeamento_campos(cabecalhos_planilha)
+    linha = linha_planilha()
+    linha[13] = 1500
+    linha[14] = None
+
+    assert transformar_linha(linha) == mapear_forma_anterior(cabecalhos_planilha, linha)
+
+
+def test_coluna_ausente_fica_vazia(cabecalhos_planilha, linha_planilha, capsys):
+    cabecalhos = [cabecalho for cabecalho in cabecalhos_planilha if cabecalho != "Bairro"]
+    linha = [valor for cabecalho, valor in zip(cabecalhos_planilha, linha_planilha()) if cabecalho != "Bairro"]
+
+    registro = next(acesso_api_google.gerar_registros_json(cabecalhos, [(2, linha)]))
+
+    assert registro["bairro"] == ""
+    assert "Bairro" in capsys.readouterr().out
+
+
+def test_celulas_alem_do_cabecalho_nao_preenchem_coluna_ausente(cabecalhos_planilha, linha_planilha):
+    cabecalhos = [cabecalho for cabecalho in cabecalhos_planilha if cabecalho != "Bairro"]
+    linha = [valor for cabecalho, valor in zip(cabecalhos_planilha, linha_planilha()) if cabecalho != "Bairro"]
+    # Coluna preenchida no fim da planilha, com o título em branco
+    linha_longa = linha + ["sem título", "outra"]
+
+    registro = next(acesso_api_google.gerar_registros_json(cabecalhos, [(2, linha_longa)]))
+
+    assert registro["bairro"] == ""
+    assert registro["email_tomador"] == "contato@teste.com.br"
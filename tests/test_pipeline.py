@@ -0,0 +1,51 @@
+import os
+
+from lxml import etree
+
+import acesso_api_google
+import certifica_xml
+import main
+from test_lote_rps import verificar_assinaturas
+from test_sincronizacao_planilha import ServicoPlanilhasFalso
+
+
+def sincronizar(cabecalhos_planilha, linha_planilha, quantidade):
+    linhas = [cabecalhos_planilha] + [linha_planilha(numero_rps=str(numero)) for numero in range(1, quantidade + 1)]
+    acesso_api_google.sincronizar_planilha(ServicoPlanilhasFalso(linhas), "planilha")
+
+
+def xmls_assinados():
+    pasta = certifica_xml.PASTA_XML_ASSINADO
+    return {nome: open(os.path.join(pasta, nome), "rb").read() for nome in sorted(os.listdir(pasta))}
+
+
+def test_pipeline_assina_confirma_e_retoma(espaco_emissao, cabecalhos_planilha, linha_planilha, capsys):
+    sincronizar(cabecalhos_planilha, linha_planilha, 3)
+
+    main.main(["pipeline"])
+
+    assert "3 XML(s) assinado(s) (0 do cache), 0 sem alterações, 0 com falha." in capsys.readouterr().out
+    assinados = xmls_assinados()
+    assert len(assinados) == 3
+    for xml_assinado in assinados.values():
+        assert len(verificar_assinaturas(etree.fromstring(xml_assinado), espaco_emissao)) == 1
+    # O NDJSON gravado pela sincronização foi consumido: o estado pendente virou o confirmado
+    assert not os.path.exists(acesso_api_google.ROTA_ESTADO_SINCRONIZACAO + acesso_api_google.SUFIXO_ESTADO_PENDENTE)
+    assert os.path.exists(acesso_api_google.ROTA_ESTADO_SINCRONIZACAO)
+
+    main.main(["pipeline", "--entrada", acesso_api_google.CAMINHO_NDJSON_FINAL])
+
+    assert "0 XML(s) assinado(s) (0 do cache), 3 sem alterações, 0 com falha." in capsys.readouterr().out
+    assert xmls_assinados() == assinados
+
+
+def test_pool_de_processos_produz_os_mesmos_bytes(espaco_emissao, cabecalhos_planilha, linha_planilha, capsys):
+    sincronizar(cabecalhos_planilha, linha_planilha, 7)
+
+    main.main(["--sem-controle", "--sem-cache"])
+    em_um_processo = xmls_assinados()
+    main.main(["pipeline", "--sem-controle", "--sem-cache", "--processos", "2"])
+
+    assert len(em_um_processo) == 7
+    assert xmls_assinados() == em_um_processo
+    assert capsys.readouterr().out.count("7 XML(s) assinado(s)") == 2
@@ -0,0 +1,249 @@
+import json
+import os
+import threading
+import time
+
+import httplib2
+import pytest
+from googleapiclient.errors import HttpError
+
+import acesso_api_google
+import criacao_rps
+
+
+class RequisicaoFalsa:
+    def __init__(self, resposta):
+        self.resposta = resposta
+
+    def execute(self):
+        return self.resposta
+
+
+class ServicoPlanilhasFalso:
+    """
+    Atende get() e values().batchGet a partir de uma lista de linhas (a primeira é o cabeçalho).
+    A aba tem `linhas_sobrando` linhas em branco depois dos dados, como uma planilha real.
+    """
+
+    def __init__(self, linhas, linhas_sobrando=100):
+        self.linhas = linhas
+        self.linhas_sobrando = linhas_sobrando
+
+    def spreadsheets(self):
+        return self
+
+    def get(self, spreadsheetId, fields):
+        propriedades = {"title": acesso_api_google.ABA_PLANILHA,
+                        "gridProperties": {"rowCount": len(self.linhas) + self.linhas_sobrando}}
+        return RequisicaoFalsa({"sheets": [{"properties": propriedades}]})
+
+    def values(self):
+        return self
+
+    def batchGet(self, spreadsheetId, ranges, majorDimension):
+        intervalos = []
+        for intervalo in ranges:
+            inicio, fim = intervalo.split("!")[1].split(":")
+            inicio = int(inicio.lstrip("ABCDEFGHIJKLMNOPQRSTUVWXYZ"))
+            fim = int(fim.lstrip("ABCDEFGHIJKLMNOPQRSTUVWXYZ"))
+            intervalos.append({"values": self.linhas[inicio - 1:fim]})
+        return RequisicaoFalsa({"valueRanges": intervalos})
+
+
+class RequisicaoComFalhas:
+    """execute() levanta HttpError com cada status de `falhas`, em ordem, e depois responde."""
+
+    def __init__(self, *falhas):
+        self.falhas = list(falhas)
+        self.execucoes = 0
+
+    def execute(self):
+        self.execucoes += 1
+        if self.falhas:
+            raise HttpError(httplib2.Response({"status": self.falhas.pop(0)}), b"{}")
+        return {"ok": True}
+
+
+def alteradas(cabecalhos, linhas, estado):
+    novo_estado = {}
+    numeradas = enumerate(linhas, start=2)
+    resultado = [linha for _, linha in acesso_api_google.filtrar_linhas_alteradas_em_fluxo(
+        cabecalhos, numeradas, estado, novo_estado
+    )]
+    return resultado, novo_estado
+
+
+def ler_ndjson():
+    with open(acesso_api_google.CAMINHO_NDJSON_FINAL, encoding="utf-8") as arquivo:
+        return [json.loads(linha) for linha in arquivo]
+
+
+def test_linha_inserida_nao_marca_as_seguintes_como_alteradas(cabecalhos_planilha, linha_planilha):
+    linhas = [linha_planilha(numero_rps=str(numero)) for numero in range(1, 6)]
+    _, estado = alteradas(cabecalhos_planilha, linhas, {})
+
+    nova = linha_planilha(numero_rps="99")
+    resultado, _ = alteradas(cabecalhos_planilha, [linhas[0], nova] + linhas[1:], estado)
+
+    assert resultado == [nova]
+
+
+def test_linha_removida_nao_marca_as_seguintes_como_alteradas(cabecalhos_planilha, linha_planilha):
+    linhas = [linha_planilha(numero_rps=str(numero)) for numero in range(1, 6)]
+    _, estado = alteradas(cabecalhos_planilha, linhas, {})
+
+    resultado, _ = alteradas(cabecalhos_planilha, linhas[:1] + linhas[2:], estado)
+
+    assert resultado == []
+
+
+def test_chaves_repetidas_sao_numeradas_pela_ocorrencia(cabecalhos_planilha, linha_planilha):
+    chave_registro = acesso_api_google.compilar_chave_registro(cabecalhos_planilha)
+    linha = linha_planilha(numero_rps="7")
+
+    assert chave_registro(2, linha) == "38.057.542/0002-54|7|A"
+    assert chave_registro(3, linha) == "38.057.542/0002-54|7|A#2"
+    assert chave_registro(4, linha_planilha(numero_rps="")) == "linha:4"
+
+
+def test_estado_so_e_confirmado_depois_do_consumo(pasta_trabalho, cabecalhos_planilha, linha_planilha):
+    linhas = [cabecalhos_planilha] + [linha_planilha(numero_rps=str(numero)) for numero in range(1, 4)]
+    servico = ServicoPlanilhasFalso(linhas)
+
+    assert acesso_api_google.sincronizar_planilha(servico, "planilha") == 3
+    # A etapa seguinte não rodou: a próxima leitura grava as mesmas linhas de novo
+    assert acesso_api_google.sincronizar_planilha(servico, "planilha") == 3
+    assert len(ler_ndjson()) == 3
+
+    assert acesso_api_google.confirmar_sincronizacao()
+    assert acesso_api_google.sincronizar_planilha(servico, "planilha") == 0
+
+    servico.linhas.append(linha_planilha(numero_rps="4"))
+    assert acesso_api_google.sincronizar_planilha(servico, "planilha") == 1
+    assert [registro["numero_rps"] for registro in ler_ndjson()] == ["4"]
+
+
+def test_identificador_acompanha_o_rps_quando_linhas_mudam_de_posicao(cabecalhos_planilha, linha_planilha):
+    indice = acesso_api_google.novo_indice_identificadores()
+    linhas = [linha_planilha(numero_rps=str(numero)) for numero in range(1, 4)]
+    primeira = {
+        registro["numero_rps"]: registro["id"]
+        for registro in acesso_api_google.gerar_registros_json(cabecalhos_planilha, enumerate(linhas, 2), indice)
+    }
+
+    # Mesmo lote/prestador (mesma base do identificador), inserido antes dos demais
+    reordenadas = [linha_planilha(numero_rps="99")] + linhas[::-1]
+    segunda = {
+        registro["numero_rps"]: registro["id"]
+        for registro in acesso_api_google.gerar_registros_json(cabecalhos_planilha, enumerate(reordenadas, 2), indice)
+    }
+
+    assert {numero: segunda[numero] for numero in primeira} == primeira
+    assert segunda["99"] not in primeira.values()
+
+
+def test_indice_antigo_por_linha_e_descartado(pasta_trabalho):
+    acesso_api_google.salvar_indice_identificadores({"contadores": {"base": 2}, "por_linha": {"2": "base"}})
+
+    indice = acesso_api_google.carregar_indice_identificadores()
+
+    assert indice == {"contadores": {"base": 2}, "por_chave": {}}
+
+
+def test_faixa_em_branco_maior_que_a_janela_nao_encerra_a_leitura(cabecalhos_planilha, linha_planilha):
+    linhas = [cabecalhos_planilha, linha_planilha(numero_rps="1")] + [[]] * 25 + [linha_planilha(numero_rps="2")]
+    servico = ServicoPlanilhasFalso(linhas)
+
+    lidas = list(acesso_api_google.ler_planilha_em_blocos(servico, "planilha", tamanho_bloco=5))
+
+    assert [numero for numero, linha in lidas if linha] == [1, 2, 28]
+    assert lidas[-1][1] == linha_planilha(numero_rps="2")
+
+
+def test_leitura_para_no_limite_de_linhas(cabecalhos_planilha, linha_planilha):
+    linhas = [cabecalhos_planilha] + [linha_planilha(numero_rps=str(numero)) for numero in range(1, 30)]
+    servico = ServicoPlanilhasFalso(linhas)
+
+    lidas = list(acesso_api_google.ler_planilha_em_blocos(servico, "planilha", tamanho_bloco=4, linha_limite=10))
+
+    assert [numero for numero, _ in lidas] == list(range(1, 11))
+
+
+@pytest.mark.parametrize("status", [429, 500, 503])
+def test_backoff_repete_status_temporarios(status):
+    requisicao = RequisicaoComFalhas(status, status)
+    esperas = []
+
+    resposta = acesso_api_google.executar_com_backoff(requisicao, espera_inicial=1.0, dormir=esperas.append)
+
+    assert resposta == {"ok": True}
+    assert requisicao.execucoes == 3
+    assert 1.0 <= esperas[0] < 2.0 and 2.0 <= esperas[1] < 3.0
+
+
+def test_backoff_nao_repete_outros_erros_e_desiste_no_limite():
+    requisicao = RequisicaoComFalhas(403)
+    with pytest.raises(HttpError):
+        acesso_api_google.executar_com_backoff(requisicao, dormir=lambda segundos: None)
+    assert requisicao.execucoes == 1
+
+    requisicao = RequisicaoComFalhas(503, 503, 503)
+    with pytest.raises(HttpError):
+        acesso_api_google.executar_com_backoff(requisicao, tentativas=3, dormir=lambda segundos: None)
+    assert requisicao.execucoes == 3
+
+
+def test_entrada_padrao_e_a_gravada_pela_sincronizacao_pendente(pasta_trabalho, cabecalhos_planilha, linha_planilha):
+    servico = ServicoPlanilhasFalso([cabecalhos_planilha, linha_planilha()])
+    acesso_api_google.sincronizar_planilha(servico, "planilha")
+    assert acesso_api_google.confirmar_sincronizacao()
+
+    servico.linhas.append(linha_planilha(numero_rps="2"))
+    acesso_api_google.sincronizar_planilha(servico, "planilha", formato="json")
+    # O NDJSON da execução anterior continua no disco, mais novo ou não
+    os.utime(criacao_rps.CAMINHO_NDJSON, ns=(time.time_ns() + 10**9,) * 2)
+
+    assert criacao_rps.entrada_padrao() == criacao_rps.CAMINHO_JSON
+    assert not acesso_api_google.confirmar_sincronizacao(arquivo=criacao_rps.CAMINHO_NDJSON)
+
+    leitura = {}
+    registros = criacao_rps.carregar_registros(criacao_rps.CAMINHO_JSON, leitura=leitura)
+    assert [registro["numero_rps"] for registro in registros] == ["2"]
+    assert acesso_api_google.confirmar_sincronizacao(arquivo=criacao_rps.CAMINHO_JSON, assinatura=leitura["assinatura"])
+
+
+def test_versao_antiga_do_arquivo_nao_confirma(pasta_trabalho, cabecalhos_planilha, linha_planilha):
+    servico = ServicoPlanilhasFalso([cabecalhos_planilha, linha_planilha()])
+    acesso_api_google.sincronizar_planilha(servico, "planilha")
+    leitura = {}
+    list(criacao_rps.carregar_registros(criacao_rps.CAMINHO_NDJSON, leitura=leitura))
+
+    servico.linhas.append(linha_planilha(numero_rps="2"))
+    acesso_api_google.sincronizar_planilha(servico, "planilha")
+
+    assert not acesso_api_google.confirmar_sincronizacao(
+        arquivo=criacao_rps.CAMINHO_NDJSON, assinatura=leitura["assinatura"]
+    )
+
+
+def test_acompanhar_ignora_marcador_de_outra_versao(pasta_trabalho, cabecalhos_planilha, linha_planilha):
+    caminho = criacao_rps.CAMINHO_NDJSON
+    with open(caminho, "w", encoding="utf-8") as arquivo:
+        arquivo.write(json.dumps({"numero_rps": "antigo"}) + "\n")
+    acesso_api_google.marcar_ndjson_concluido(caminho)
+    # Nova execução gravando no mesmo arquivo, com o marcador da anterior ainda lá
+    with open(caminho, "a", encoding="utf-8") as arquivo:
+        arquivo.write(json.dumps({"numero_rps": "novo"}) + "\n")
+
+    lidos = []
+    leitor = threading.Thread(target=lambda: lidos.extend(
+        criacao_rps.ler_registros_ndjson(caminho, acompanhar=True, intervalo_espera=0.01)
+    ))
+    leitor.start()
+    time.sleep(0.2)
+    assert leitor.is_alive()
+
+    acesso_api_google.marcar_ndjson_concluido(caminho)
+    leitor.join(timeout=5)
+    assert not leitor.is_alive()
+    assert [registro["numero_rps"] for registro in lidos] == ["antigo", "novo"]
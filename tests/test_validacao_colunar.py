@@ -0,0 +1,234 @@
+import numpy as np
+import pytest
+
+import acesso_api_google
+import instrumentacao
+import validacao_colunar
+from validacao_colunar import (
+    converter_aliquota, converter_aliquotas, converter_decimal, converter_decimais, data_invalida, datas_invalidas,
+    validar_bloco,
+)
+
+
+def resumir(numero, vazio, invalido, reescrever):
+    return "vazio" if vazio else "inválido" if invalido else (round(float(numero), 6), bool(reescrever))
+
+
+def converter(valores, funcao=converter_decimais):
+    return [resumir(*celula) for celula in zip(*funcao(np.array(valores, dtype=str)))]
+
+
+VALORES_MONETARIOS = [
+    ("1500.00", (1500.0, False)),
+    ("1500", (1500.0, False)),
+    ("0.05", (0.05, False)),
+    ("1.234,56", (1234.56, True)),
+    ("1.234.567,8", (1234567.8, True)),
+    ("R$ 75,00", (75.0, True)),
+    (" 12,5 ", (12.5, True)),
+    ("1.500", (1.5, False)),  # sem vírgula, o ponto é decimal
+    ("", "vazio"),
+    ("   ", "vazio"),
+    ("R$", "vazio"),
+    ("abc", "inválido"),
+    ("12a", "inválido"),
+    ("1,2,3", "inválido"),
+    ("1.2.3", "inválido"),
+    ("1,234.50", "inválido"),  # ponto depois da vírgula
+    ("-5,00", "inválido"),
+    ("1" * 21, "inválido"),
+]
+ALIQUOTAS = [
+    ("0.05", (0.05, True)),
+    ("0,05", (0.05, True)),
+    ("5%", (0.05, True)),
+    ("5,00", (0.05, True)),
+    ("5", (0.05, True)),
+    ("2,5 %", (0.025, True)),
+    ("1%", (0.01, True)),
+    ("1", "inválido"),  # 100% ou 1%: ambíguo
+    ("1,00", "inválido"),
+    ("", "vazio"),
+    ("cinco", "inválido"),
+]
+DATAS = [
+    ("04/12/2018 11:01", False),
+    ("29/02/2020 23:59", False),
+    ("29/02/2019 10:00", True),
+    ("29/02/1900 10:00", True),
+    ("31/04/2020 10:00", True),
+    ("00/01/2020 10:00", True),
+    ("01/13/2020 10:00", True),
+    ("04/12/2018 24:00", True),
+    ("04/12/2018 11:60", True),
+    ("04-12-2018 11:01", True),
+    ("4/12/2018 11:01", True),
+    ("04/12/2018", True),
+    ("2018-12-04T11:01:00", False),
+    ("2018-12-04T11:01:00.123", False),
+    ("2018-13-04T11:01:00", True),
+]
+
+
+@pytest.mark.parametrize("texto, esperado", VALORES_MONETARIOS)
+def test_valores_monetarios(texto, esperado):
+    assert converter([texto]) == [esperado]
+    assert resumir(*converter_decimal(texto)) == esperado
+
+
+def test_conversao_da_coluna_inteira_de_uma_vez():
+    textos = ["1.234,56", "", "abc", "75.00"]
+
+    assert converter(textos) == [(1234.56, True), "vazio", "inválido", (75.0, False)]
+
+
+def test_conversao_de_submatriz():
+    numeros, vazios, invalidos, _ = converter_decimais(np.array([["1,00", ""], ["x", "2.50"]], dtype=str))
+
+    assert numeros[0, 0] == 1.0 and numeros[1, 1] == 2.5
+    assert vazios.tolist() == [[False, True], [False, False]]
+    assert invalidos.tolist() == [[False, False], [True, False]]
+
+
+@pytest.mark.parametrize("texto, esperado", ALIQUOTAS)
+def test_aliquotas(texto, esperado):
+    assert converter([texto], converter_aliquotas) == [esperado]
+    assert resumir(*converter_aliquota(texto)) == esperado
+
+
+@pytest.mark.parametrize("texto, invalida", DATAS)
+def test_datas(texto, invalida):
+    assert datas_invalidas(np.array([texto], dtype=str)).tolist() == [invalida]
+    assert data_invalida(texto) == invalida
+
+
+@pytest.fixture(params=["numpy", "linha a linha"])
+def sem_numpy(request, monkeypatch):
+    """Roda o teste com numpy e de novo como se ele não estivesse instalado."""
+    if request.param == "linha a linha":
+        monkeypatch.setattr(validacao_colunar, "np", None)
+    return request.param
+
+
+@pytest.fixture
+def validar(cabecalhos_planilha, sem_numpy):
+    colunas_por_chave = {chave: indice for indice, (_, chave, _) in enumerate(acesso_api_google.MAPEAMENTO_CAMPOS)}
+
+    def executar(*linhas):
+        return validar_bloco(cabecalhos_planilha, list(enumerate(linhas, start=2)), colunas_por_chave)
+    return executar
+
+
+def indice(chave):
+    return [chave_json for _, chave_json, _ in acesso_api_google.MAPEAMENTO_CAMPOS].index(chave)
+
+
+def test_linha_valida_fica_como_esta(validar, linha_planilha):
+    linha = linha_planilha(aliquota="0.0500")
+
+    (validada,) = validar(linha)
+
+    assert validada == validacao_colunar.LinhaValidada(2, linha, [], [])
+
+
+def test_valores_pt_br_sao_reescritos_com_ponto(validar, linha_planilha):
+    linha = linha_planilha(
+        valor_servicos="R$ 1.500,00", base_calculo="1.500,00", valor_iss="75,00",
+        valor_liquido_nfse="1500.00", aliquota="5%"
+    )
+
+    (validada,) = validar(linha)
+
+    assert validada.erros == []
+    assert validada.linha[indice("valor_servicos")] == "1500.00"
+    assert validada.linha[indice("base_calculo")] == "1500.00"
+    assert validada.linha[indice("valor_iss")] == "75.00"
+    assert validada.linha[indice("aliquota")] == "0.0500"
+    assert validada.linha[indice("valor_liquido_nfse")] == "1500.00"
+    assert linha[indice("valor_servicos")] == "R$ 1.500,00"  # a entrada não é alterada
+
+
+def test_erros_por_linha(validar, linha_planilha):
+    validadas = validar(
+        linha_planilha(),
+        linha_planilha(valor_servicos="mil"),
+        linha_planilha(valor_iss="80.00"),
+        linha_planilha(valor_liquido_nfse="1400.00"),
+        linha_planilha(data_hora_emissao="31/02/2018 11:01"),
+        linha_planilha(data_hora_emissao=" "),
+    )
+
+    assert [validada.numero_linha for validada in validadas] == [2, 3, 4, 5, 6, 7]
+    assert validadas[0].erros == []
+    assert validadas[1].erros[0] == "valor_servicos inválido ('mil')"
+    assert validadas[2].erros == ["valor_iss 80.00 difere de base_calculo × aliquota (75.00)"]
+    assert validadas[3].erros[0].startswith("valor_liquido_nfse 1400.00 difere")
+    assert validadas[4].erros == ["data_hora_emissao inválida ('31/02/2018 11:01')"]
+    assert validadas[5].erros == ["data_hora_emissao vazia"]
+
+
+def test_vazios_valem_zero_e_celulas_omitidas_nao_contam(validar, linha_planilha, cabecalhos_planilha):
+    linha = linha_planilha(valor_pis="", complemento="")
+    sem_fim = linha_planilha()[:-3]  # a API omite as células vazias no fim da linha
+
+    com_vazios, omitidas = validar(linha, sem_fim)
+
+    assert com_vazios.erros == []
+    assert com_vazios.campos_vazios == [cabecalhos_planilha[indice("valor_pis")], cabecalhos_planilha[indice("complemento")]]
+    assert omitidas.campos_vazios == []
+    assert omitidas.erros == []
+
+
+@pytest.mark.parametrize("aliquota", ["5", "5,00", "5%", "0.05"])
+def test_aliquotas_aceitas_viram_a_mesma_fracao(validar, linha_planilha, aliquota):
+    (validada,) = validar(linha_planilha(aliquota=aliquota))
+
+    assert validada.erros == []
+    assert validada.linha[indice("aliquota")] == "0.0500"
+
+
+def test_aliquota_ambigua_e_recusada(validar, linha_planilha):
+    (validada,) = validar(linha_planilha(aliquota="1"))
+
+    assert validada.erros == ["aliquota inválido ('1')"]
+
+
+def test_fluxo_descarta_invalidas_e_entrega_normalizadas(cabecalhos_planilha, linha_planilha, sem_numpy, capsys):
+    linhas = [linha_planilha(valor_iss="75,00"), linha_planilha(valor_servicos="mil"), linha_planilha()]
+
+    validas = list(acesso_api_google.filtrar_linhas_validas_em_fluxo(
+        cabecalhos_planilha, enumerate(linhas, start=2), tamanho_bloco=2
+    ))
+
+    assert [numero for numero, _ in validas] == [2, 4]
+    assert validas[0][1][indice("valor_iss")] == "75.00"
+    assert "Linha 3" in capsys.readouterr().out
+
+
+def test_com_e_sem_numpy_o_resultado_e_o_mesmo(cabecalhos_planilha, linha_planilha, monkeypatch, capsys):
+    colunas_por_chave = {chave: indice for indice, (_, chave, _) in enumerate(acesso_api_google.MAPEAMENTO_CAMPOS)}
+    linhas = [linha_planilha(valor_servicos=texto) for texto, _ in VALORES_MONETARIOS]
+    linhas += [linha_planilha(aliquota=texto) for texto, _ in ALIQUOTAS]
+    linhas += [linha_planilha(data_hora_emissao=texto) for texto, _ in DATAS]
+    linhas += [
+        linha_planilha(valor_iss="80.00"),
+        linha_planilha(valor_liquido_nfse="1.400,00", valor_pis="R$ 10,00"),
+        linha_planilha(complemento="", valor_pis=" ")[:-2],
+        [""] * 8 + linha_planilha()[8:],
+    ]
+    linhas_numeradas = list(enumerate(linhas, start=2))
+
+    def executar():
+        instrumentacao.configurar()  # a amostragem das mensagens recomeça a cada execução
+        validadas = validar_bloco(cabecalhos_planilha, linhas_numeradas, colunas_por_chave)
+        validas = list(acesso_api_google.filtrar_linhas_validas_em_fluxo(
+            cabecalhos_planilha, iter(linhas_numeradas), tamanho_bloco=7
+        ))
+        return validadas, validas, capsys.readouterr().out
+
+    com_numpy = executar()
+    monkeypatch.setattr(validacao_colunar, "np", None)
+    sem_numpy = executar()
+
+    assert sem_numpy == com_numpy
+    assert sum(1 for validada in com_numpy[0] if validada.erros) > 10